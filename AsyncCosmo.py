@@ -0,0 +1,578 @@
+import asyncio
+import concurrent.futures
+import datetime
+import functools
+import itertools
+import os
+import time
+
+from .Cosmo import Cosmo
+from .src.diff_workbooks import diff_workbooks
+
+
+# function that runs a cosmo macro on a workbook file from start to finish
+# it is defined at the top level of the module so a process pool can run it
+def run_cosmo_macro(workbook_file_path, cosmo_macro, sheets=None):
+    """
+    Description
+    -----------
+    Open a workbook, run a cosmo macro on it, and get the cosmo log
+    of the actions that were run. Only the sheets the macro writes to
+    are loaded, unless sheets is given.
+
+    Parameters
+    ----------
+    workbook_file_path : str
+        The file path of the workbook.
+    cosmo_macro : str or dict
+        The file path of the cosmo macro, or the cosmo macro itself.
+    sheets : list, optional
+        The names of the worksheets to load.
+        Default is None, which loads the sheets the macro writes to.
+
+    Returns
+    -------
+    list
+        The cosmo log of the actions that were run.
+
+    Imports
+    -------
+    from .Cosmo import Cosmo
+
+    Examples
+    --------
+    >>> run_cosmo_macro("report_q3.xlsx", "roll_forward.cosmomacro")
+    [{'action': 'update_named_ranges', ...}, {'action': 'save', ...}]
+    """
+    cosmo = Cosmo(workbook_file_path, sheets=sheets, cosmo_macro=cosmo_macro)
+    cosmo.RunCosmoMacro()
+    return cosmo.cosmo_log
+
+
+class CosmoRunner:
+    """
+    Description
+    -----------
+    Runs the blocking work of Cosmo (opening, updating, recalculating and
+    saving workbooks) for asyncio code, without blocking the event loop.
+
+    The work runs in a bounded pool of threads, or of processes for the
+    work that runs on a whole workbook file from start to finish (like
+    running a cosmo macro). A semaphore limits how many operations run at
+    once, so hundreds of operations can be awaited together while only a
+    few workbooks are in memory at a time. Every operation puts progress
+    events on the events queue as it is queued, starts, and ends.
+
+    An operation that is cancelled before it starts never runs. One that
+    is cancelled while it runs raises asyncio.CancelledError at once, but
+    its worker finishes in the background (Python cannot stop a running
+    thread), and its place in the concurrency limit is only given back
+    when it does.
+
+    Parameters
+    ----------
+    max_workers : int, optional
+        The number of workers of the pool.
+        Default is None, which uses the number of CPUs (at most 32).
+    max_concurrent : int, optional
+        The number of operations that can run at once.
+        Default is None, which is the same as max_workers.
+    use_processes : bool, optional
+        Whether to run whole-file operations (run_macro and get_diff) in
+        a process pool instead of the thread pool, so they do not compete
+        for the GIL. Operations on an open workbook always run in threads,
+        since the workbook lives in this process.
+        Default is False.
+
+    Attributes
+    ----------
+    events : asyncio.Queue
+        The progress events, as dictionaries of the form:
+            {
+                'event': 'queued', 'started', 'finished', 'failed' or 'cancelled',
+                'id': int,
+                'operation': str,
+                'file_path': str,
+                'elapsed': float (seconds, once the operation ends),
+                'error': str (for failed operations),
+                'timestamp': str,
+            }
+    running : int
+        The number of operations that are running.
+
+    Methods
+    -------
+    open
+        Open a workbook, and get an AsyncCosmo for it.
+    run_macro
+        Run a cosmo macro on a workbook file, from start to finish.
+    run_macros
+        Run a cosmo macro on many workbook files at once.
+    get_diff
+        Compare two versions of a workbook file.
+    run
+        Run any blocking function as an operation.
+    progress
+        Iterate over the progress events as they happen.
+    close
+        Stop the pool, once the operations that are running finish.
+
+    Examples
+    --------
+    >>> async def refresh(file_paths):
+    ...     async with CosmoRunner(max_workers=8) as runner:
+    ...         return await runner.run_macros(file_paths, "roll_forward.cosmomacro")
+    >>> asyncio.run(refresh(glob.glob("reports/*.xlsx")))
+    [[{'action': 'update_named_ranges', ...}, ...], ...]
+    """
+    def __init__(self, max_workers=None, max_concurrent=None, use_processes=False):
+        if max_workers is None:
+            max_workers = min(32, os.cpu_count() or 1)
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1.")
+        if max_concurrent is None:
+            max_concurrent = max_workers
+        if max_concurrent < 1:
+            raise ValueError("max_concurrent must be at least 1.")
+
+        self.max_workers = max_workers
+        self.max_concurrent = max_concurrent
+        self.use_processes = use_processes
+
+        # the thread pool runs the work on open workbooks,
+        # and the process pool (if used) runs the whole-file work
+        self._thread_pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="cosmo")
+        self._process_pool = concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) \
+            if use_processes else None
+
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._ids = itertools.count(1)
+        self._closed = False
+        self.events = asyncio.Queue()
+        self.running = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    def _emit(self, event, operation_id, operation, file_path, **details):
+        self.events.put_nowait({
+            'event': event
+            , 'id': operation_id
+            , 'operation': operation
+            , 'file_path': file_path
+            , **details
+            , "timestamp": datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        })
+
+    async def run(self, operation, file_path, function, *args, lock=None, use_process=False, **kwargs):
+        """
+        Description
+        -----------
+        Run a blocking function in the pool as an operation, within the
+        concurrency limit, putting progress events on the events queue.
+
+        Parameters
+        ----------
+        operation : str
+            The name of the operation, for the progress events.
+        file_path : str
+            The file path of the workbook, for the progress events.
+        function : callable
+            The blocking function to run.
+        *args
+            The arguments of the function.
+        lock : asyncio.Lock, optional
+            A lock to hold while the function runs, so operations on the
+            same workbook run one at a time.
+            Default is None.
+        use_process : bool, optional
+            Whether to run the function in the process pool, if there is one.
+            The function and its arguments must be picklable.
+            Default is False.
+        **kwargs
+            The keyword arguments of the function.
+
+        Returns
+        -------
+        object
+            What the function returns.
+
+        Raises
+        ------
+        ValueError
+            If the runner is closed.
+        asyncio.CancelledError
+            If the operation is cancelled.
+        Exception
+            Whatever the function raises.
+        """
+        if self._closed:
+            raise ValueError("The runner is closed.")
+
+        operation_id = next(self._ids)
+        self._emit('queued', operation_id, operation, file_path)
+
+        # wait for a place in the concurrency limit, and for the workbook
+        # an operation cancelled while it waits never runs
+        try:
+            await self._semaphore.acquire()
+        except asyncio.CancelledError:
+            self._emit('cancelled', operation_id, operation, file_path)
+            raise
+        if lock is not None:
+            try:
+                await lock.acquire()
+            except asyncio.CancelledError:
+                self._semaphore.release()
+                self._emit('cancelled', operation_id, operation, file_path)
+                raise
+
+        def release(future=None):
+            # retrieve the error of a worker that finished after it was
+            # cancelled, so it is not reported as never retrieved
+            if future is not None and not future.cancelled():
+                future.exception()
+            self.running -= 1
+            if lock is not None:
+                lock.release()
+            self._semaphore.release()
+
+        # run the function in the pool
+        loop = asyncio.get_running_loop()
+        pool = self._process_pool if use_process and self._process_pool is not None else self._thread_pool
+        self.running += 1
+        self._emit('started', operation_id, operation, file_path)
+        start = time.perf_counter()
+        future = loop.run_in_executor(pool, functools.partial(function, *args, **kwargs))
+        try:
+            result = await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # a worker that has not started is cancelled, and one that has
+            # keeps its place in the limit until it finishes
+            future.cancel()
+            if future.done():
+                release(future)
+            else:
+                future.add_done_callback(release)
+            self._emit('cancelled', operation_id, operation, file_path,
+                       elapsed=time.perf_counter() - start)
+            raise
+        except Exception as error:
+            release()
+            self._emit('failed', operation_id, operation, file_path,
+                       elapsed=time.perf_counter() - start, error=repr(error))
+            raise
+        release()
+        self._emit('finished', operation_id, operation, file_path, elapsed=time.perf_counter() - start)
+        return result
+
+    async def open(self, workbook_file_path, sheets=None, cosmo_macro=None):
+        """
+        Description
+        -----------
+        Open a workbook in the pool, and get an AsyncCosmo for it.
+
+        Parameters
+        ----------
+        workbook_file_path : str
+            The file path of the workbook to open.
+        sheets : list, optional
+            The names of the worksheets to load (see Cosmo).
+            Default is None.
+        cosmo_macro : str or dict, optional
+            The cosmo macro to run on the workbook (see Cosmo).
+            Default is None.
+
+        Returns
+        -------
+        AsyncCosmo
+            The workbook, with its blocking methods run in the pool.
+
+        Examples
+        --------
+        >>> cosmo = await runner.open("report.xlsx", sheets=["Inputs"])
+        """
+        cosmo = await self.run('open', workbook_file_path, Cosmo, workbook_file_path,
+                               sheets=sheets, cosmo_macro=cosmo_macro)
+        return AsyncCosmo(cosmo, self)
+
+    async def run_macro(self, workbook_file_path, cosmo_macro, sheets=None):
+        """
+        Description
+        -----------
+        Run a cosmo macro on a workbook file, from opening it to saving it,
+        in one worker (a process, if the runner uses processes), so the
+        workbook is never brought back to the event loop.
+
+        Parameters
+        ----------
+        workbook_file_path : str
+            The file path of the workbook.
+        cosmo_macro : str or dict
+            The file path of the cosmo macro, or the cosmo macro itself.
+        sheets : list, optional
+            The names of the worksheets to load.
+            Default is None, which loads the sheets the macro writes to.
+
+        Returns
+        -------
+        list
+            The cosmo log of the actions that were run.
+
+        Examples
+        --------
+        >>> await runner.run_macro("report_q3.xlsx", "roll_forward.cosmomacro")
+        [{'action': 'update_named_ranges', ...}, {'action': 'save', ...}]
+        """
+        return await self.run('run_macro', workbook_file_path, run_cosmo_macro, workbook_file_path,
+                              cosmo_macro, sheets=sheets, use_process=True)
+
+    async def run_macros(self, workbook_file_paths, cosmo_macro, return_exceptions=True):
+        """
+        Description
+        -----------
+        Run a cosmo macro on many workbook files at once, within the
+        concurrency limit.
+
+        Parameters
+        ----------
+        workbook_file_paths : list
+            The file paths of the workbooks.
+        cosmo_macro : str or dict
+            The file path of the cosmo macro, or the cosmo macro itself.
+        return_exceptions : bool, optional
+            Whether the error of a workbook that fails is returned in its
+            place, instead of being raised (and cancelling the rest).
+            Default is True.
+
+        Returns
+        -------
+        list
+            The cosmo log (or error) of each workbook, in the same order
+            as the file paths.
+
+        Examples
+        --------
+        >>> results = await runner.run_macros(file_paths, "roll_forward.cosmomacro")
+        >>> [path for path, result in zip(file_paths, results) if isinstance(result, Exception)]
+        ['reports/broken.xlsx']
+        """
+        tasks = [asyncio.ensure_future(self.run_macro(file_path, cosmo_macro))
+                 for file_path in workbook_file_paths]
+        try:
+            return await asyncio.gather(*tasks, return_exceptions=return_exceptions)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
+    async def get_diff(self, old_file_path, new_file_path):
+        """
+        Description
+        -----------
+        Compare two versions of a workbook file (see `diff_workbooks`)
+        in the pool.
+
+        Parameters
+        ----------
+        old_file_path : str
+            The file path of the old workbook.
+        new_file_path : str
+            The file path of the new workbook.
+
+        Returns
+        -------
+        dict
+            The differences, as given by `diff_workbooks`.
+
+        Examples
+        --------
+        >>> diff = await runner.get_diff("report.xlsx", "report_q2.xlsx")
+        >>> diff['equal']
+        False
+        """
+        return await self.run('get_diff', new_file_path, diff_workbooks, old_file_path, new_file_path,
+                              use_process=True)
+
+    async def progress(self):
+        """
+        Description
+        -----------
+        Iterate over the progress events as they happen, until the runner
+        is closed and every event has been given.
+
+        Examples
+        --------
+        >>> async for event in runner.progress():
+        ...     print(event['event'], event['operation'], event['file_path'])
+        started run_macro reports/a.xlsx
+        """
+        while not (self._closed and self.events.empty()):
+            event = await self.events.get()
+            if event is None:
+                break
+            yield event
+
+    async def close(self):
+        """
+        Description
+        -----------
+        Stop the pool, once the operations that are running finish,
+        and end the iteration of the progress events.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        await asyncio.to_thread(self._thread_pool.shutdown, True)
+        if self._process_pool is not None:
+            await asyncio.to_thread(self._process_pool.shutdown, True)
+        self.events.put_nowait(None)
+
+
+# async version of the Cosmo class
+# the methods have the same names and arguments as the methods of Cosmo,
+# and run the Cosmo methods in the pool of a CosmoRunner
+class AsyncCosmo:
+    """
+    Description
+    -----------
+    An asyncio facade over a Cosmo. Each method runs the Cosmo method of
+    the same name in the pool of a CosmoRunner, within its concurrency
+    limit, and can be awaited together with the methods of other workbooks.
+    The methods of one workbook run one at a time, in the order they are
+    called, since a workbook cannot be changed by two threads at once.
+
+    Use `CosmoRunner.open` to open one.
+
+    Parameters
+    ----------
+    cosmo : Cosmo
+        The workbook.
+    runner : CosmoRunner
+        The runner whose pool runs the methods.
+
+    Attributes
+    ----------
+    cosmo : Cosmo
+        The workbook.
+    workbook_file_path : str
+        The file path of the workbook.
+    sheet_names : list
+        The names of the sheets in the workbook.
+    cosmo_log : list
+        The actions performed on the workbook.
+
+    Methods
+    -------
+    ### Workbook update methods:
+    Save
+    UpdateLinks
+    UpdateNamedRanges
+    StreamRows
+    Recalculate
+
+    ### Workbook data methods:
+    get_diff
+
+    ### Macro methods:
+    SaveCosmoMacro
+    RunCosmoMacro
+
+    Examples
+    --------
+    >>> async def roll_forward(file_paths):
+    ...     async with CosmoRunner(max_workers=4) as runner:
+    ...         async def update(file_path):
+    ...             cosmo = await runner.open(file_path, sheets=["Inputs"])
+    ...             await cosmo.UpdateNamedRanges({"quarter": 3})
+    ...             await cosmo.Save(is_copy=False)
+    ...         await asyncio.gather(*(update(file_path) for file_path in file_paths))
+    """
+    def __init__(self, cosmo, runner):
+        self.cosmo = cosmo
+        self.runner = runner
+        self._lock = asyncio.Lock()
+
+    @property
+    def workbook_file_path(self):
+        return self.cosmo.workbook_file_path
+
+    @property
+    def sheet_names(self):
+        return self.cosmo.sheet_names
+
+    @property
+    def cosmo_log(self):
+        return self.cosmo.cosmo_log
+
+    async def _run(self, operation, method, *args, **kwargs):
+        return await self.runner.run(operation, self.cosmo.workbook_file_path, method, *args,
+                                     lock=self._lock, **kwargs)
+
+    async def Save(self, is_copy=True, new_filename=None, recalculate=None, compression=None):
+        """
+        Save the workbook (see Cosmo.Save).
+
+        Notes
+        -----
+        Cosmo.Save asks on the console before replacing a save action
+        that is already in the cosmo log, so save once per workbook.
+        """
+        return await self._run('save', self.cosmo.Save, is_copy=is_copy,
+                               new_filename=new_filename, recalculate=recalculate, compression=compression)
+
+    async def UpdateLinks(self, links):
+        """
+        Update the links in the workbook (see Cosmo.UpdateLinks).
+        """
+        return await self._run('update_links', self.cosmo.UpdateLinks, links)
+
+    async def UpdateNamedRanges(self, named_ranges):
+        """
+        Update the named ranges in the workbook (see Cosmo.UpdateNamedRanges).
+        """
+        return await self._run('update_named_ranges', self.cosmo.UpdateNamedRanges, named_ranges)
+
+    async def UpdateRange(self, excel_range, value):
+        """
+        Write values to ranges of cells (see Cosmo.UpdateRange).
+        """
+        return await self._run('update_range', self.cosmo.UpdateRange, excel_range, value)
+
+    async def StreamRows(self, sheet_name, rows, start_row=None, new_filename=None, replace=False):
+        """
+        Write rows to a sheet of the workbook file (see Cosmo.StreamRows).
+        The rows are read in the worker thread, so a generator of rows
+        should not depend on the event loop.
+        """
+        return await self._run('stream_rows', self.cosmo.StreamRows, sheet_name, rows,
+                               start_row=start_row, new_filename=new_filename, replace=replace)
+
+    async def Recalculate(self):
+        """
+        Recalculate the formulas that depend on the cells that changed
+        (see Cosmo.Recalculate).
+        """
+        return await self._run('recalculate', self.cosmo.Recalculate)
+
+    async def get_diff(self, other_file_path):
+        """
+        Compare the workbook file to another version of it (see Cosmo.get_diff).
+        """
+        return await self._run('get_diff', self.cosmo.get_diff, other_file_path)
+
+    async def SaveCosmoMacro(self, file_path, file_format="json"):
+        """
+        Save the cosmo macro to a json or msgpack file (see Cosmo.SaveCosmoMacro).
+        """
+        return await self._run('save_cosmo_macro', self.cosmo.SaveCosmoMacro, file_path, file_format=file_format)
+
+    async def RunCosmoMacro(self, cosmo_macro=None):
+        """
+        Run a cosmo macro on the workbook (see Cosmo.RunCosmoMacro).
+        """
+        return await self._run('run_cosmo_macro', self.cosmo.RunCosmoMacro, cosmo_macro)
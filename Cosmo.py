@@ -1,10 +1,35 @@
 import datetime
+import os
+import zipfile
 
 from .src.is_xlsb import is_xlsb
 from .src.open_workbook import open_workbook
 from .src.get_named_ranges import get_named_ranges
+from .src.name_index import get_name_index
+from .src.update_named_ranges import update_named_ranges
+from .src.write_request import build_write_requests, execute_write_requests, trusted_write_request
+from .src.stream_rows import stream_rows
+from .src.splice_cells import splice_cells
+from .src.diff_workbooks import diff_workbooks
+from .src.export_sheets import export_sheets
+from .src.formula_graph import build_formula_graph
+from .src.write_cached_values import write_cached_values
 from .src.get_links import get_links
-from .src.save_workbook import save_workbook
+from .src.update_links import update_links
+from .src.check_links import check_link_targets
+from .src.save_workbook import get_save_path, save_workbook
+from .src.compress_package import compress_package, get_compression_level
+from .src.load_sheet_subset import get_unloaded_sheets, placeholder_sheets, unload_sheets
+from .src.load_cached_values import read_range
+from .src.excel_dates import read_dates
+from .src.paged_sheet import execute_paged_write_requests, open_paged_sheets, save_paged_sheets
+from .src.get_sheet_parts import get_sheet_parts
+from .src.mapped_zip import get_mapped_zip
+from .src.column_letter_from_index import column_letter_from_index
+from .src.get_macro_sheets import get_macro_sheets
+from .src.range_index import RangeIndex, build_name_range_index, find_write_conflicts, iter_logged_writes
+from .src.load_cosmo_macro import load_cosmo_macro
+from .src.save_cosmo_macro import save_cosmo_macro
 
 
 # define a class to hold the data from the excel file
@@ -18,7 +43,7 @@ class Cosmo:
     A class to hold the data from the excel file and to update the excel file.
 
     Creates a dicitonary to hold the cosmo macro as it is built. This cosmo
-    macro can be saved to a json file using the SaveCosmoMacro method.
+    macro can be saved to a json or msgpack file using the SaveCosmoMacro method.
 
     Can load and run a cosmo macro from a .cosmomacro file.
 
@@ -29,11 +54,56 @@ class Cosmo:
     ----------
     workbook_file_path : str
         The file path of the workbook to open.
+    sheets : list, optional
+        The names of the worksheets to load. The other worksheets keep
+        their place in the workbook, but their cells are not loaded, using
+        them raises a ValueError, and they are copied from the original
+        file as they are when the workbook is saved.
+        Default is None, which loads every sheet, unless a cosmo macro is
+        given, in which case only the sheets the macro writes to are loaded.
+        Ignored for xlsb files.
+    cosmo_macro : str or dict, optional
+        The file path of a cosmo macro to run on the workbook
+        with the RunCosmoMacro method, or the cosmo macro itself.
+        Default is None.
+    elide_writes : bool, optional
+        Whether to skip the writes that would not change their cells
+        (a number within a small tolerance of the value of the cell, a
+        date equal to its datetime, an empty string in an empty cell, ...),
+        and to copy the loaded sheets that were not written to from the
+        original file when the workbook is saved, instead of writing them
+        again. The number of skipped writes is logged with each update.
+        Default is False.
+    parallel : bool, optional
+        Whether to parse the large worksheets in worker processes at the
+        same time when every sheet is loaded (see `load_workbook_parallel`).
+        Default is False.
+    paged_sheets : list, optional
+        The names of the worksheets to page instead of loading: only
+        page_rows rows of each are kept in memory, the rest is spilled to
+        a temporary file (see `PagedSheet`). They can be read with
+        get_values and get_cells, and written with UpdateRange, and the
+        rows written to are spliced into them when the workbook is saved.
+        Default is None.
+    page_rows : int, optional
+        The number of rows of each paged sheet to keep in memory.
+        Default is 65536.
+    staging_cache : StagingCache, optional
+        A local cache of the files of a slow network share (see
+        `StagingCache`). The workbook is copied to it once, every read
+        is served from the local copy, and saves are written locally and
+        uploaded to where they would have been saved, in one copy.
+        Default is None, which works on the workbook file itself.
 
     Attributes
     ----------
     workbook_file_path : str
-        The file path of the workbook.
+        The file path of the workbook (of its local copy, with a staging cache).
+    source_file_path : str
+        The file path the workbook was opened from, which saves are named
+        after and uploaded next to with a staging cache.
+    staging_cache : StagingCache or None
+        The staging cache the workbook is read from, if any.
     is_xlsb : bool
         Whether the workbook is an xlsb file or not.
     wb : openpyxl.Workbook or pyxlsb.Workbook
@@ -50,8 +120,41 @@ class Cosmo:
         Alias for sheet_names.
     tabs : list
         Alias for sheet_names.
+    loaded_sheets : list
+        The names of the sheets whose cells are loaded.
+    paged_sheets : dict
+        The paged sheets, keyed by sheet name (see `PagedSheet`).
+    elide_writes : bool
+        Whether writes that would not change their cells are skipped,
+        and the sheets that were not written to are copied when saving.
+    dirty_sheets : set
+        The names of the sheets that the update methods wrote to.
+        Cells changed directly on wb are not tracked, so with elide_writes
+        the names of their sheets have to be added to it before saving.
+    compression_report : list
+        The compression report of the last save with a compression
+        profile: the size, compressed size and compression time of each
+        part of the saved file (see `compress_package`).
     named_ranges : list
         The names of the named ranges in the workbook.
+    name_index : NameIndex or None
+        The index of the defined names in the workbook, mapping each
+        name to its parsed (sheet, CellRange) destinations.
+        Built once when the workbook is opened.
+        None for xlsb files.
+    formula_graph : FormulaGraph or None
+        The formulas of the workbook and the cells they depend on,
+        used to recalculate the formulas that depend on changed cells.
+        Built from the workbook file the first time it is needed.
+        None until then, and for xlsb files.
+    name_range_index : RangeIndex or None
+        The spatial index of the ranges of the defined names, used to find
+        the names that cover a cell or meet a range.
+        Built the first time it is needed. None until then, and for xlsb files.
+    write_index : RangeIndex or None
+        The spatial index of the ranges written by the actions of the
+        cosmo log. Built the first time it is needed, and kept up to date
+        with the log after that. None until then.
     links : list
         The links in the workbook.
     external_links : list
@@ -65,6 +168,9 @@ class Cosmo:
     cosmo_log : list
         A list to hold the actions performed on the workbook.
         This list can be saved to a json file using the SaveCosmoLog method.
+    loaded_cosmo_macro : dict or None
+        The cosmo macro to run with the RunCosmoMacro method,
+        loaded with the LoadCosmoMacro method or when the workbook is opened.
 
     Methods
     -------
@@ -75,15 +181,50 @@ class Cosmo:
         If the workbook is not an xlsb file, then save it using openpyxl.
         After saving the workbook, prints a message to the console
         with the file path of the saved workbook.
+    UpdateRange
+        Write a value, or a block of values, to ranges of cells.
+    StreamRows
+        Write the rows from a generator to a sheet of the workbook file,
+        without building the cells in memory.
+    SpliceCells
+        Write values into a few cells of the workbook file,
+        without loading or rewriting the rest of their sheets.
+    Recalculate
+        Recalculate the formulas that depend on the cells that changed.
+
+    ### Workbook data methods:
+    get_values
+        Get the values of a range of cells, with the values of the formulas.
+    get_cells
+        Get the values and the formulas of the cells in a range.
+    get_dates
+        Get the dates of a range of cells as a numpy datetime64 array.
+    get_diff
+        Compare the workbook file to another version of it, and get
+        the cells, named ranges and links that differ.
+    get_link_health
+        Check that the files the links point to are there and up to date.
+    get_clean_sheets
+        Get the loaded sheets that have not been written to.
+    find_names
+        Find the named ranges that meet, contain or lie inside a range.
+    find_writes
+        Find the logged writes that meet, contain or lie inside a range.
+    export
+        Export sheets and named ranges to Parquet or Feather files.
 
 
     ### Macro methods:
     SaveCosmoMacro
-        Save the cosmo macro to a json file.
+        Save the cosmo macro to a json or msgpack file.
     LoadCosmoMacro
-        Load a cosmo macro from a json file.
+        Load a cosmo macro from a json or msgpack file.
     RunCosmoMacro
         Run a cosmo macro.
+    get_macro_sheets
+        Get the sheets of the workbook that a cosmo macro writes to.
+    get_macro_conflicts
+        Get the writes of a cosmo macro that write over earlier writes of it.
     SaveCosmoLog
         Save the cosmo log to a json file.
 
@@ -92,14 +233,39 @@ class Cosmo:
 
 
     """
-    def __init__(self, workbook_file_path):
+    def __init__(self, workbook_file_path, sheets=None, cosmo_macro=None, elide_writes=False, parallel=False,
+                 paged_sheets=None, page_rows=65536, staging_cache=None):
+        # with a staging cache, the workbook is read from its local copy
+        self.source_file_path = workbook_file_path
+        self.staging_cache = staging_cache
+        if staging_cache is not None:
+            workbook_file_path = staging_cache.stage(workbook_file_path)
         self.workbook_file_path = workbook_file_path
 
         # boolean for whether the workbook is .xlsb or not
         self.is_xlsb = is_xlsb(workbook_file_path)
 
+        # load the cosmo macro to run, if one is given
+        self.loaded_cosmo_macro = None if cosmo_macro is None else load_cosmo_macro(cosmo_macro)
+
+        # when running a cosmo macro, only load the sheets it writes to
+        if sheets is None and self.loaded_cosmo_macro is not None and not self.is_xlsb:
+            sheets = get_macro_sheets(self.loaded_cosmo_macro, workbook_file_path)
+
+        # the paged sheets are not loaded
+        if paged_sheets and self.is_xlsb:
+            raise ValueError("xlsb workbooks cannot be paged. Save the workbook as .xlsx or .xlsm to page it.")
+        if paged_sheets:
+            if sheets is None:
+                with get_mapped_zip(workbook_file_path) as zf:
+                    sheets = list(get_sheet_parts(zf))
+            sheets = [sheet for sheet in sheets if sheet not in paged_sheets]
+
         # open the workbook
-        self.wb = open_workbook(workbook_file_path)
+        # (with only some of its sheets loaded, if sheets is given)
+        # the cached values of the formulas are kept as the sheets are
+        # read, so both can be read without loading the workbook twice
+        self.wb = open_workbook(workbook_file_path, sheets=sheets, cached_values=True, parallel=parallel)
 
         # alias the wb to book, workbook_obj
         # this is to make it easier to remember the variable name
@@ -114,6 +280,33 @@ class Cosmo:
         self.worksheets = self.sheet_names
         self.tabs = self.sheet_names
 
+        # get the names of the sheets whose cells are loaded
+        unloaded_sheets = get_unloaded_sheets(self.wb)
+        self.loaded_sheets = [sheet for sheet in self.sheet_names if sheet not in unloaded_sheets]
+
+        # page the sheets that are too big to load
+        self.paged_sheets = open_paged_sheets(workbook_file_path, paged_sheets or [], max_rows=page_rows)
+
+        # keep track of the sheets that are written to, so
+        # the others can be copied as they are when saving
+        self.elide_writes = elide_writes
+        self.dirty_sheets = set()
+
+        # the compression report of the last save with a compression profile
+        self.compression_report = []
+
+        # build the index of the defined names once, so
+        # named range lookups and updates do not re-read the name list
+        self.name_index = None if self.is_xlsb else get_name_index(self.wb)
+
+        # the formula graph is built the first time it is needed
+        self.formula_graph = None
+
+        # so are the spatial indexes of the names and of the logged writes
+        self.name_range_index = None
+        self.write_index = None
+        self._indexed_log_length = 0
+
         # get the named ranges
         self.named_ranges = get_named_ranges(self.wb)
 
@@ -132,7 +325,7 @@ class Cosmo:
         self.cosmo_log = []
 
     # function to save the workbook
-    def Save(self, is_copy=True, new_filename=None):
+    def Save(self, is_copy=True, new_filename=None, recalculate=None, compression=None):
         """
         Description
         -----------
@@ -153,10 +346,26 @@ class Cosmo:
             Default is None.
             If None, then the workbook is saved with the original filename.
             If not None, then the workbook is saved with the new filename.
+        recalculate : bool
+            Whether to recalculate the formulas that depend on the cells
+            that changed, and write the values of all of the formulas
+            into the saved file.
+            Default is None, which recalculates when sheets have writes
+            that were not saved (see dirty_sheets), or when the formula
+            graph is already built, since building it reads every sheet.
+        compression : str, optional
+            The compression profile to save the workbook with: "fast",
+            "balanced", "small", or "stored" for intermediate files
+            (see `compress_package`). The parts are compressed with a pool
+            of threads, once, after the values are written, and the time
+            spent on each part is kept in compression_report.
+            Default is None, which saves the workbook as openpyxl does.
+            Ignored for xlsb files.
 
         Returns
         -------
-        None
+        str
+            The file path of the saved workbook.
 
         Notes
         -----
@@ -164,10 +373,28 @@ class Cosmo:
         then the workbook is saved using pyxlsb.
         If the workbook is not an xlsb file,
         then the workbook is saved using openpyxl.
+        openpyxl does not keep the values of formulas when it saves,
+        so when the workbook is recalculated they are written back
+        afterwards, so programs that read the saved values (like openpyxl
+        with data_only=True) see up to date numbers.
+        Sheets that were not loaded are copied from the original file,
+        with their values, and only the values that were recalculated
+        are written into them. With elide_writes, so are the loaded sheets
+        that were not written to (see `get_clean_sheets`).
+        The rows written to the paged sheets are spliced into their copies,
+        and the workbook is marked to be fully recalculated when Excel
+        opens it, since the formulas that depend on them are not
+        recalculated here.
+        With a staging cache, the workbook is saved to a local file first,
+        and uploaded to the file path it is saved to once it is complete.
 
         Imports
         -------
-        from .src.save_workbook import save_workbook
+        from .src.save_workbook import get_save_path, save_workbook
+        from .src.write_cached_values import write_cached_values
+        from .src.load_sheet_subset import placeholder_sheets
+        from .src.compress_package import compress_package
+        from .src.paged_sheet import save_paged_sheets
 
         Examples
         --------
@@ -181,17 +408,86 @@ class Cosmo:
         Saved workbook as
         C:\\Users\\username\\Documents\\Python Scripts\\Cosmo\\test_copy.xlsb
         """
-        # save the workbook
-        save_workbook(
-            # the workbook object
-            self.wb
-            # whether the workbook is a copy of the original workbook
-            , is_copy=is_copy
-            # the new filename to save the workbook as
-            # if None, then the workbook is saved with the original filename
-            # if not None, then the workbook is saved with the new filename
-            , new_filename=new_filename
-            )
+        # recalculate the formulas that depend on the changed cells
+        # before saving, since saving in place replaces the file
+        # the formula graph is read from
+        if recalculate is None:
+            recalculate = bool(self.dirty_sheets) or self.formula_graph is not None
+        if recalculate and not self.is_xlsb:
+            self.Recalculate()
+
+        # with elide_writes, the sheets that were not written to
+        # are saved like the sheets that were not loaded, by copying
+        # them from the original file
+        clean_sheets = self.get_clean_sheets() if self.elide_writes else []
+
+        # with a compression profile, the workbook is saved and its
+        # values (and the rows of the paged sheets) are written without
+        # compression, and it is compressed once, at the end
+        write_values = recalculate and not self.is_xlsb
+        write_pages = any(paged.changed for paged in self.paged_sheets.values())
+        compress = compression is not None and not self.is_xlsb
+        if compress:
+            get_compression_level(compression)
+        rewrite = write_values or write_pages
+        save_compression = "stored" if compress and rewrite else compression if compress else None
+        rewrite_compression = zipfile.ZIP_STORED if compress else zipfile.ZIP_DEFLATED
+        report = []
+
+        # with a staging cache, the workbook is saved to a local file,
+        # which is uploaded to the file path it would have been saved to
+        save_is_copy, save_filename, upload_path = is_copy, new_filename, None
+        if self.staging_cache is not None:
+            upload_path = get_save_path(self.source_file_path, is_copy=is_copy, new_filename=new_filename)
+            save_is_copy, save_filename = True, self.staging_cache.get_upload_path(upload_path)
+        with placeholder_sheets(self.wb, clean_sheets):
+            copied_sheets = get_unloaded_sheets(self.wb)
+
+            # save the workbook
+            saved_file_path = save_workbook(
+                # the workbook object
+                self.wb
+                # whether the workbook is a copy of the original workbook
+                , is_copy=save_is_copy
+                # the new filename to save the workbook as
+                # if None, then the workbook is saved with the original filename
+                # if not None, then the workbook is saved with the new filename
+                , new_filename=save_filename
+                # the file path the workbook was opened from
+                , file_path=self.workbook_file_path
+                # the compression profile to save the workbook with
+                , compression=save_compression
+                , report=report
+                )
+
+        # write the values of the formulas into the saved file
+        # the sheets that were copied still have their values,
+        # so only the values that changed are written into them
+        if write_values:
+            cached_values = self.formula_graph.get_cached_values(
+                sheets=[sheet for sheet in self.loaded_sheets if sheet not in copied_sheets])
+            cached_values.update(self.formula_graph.get_cached_values(
+                sheets=copied_sheets, changed_only=True))
+            write_cached_values(saved_file_path, cached_values, compression=rewrite_compression)
+
+        # splice the rows written to the paged sheets into their copies
+        if write_pages:
+            save_paged_sheets(saved_file_path, self.paged_sheets.values(), compression=rewrite_compression)
+
+        if compress:
+            if rewrite:
+                report = compress_package(saved_file_path, profile=compression)
+            self.compression_report = report
+
+        # upload the saved workbook from the staging cache
+        if upload_path is not None:
+            saved_file_path = self.staging_cache.upload(saved_file_path, upload_path)
+            print("Workbook uploaded to: " + saved_file_path)
+
+        # saved in place, the workbook file has every write,
+        # so no sheet has writes that were not saved
+        if not is_copy:
+            self.dirty_sheets.clear()
 
         # log the action to the cosmo log
         # first check if the cosmo log already has a save action anywhere
@@ -217,6 +513,7 @@ class Cosmo:
                     'action': 'save'
                     , 'is_copy': is_copy
                     , 'new_filename': new_filename
+                    , 'compression': compression
                     , "timestamp": datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
                 }
 
@@ -228,11 +525,88 @@ class Cosmo:
             else:
                 # do not overwrite the previous save action
                 pass
+        else:
+            # add the save action to the cosmo log
+            # and to the cosmo macro
+            self.cosmo_log.append({
+                'action': 'save'
+                , 'is_copy': is_copy
+                , 'new_filename': new_filename
+                , 'compression': compression
+                , "timestamp": datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            })
+            self.cosmo_macro['cosmo_log'] = self.cosmo_log
+
+        return saved_file_path
+
+    # function to recalculate the formulas that depend on changed cells
+    def Recalculate(self):
+        """
+        Description
+        -----------
+        Recalculate the formulas that depend on the cells that changed
+        since the workbook was opened (or last recalculated), and nothing
+        else. The changed cells are found by comparing the workbook object
+        to the formula graph, so cells changed by any method are included.
+
+        The formula graph is built from the workbook file the first time
+        this is called. Formulas that use functions outside of the supported
+        subset (SUM, SUMIF(S), INDEX/MATCH, VLOOKUP, IF, IFERROR, AND, OR,
+        NOT, MIN, MAX, AVERAGE, COUNT, ROUND, ABS and arithmetic) keep their
+        old values, and are listed in formula_graph.unsupported.
+        Also logs the action to the cosmo log.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        dict
+            Dictionary where the keys are tuples of the form
+            (sheet name, cell reference) and the values are the new values,
+            for each formula whose value changed.
+
+        Raises
+        ------
+        ValueError
+            If the workbook is an xlsb file.
+
+        Imports
+        -------
+        from .src.formula_graph import build_formula_graph
+
+        Examples
+        --------
+        >>> cosmo.UpdateNamedRanges({'growth_rate': 0.07})
+        >>> cosmo.Recalculate()
+        {('Summary', 'B10'): 10700.0, ('Summary', 'B11'): 749.0}
+        """
+        # build the formula graph from the workbook file
+        if self.formula_graph is None:
+            self.formula_graph = build_formula_graph(self.workbook_file_path)
+
+        # find the cells that changed, and recalculate what depends on them
+        changed_cells = self.formula_graph.update_from_workbook(self.wb)
+        recalculated = self.formula_graph.recalculate()
+
+        # log the action to the cosmo log
+        self.cosmo_log.append({
+            'action': 'recalculate'
+            , 'changed_cells': changed_cells
+            , 'recalculated_cells': len(recalculated)
+            , 'unsupported_cells': len(self.formula_graph.unsupported)
+            , "timestamp": datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        })
+
+        return recalculated
 
     # function to close the workbook
     def Close(self):
         """
-        Close the workbook.
+        Close the workbook, and the paged sheets. For xlsb workbooks,
+        this also releases the memory mapping of the workbook file
+        (see `open_workbook_pyxlsb`).
 
         Parameters
         ----------
@@ -242,7 +616,9 @@ class Cosmo:
         -------
         None
         """
-        eu.close_workbook(self.wb)
+        for paged in self.paged_sheets.values():
+            paged.close()
+        self.wb.close()
 
     # function to update links
     def UpdateLinks(self, links):
@@ -267,8 +643,30 @@ class Cosmo:
         Returns
         -------
         None
+
+        Notes
+        -----
+        Also logs the action to the cosmo log and updates the cosmo macro.
+
+        Imports
+        -------
+        from .src.update_links import update_links
         """
-        self.wb = eu.update_links(self.wb, links)
+        self.wb = update_links(self.wb, links)
+
+        # get the links in the workbook again, since they changed
+        self.links = get_links(self.wb)
+        self.external_links = self.links
+        self.linked_files = self.links
+
+        # log the action to the cosmo log
+        # and add it to the cosmo macro
+        self.cosmo_log.append({
+            'action': 'update_links'
+            , 'links': links
+            , "timestamp": datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        })
+        self.cosmo_macro['cosmo_log'] = self.cosmo_log
 
     # function to update the named ranges
     # takes a dictionary called named_ranges as input where the keys are the named ranges and the values are the new values
@@ -287,7 +685,8 @@ class Cosmo:
         Parameters
         ----------
         named_ranges : dict
-            The dictionary with the current values as keys and the desired values as values.
+            The dictionary with the names of the named ranges as keys
+            and the new values as values.
             Dictionary should be of the form:
                 {
                     named_range1: new_value1,
@@ -298,6 +697,1102 @@ class Cosmo:
         Returns
         -------
         None
+
+        Notes
+        -----
+        All of the named ranges are resolved and checked before anything
+        is written, and then written in one pass per sheet.
+        With elide_writes, the cells that already have their new values
+        are not written, and the number of them is logged as 'elided'.
+        Also logs the action to the cosmo log and updates the cosmo macro.
+        """
+        counts = {}
+        self.wb = update_named_ranges(self.wb, named_ranges, elide=self.elide_writes, counts=counts)
+        elided = self._record_writes(counts)
+
+        # log the action to the cosmo log
+        # and add it to the cosmo macro
+        self.cosmo_log.append({
+            'action': 'update_named_ranges'
+            , 'named_ranges': named_ranges
+            , 'elided': elided
+            , "timestamp": datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        })
+        self.cosmo_macro['cosmo_log'] = self.cosmo_log
+
+    # function to keep track of the sheets that were written to
+    def _record_writes(self, counts):
+        """
+        Add the sheets with cells that were written to the dirty sheets,
+        from the counts of an update, and get the number of writes
+        that were skipped.
+        """
+        self.dirty_sheets.update(sheet for sheet, sheet_counts in counts.items() if sheet_counts['written'])
+        return sum(sheet_counts['elided'] for sheet_counts in counts.values())
+
+    # function to check that sheets can be rewritten in the workbook file
+    def _check_file_writes(self, sheet_names):
+        """
+        Check that sheets can be rewritten in place in the workbook file,
+        without losing writes: they must not be paged, or have writes that
+        were not saved, and loaded sheets must not have pivot tables,
+        since they cannot be unloaded.
+        """
+        for sheet_name in sheet_names:
+            if sheet_name in self.paged_sheets:
+                raise ValueError(f"The sheet {sheet_name} is paged, so it cannot be rewritten "
+                                 f"in the workbook file. Write to it with UpdateRange.")
+            if sheet_name in self.dirty_sheets:
+                raise ValueError(f"The sheet {sheet_name} has writes that were not saved. Save the "
+                                 f"workbook in place first, or write to a new file with new_filename.")
+            if sheet_name in self.loaded_sheets and self.wb[sheet_name]._pivots:
+                raise ValueError(f"The sheet {sheet_name} has pivot tables, so it cannot be rewritten "
+                                 f"in the workbook file while it is loaded. "
+                                 f"Open the workbook without {sheet_name} in sheets to rewrite it.")
+
+    # function to drop the loaded cells of sheets rewritten in the workbook file
+    def _unload_rewritten_sheets(self, sheet_names):
+        """
+        Unload the sheets that were rewritten in the workbook file, so
+        saving the workbook copies them from the file, and drop the formula
+        graph, which was built from the file before they were rewritten.
+        """
+        unload_sheets(self.wb, sheet_names)
+        unloaded_sheets = get_unloaded_sheets(self.wb)
+        self.loaded_sheets = [sheet for sheet in self.sheet_names if sheet not in unloaded_sheets]
+        self.formula_graph = None
+
+    # function to rewrite the workbook file, through the staging cache when there is one
+    def _rewrite_workbook_file(self, rewrite, new_filename):
+        """
+        Rewrite the workbook file with rewrite(new_file_path), which reads
+        the workbook file and writes to new_file_path (or rewrites the
+        workbook file in place when it is None). With a staging cache, the
+        new file is written to a local file and uploaded to the share, to
+        new_filename or over the workbook on the share, so the rewrite is
+        not lost when the workbook is staged again.
+        """
+        if self.staging_cache is None:
+            return rewrite(new_filename)
+
+        upload_path = self.source_file_path if new_filename is None else new_filename
+        local_path = self.staging_cache.get_upload_path(upload_path)
+        try:
+            result = rewrite(local_path)
+        except BaseException:
+            os.remove(local_path)
+            raise
+        self.staging_cache.upload(local_path, upload_path)
+        print("Workbook uploaded to: " + upload_path)
+        return result
+
+    # function to write checked writes to the loaded and paged sheets
+    def _execute_writes(self, requests, counts):
+        paged = [request for request in requests if request.sheet in self.paged_sheets]
+        loaded = [request for request in requests if request.sheet not in self.paged_sheets]
+        count = execute_write_requests(self.wb, loaded, elide=self.elide_writes, counts=counts)
+        return count + execute_paged_write_requests(self.paged_sheets, paged, elide=self.elide_writes, counts=counts)
+
+    # function to update ranges of cells
+    def UpdateRange(self, excel_range, value):
         """
-        self.wb = eu.update_named_ranges(self.wb, named_ranges)
+        Description
+        -----------
+        Write a value, or a block of values, to ranges of cells.
+        The sheets, ranges and values are checked once, before anything
+        is written, and the checked writes are logged to the cosmo log,
+        so running the cosmo macro again does not check them again.
+        With elide_writes, the cells that already have their new values
+        are not written, and the number of them is logged as 'elided'.
+
+        Parameters
+        ----------
+        excel_range : dict
+            Dictionary where the keys are sheet names (or numbers from 1)
+            and the values are cell ranges, either in A1 notation
+            ("B2" or "B2:C3") or (row, column) tuples.
+        value : object, list or tuple
+            The values to write to each range. Either a single value,
+            which is written to every cell of the range, a flat list with
+            one value for every cell (row by row), or a list of rows.
+            numpy arrays and pandas Series and DataFrames are written too,
+            with their date columns converted at once (see `to_cell_values`).
+            Ranges on paged sheets are written to their blocks.
+
+        Returns
+        -------
+        int
+            The number of cells written (without the ones that were skipped).
 
+        Raises
+        ------
+        ValueError
+            If the workbook is an xlsb file.
+        ValueError
+            If the update is not valid (see `build_write_request`).
+
+        Imports
+        -------
+        from .src.write_request import build_write_requests, execute_write_requests
+        from .src.paged_sheet import execute_paged_write_requests
+
+        Examples
+        --------
+        >>> cosmo.UpdateRange({'Inputs': 'B2:B3'}, [0.07, 1200])
+        2
+        """
+        if self.is_xlsb:
+            raise ValueError("xlsb workbooks are read only. Save the workbook as .xlsx or .xlsm to update it.")
+
+        requests = build_write_requests(self.wb.sheetnames, excel_range, value)
+        counts = {}
+        count = self._execute_writes(requests, counts)
+        elided = self._record_writes(counts)
+
+        # log the action to the cosmo log
+        # and add it to the cosmo macro
+        self.cosmo_log.append({
+            'action': 'update_range'
+            , 'writes': [request.to_dict() for request in requests]
+            , 'elided': elided
+            , "timestamp": datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        })
+        self.cosmo_macro['cosmo_log'] = self.cosmo_log
+
+        return count
+
+    # function to stream rows to a sheet
+    def StreamRows(self, sheet_name, rows, start_row=None, new_filename=None, replace=False):
+        """
+        Description
+        -----------
+        Append rows from an iterable (usually a generator) to a sheet,
+        after the rows it has, or replace its rows with them (with replace).
+        The rows are written straight into the workbook file as they are
+        produced, instead of being built as cells in memory and saved with
+        the rest of the workbook, so memory use stays flat no matter how
+        many rows are written.
+        Also logs the action to the cosmo log and updates the cosmo macro.
+
+        Parameters
+        ----------
+        sheet_name : str
+            The name of the sheet to write the rows to.
+        rows : iterable
+            Iterable of rows, where each row is an iterable of values.
+        start_row : int
+            The row number of the first row. When appending, it must be
+            after the last row of the sheet.
+            Default is None, which starts after the last row of the sheet,
+            or at row 1 with replace.
+        new_filename : str
+            The file path to save the new workbook to.
+            Default is None.
+            If None, then the workbook file is rewritten in place.
+        replace : bool
+            Whether to replace the rows of the sheet instead of appending to them.
+            Default is False.
+
+        Returns
+        -------
+        int
+            The number of rows written.
+
+        Raises
+        ------
+        ValueError
+            If the workbook file is rewritten in place, and the sheet is
+            paged, has writes that were not saved, or has pivot tables.
+        ValueError
+            If appending, and start_row is not after the last row of the sheet.
+
+        Notes
+        -----
+        The rows are spliced into the workbook file on disk. When it is
+        rewritten in place, the sheet is unloaded (see `unload_sheets`),
+        since its loaded cells no longer match the file, so it is copied
+        from the file when the workbook is saved. Load the workbook again
+        to read or write its cells.
+
+        With a staging cache, the new workbook is written to a local file
+        and uploaded to new_filename, or over the workbook on the share.
+
+        Imports
+        -------
+        from .src.stream_rows import stream_rows
+
+        Examples
+        --------
+        >>> cosmo.StreamRows("Detail", (row for row in detail_rows()), replace=True)
+        250001
+        >>> cosmo.StreamRows("Detail", (row for row in late_rows()))
+        120
+        """
+        # the sheet is rewritten in the workbook file, so it
+        # cannot have writes that would be lost
+        in_place = new_filename is None
+        if in_place:
+            self._check_file_writes([sheet_name])
+
+        # write the rows to the workbook file
+        row_count = self._rewrite_workbook_file(
+            lambda new_file_path: stream_rows(
+                self.workbook_file_path
+                , sheet_name
+                , rows
+                , start_row=start_row
+                , new_filename=new_file_path
+                , replace=replace
+                )
+            , new_filename
+            )
+        if in_place:
+            self._unload_rewritten_sheets([sheet_name])
+
+        # log the action to the cosmo log
+        # the rows themselves are not logged, since they can come from a
+        # generator that can only be read once
+        self.cosmo_log.append({
+            'action': 'stream_rows'
+            , 'sheet_name': sheet_name
+            , 'start_row': start_row
+            , 'row_count': row_count
+            , 'new_filename': new_filename
+            , 'replace': replace
+            , "timestamp": datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        })
+        self.cosmo_macro['cosmo_log'] = self.cosmo_log
+
+        return row_count
+
+    # function to write a few cells straight into the workbook file
+    def SpliceCells(self, cells, new_filename=None):
+        """
+        Description
+        -----------
+        Write values into cells of the workbook file, for small edits to
+        big sheets. Only the rows with the cells are rewritten, and the
+        rest of each sheet is copied through as it is, so the cost is one
+        read and write of each sheet, however many rows it has, instead of
+        loading and saving all of its cells.
+        Also logs the action to the cosmo log and updates the cosmo macro.
+
+        Parameters
+        ----------
+        cells : dict
+            Dictionary where the keys are sheet names and the values are
+            dictionaries of the new values, keyed by cell reference
+            (e.g. {"Inputs": {"B2": 0.07}}). Strings starting with "="
+            are written as formulas, and dates are written in the date
+            system of the workbook, with a date format.
+        new_filename : str
+            The file path to save the new workbook to.
+            Default is None.
+            If None, then the workbook file is rewritten in place.
+
+        Returns
+        -------
+        int
+            The number of cells written.
+
+        Raises
+        ------
+        ValueError
+            If the workbook file is rewritten in place, and a sheet is
+            paged, has writes that were not saved, or has pivot tables.
+
+        Notes
+        -----
+        The cells are spliced into the workbook file on disk. When it is
+        rewritten in place, their sheets are unloaded (see `unload_sheets`),
+        since their loaded cells no longer match the file, so they are
+        copied from the file when the workbook is saved. Load the workbook
+        again to read or write their cells.
+
+        With a staging cache, the new workbook is written to a local file
+        and uploaded to new_filename, or over the workbook on the share.
+
+        Imports
+        -------
+        from .src.splice_cells import splice_cells
+
+        Examples
+        --------
+        >>> cosmo.SpliceCells({"Inputs": {"B2": 0.07, "B3": "East"}})
+        2
+        """
+        # the sheets are rewritten in the workbook file, so they
+        # cannot have writes that would be lost
+        in_place = new_filename is None
+        if in_place:
+            self._check_file_writes(list(cells))
+
+        # write the cells to the workbook file
+        cell_count = self._rewrite_workbook_file(
+            lambda new_file_path: splice_cells(self.workbook_file_path, cells, new_file_path=new_file_path)
+            , new_filename
+            )
+        if in_place:
+            self._unload_rewritten_sheets(list(cells))
+
+        # log the action to the cosmo log
+        self.cosmo_log.append({
+            'action': 'splice_cells'
+            , 'cells': cells
+            , 'new_filename': new_filename
+            , "timestamp": datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        })
+        self.cosmo_macro['cosmo_log'] = self.cosmo_log
+
+        return cell_count
+
+    # function to read a range of cells, with the formulas and their values
+    def _read_range(self, sheet_name, cell_range):
+        if self.is_xlsb:
+            raise ValueError("Reading ranges is not supported for xlsb workbooks.")
+        if sheet_name not in self.sheet_names:
+            raise ValueError(f"The sheet {sheet_name} is not in the workbook.")
+        if sheet_name in self.paged_sheets:
+            rows = self.paged_sheets[sheet_name].read_range(cell_range)
+        elif sheet_name not in self.loaded_sheets:
+            raise ValueError(f"The sheet {sheet_name} was not loaded. "
+                             f"Open the workbook with {sheet_name} in sheets to use it.")
+        else:
+            rows = read_range(self.wb[sheet_name], cell_range)
+
+        # formulas that were recalculated have their new values
+        if self.formula_graph is not None and self.formula_graph.recalculated:
+            values = self.formula_graph.values.get(sheet_name, {})
+            rows = [[(row, column, values.get((row, column))
+                      if (sheet_name, row, column) in self.formula_graph.recalculated else value, formula)
+                     for row, column, value, formula in cells] for cells in rows]
+        return rows
+
+    # function to get the values of a range of cells
+    def get_values(self, sheet_name, cell_range):
+        """
+        Description
+        -----------
+        Get the values of a range of cells, where the value of a formula
+        is its value when the workbook was saved, or its new value if it
+        was recalculated with the Recalculate method. The formulas and
+        their values are both read when the workbook is opened, in one
+        pass, so the workbook does not need to be loaded again with
+        data_only=True.
+
+        Parameters
+        ----------
+        sheet_name : str
+            The name of the sheet.
+        cell_range : str
+            The range of cells, in A1 notation (e.g. "B2:C10").
+
+        Returns
+        -------
+        list
+            The rows of the range, as lists of values.
+
+        Raises
+        ------
+        ValueError
+            If the workbook is an xlsb file.
+        ValueError
+            If the sheet is not in the workbook, or was neither loaded nor paged.
+        ValueError
+            If the range is not a range of cells.
+
+        Imports
+        -------
+        from .src.load_cached_values import read_range
+
+        Examples
+        --------
+        >>> cosmo.get_values("Summary", "B9:B10")
+        [[700.0], [10700.0]]
+        """
+        return [[value for _, _, value, _ in cells] for cells in self._read_range(sheet_name, cell_range)]
+
+    # function to get the values and formulas of a range of cells
+    def get_cells(self, sheet_name, cell_range):
+        """
+        Description
+        -----------
+        Get the values and the formulas of the cells in a range that are
+        not empty, e.g. to check which of the cells that were updated
+        feed formulas. The value of a formula is as given by get_values.
+
+        Parameters
+        ----------
+        sheet_name : str
+            The name of the sheet.
+        cell_range : str
+            The range of cells, in A1 notation (e.g. "B2:C10").
+
+        Returns
+        -------
+        dict
+            Dictionary where the keys are cell references (e.g. "B10")
+            and the values are dictionaries of the form
+            {'value': value, 'formula': formula or None}.
+
+        Raises
+        ------
+        ValueError
+            If the workbook is an xlsb file.
+        ValueError
+            If the sheet is not in the workbook, or was neither loaded nor paged.
+        ValueError
+            If the range is not a range of cells.
+
+        Imports
+        -------
+        from .src.load_cached_values import read_range
+
+        Examples
+        --------
+        >>> cosmo.get_cells("Summary", "B9:B10")
+        {'B9': {'value': 700.0, 'formula': None}, 'B10': {'value': 10700.0, 'formula': '=B8+B9'}}
+        """
+        return {
+            f"{column_letter_from_index(column)}{row}": {'value': value, 'formula': formula}
+            for cells in self._read_range(sheet_name, cell_range)
+            for row, column, value, formula in cells
+            if value is not None or formula is not None
+        }
+
+    # function to get the dates of a range of cells as an array
+    def get_dates(self, sheet_name, cell_range):
+        """
+        Description
+        -----------
+        Get the dates of a range of cells as a numpy datetime64 array,
+        for long date columns. The serial numbers of the range are read
+        straight from the workbook file and converted all at once, in the
+        date system of the workbook, instead of one cell at a time, so the
+        sheet does not need to be loaded. Use `get_date_quarters` on the
+        result to bucket the dates by quarter.
+
+        Parameters
+        ----------
+        sheet_name : str
+            The name of the sheet.
+        cell_range : str
+            The range of cells, in A1 notation (e.g. "C2:C500000").
+
+        Returns
+        -------
+        numpy.ndarray
+            The dates, as datetime64[ms], with one row for each row of the
+            range and one column for each column. Empty cells, and cells
+            that do not hold numbers, are NaT.
+
+        Raises
+        ------
+        ValueError
+            If the sheet is not in the workbook, or the range is not a range of cells.
+        ImportError
+            If numpy is not installed.
+
+        Notes
+        -----
+        The dates are read from the workbook file on disk, so changes
+        made to the workbook object that have not been saved yet are not
+        included.
+
+        Imports
+        -------
+        from .src.excel_dates import read_dates
+
+        Examples
+        --------
+        >>> cosmo.get_dates("Claims", "C2:C4")
+        array([['2024-03-31T00:00:00.000'],
+               ['2024-04-01T00:00:00.000'],
+               ['NaT']], dtype='datetime64[ms]')
+        """
+        epoch = None if self.is_xlsb else self.wb.epoch
+        return read_dates(self.workbook_file_path, sheet_name, cell_range, epoch=epoch)
+
+    # function to compare the workbook to another version of it
+    def get_diff(self, other_file_path):
+        """
+        Description
+        -----------
+        Compare the workbook file to another version of it (usually the
+        file a session saved to), and get the cells, named ranges and links
+        that differ. Sheets that are unchanged in the file are skipped, and
+        only the rows that changed are read cell by cell, so this is quick
+        enough to check every save.
+
+        Parameters
+        ----------
+        other_file_path : str
+            The file path of the other version of the workbook.
+
+        Returns
+        -------
+        dict
+            The differences, with the workbook file as the old version
+            and the other file as the new version.
+            See `diff_workbooks` for the form of the dictionary.
+
+        Notes
+        -----
+        The files on disk are compared, so changes made to the workbook
+        object that have not been saved yet are not included.
+
+        Imports
+        -------
+        from .src.diff_workbooks import diff_workbooks
+
+        Examples
+        --------
+        >>> cosmo.Save(is_copy=False, new_filename="report_q2.xlsx")
+        >>> diff = cosmo.get_diff("report_q2.xlsx")
+        >>> diff['equal']
+        False
+        >>> diff['names']['changed']
+        {'Quarter': {'old': 'Inputs!$B$1', 'new': 'Inputs!$B$2'}}
+        """
+        return diff_workbooks(self.workbook_file_path, other_file_path)
+
+    # function to check the files the links point to
+    def get_link_health(self, case_sensitive=False):
+        """
+        Description
+        -----------
+        Check that the files the links of the workbook point to are there,
+        and whether they changed after the workbook file was saved, with
+        suggestions for links to files that are not there.
+        The links of the workbook object are checked, so links updated
+        with UpdateLinks are checked before the workbook is saved.
+
+        Parameters
+        ----------
+        case_sensitive : bool, optional
+            Whether a link must match the case of its file to find it.
+            Default is False, as on Windows and network shares.
+
+        Returns
+        -------
+        list
+            The links, as dictionaries of the form
+            {'workbook': str, 'link': str, 'path': str, 'status': str,
+             'modified': int or None, 'suggestions': list},
+            where the status is 'ok', 'stale', 'moved', 'missing' or 'unresolved'.
+            See `check_link_targets`.
+
+        Imports
+        -------
+        from .src.check_links import check_link_targets
+
+        Examples
+        --------
+        >>> [(link['link'], link['status'], link['suggestions']) for link in cosmo.get_link_health()]
+        [('Data3Q2024.xlsx', 'moved', ['Data3Q2024 final.xlsx'])]
+        """
+        # pyxlsb gives the links with the sheets they have
+        links = [link[0] if isinstance(link, tuple) else link for link in self.links]
+        # the links are relative to where the workbook was opened from
+        mtime_ns = os.stat(self.source_file_path).st_mtime_ns
+        return check_link_targets({self.source_file_path: (links, mtime_ns)}, case_sensitive=case_sensitive)
+
+    # function to get the loaded sheets that were not written to
+    def get_clean_sheets(self):
+        """
+        Description
+        -----------
+        Get the loaded sheets that the update methods have not written to
+        since the workbook was opened. With elide_writes, these sheets are
+        copied from the original file when the workbook is saved, the same
+        as the sheets that were not loaded.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        list
+            The names of the clean sheets, in workbook order.
+
+        Examples
+        --------
+        >>> cosmo = Cosmo("report_q3.xlsx", elide_writes=True)
+        >>> cosmo.UpdateRange({'Inputs': 'B1'}, 0.05)
+        1
+        >>> cosmo.get_clean_sheets()
+        ['Summary', 'Detail']
+        """
+        return [sheet for sheet in self.loaded_sheets if sheet not in self.dirty_sheets]
+
+    # function to query a spatial index of ranges
+    def _query_range_index(self, index, sheet_name, cell_range, how):
+        queries = {'overlapping': index.overlapping, 'containing': index.containing, 'within': index.within}
+        if how not in queries:
+            raise ValueError(f"how must be one of {list(queries)}, not {how}.")
+        if sheet_name not in self.sheet_names:
+            raise ValueError(f"The sheet {sheet_name} is not in the workbook.")
+        return queries[how](sheet_name, cell_range)
+
+    # function to find the named ranges at a range
+    def find_names(self, sheet_name, cell_range, how="overlapping"):
+        """
+        Description
+        -----------
+        Find the named ranges that meet a range of cells (or cover a cell),
+        contain it, or lie inside it, through a spatial index of the
+        ranges of the names, built the first time it is needed.
+
+        Parameters
+        ----------
+        sheet_name : str
+            The name of the sheet.
+        cell_range : str or tuple
+            The range of cells, in A1 notation (e.g. "D14" or "B2:C10"),
+            or a (row, column) tuple for a single cell.
+        how : str, optional
+            "overlapping" for the names that meet the range,
+            "containing" for the names that contain all of it, or
+            "within" for the names that lie inside it.
+            Default is "overlapping".
+
+        Returns
+        -------
+        list
+            The names, where names scoped to a sheet are given as "Sheet!name".
+
+        Raises
+        ------
+        ValueError
+            If the workbook is an xlsb file, the sheet is not in the
+            workbook, or how is not one of the choices.
+
+        Imports
+        -------
+        from .src.range_index import build_name_range_index
+
+        Examples
+        --------
+        >>> cosmo.find_names("Inputs", "D14")
+        ['rates', 'growth_rate']
+        """
+        if self.is_xlsb:
+            raise ValueError("Finding names by range is not supported for xlsb workbooks.")
+        if self.name_range_index is None:
+            self.name_range_index = build_name_range_index(self.wb)
+        return self._query_range_index(self.name_range_index, sheet_name, cell_range, how)
+
+    # function to find the logged writes at a range
+    def find_writes(self, sheet_name, cell_range, how="overlapping"):
+        """
+        Description
+        -----------
+        Find the writes of the cosmo log (update_range and
+        update_named_ranges actions) that meet a range of cells, contain
+        it, or lie inside it, through a spatial index of the ranges
+        written, which is kept up to date as actions are logged.
+
+        Parameters
+        ----------
+        sheet_name : str
+            The name of the sheet.
+        cell_range : str or tuple
+            The range of cells, in A1 notation, or a (row, column) tuple.
+        how : str, optional
+            "overlapping", "containing" or "within", as for `find_names`.
+            Default is "overlapping".
+
+        Returns
+        -------
+        list
+            The writes, in the order they were logged, as dictionaries of
+            the form {'index': position of the action in the cosmo log,
+            'action': str, 'target': the range or the name written}.
+
+        Raises
+        ------
+        ValueError
+            If the sheet is not in the workbook, or how is not one of the choices.
+
+        Imports
+        -------
+        from .src.range_index import RangeIndex, iter_logged_writes
+
+        Examples
+        --------
+        >>> cosmo.UpdateRange({"Inputs": "B10:D20"}, 0)
+        >>> cosmo.find_writes("Inputs", "D14")
+        [{'index': 0, 'action': 'update_range', 'target': 'Inputs!B10:D20'}]
+        """
+        if self.write_index is None:
+            self.write_index = RangeIndex()
+            self._indexed_log_length = 0
+        for sheet, bounds, write in iter_logged_writes(self.cosmo_log, self.name_index,
+                                                       start=self._indexed_log_length):
+            self.write_index.add(sheet, bounds, write)
+        self._indexed_log_length = len(self.cosmo_log)
+        return self._query_range_index(self.write_index, sheet_name, cell_range, how)
+
+    # function to export sheets and named ranges to columnar files
+    def export(self, output_dir, sheets=None, named_ranges=None, file_format="parquet",
+               header=True, batch_size=65536, strict=False):
+        """
+        Description
+        -----------
+        Export sheets and named ranges of the workbook file to Parquet or
+        Feather files, one for each sheet or named range, streaming the
+        rows into Arrow record batches so no sheet is held in memory.
+        The values are read from the workbook file, so changes that have
+        not been saved are not exported. Needs pyarrow.
+
+        Parameters
+        ----------
+        output_dir : str
+            The directory to write the files to.
+        sheets : list, optional
+            The names of the sheets to export.
+            Default is None, which exports every sheet if no named ranges are given.
+        named_ranges : list, optional
+            The names of the named ranges to export.
+        file_format : str, optional
+            "parquet" or "feather". Default is "parquet".
+        header : bool, optional
+            Whether the first row of each sheet or named range has the
+            column names. Default is True.
+        batch_size : int, optional
+            The number of rows in each record batch. Default is 65536.
+        strict : bool, optional
+            Whether to raise an error for a value that does not fit the
+            type of its column, instead of writing it as a null.
+            Default is False.
+
+        Returns
+        -------
+        dict
+            Dictionary where the keys are the sheet names and named range
+            names, and the values are dictionaries with the path, the
+            number of rows, the column types and the number of values
+            that did not fit the type of their column.
+
+        Imports
+        -------
+        from .src.export_sheets import export_sheets
+
+        Examples
+        --------
+        >>> cosmo.export("snapshots", sheets=["Detail"], named_ranges=["rates"])
+        {'Detail': {'path': 'snapshots/Detail.parquet', 'rows': 5000, ...}, 'rates': {...}}
+        """
+        return export_sheets(self.workbook_file_path, output_dir, sheets=sheets, named_ranges=named_ranges,
+                             file_format=file_format, header=header, batch_size=batch_size, strict=strict)
+
+    # function to save the cosmo macro
+    def SaveCosmoMacro(self, file_path, file_format="json"):
+        """
+        Description
+        -----------
+        Save the cosmo macro (the actions performed on the workbook so far)
+        to a file, usually with the file extension .cosmomacro, so it
+        can be run on another workbook with the RunCosmoMacro method.
+
+        Parameters
+        ----------
+        file_path : str
+            The file path to save the cosmo macro to.
+        file_format : str, optional
+            The file format: "json", or "msgpack", which saves the large
+            blocks of values written with UpdateRange as sidecar arrays in
+            a directory next to the macro file, read only when the macro
+            runs (see `save_cosmo_macro_msgpack`).
+            Default is "json".
+
+        Returns
+        -------
+        str
+            The file path of the saved cosmo macro.
+
+        Raises
+        ------
+        ValueError
+            If the file format is not "json" or "msgpack".
+
+        Imports
+        -------
+        from .src.save_cosmo_macro import save_cosmo_macro
+
+        Examples
+        --------
+        >>> cosmo.UpdateNamedRanges({'growth_rate': 0.07})
+        >>> cosmo.SaveCosmoMacro("roll_forward.cosmomacro")
+        'roll_forward.cosmomacro'
+        >>> cosmo.SaveCosmoMacro("monthly_load.cosmomacro", file_format="msgpack")
+        'monthly_load.cosmomacro'
+        """
+        return save_cosmo_macro(self.cosmo_macro, file_path, file_format=file_format)
+
+    # function to load a cosmo macro
+    def LoadCosmoMacro(self, cosmo_macro):
+        """
+        Description
+        -----------
+        Load a cosmo macro to run on the workbook with the RunCosmoMacro method.
+
+        Parameters
+        ----------
+        cosmo_macro : str or dict
+            The file path of the cosmo macro, or the cosmo macro itself.
+
+        Returns
+        -------
+        dict
+            The cosmo macro.
+
+        Raises
+        ------
+        ValueError
+            If the cosmo macro does not have a cosmo_log list of actions.
+
+        Notes
+        -----
+        The workbook is already open, so every sheet it was opened with
+        stays loaded. To only load the sheets the macro writes to, give
+        the macro when the workbook is opened instead, as in
+        Cosmo(workbook_file_path, cosmo_macro=...).
+
+        Imports
+        -------
+        from .src.load_cosmo_macro import load_cosmo_macro
+
+        Examples
+        --------
+        >>> cosmo.LoadCosmoMacro("roll_forward.cosmomacro")
+        {'cosmo_log': [{'action': 'update_named_ranges', ...}]}
+        """
+        self.loaded_cosmo_macro = load_cosmo_macro(cosmo_macro)
+        return self.loaded_cosmo_macro
+
+    # function to run a cosmo macro
+    def RunCosmoMacro(self, cosmo_macro=None):
+        """
+        Description
+        -----------
+        Run the actions of a cosmo macro on the workbook, in order.
+        Each action is logged to the cosmo log as it runs, the same as
+        when the method is called directly.
+
+        Every action is checked before any of them is run, so a macro
+        with an action that cannot be run does not leave the workbook
+        half updated, and a warning is printed for each write that writes
+        over cells an earlier write of the macro wrote (see `get_macro_conflicts`).
+
+        Parameters
+        ----------
+        cosmo_macro : str or dict, optional
+            The file path of the cosmo macro, or the cosmo macro itself.
+            Default is None, which runs the loaded cosmo macro.
+
+        Returns
+        -------
+        int
+            The number of actions run.
+
+        Raises
+        ------
+        ValueError
+            If no cosmo macro is given or loaded.
+        ValueError
+            If the cosmo macro has an action that cannot be run.
+        ValueError
+            If a splice_cells action rewrites a sheet in place that has
+            writes that are not saved, or that later actions write to.
+
+        Notes
+        -----
+        stream_rows actions are skipped with a warning, since the rows
+        they wrote are not kept in the macro. Write the rows again with
+        StreamRows after the macro runs.
+
+        Imports
+        -------
+        from .src.load_cosmo_macro import load_cosmo_macro
+
+        Examples
+        --------
+        >>> # only the sheets the macro writes to are loaded
+        >>> cosmo = Cosmo("report_q3.xlsx", cosmo_macro="roll_forward.cosmomacro")
+        >>> cosmo.loaded_sheets
+        ['Inputs']
+        >>> cosmo.RunCosmoMacro()
+        Workbook saved to: report_q3_2024-10-01_09-00-00.xlsx
+        3
+        """
+        # get the cosmo macro to run
+        if cosmo_macro is not None:
+            self.LoadCosmoMacro(cosmo_macro)
+        if self.loaded_cosmo_macro is None:
+            raise ValueError("No cosmo macro is loaded. Load one with the LoadCosmoMacro method.")
+        actions = self.loaded_cosmo_macro['cosmo_log']
+
+        # check every action before running any of them
+        # the writes of update_range actions were checked when they were
+        # logged, so only their sheets and ranges are looked up
+        # the sheets spliced in place cannot have writes that were not saved,
+        # and cannot be written to once they are spliced (and unloaded)
+        runnable_actions = ['update_links', 'update_named_ranges', 'update_range', 'recalculate', 'save',
+                            'splice_cells']
+        skipped_actions = ['stream_rows']
+        writes = {}
+        written = set()
+        spliced = set()
+        for index, action in enumerate(actions):
+            if action['action'] in skipped_actions:
+                continue
+            if action['action'] not in runnable_actions:
+                raise ValueError(f"The cosmo macro action {action['action']} cannot be run. " +
+                                 f"Cosmo macros can run the actions {runnable_actions}.")
+            if action['action'] == 'update_range':
+                writes[index] = [trusted_write_request(self.wb.sheetnames, **write) for write in action['writes']]
+            if action['action'] in ('update_range', 'update_named_ranges'):
+                sheets = get_macro_sheets({'cosmo_log': [action]}, self.workbook_file_path)
+                if spliced.intersection(sheets):
+                    raise ValueError(f"The cosmo macro action {index} writes to the sheets "
+                                     f"{sorted(spliced.intersection(sheets))}, which an earlier "
+                                     f"splice_cells action rewrote in the workbook file.")
+                written.update(sheets)
+            elif action['action'] == 'save' and not action.get('is_copy', True):
+                written.clear()
+            elif action['action'] == 'splice_cells' and action.get('new_filename') is None:
+                missing = [sheet for sheet in action['cells'] if sheet not in self.wb.sheetnames]
+                if missing:
+                    raise ValueError(f"The sheets {missing} of the cosmo macro action {index} are not in the workbook.")
+                if written.intersection(action['cells']):
+                    raise ValueError(f"The cosmo macro action {index} splices cells into the sheets "
+                                     f"{sorted(written.intersection(action['cells']))}, which have writes "
+                                     f"of the macro that are not saved to the workbook file.")
+                self._check_file_writes(list(action['cells']))
+                spliced.update(action['cells'])
+
+        # warn about the writes that write over earlier writes of the macro
+        for conflict in find_write_conflicts(actions, self.name_index):
+            print(f"Warning: {conflict['second']['target']} (action {conflict['second']['index']}) writes over "
+                  f"{conflict['first']['target']} (action {conflict['first']['index']}) "
+                  f"at {conflict['sheet']}!{conflict['range']}.")
+
+        # run the actions in order
+        for index, action in enumerate(actions):
+            if action['action'] == 'update_links':
+                self.UpdateLinks(action['links'])
+            elif action['action'] == 'update_named_ranges':
+                self.UpdateNamedRanges(action['named_ranges'])
+            elif action['action'] == 'update_range':
+                counts = {}
+                self._execute_writes(writes[index], counts)
+                elided = self._record_writes(counts)
+                self.cosmo_log.append({
+                    'action': 'update_range'
+                    , 'writes': action['writes']
+                    , 'elided': elided
+                    , "timestamp": datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                })
+                self.cosmo_macro['cosmo_log'] = self.cosmo_log
+            elif action['action'] == 'recalculate':
+                self.Recalculate()
+            elif action['action'] == 'splice_cells':
+                self.SpliceCells(action['cells'], new_filename=action.get('new_filename'))
+            elif action['action'] == 'stream_rows':
+                print(f"Warning: The cosmo macro action {index} (stream_rows) was skipped, "
+                      "since the rows it wrote are not kept in the macro.")
+            elif action['action'] == 'save':
+                self.Save(is_copy=action.get('is_copy', True), new_filename=action.get('new_filename'),
+                          compression=action.get('compression'))
+
+        return len(actions)
+
+    # function to get the sheets a cosmo macro writes to
+    def get_macro_sheets(self, cosmo_macro=None):
+        """
+        Description
+        -----------
+        Get the sheets of the workbook that a cosmo macro writes to,
+        which are the sheets that need to be loaded to run it.
+
+        Parameters
+        ----------
+        cosmo_macro : str or dict, optional
+            The file path of the cosmo macro, or the cosmo macro itself.
+            Default is None, which uses the loaded cosmo macro.
+
+        Returns
+        -------
+        list
+            The names of the sheets the macro writes to, in workbook order.
+
+        Raises
+        ------
+        ValueError
+            If no cosmo macro is given or loaded.
+        ValueError
+            If a named range of the macro is not in the workbook.
+
+        Imports
+        -------
+        from .src.get_macro_sheets import get_macro_sheets
+
+        Examples
+        --------
+        >>> cosmo.get_macro_sheets("roll_forward.cosmomacro")
+        ['Inputs']
+        """
+        if cosmo_macro is not None:
+            cosmo_macro = load_cosmo_macro(cosmo_macro)
+        elif self.loaded_cosmo_macro is not None:
+            cosmo_macro = self.loaded_cosmo_macro
+        else:
+            raise ValueError("No cosmo macro is loaded. Load one with the LoadCosmoMacro method.")
+        return get_macro_sheets(cosmo_macro, self.workbook_file_path)
+
+    # function to get the writes of a cosmo macro that write over each other
+    def get_macro_conflicts(self, cosmo_macro=None):
+        """
+        Description
+        -----------
+        Get the writes of a cosmo macro that write over cells an earlier
+        write of the macro wrote, so the earlier values are lost when the
+        macro runs. The writes are the ranges of update_range actions and
+        the named ranges of update_named_ranges actions.
+
+        Parameters
+        ----------
+        cosmo_macro : str or dict, optional
+            The file path of the cosmo macro, or the cosmo macro itself.
+            Default is None, which uses the loaded cosmo macro.
+
+        Returns
+        -------
+        list
+            The conflicts, as given by `find_write_conflicts`.
+
+        Raises
+        ------
+        ValueError
+            If no cosmo macro is given or loaded.
+
+        Imports
+        -------
+        from .src.range_index import find_write_conflicts
+
+        Examples
+        --------
+        >>> cosmo.get_macro_conflicts("roll_forward.cosmomacro")
+        [{'sheet': 'Inputs', 'range': 'D14',
+          'first': {'index': 0, 'action': 'update_named_ranges', 'target': 'growth_rate'},
+          'second': {'index': 2, 'action': 'update_range', 'target': 'Inputs!B10:D20'}}]
+        """
+        if cosmo_macro is not None:
+            cosmo_macro = load_cosmo_macro(cosmo_macro)
+        elif self.loaded_cosmo_macro is not None:
+            cosmo_macro = self.loaded_cosmo_macro
+        else:
+            raise ValueError("No cosmo macro is loaded. Load one with the LoadCosmoMacro method.")
+        return find_write_conflicts(cosmo_macro.get('cosmo_log', []), self.name_index)
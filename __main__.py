@@ -0,0 +1,11 @@
+"""
+__main__.py
+
+Run the cosmo command line interface with `python -m excel_utils`.
+"""
+import sys
+
+from .cli import main
+
+
+sys.exit(main())
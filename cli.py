@@ -0,0 +1,585 @@
+"""
+cli.py
+
+The cosmo command line interface, for running routine workbook updates
+from a scheduler or a shell:
+
+    python -m excel_utils inspect "reports/*.xlsx" --json
+    python -m excel_utils names report.xlsx --set growth_rate=0.07
+    python -m excel_utils links "reports/**/*.xlsx" --replace old.xlsx=new.xlsx --jobs 4
+    python -m excel_utils run-macro roll_forward.cosmomacro "reports/*.xlsx" --dry-run
+    python -m excel_utils run-macro nightly.cosmomacro "reports/*.xlsx" --manifest nightly.manifest.json
+    python -m excel_utils roll-quarter "reports/*2Q2024*.xlsx" --name-quarter quarter
+    python -m excel_utils diff report.xlsx report_copy.xlsx
+    python -m excel_utils check-links "reports/**/*.xlsx" --problems
+    python -m excel_utils fan-out regional_template.xlsx regions.json --jobs 8
+    python -m excel_utils links "//fileserver/finance/*.xlsx" --replace old.xlsx=new.xlsx --stage-dir C:/staging
+
+The project is imported as `excel_utils` (the checkout directory, with its
+parent directory on the path), so the command is run with `python -m`.
+No `cosmo` console script is declared, since the project is not packaged;
+`main` is the function one would point at.
+Only the standard library is imported up front, and each subcommand
+imports what it needs when it runs, so the command starts quickly.
+
+Exit status is 0 if every file succeeded, 1 if any file failed,
+and 2 if the arguments are not valid or no files matched.
+"""
+import argparse
+import contextlib
+import glob
+import json
+import os
+import sys
+
+
+def expand_paths(patterns):
+    """
+    Description
+    -----------
+    Expand the file path arguments, which can be glob patterns
+    (with ** for any number of directories), into file paths.
+
+    Parameters
+    ----------
+    patterns : list
+        The file paths and glob patterns.
+
+    Returns
+    -------
+    tuple
+        Tuple of the form (file_paths, unmatched), where file_paths is the
+        list of matching file paths in order without duplicates, and
+        unmatched is the list of the patterns that matched nothing.
+
+    Imports
+    -------
+    glob
+    os
+
+    Examples
+    --------
+    >>> expand_paths(["reports/*.xlsx", "missing.xlsx"])
+    (['reports/a.xlsx', 'reports/b.xlsx'], ['missing.xlsx'])
+    """
+    file_paths = []
+    unmatched = []
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            matches = sorted(path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path))
+        else:
+            matches = [pattern] if os.path.isfile(pattern) else []
+        if not matches:
+            unmatched.append(pattern)
+        file_paths.extend(path for path in matches if path not in file_paths)
+    return file_paths, unmatched
+
+
+def parse_assignments(assignments, parse_values=False):
+    """
+    Description
+    -----------
+    Parse NAME=VALUE arguments into a dictionary.
+
+    Parameters
+    ----------
+    assignments : list
+        The NAME=VALUE arguments.
+    parse_values : bool, optional
+        Whether to read each value as json (so numbers, lists, true and
+        false keep their types), falling back to the text as it is.
+        Default is False.
+
+    Returns
+    -------
+    dict
+        Dictionary of the names and their values.
+
+    Raises
+    ------
+    ValueError
+        If an argument has no "=".
+
+    Imports
+    -------
+    json
+
+    Examples
+    --------
+    >>> parse_assignments(["growth_rate=0.07", "label=Q3"], parse_values=True)
+    {'growth_rate': 0.07, 'label': 'Q3'}
+    """
+    parsed = {}
+    for assignment in assignments or []:
+        name, separator, value = assignment.partition("=")
+        if not separator or not name:
+            raise ValueError(f"{assignment} is not of the form NAME=VALUE.")
+        if parse_values:
+            try:
+                value = json.loads(value)
+            except ValueError:
+                pass
+        parsed[name] = value
+    return parsed
+
+
+def get_save_recalculate(cosmo):
+    # recalculating reads every sheet, which is only needed when there are
+    # loaded sheets whose formulas openpyxl would save without values
+    return bool(cosmo.loaded_sheets)
+
+
+def stage_file(file_path, options):
+    # the local copy of the file to read, when the files are staged
+    # (see `StagingCache`), or the file itself
+    staging_cache = options.get('staging_cache')
+    return file_path if staging_cache is None else staging_cache.stage(file_path)
+
+
+def inspect_workbook(file_path, options):
+    """
+    Get the sheets, named ranges and links of a workbook, read from the
+    workbook file without loading it. For xlsb files only the sheets are given.
+    """
+    local_path = stage_file(file_path, options)
+    if file_path.lower().endswith(".xlsb"):
+        from .src.open_workbook import open_workbook_pyxlsb
+        with open_workbook_pyxlsb(local_path) as wb:
+            return {'format': 'xlsb', 'size': os.path.getsize(local_path), 'sheets': list(wb.sheets)}
+
+    from .src.diff_workbooks import read_defined_names
+    from .src.find_links import find_links_openpyxl
+    from .src.get_sheet_parts import get_sheet_parts
+    from .src.mapped_zip import get_mapped_zip
+
+    with get_mapped_zip(local_path) as zf:
+        sheets = [{'name': sheet, 'part': part,
+                   'size': zf.getinfo(part).file_size if part in zf.NameToInfo else None}
+                  for sheet, part in get_sheet_parts(zf).items()]
+        names = read_defined_names(zf)
+    return {
+        'format': os.path.splitext(file_path)[1].lstrip(".").lower(),
+        'size': os.path.getsize(local_path),
+        'sheets': sheets,
+        'named_ranges': len(names),
+        'links': find_links_openpyxl(local_path),
+    }
+
+
+def update_names(file_path, options):
+    """
+    List the named ranges of a workbook, or set their values and save it,
+    loading only the sheets the named ranges point to.
+    """
+    from .src.diff_workbooks import read_defined_names
+    from .src.mapped_zip import get_mapped_zip
+
+    local_path = stage_file(file_path, options)
+    with get_mapped_zip(local_path) as zf:
+        names = read_defined_names(zf)
+    if not options['set']:
+        return {'named_ranges': names}
+
+    from .src.get_macro_sheets import get_macro_sheets
+    macro = {'cosmo_log': [{'action': 'update_named_ranges', 'named_ranges': options['set']}]}
+    sheets = get_macro_sheets(macro, local_path)
+    if options['dry_run']:
+        return {'set': options['set'], 'sheets': sheets}
+
+    from .Cosmo import Cosmo
+    cosmo = Cosmo(file_path, sheets=sheets, staging_cache=options.get('staging_cache'))
+    cosmo.UpdateNamedRanges(options['set'])
+    saved = cosmo.Save(is_copy=not options['in_place'], compression=options['compression'])
+    return {'set': options['set'], 'sheets': sheets, 'saved': saved}
+
+
+def update_file_links(file_path, options):
+    """
+    List the links of a workbook, or replace them and save it,
+    without loading any of its worksheets.
+    """
+    from .src.find_links import find_links_openpyxl
+
+    links = find_links_openpyxl(stage_file(file_path, options))
+    if not options['replace']:
+        return {'links': links}
+
+    replace = {link: new_link for link, new_link in options['replace'].items() if link in links}
+    if options['dry_run'] or not replace:
+        return {'links': links, 'replace': replace, 'saved': None}
+
+    from .Cosmo import Cosmo
+    cosmo = Cosmo(file_path, sheets=[], staging_cache=options.get('staging_cache'))
+    cosmo.UpdateLinks(replace)
+    saved = cosmo.Save(is_copy=not options['in_place'], recalculate=get_save_recalculate(cosmo),
+                       compression=options['compression'])
+    return {'links': cosmo.links, 'replace': replace, 'saved': saved}
+
+
+def run_macro(file_path, options):
+    """
+    Run a cosmo macro on a workbook, loading only the sheets it writes to.
+    """
+    from .src.get_macro_sheets import get_macro_sheets
+
+    macro = options['cosmo_macro']
+    if options['dry_run']:
+        return {'sheets': get_macro_sheets(macro, stage_file(file_path, options)),
+                'actions': [action['action'] for action in macro['cosmo_log']]}
+
+    from .Cosmo import Cosmo
+    cosmo = Cosmo(file_path, cosmo_macro=macro, staging_cache=options.get('staging_cache'))
+    cosmo.RunCosmoMacro()
+    return {'sheets': cosmo.loaded_sheets, 'cosmo_log': cosmo.cosmo_log}
+
+
+def roll_quarter(file_path, options):
+    """
+    Roll a quarterly workbook forward a quarter: save it under the file
+    name of the next quarter, with the links that name its quarter pointed
+    to the next quarter, and the quarter and year named ranges updated.
+    """
+    from .src.find_links import find_links_openpyxl
+    from .src.get_next_quarter_year import get_next_quarter_year
+    from .src.get_quarter_year import get_quarter_year
+    from .src.roll_quarter_text import roll_quarter_text
+
+    # find the quarter of the workbook, and the next quarter
+    quarter, year = get_quarter_year(os.path.basename(file_path))
+    next_year, next_quarter = get_next_quarter_year(year, quarter)
+
+    # the file path of the next quarter
+    directory = options['output_dir'] or os.path.dirname(file_path)
+    new_file_path = os.path.join(
+        directory, roll_quarter_text(os.path.basename(file_path), year, quarter, next_year, next_quarter))
+    if os.path.exists(new_file_path) and not options['overwrite']:
+        raise ValueError(f"The file {new_file_path} already exists. Use --overwrite to replace it.")
+
+    # the links and named ranges to update
+    local_path = stage_file(file_path, options)
+    links = {link: roll_quarter_text(link, year, quarter, next_year, next_quarter)
+             for link in find_links_openpyxl(local_path)}
+    links = {link: new_link for link, new_link in links.items() if new_link != link}
+    named_ranges = {}
+    if options['name_quarter']:
+        named_ranges[options['name_quarter']] = next_quarter
+    if options['name_year']:
+        named_ranges[options['name_year']] = next_year
+
+    from .src.get_macro_sheets import get_macro_sheets
+    sheets = get_macro_sheets(
+        {'cosmo_log': [{'action': 'update_named_ranges', 'named_ranges': named_ranges}]}, local_path)
+    plan = {
+        'quarter': f"{quarter}Q{year}",
+        'next_quarter': f"{next_quarter}Q{next_year}",
+        'new_file_path': new_file_path,
+        'links': links,
+        'named_ranges': named_ranges,
+        'sheets': sheets,
+    }
+    if options['dry_run']:
+        return plan
+
+    from .Cosmo import Cosmo
+    cosmo = Cosmo(file_path, sheets=sheets, staging_cache=options.get('staging_cache'))
+    if links:
+        cosmo.UpdateLinks(links)
+    if named_ranges:
+        cosmo.UpdateNamedRanges(named_ranges)
+    plan['saved'] = cosmo.Save(is_copy=True, new_filename=os.path.abspath(new_file_path),
+                               recalculate=get_save_recalculate(cosmo), compression=options['compression'])
+    return plan
+
+
+def run_job(job, file_path, options):
+    """
+    Run one subcommand on one file, catching its error, with anything it
+    prints sent to stderr so stdout only has the results.
+    """
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            return {'file': file_path, 'ok': True, **job(file_path, options)}
+    except Exception as error:
+        return {'file': file_path, 'ok': False, 'error': f"{type(error).__name__}: {error}"}
+
+
+def run_jobs(job, file_paths, options, jobs=1):
+    """
+    Run a subcommand on each file, in a pool of processes if jobs is more than 1.
+    The results are in the same order as the files. When the files are
+    staged, they are all copied first, a few at a time, so the pool of
+    processes does not copy more of them at once than the staging cache allows.
+    """
+    if options.get('staging_cache') is not None:
+        options['staging_cache'].stage_many(file_paths)
+
+    if jobs <= 1 or len(file_paths) <= 1:
+        return [run_job(job, file_path, options) for file_path in file_paths]
+
+    import concurrent.futures
+    with concurrent.futures.ProcessPoolExecutor(max_workers=min(jobs, len(file_paths))) as pool:
+        return list(pool.map(run_job, [job] * len(file_paths), file_paths, [options] * len(file_paths)))
+
+
+def format_result(result, indent="  "):
+    """
+    Format a result as indented lines of text, for people to read.
+    """
+    lines = []
+    for key, value in result.items():
+        if isinstance(value, dict) and value:
+            lines.append(f"{indent}{key}:")
+            lines.extend(f"{indent}  {name}: {item}" for name, item in value.items())
+        elif isinstance(value, list) and value:
+            lines.append(f"{indent}{key}:")
+            lines.extend(f"{indent}  {item}" for item in value)
+        else:
+            lines.append(f"{indent}{key}: {value}")
+    return "\n".join(lines)
+
+
+def write_output(command, results, as_json):
+    """
+    Write the results to stdout, as one json document or as text.
+    """
+    if as_json:
+        json.dump({'command': command, 'results': results}, sys.stdout, indent=2, default=str)
+        sys.stdout.write("\n")
+        return
+    for result in results:
+        status = "ok" if result.get('ok', True) else "FAILED"
+        details = {key: value for key, value in result.items() if key not in ('file', 'ok')}
+        sys.stdout.write(f"{result.get('file', command)}: {status}\n")
+        if details:
+            sys.stdout.write(format_result(details) + "\n")
+
+
+def build_parser():
+    """
+    Build the argument parser of the command line interface.
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m excel_utils", description="Inspect and update routine Excel reports.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def add_file_command(name, help_text):
+        subparser = subparsers.add_parser(name, help=help_text, description=help_text)
+        subparser.add_argument("files", nargs="+", help="workbook files or glob patterns")
+        subparser.add_argument("--jobs", "-j", type=int, default=1,
+                               help="number of files to work on at once (default 1)")
+        subparser.add_argument("--json", action="store_true", help="write the results as json")
+        return subparser
+
+    def add_staging_options(subparser):
+        subparser.add_argument("--stage-dir", metavar="DIR",
+                               help="copy each workbook to this local directory once, work on the copy, "
+                                    "and upload saves back in one copy (for workbooks on network shares)")
+        subparser.add_argument("--stage-transfers", type=int, default=4, metavar="N",
+                               help="with --stage-dir, number of copies to or from the share at once (default 4)")
+
+    def add_compression_option(subparser):
+        subparser.add_argument("--compression", choices=["stored", "fast", "balanced", "small"],
+                               help="compress the saved workbooks with this profile, with a pool of "
+                                    "threads (default: as openpyxl saves them)")
+
+    inspect = add_file_command("inspect", "List the sheets, named ranges and links of workbooks.")
+    add_staging_options(inspect)
+
+    names = add_file_command("names", "List the named ranges of workbooks, or set their values.")
+    names.add_argument("--set", action="append", metavar="NAME=VALUE",
+                       help="value to set a named range to (read as json if it can be)")
+    names.add_argument("--in-place", action="store_true",
+                       help="save over the workbook instead of saving a copy")
+    names.add_argument("--dry-run", action="store_true", help="show what would change without saving")
+    add_compression_option(names)
+    add_staging_options(names)
+
+    links = add_file_command("links", "List the links of workbooks, or replace them.")
+    links.add_argument("--replace", action="append", metavar="OLD=NEW", help="link to replace")
+    links.add_argument("--in-place", action="store_true",
+                       help="save over the workbook instead of saving a copy")
+    links.add_argument("--dry-run", action="store_true", help="show what would change without saving")
+    add_compression_option(links)
+    add_staging_options(links)
+
+    macro = subparsers.add_parser("run-macro", help="Run a cosmo macro on workbooks.",
+                                  description="Run a cosmo macro on workbooks.")
+    macro.add_argument("cosmo_macro", help="the cosmo macro file")
+    macro.add_argument("files", nargs="+", help="workbook files or glob patterns")
+    macro.add_argument("--jobs", "-j", type=int, default=1,
+                       help="number of files to work on at once (default 1)")
+    macro.add_argument("--json", action="store_true", help="write the results as json")
+    macro.add_argument("--dry-run", action="store_true",
+                       help="show the sheets that would be loaded and the actions, without running them")
+    macro.add_argument("--manifest", metavar="FILE",
+                       help="only run the workbooks whose links, files or macro changed since the "
+                            "fingerprints in this manifest, in dependency order, and update it")
+    macro.add_argument("--force", action="store_true",
+                       help="with --manifest, run every workbook and record new fingerprints")
+    add_staging_options(macro)
+
+    roll = add_file_command("roll-quarter", "Roll quarterly workbooks forward to the next quarter.")
+    roll.add_argument("--name-quarter", metavar="NAME", help="named range to set to the next quarter")
+    roll.add_argument("--name-year", metavar="NAME", help="named range to set to the year of the next quarter")
+    roll.add_argument("--output-dir", metavar="DIR", help="directory to save to (default: next to each workbook)")
+    roll.add_argument("--overwrite", action="store_true", help="replace a next quarter file that exists")
+    roll.add_argument("--dry-run", action="store_true", help="show what would change without saving")
+    add_compression_option(roll)
+    add_staging_options(roll)
+
+    diff = subparsers.add_parser("diff", help="Compare two versions of a workbook.",
+                                 description="Compare two versions of a workbook.")
+    diff.add_argument("old_file", help="the old version")
+    diff.add_argument("new_file", help="the new version")
+    diff.add_argument("--json", action="store_true", help="write the results as json")
+
+    check = subparsers.add_parser("check-links", help="Check the files the links of workbooks point to.",
+                                  description="Check that the files the links of workbooks point to "
+                                              "are there and not newer than the workbooks.")
+    check.add_argument("files", nargs="+", help="workbook files or glob patterns")
+    check.add_argument("--jobs", "-j", type=int, default=32,
+                       help="number of files to check at once (default 32)")
+    check.add_argument("--problems", action="store_true", help="only show the links that are not ok")
+    check.add_argument("--case-sensitive", action="store_true",
+                       help="only find linked files whose names match the case of the links")
+    check.add_argument("--json", action="store_true", help="write the results as json")
+
+    fan_out = subparsers.add_parser("fan-out", help="Generate many workbooks from one template.",
+                                    description="Generate many workbooks from one template.")
+    fan_out.add_argument("template", help="the template workbook")
+    fan_out.add_argument("variants", help="json file with the list of variants to generate")
+    fan_out.add_argument("--jobs", "-j", type=int, default=1,
+                         help="number of workbooks to generate at once (default 1)")
+    fan_out.add_argument("--json", action="store_true", help="write the results as json")
+
+    return parser
+
+
+def main(argv=None):
+    """
+    Description
+    -----------
+    Run the command line interface.
+
+    Parameters
+    ----------
+    argv : list, optional
+        The arguments, without the program name.
+        Default is None, which uses sys.argv.
+
+    Returns
+    -------
+    int
+        The exit status: 0 if every file succeeded, 1 if any file failed,
+        and 2 if the arguments are not valid or no files matched.
+
+    Examples
+    --------
+    >>> main(["inspect", "reports/*.xlsx", "--json"])
+    0
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    # compare two files
+    if args.command == "diff":
+        from .src.diff_workbooks import diff_workbooks
+        try:
+            with contextlib.redirect_stdout(sys.stderr):
+                result = {'file': args.new_file, 'ok': True, 'old_file': args.old_file,
+                          **diff_workbooks(args.old_file, args.new_file)}
+        except Exception as error:
+            result = {'file': args.new_file, 'ok': False, 'error': f"{type(error).__name__}: {error}"}
+        write_output(args.command, [result], args.json)
+        return 0 if result['ok'] else 1
+
+    # check the links of all the files at once, so each folder is listed once
+    if args.command == "check-links":
+        from .src.check_links import check_links
+        if args.jobs < 1:
+            parser.error("--jobs must be at least 1")
+        file_paths, unmatched = expand_paths(args.files)
+        for pattern in unmatched:
+            sys.stderr.write(f"cosmo: no files match {pattern}\n")
+        if not file_paths:
+            return 2
+        links = check_links(file_paths, max_workers=args.jobs, case_sensitive=args.case_sensitive)
+        problems = [link for link in links if link['status'] not in ('ok', 'unresolved')]
+        results = [{'file': link.pop('workbook'), 'ok': link['status'] in ('ok', 'unresolved'), **link}
+                   for link in (problems if args.problems else links)]
+        write_output(args.command, results, args.json)
+        return 0 if not problems and not unmatched else 1
+
+    # generate workbooks from a template
+    if args.command == "fan-out":
+        from .src.fan_out_template import fan_out_template
+        if args.jobs < 1:
+            parser.error("--jobs must be at least 1")
+        try:
+            with open(args.variants, encoding="utf-8") as f:
+                variants = json.load(f)
+            results = fan_out_template(args.template, variants, max_workers=args.jobs)
+        except (OSError, ValueError) as error:
+            parser.error(str(error))
+        results = [{'file': result.pop('file_path'), **result} for result in results]
+        write_output(args.command, results, args.json)
+        return 0 if all(result['ok'] for result in results) else 1
+
+    # the options of each subcommand
+    try:
+        if args.command == "inspect":
+            job, options = inspect_workbook, {}
+        elif args.command == "names":
+            job = update_names
+            options = {'set': parse_assignments(args.set, parse_values=True),
+                       'in_place': args.in_place, 'dry_run': args.dry_run, 'compression': args.compression}
+        elif args.command == "links":
+            job = update_file_links
+            options = {'replace': parse_assignments(args.replace),
+                       'in_place': args.in_place, 'dry_run': args.dry_run, 'compression': args.compression}
+        elif args.command == "run-macro":
+            from .src.load_cosmo_macro import load_cosmo_macro
+            job = run_macro
+            options = {'cosmo_macro': load_cosmo_macro(args.cosmo_macro), 'dry_run': args.dry_run}
+        else:
+            job = roll_quarter
+            options = {'name_quarter': args.name_quarter, 'name_year': args.name_year,
+                       'output_dir': args.output_dir, 'overwrite': args.overwrite,
+                       'dry_run': args.dry_run, 'compression': args.compression}
+    except (OSError, ValueError) as error:
+        parser.error(str(error))
+
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if args.stage_dir is not None:
+        from .src.staging_cache import StagingCache
+        try:
+            options['staging_cache'] = StagingCache(args.stage_dir, max_transfers=args.stage_transfers)
+        except (OSError, ValueError) as error:
+            parser.error(str(error))
+    manifest = getattr(args, "manifest", None)
+    if getattr(args, "force", False) and manifest is None:
+        parser.error("--force needs --manifest")
+
+    # find the files, and run the subcommand on each of them
+    file_paths, unmatched = expand_paths(args.files)
+    for pattern in unmatched:
+        sys.stderr.write(f"cosmo: no files match {pattern}\n")
+    if not file_paths:
+        return 2
+
+    # with a manifest, only run the macro on the workbooks that are out of date
+    if manifest is not None:
+        from .src.incremental_refresh import refresh_workbooks
+        try:
+            with contextlib.redirect_stdout(sys.stderr):
+                results = refresh_workbooks(
+                    file_paths, options['cosmo_macro'], manifest,
+                    run=lambda paths: run_jobs(job, paths, options, jobs=args.jobs),
+                    force=args.force, dry_run=args.dry_run)
+        except (OSError, ValueError) as error:
+            parser.error(str(error))
+    else:
+        results = run_jobs(job, file_paths, options, jobs=args.jobs)
+    write_output(args.command, results, args.json)
+    return 0 if all(result['ok'] for result in results) and not unmatched else 1
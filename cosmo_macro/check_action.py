@@ -2,4 +2,5 @@
 checks if the action added to the cosmo macro is valid, and if it already exists
 """
 
-valid_actions = ['add', 'remove', 'update', 'list', 'save', 'load', 'update_named_range', 'update_cell']
\ No newline at end of file
+# the actions that Cosmo logs to the cosmo macro
+valid_actions = ['update_links', 'update_named_ranges', 'update_range', 'recalculate', 'save', 'stream_rows', 'splice_cells']
\ No newline at end of file
@@ -0,0 +1,393 @@
+"""
+check_links.py
+"""
+import concurrent.futures
+import difflib
+import ntpath
+import os
+import urllib.parse
+
+from .find_links import find_links_openpyxl, find_links_pyxlsb
+from .is_xlsb import is_xlsb
+
+
+# the file extensions of the files a link can be rewritten to
+LINK_EXTENSIONS = (".xlsx", ".xlsm", ".xlsb", ".xltx", ".xls", ".csv")
+
+# the number of threads to check the links with, since
+# the time goes on waiting for the file system (often a network share)
+DEFAULT_MAX_WORKERS = 32
+
+
+def resolve_link_target(workbook_path, link):
+    """
+    Description
+    -----------
+    Get the path of the file a link points to, as Excel finds it:
+    relative links are relative to the folder of the workbook, and
+    file urls are turned back into paths.
+
+    Parameters
+    ----------
+    workbook_path : str
+        The file path of the workbook with the link.
+    link : str
+        The link, as given by `find_links`.
+
+    Returns
+    -------
+    str or None
+        The absolute path of the linked file, or None if the link is not
+        to a file (e.g. a web address).
+
+    Imports
+    -------
+    ntpath
+    os
+    urllib.parse
+
+    Examples
+    --------
+    >>> resolve_link_target("/reports/2024/Report2Q2024.xlsx", "../data/Data2Q2024.xlsx")
+    '/reports/data/Data2Q2024.xlsx'
+    >>> resolve_link_target("/reports/Report2Q2024.xlsx", "https://example.com/Data.xlsx")
+    None
+    """
+    target = link
+    if target.lower().startswith("file:"):
+        target = urllib.parse.unquote(urllib.parse.urlparse(target).path)
+        # file:///C:/data/Data.xlsx has the drive after the slash
+        if ntpath.splitdrive(target.lstrip("/"))[0]:
+            target = target.lstrip("/")
+    elif "://" in target:
+        return None
+
+    # links written on Windows use backslashes
+    if os.sep == "/":
+        target = target.replace("\\", "/")
+    if not os.path.isabs(target) and not ntpath.splitdrive(target)[0]:
+        target = os.path.join(os.path.dirname(os.path.abspath(workbook_path)), target)
+    return os.path.normpath(target)
+
+
+def read_workbook_links(file_path):
+    """
+    Description
+    -----------
+    Read the links of a workbook file and when it was last modified,
+    without loading the workbook.
+
+    Parameters
+    ----------
+    file_path : str
+        The file path of the workbook.
+
+    Returns
+    -------
+    tuple
+        The links (list) and the modification time of the workbook
+        (int, in nanoseconds).
+
+    Imports
+    -------
+    os
+    .find_links
+    .is_xlsb
+
+    Examples
+    --------
+    >>> read_workbook_links("Report2Q2024.xlsx")
+    (['Data2Q2024.xlsx'], 1718000000000000000)
+    """
+    mtime_ns = os.stat(file_path).st_mtime_ns
+    links = find_links_pyxlsb(file_path) if is_xlsb(file_path) else find_links_openpyxl(file_path)
+    return links, mtime_ns
+
+
+def list_directory(directory, names, case_sensitive=True):
+    """
+    Description
+    -----------
+    List a directory once, and stat the files in it that links point to.
+
+    Parameters
+    ----------
+    directory : str
+        The directory.
+    names : set
+        The names of the files in the directory to stat.
+    case_sensitive : bool, optional
+        Whether the names must match the case of the files, as on a case
+        sensitive file system. Otherwise they are matched with any case,
+        as on Windows and most network shares.
+        Default is True.
+
+    Returns
+    -------
+    tuple
+        The names of the files in the directory (list) and the
+        modification times of the linked files that are there, as a
+        dictionary keyed by name (as given in names).
+        Both are None if the directory is not there.
+
+    Imports
+    -------
+    os
+
+    Examples
+    --------
+    >>> list_directory("/reports/data", {"Data2Q2024.xlsx"})
+    (['Data1Q2024.xlsx', 'Data2Q2024.xlsx'], {'Data2Q2024.xlsx': 1718000000000000000})
+    """
+    try:
+        entries = list(os.scandir(directory))
+    except (FileNotFoundError, NotADirectoryError, PermissionError):
+        return None, None
+
+    # the entries by name, and by case folded name for names in another case
+    by_name = {entry.name: entry for entry in entries}
+    by_folded_name = {}
+    if not case_sensitive:
+        for entry in entries:
+            by_folded_name.setdefault(entry.name.casefold(), entry)
+    modified = {}
+    for name in names:
+        entry = by_name.get(name) or by_folded_name.get(name.casefold())
+        if entry is None:
+            continue
+        try:
+            if entry.is_file():
+                modified[name] = entry.stat().st_mtime_ns
+        except OSError:
+            pass
+    return [entry.name for entry in entries], modified
+
+
+def suggest_link_targets(link, name, listing, count=3):
+    """
+    Description
+    -----------
+    Suggest links to use instead of a link to a file that is not there,
+    from the files of a folder: the same name in another case first,
+    then the names that start with the same name, and then the names
+    that are closest to it.
+
+    Parameters
+    ----------
+    link : str
+        The link, as it is written in the workbook.
+    name : str
+        The name of the file the link points to.
+    listing : list
+        The names of the files of the folder.
+    count : int, optional
+        The most suggestions to give. Default is 3.
+
+    Returns
+    -------
+    list
+        The suggested links, written the same way as the link,
+        with the name of the file replaced.
+
+    Imports
+    -------
+    difflib
+    ntpath
+    os
+
+    Examples
+    --------
+    >>> suggest_link_targets("..\\data\\Data2Q2024.xlsx", "Data2Q2024.xlsx",
+    ...                      ["Data2Q2024 final.xlsx", "Data1Q2024.xlsx"])
+    ['..\\data\\Data2Q2024 final.xlsx', '..\\data\\Data1Q2024.xlsx']
+    """
+    candidates = [candidate for candidate in listing
+                  if candidate.lower().endswith(LINK_EXTENSIONS) and candidate != name]
+    matches = [candidate for candidate in candidates if candidate.lower() == name.lower()]
+
+    # then the names that add to the name (e.g. "Data2Q2024 final.xlsx")
+    stem = os.path.splitext(name)[0].lower()
+    matches += sorted(candidate for candidate in candidates
+                      if candidate.lower().startswith(stem) and candidate not in matches)
+    by_lower = {candidate.lower(): candidate for candidate in candidates}
+    matches += [by_lower[match] for match in
+                difflib.get_close_matches(name.lower(), list(by_lower), n=count, cutoff=0.6)
+                if by_lower[match] not in matches]
+
+    # keep the folder of the link as it is written
+    folder = link[:len(link) - len(ntpath.basename(link))]
+    return [folder + match for match in matches[:count]]
+
+
+def check_link_targets(links, max_workers=DEFAULT_MAX_WORKERS, case_sensitive=False):
+    """
+    Description
+    -----------
+    Check that the files the links of workbooks point to are there, and
+    whether they changed after the workbooks were saved. Every folder is
+    listed once, by a pool of threads, and only the linked files in it
+    are stat'ed, so many links to the same folders (even on a network
+    share) are quick to check.
+
+    A link is
+        'ok' if the file is there and is older than the workbook,
+        'stale' if the file is there and changed after the workbook was saved,
+        'moved' if the file is not there but a file like it is in the
+            same folder (or the folder of the workbook, if the folder of
+            the link is not there), given as 'suggestions',
+        'missing' if the file is not there and there are no suggestions, or
+        'unresolved' if the link is not to a file.
+
+    Parameters
+    ----------
+    links : dict
+        Dictionary where the keys are the file paths of the workbooks and
+        the values are tuples of their links (list) and modification times
+        (int, in nanoseconds, or None to not check for stale links).
+    max_workers : int, optional
+        The number of threads to use. Default is 32.
+    case_sensitive : bool, optional
+        Whether a link must match the case of its file to find it
+        (see `list_directory`). Default is False, since Excel resolves
+        links on Windows and network shares, which ignore case.
+
+    Returns
+    -------
+    list
+        The links, in order, as dictionaries of the form
+        {'workbook': str, 'link': str, 'path': str, 'status': str,
+         'modified': int or None, 'suggestions': list}.
+
+    Imports
+    -------
+    concurrent.futures
+    ntpath
+    os
+
+    Examples
+    --------
+    >>> check_link_targets({"Report3Q2024.xlsx": (["Data3Q2024.xlsx"], None)})
+    [{'workbook': 'Report3Q2024.xlsx', 'link': 'Data3Q2024.xlsx', 'path': '/reports/Data3Q2024.xlsx',
+      'status': 'moved', 'modified': None, 'suggestions': ['Data3Q2024 final.xlsx']}]
+    """
+    # the linked files by folder, and the folders of the workbooks
+    # (to look in if the folder of a link is not there)
+    targets = {}
+    folders = {}
+    for workbook_path, (workbook_links, _) in links.items():
+        folders.setdefault(os.path.dirname(os.path.abspath(workbook_path)), set())
+        for link in workbook_links:
+            path = resolve_link_target(workbook_path, link)
+            targets[(workbook_path, link)] = path
+            if path is not None:
+                folders.setdefault(os.path.dirname(path), set()).add(os.path.basename(path))
+
+    # list every folder once
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        listings = dict(zip(folders, executor.map(list_directory, folders, folders.values(),
+                                                  [case_sensitive] * len(folders))))
+
+    results = []
+    suggestions = {}
+    for workbook_path, (workbook_links, workbook_mtime_ns) in links.items():
+        for link in workbook_links:
+            path = targets[(workbook_path, link)]
+            result = {'workbook': workbook_path, 'link': link, 'path': path,
+                      'status': 'unresolved', 'modified': None, 'suggestions': []}
+            results.append(result)
+            if path is None:
+                continue
+
+            folder, name = os.path.split(path)
+            listing, modified = listings[folder]
+            if modified is not None and name in modified:
+                result['modified'] = modified[name]
+                stale = workbook_mtime_ns is not None and modified[name] > workbook_mtime_ns
+                result['status'] = 'stale' if stale else 'ok'
+                continue
+
+            # look for the file in its folder, or in the folder of the workbook,
+            # once for each file that is not there
+            if listing is not None:
+                key = (folder, name)
+                if key not in suggestions:
+                    suggestions[key] = suggest_link_targets(name, name, listing)
+                prefix = link[:len(link) - len(ntpath.basename(link))]
+                result['suggestions'] = [prefix + suggestion for suggestion in suggestions[key]]
+            else:
+                key = (os.path.dirname(os.path.abspath(workbook_path)), name)
+                listing, _ = listings[key[0]]
+                if listing is not None and key not in suggestions:
+                    found = [candidate for candidate in listing if candidate == name
+                             or not case_sensitive and candidate.casefold() == name.casefold()]
+                    suggestions[key] = found[:1] + [suggestion for suggestion in
+                                                    suggest_link_targets(name, name, listing)
+                                                    if suggestion not in found[:1]]
+                result['suggestions'] = list(suggestions.get(key, []))
+            result['status'] = 'moved' if result['suggestions'] else 'missing'
+    return results
+
+
+def check_links(file_paths, max_workers=DEFAULT_MAX_WORKERS, case_sensitive=False):
+    """
+    Description
+    -----------
+    Check the links of many workbook files at once (see
+    `check_link_targets`). The links of the workbooks are read from
+    their packages, without loading the workbooks, by the same pool
+    of threads that checks the linked files.
+
+    Parameters
+    ----------
+    file_paths : list
+        The file paths of the workbooks.
+    max_workers : int, optional
+        The number of threads to use. Default is 32.
+    case_sensitive : bool, optional
+        Whether a link must match the case of its file to find it.
+        Default is False (see `check_link_targets`).
+
+    Returns
+    -------
+    list
+        The links, as given by `check_link_targets`. A workbook whose links
+        could not be read is given as one dictionary with the status 'error'
+        and the 'error', instead of its links.
+
+    Imports
+    -------
+    concurrent.futures
+
+    Examples
+    --------
+    >>> problems = [result for result in check_links(glob.glob("reports/*.xlsx"))
+    ...             if result['status'] not in ('ok', 'unresolved')]
+    >>> {result['link']: result['suggestions'][0] for result in problems if result['status'] == 'moved'}
+    {'Data3Q2024.xlsx': 'Data3Q2024 final.xlsx'}
+    """
+    def read_links(file_path):
+        try:
+            return read_workbook_links(file_path)
+        except Exception as error:
+            return error
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        read = dict(zip(file_paths, executor.map(read_links, file_paths)))
+
+    checked = check_link_targets({file_path: links for file_path, links in read.items()
+                                  if not isinstance(links, Exception)},
+                                 max_workers=max_workers, case_sensitive=case_sensitive)
+    by_workbook = {}
+    for result in checked:
+        by_workbook.setdefault(result['workbook'], []).append(result)
+
+    # the results in the order of the workbooks
+    results = []
+    for file_path, links in read.items():
+        if isinstance(links, Exception):
+            results.append({'workbook': file_path, 'link': None, 'path': None, 'status': 'error',
+                            'modified': None, 'suggestions': [],
+                            'error': f"{type(links).__name__}: {links}"})
+        else:
+            results.extend(by_workbook.get(file_path, []))
+    return results
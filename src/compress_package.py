@@ -0,0 +1,183 @@
+"""
+compress_package.py
+"""
+import concurrent.futures
+import os
+import tempfile
+import time
+import zipfile
+import zlib
+
+from .copy_zip_member import copy_zip_member, write_raw_member
+from .mapped_zip import get_mapped_zip
+
+
+# the compression profiles, as zlib compression levels
+# ("stored" leaves the parts uncompressed, for intermediate files)
+COMPRESSION_PROFILES = {"stored": None, "fast": 1, "balanced": 6, "small": 9}
+
+# the size of the pieces large parts are split into, so the pieces
+# of one part can be compressed at the same time
+COMPRESS_CHUNK_SIZE = 1 << 20
+
+# the size of the deflate window, which each piece is primed with
+# from the end of the piece before it, so splitting costs little size
+DEFLATE_WINDOW = 1 << 15
+
+
+def get_compression_level(profile):
+    """
+    Description
+    -----------
+    Get the zlib compression level of a compression profile.
+
+    Parameters
+    ----------
+    profile : str
+        The compression profile: "stored", "fast", "balanced" or "small".
+
+    Returns
+    -------
+    int or None
+        The compression level, or None for "stored".
+
+    Raises
+    ------
+    ValueError
+        If the profile is not one of the compression profiles.
+
+    Examples
+    --------
+    >>> get_compression_level("fast")
+    1
+    """
+    if profile not in COMPRESSION_PROFILES:
+        raise ValueError(f"The compression profile {profile} is not one of {list(COMPRESSION_PROFILES)}.")
+    return COMPRESSION_PROFILES[profile]
+
+
+def _compress_piece(data, start, end, level):
+    # compress one piece of a part as raw deflate, primed with the
+    # window before it, ending on a byte boundary (or the end of the
+    # stream, for the last piece) so the pieces can be joined
+    began = time.thread_time()
+    if start:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS, 8, zlib.Z_DEFAULT_STRATEGY,
+                                      data[max(0, start - DEFLATE_WINDOW):start])
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    last = end >= len(data)
+    compressed = compressor.compress(data[start:end]) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+    return compressed, time.thread_time() - began
+
+
+def compress_package(file_path, new_file_path=None, profile="balanced", max_workers=None):
+    """
+    Description
+    -----------
+    Compress the uncompressed (stored) parts of a workbook package, with
+    a pool of threads, since zlib does not hold the GIL while it compresses.
+    Large parts are split into pieces of 1 MB that are compressed at the
+    same time, each primed with the end of the piece before it, and joined
+    into one deflate stream, so one large sheet uses every thread too.
+    Parts that are already compressed are copied as they are.
+
+    Parameters
+    ----------
+    file_path : str
+        The file path of the workbook package, usually saved without
+        compression (see `save_workbook_stored`).
+    new_file_path : str, optional
+        The file path to write the compressed package to.
+        Default is None, which rewrites the package in place.
+    profile : str, optional
+        The compression profile: "fast" (zlib level 1), "balanced"
+        (level 6, what Excel and openpyxl use), "small" (level 9), or
+        "stored" (no compression, for intermediate files).
+        Default is "balanced".
+    max_workers : int, optional
+        The number of threads to use.
+        Default is None, which uses the default of ThreadPoolExecutor.
+
+    Returns
+    -------
+    list
+        The parts, in order, as dictionaries of the form
+        {'part': str, 'size': int, 'compressed_size': int, 'seconds': float},
+        where seconds is the processor time spent compressing the part
+        (added up over its pieces, so it does not count the time spent
+        waiting for other threads), 0.0 for the parts that were copied.
+
+    Raises
+    ------
+    ValueError
+        If the profile is not one of the compression profiles.
+
+    Imports
+    -------
+    concurrent.futures
+    os
+    tempfile
+    time
+    zipfile
+    zlib
+    .copy_zip_member
+    .mapped_zip
+
+    Examples
+    --------
+    >>> report = compress_package("consolidation_stored.xlsx", "consolidation.xlsx", profile="fast")
+    >>> max(report, key=lambda part: part['seconds'])
+    {'part': 'xl/worksheets/sheet3.xml', 'size': 105012345, 'compressed_size': 9876543, 'seconds': 0.41}
+    """
+    level = get_compression_level(profile)
+    if new_file_path is None:
+        new_file_path = file_path
+
+    directory = os.path.dirname(os.path.abspath(new_file_path))
+    fd, temp_path = tempfile.mkstemp(suffix=".tmp", dir=directory)
+    os.close(fd)
+
+    report = []
+    try:
+        with get_mapped_zip(file_path) as source_zip, \
+                zipfile.ZipFile(temp_path, "w", allowZip64=True) as target_zip, \
+                concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # start compressing every piece of every stored part
+            pieces = []
+            for info in source_zip.infolist():
+                if level is None or info.compress_type != zipfile.ZIP_STORED:
+                    pieces.append(None)
+                    continue
+                data = source_zip.raw_member(info.filename)
+                pieces.append([executor.submit(_compress_piece, data, start,
+                                               start + COMPRESS_CHUNK_SIZE, level)
+                               for start in range(0, max(len(data), 1), COMPRESS_CHUNK_SIZE)])
+
+            # write the parts in order, as their pieces are done
+            for info, part_pieces in zip(source_zip.infolist(), pieces):
+                if part_pieces is None:
+                    new_info = copy_zip_member(source_zip, target_zip, info)
+                    report.append({'part': info.filename, 'size': info.file_size,
+                                   'compressed_size': new_info.compress_size, 'seconds': 0.0})
+                    continue
+                results = [piece.result() for piece in part_pieces]
+                new_info = zipfile.ZipInfo(info.filename, info.date_time)
+                new_info.compress_type = zipfile.ZIP_DEFLATED
+                new_info.create_system = info.create_system
+                new_info.external_attr = info.external_attr
+                new_info.CRC = info.CRC
+                new_info.file_size = info.file_size
+                new_info.compress_size = sum(len(compressed) for compressed, _ in results)
+                write_raw_member(target_zip, new_info, (compressed for compressed, _ in results))
+                report.append({'part': info.filename, 'size': info.file_size,
+                               'compressed_size': new_info.compress_size,
+                               'seconds': sum(seconds for _, seconds in results)})
+
+        os.replace(temp_path, new_file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    return report
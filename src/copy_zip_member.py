@@ -0,0 +1,196 @@
+"""
+copy_zip_member.py
+"""
+import struct
+import zipfile
+
+
+# size of the fixed part of a local file header in a zip file
+LOCAL_HEADER_SIZE = 30
+
+
+def read_raw_chunks(source_zip, info, chunk_size):
+    """
+    Description
+    -----------
+    Read the compressed bytes of a member of a zip file in chunks,
+    straight from the file the zip file was opened from.
+
+    Parameters
+    ----------
+    source_zip : zipfile.ZipFile
+        The zip file, opened for reading.
+    info : zipfile.ZipInfo
+        The member to read.
+    chunk_size : int
+        The number of bytes to read at a time.
+
+    Returns
+    -------
+    generator
+        Yields the compressed bytes in chunks.
+
+    Raises
+    ------
+    ValueError
+        If the local file header of the member is not valid,
+        or the member is truncated.
+
+    Imports
+    -------
+    struct
+
+    Examples
+    --------
+    >>> b"".join(read_raw_chunks(source_zip, info, 1 << 20))
+    b'...'
+    """
+    # find the start of the compressed bytes, which follow the local
+    # file header (its name and extra field can differ in length from
+    # the ones in the central directory)
+    source_zip.fp.seek(info.header_offset)
+    header = source_zip.fp.read(LOCAL_HEADER_SIZE)
+    if header[:4] != b"PK\x03\x04":
+        raise ValueError(f"The zip member {info.filename} has an invalid local header.")
+    name_length, extra_length = struct.unpack("<HH", header[26:30])
+    position = info.header_offset + LOCAL_HEADER_SIZE + name_length + extra_length
+
+    # read the compressed bytes, seeking each time in case the
+    # file is read by something else in between
+    remaining = info.compress_size
+    while remaining > 0:
+        source_zip.fp.seek(position)
+        chunk = source_zip.fp.read(min(chunk_size, remaining))
+        if not chunk:
+            raise ValueError(f"The zip member {info.filename} is truncated.")
+        position += len(chunk)
+        remaining -= len(chunk)
+        yield chunk
+
+
+def copy_zip_member(source_zip, target_zip, info, chunk_size=1 << 20, name=None):
+    """
+    Description
+    -----------
+    Copy one member of a zip file into another zip file without
+    decompressing and recompressing it. The compressed bytes are copied
+    as they are, with the same CRC and sizes, so copying an unchanged
+    part of a workbook package costs one sequential read and write.
+
+    Parameters
+    ----------
+    source_zip : zipfile.ZipFile or MappedZip
+        The zip file to copy from, opened for reading.
+    target_zip : zipfile.ZipFile
+        The zip file to copy to, opened for writing.
+    info : zipfile.ZipInfo
+        The member of the source zip file to copy.
+    chunk_size : int, optional
+        The number of bytes to copy at a time.
+        Default is 1 MB.
+    name : str, optional
+        The name of the member in the target zip file.
+        Default is None, which keeps the name it has in the source zip file.
+
+    Returns
+    -------
+    zipfile.ZipInfo
+        The info of the member in the target zip file.
+
+    Raises
+    ------
+    ValueError
+        If the member is encrypted.
+    ValueError
+        If the local file header of the member is not valid.
+    ValueError
+        If the member is truncated.
+
+    Imports
+    -------
+    struct
+    zipfile
+
+    Examples
+    --------
+    >>> import zipfile
+    >>> with zipfile.ZipFile("test.xlsx") as source_zip, \\
+    ...         zipfile.ZipFile("copy.xlsx", "w") as target_zip:
+    ...     for info in source_zip.infolist():
+    ...         copy_zip_member(source_zip, target_zip, info)
+    """
+    # encrypted members cannot be copied without the password
+    if info.flag_bits & 0x1:
+        raise ValueError(f"The zip member {info.filename} is encrypted.")
+
+    # get the compressed bytes of the member
+    # a memory-mapped source hands them over without copying
+    if hasattr(source_zip, "raw_member"):
+        view = source_zip.raw_member(info.filename)
+        chunks = (view[start:start + chunk_size] for start in range(0, len(view), chunk_size))
+    else:
+        chunks = read_raw_chunks(source_zip, info, chunk_size)
+
+    # build the info of the copied member
+    # the sizes and CRC are known up front, so no data descriptor is used
+    new_info = zipfile.ZipInfo(name or info.filename, info.date_time)
+    new_info.compress_type = info.compress_type
+    new_info.create_system = info.create_system
+    new_info.external_attr = info.external_attr
+    new_info.flag_bits = info.flag_bits & ~0x08
+    new_info.CRC = info.CRC
+    new_info.compress_size = info.compress_size
+    new_info.file_size = info.file_size
+    return write_raw_member(target_zip, new_info, chunks)
+
+
+def write_raw_member(target_zip, info, chunks):
+    """
+    Description
+    -----------
+    Write a member to a zip file from its compressed bytes, which are
+    written as they are. The info of the member must have its compression,
+    CRC and sizes filled in, since they are written before the bytes.
+
+    Parameters
+    ----------
+    target_zip : zipfile.ZipFile
+        The zip file to write to, opened for writing.
+    info : zipfile.ZipInfo
+        The info of the member.
+    chunks : iterable
+        The compressed bytes of the member, in chunks.
+
+    Returns
+    -------
+    zipfile.ZipInfo
+        The info of the member, with its place in the zip file.
+
+    Imports
+    -------
+    zipfile
+
+    Examples
+    --------
+    >>> info = zipfile.ZipInfo("xl/worksheets/sheet1.xml", (2024, 6, 30, 0, 0, 0))
+    >>> info.compress_type, info.CRC = zipfile.ZIP_DEFLATED, zlib.crc32(xml)
+    >>> info.file_size, info.compress_size = len(xml), len(compressed)
+    >>> write_raw_member(target_zip, info, [compressed])
+    <ZipInfo filename='xl/worksheets/sheet1.xml' compress_type=deflate ...>
+    """
+    zip64 = max(info.file_size, info.compress_size) > zipfile.ZIP64_LIMIT
+
+    # write the local file header and the compressed bytes
+    target_zip.fp.seek(target_zip.start_dir)
+    info.header_offset = target_zip.fp.tell()
+    target_zip.fp.write(info.FileHeader(zip64))
+    for chunk in chunks:
+        target_zip.fp.write(chunk)
+
+    # register the member, so it is written to the central directory
+    target_zip.filelist.append(info)
+    target_zip.NameToInfo[info.filename] = info
+    target_zip.start_dir = target_zip.fp.tell()
+    target_zip._didModify = True
+
+    return info
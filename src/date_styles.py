@@ -0,0 +1,315 @@
+"""
+date_styles.py
+"""
+import datetime
+import re
+from xml.sax.saxutils import unescape
+
+from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format, is_timedelta_format
+from openpyxl.utils.datetime import from_excel
+
+from .get_sheet_parts import REL_NS, get_relationships, get_workbook_part
+
+
+# the relationship type of the styles part of a workbook
+STYLES_TYPE = REL_NS + "/styles"
+
+# the built-in number formats given to the values of each kind
+# when they are written to a cell that has no date format
+DATE_FORMAT_IDS = {"date": 14, "datetime": 22, "time": 21, "timedelta": 46}
+
+# the cell formats of the styles part, and the parts of each cell format
+CELL_XFS_PATTERN = re.compile(rb"<((?:\w+:)?)cellXfs\b([^>]*?)>(.*?)</(?:\w+:)?cellXfs>", re.S)
+XF_PATTERN = re.compile(rb"<((?:\w+:)?)xf\b([^>]*?)(/>|>.*?</(?:\w+:)?xf>)", re.S)
+NUM_FMT_PATTERN = re.compile(rb"<(?:\w+:)?numFmt\b([^>]*?)/?>")
+NUM_FMT_ID_PATTERN = re.compile(rb'\snumFmtId="(\d*)"')
+APPLY_NUMBER_FORMAT_PATTERN = re.compile(rb'\sapplyNumberFormat="[^"]*"')
+FORMAT_CODE_PATTERN = re.compile(rb'\sformatCode="([^"]*)"')
+COUNT_PATTERN = re.compile(rb'\scount="\d*"')
+
+
+def get_date_kind(value):
+    """
+    Description
+    -----------
+    Get the kind of a date or time value, which picks the number format
+    it is written with: "date", "datetime", "time" or "timedelta".
+
+    Parameters
+    ----------
+    value : object
+        The value.
+
+    Returns
+    -------
+    str or None
+        The kind of the value, or None if it is not a date or time.
+
+    Imports
+    -------
+    datetime
+
+    Examples
+    --------
+    >>> get_date_kind(datetime.date(2024, 3, 31))
+    'date'
+    >>> get_date_kind(3.5)
+    """
+    if isinstance(value, datetime.datetime):
+        return "datetime"
+    if isinstance(value, datetime.date):
+        return "date"
+    if isinstance(value, datetime.time):
+        return "time"
+    if isinstance(value, datetime.timedelta):
+        return "timedelta"
+    return None
+
+
+def get_styles_part(zf):
+    """
+    Description
+    -----------
+    Get the name of the styles part of the workbook package,
+    which is usually "xl/styles.xml".
+
+    Parameters
+    ----------
+    zf : zipfile.ZipFile or MappedZip
+        The workbook package.
+
+    Returns
+    -------
+    str or None
+        The name of the styles part, or None if the workbook has no styles.
+
+    Imports
+    -------
+    .get_sheet_parts
+
+    Examples
+    --------
+    >>> get_styles_part(zf)
+    'xl/styles.xml'
+    """
+    for rel_type, target in get_relationships(zf, get_workbook_part(zf)).values():
+        if rel_type == STYLES_TYPE and target in zf.NameToInfo:
+            return target
+    return None
+
+
+class DateStyles:
+    """
+    Description
+    -----------
+    The cell formats (the cellXfs of the styles part) of a workbook package,
+    as far as dates are concerned: which cell formats have a date or a
+    duration number format, so serial numbers can be read as dates the way
+    openpyxl reads them, and which cell format to give a date, datetime,
+    time or timedelta written to a cell, so it is still a date when the
+    workbook is opened again.
+
+    A cell whose format already has a date format keeps it. Otherwise the
+    cell gets a copy of its format with the built-in number format of its
+    kind of value (see `DATE_FORMAT_IDS`), reusing a cell format that is
+    the same if there is one, and adding it to the cell formats if not.
+
+    Parameters
+    ----------
+    styles_xml : bytes, optional
+        The xml of the styles part.
+        Default is None, for a workbook without styles, where values are
+        read as they are and written without a cell format.
+    part : str, optional
+        The name of the styles part. Default is None.
+
+    Attributes
+    ----------
+    part : str
+        The name of the styles part.
+    date_styles : set
+        The indexes of the cell formats with a date, time or duration format.
+    timedelta_styles : set
+        The indexes of the cell formats with a duration format.
+
+    Methods
+    -------
+    decode
+        Read the value of a cell according to its cell format.
+    get_style
+        Get the cell format to write a value with.
+    to_xml
+        Get the xml of the styles part, with the cell formats that were added.
+
+    Examples
+    --------
+    >>> date_styles = read_date_styles(zf)
+    >>> date_styles.decode(45331, "3", WINDOWS_EPOCH)
+    datetime.datetime(2024, 2, 9, 0, 0)
+    >>> date_styles.get_style(datetime.date(2024, 2, 9))
+    '7'
+    """
+    def __init__(self, styles_xml=None, part=None):
+        self.part = part
+        self._styles_xml = styles_xml
+
+        # the xml of each cell format, and the cell formats added
+        self._xfs = []
+        self._added = []
+        self._assigned = {}
+
+        # the custom number formats, by id
+        custom_formats = {}
+        match = None if styles_xml is None else CELL_XFS_PATTERN.search(styles_xml)
+        if match is not None:
+            for attributes in NUM_FMT_PATTERN.findall(styles_xml[:match.start()]):
+                num_fmt_id = NUM_FMT_ID_PATTERN.search(attributes)
+                format_code = FORMAT_CODE_PATTERN.search(attributes)
+                if num_fmt_id is not None and format_code is not None:
+                    custom_formats[int(num_fmt_id.group(1))] = unescape(
+                        format_code.group(1).decode("utf-8"), {"&quot;": '"', "&apos;": "'"})
+            self._prefix = match.group(1)
+            self._xfs = [xf.group(0) for xf in XF_PATTERN.finditer(match.group(3))]
+        self._cell_xfs = match is not None
+        self._custom_formats = custom_formats
+
+        self.date_styles = set()
+        self.timedelta_styles = set()
+        for index, xf in enumerate(self._xfs):
+            self._index_format(index, xf)
+
+    def _index_format(self, index, xf):
+        # note whether a cell format has a date or a duration format
+        num_fmt_id = NUM_FMT_ID_PATTERN.search(xf[:xf.find(b">")])
+        num_fmt_id = int(num_fmt_id.group(1) or 0) if num_fmt_id is not None else 0
+        format_code = self._custom_formats.get(num_fmt_id, BUILTIN_FORMATS.get(num_fmt_id))
+        if format_code is None:
+            return
+        if is_date_format(format_code):
+            self.date_styles.add(index)
+        if is_timedelta_format(format_code):
+            self.timedelta_styles.add(index)
+
+    @property
+    def changed(self):
+        """
+        Whether any cell formats were added.
+        """
+        return bool(self._added)
+
+    def decode(self, value, style, epoch):
+        """
+        Read the value of a cell according to its cell format (its s
+        attribute), as openpyxl reads it: numbers in a cell with a date
+        format are dates, times or timedeltas, in the date system of the
+        workbook. Other values are given as they are.
+        """
+        if style is None or isinstance(value, bool) or not isinstance(value, (int, float)):
+            return value
+        index = int(style)
+        if index not in self.date_styles:
+            return value
+        try:
+            return from_excel(value, epoch, timedelta=index in self.timedelta_styles)
+        except (OverflowError, ValueError):
+            return value
+
+    def get_style(self, value, style=None):
+        """
+        Get the cell format to write a value to a cell with, given the cell
+        format the cell has (its s attribute, or None). Dates, datetimes,
+        times and timedeltas get a cell format with a date or duration
+        format, and other values keep the cell format of the cell.
+        """
+        kind = get_date_kind(value)
+        if kind is None or not self._cell_xfs:
+            return style
+
+        # keep the cell format if it already has a format of the right kind
+        index = 0 if style is None else int(style)
+        if index in (self.timedelta_styles if kind == "timedelta" else self.date_styles):
+            return style
+
+        key = (index, kind)
+        if key not in self._assigned:
+            self._assigned[key] = str(self._find_or_add(index, DATE_FORMAT_IDS[kind]))
+        return self._assigned[key]
+
+    def _find_or_add(self, index, num_fmt_id):
+        # a copy of a cell format with another number format,
+        # which is the same cell format if it is there already
+        if index < len(self._xfs):
+            match = XF_PATTERN.match(self._xfs[index])
+            prefix, attributes, end = match.group(1), match.group(2), match.group(3)
+        else:
+            prefix, attributes, end = self._prefix, b' fontId="0" fillId="0" borderId="0" xfId="0"', b"/>"
+        attributes = APPLY_NUMBER_FORMAT_PATTERN.sub(b"", NUM_FMT_ID_PATTERN.sub(b"", attributes)).rstrip()
+        xf = (b"<" + prefix + b"xf" + f' numFmtId="{num_fmt_id}"'.encode("ascii") + attributes
+              + b' applyNumberFormat="1"' + end)
+        if xf in self._xfs:
+            return self._xfs.index(xf)
+
+        self._xfs.append(xf)
+        self._added.append(xf)
+        self._index_format(len(self._xfs) - 1, xf)
+        return len(self._xfs) - 1
+
+    def to_xml(self):
+        """
+        Get the xml of the styles part, with the cell formats that were
+        added at the end of the cell formats.
+        """
+        if not self._added:
+            return self._styles_xml
+        match = CELL_XFS_PATTERN.search(self._styles_xml)
+        prefix = match.group(1)
+        return b"".join([
+            self._styles_xml[:match.start()],
+            b"<" + prefix + b"cellXfs" + COUNT_PATTERN.sub(b"", match.group(2)),
+            f' count="{len(self._xfs)}">'.encode("ascii"),
+            match.group(3), *self._added,
+            b"</" + prefix + b"cellXfs>",
+            self._styles_xml[match.end():],
+            ])
+
+    def write_xml(self, dst):
+        """
+        Write the xml of the styles part (see `to_xml`) to a file object,
+        as `rewrite_package` takes replaced parts.
+        """
+        dst.write(self.to_xml())
+
+
+def read_date_styles(zf):
+    """
+    Description
+    -----------
+    Read the cell formats of a workbook package (see `DateStyles`),
+    without loading the workbook.
+
+    Parameters
+    ----------
+    zf : zipfile.ZipFile or MappedZip
+        The workbook package.
+
+    Returns
+    -------
+    DateStyles
+        The cell formats of the workbook.
+
+    Imports
+    -------
+    .get_sheet_parts
+
+    Examples
+    --------
+    >>> date_styles = read_date_styles(zf)
+    >>> date_styles.part
+    'xl/styles.xml'
+    >>> sorted(date_styles.date_styles)
+    [3, 4]
+    """
+    part = get_styles_part(zf)
+    if part is None:
+        return DateStyles()
+    return DateStyles(zf.read(part), part=part)
@@ -0,0 +1,399 @@
+"""
+diff_workbooks.py
+"""
+import hashlib
+import re
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
+
+from .column_letter_from_index import column_letter_from_index
+from .find_links import find_links_openpyxl
+from .get_sheet_parts import MAIN_NS, get_sheet_parts, get_workbook_part
+from .mapped_zip import get_mapped_zip
+from .read_shared_strings import get_shared_strings_part, read_shared_strings
+from .read_sheet_rows import iter_row_cells, iter_sheet_rows
+
+
+# the index of a cell that holds a shared string
+SHARED_STRING_CELL_PATTERN = re.compile(rb'(<(?:\w+:)?c\b[^>]*?\st="s"[^>]*>\s*<(?:\w+:)?v>)(\d+)(<)')
+
+def parse_row_cells(row, shared_strings):
+    """
+    Description
+    -----------
+    Parse the cells of a row of a worksheet part into their values and
+    formulas, resolving shared strings.
+
+    Parameters
+    ----------
+    row : bytes
+        The xml of the row, as given by `iter_sheet_rows`.
+    shared_strings : list
+        The shared strings of the workbook.
+
+    Returns
+    -------
+    dict
+        Dictionary where the keys are the cell references, in column order,
+        and the values are tuples of the form (value, formula). The formula
+        is None for cells without one, and "" for cells that share the
+        formula of another cell.
+
+    Imports
+    -------
+    .column_letter_from_index
+    .read_sheet_rows
+
+    Examples
+    --------
+    >>> parse_row_cells(b'<row r="2"><c r="A2"><v>1.5</v></c>'
+    ...                 b'<c r="B2"><f>A2*2</f><v>3</v></c></row>', [])
+    {'A2': (1.5, None), 'B2': (3, '=A2*2')}
+    """
+    return {f"{column_letter_from_index(column)}{row_number}": (value, "=" + formula if formula else formula)
+            for row_number, column, value, formula, _ in iter_row_cells(row, shared_strings)}
+
+
+def hash_row(row, shared_strings=None):
+    """
+    Description
+    -----------
+    Hash the xml of a row of a worksheet part. When the shared strings
+    are given, the cells that hold a shared string are hashed with the
+    string instead of its index, so rows of workbooks with different
+    shared strings hash the same when their strings are the same.
+
+    Parameters
+    ----------
+    row : bytes
+        The xml of the row, as given by `iter_sheet_rows`.
+    shared_strings : list, optional
+        The shared strings of the workbook.
+        Default is None, which hashes the indexes of the shared strings.
+
+    Returns
+    -------
+    bytes
+        The hash of the row.
+
+    Imports
+    -------
+    hashlib
+    re
+    xml.sax.saxutils
+
+    Examples
+    --------
+    >>> hash_row(b'<row r="2"><c r="A2" t="s"><v>0</v></c></row>', ["East"])
+    b'...'
+    """
+    if shared_strings is not None and b't="s"' in row:
+        def resolve(match):
+            index = int(match.group(2))
+            text = shared_strings[index] if index < len(shared_strings) else ""
+            return match.group(1) + escape(text).encode("utf-8") + match.group(3)
+        row = SHARED_STRING_CELL_PATTERN.sub(resolve, row)
+    return hashlib.blake2b(row, digest_size=16).digest()
+
+
+def hash_sheet_rows(zf, part, shared_strings=None):
+    """
+    Description
+    -----------
+    Hash the xml of each row of a worksheet part (see `hash_row`).
+
+    Parameters
+    ----------
+    zf : zipfile.ZipFile or MappedZip
+        The workbook package.
+    part : str
+        The name of the worksheet part.
+    shared_strings : list, optional
+        The shared strings of the workbook, to hash the cells that hold
+        a shared string with the string instead of its index.
+        Default is None, which hashes the indexes of the shared strings.
+
+    Returns
+    -------
+    dict
+        Dictionary where the keys are the row numbers
+        and the values are the hashes of the rows.
+
+    Examples
+    --------
+    >>> hash_sheet_rows(zf, "xl/worksheets/sheet1.xml")
+    {1: b'...', 2: b'...'}
+    """
+    return {row_number: hash_row(row, shared_strings) for row_number, row in iter_sheet_rows(zf, part)}
+
+
+def diff_sheet(old_zf, old_part, old_strings, new_zf, new_part, new_strings):
+    """
+    Description
+    -----------
+    Find the cells that differ between two versions of a worksheet.
+
+    The rows of the old sheet are hashed as they are streamed, then the
+    rows of the new sheet are streamed and compared by hash. Only the rows
+    whose hash differs are parsed into cells and compared cell by cell,
+    so unchanged rows are never parsed.
+
+    When the two workbooks have different shared strings (old_strings is
+    not new_strings), the same index can stand for different strings, so
+    the rows are hashed with their strings instead (see `hash_row`).
+
+    Parameters
+    ----------
+    old_zf : zipfile.ZipFile or MappedZip
+        The old workbook package.
+    old_part : str
+        The name of the old worksheet part.
+    old_strings : list
+        The shared strings of the old workbook.
+    new_zf : zipfile.ZipFile or MappedZip
+        The new workbook package.
+    new_part : str
+        The name of the new worksheet part.
+    new_strings : list
+        The shared strings of the new workbook.
+
+    Returns
+    -------
+    list
+        The changed cells, in row and column order, as dictionaries of
+        the form {'cell': ref, 'old': value, 'new': value}. Cells with a
+        formula on either side also have 'old_formula' and 'new_formula'.
+        Cells that are empty on one side have None as their value there.
+
+    Imports
+    -------
+    .read_sheet_rows
+
+    Examples
+    --------
+    >>> diff_sheet(old_zf, "xl/worksheets/sheet1.xml", old_strings,
+    ...            new_zf, "xl/worksheets/sheet1.xml", new_strings)
+    [{'cell': 'B2', 'old': 10, 'new': 12}]
+    """
+    # hash every row of the old sheet, with its strings
+    # unless the shared strings of the workbooks are the same
+    resolve = old_strings is not new_strings
+    old_hashes = hash_sheet_rows(old_zf, old_part, old_strings if resolve else None)
+
+    # stream the new sheet, and keep only the rows whose hash differs
+    # the old hashes that are left over are the rows not in the new sheet
+    new_rows = {}
+    old_needed = set()
+    for row_number, row in iter_sheet_rows(new_zf, new_part):
+        old_hash = old_hashes.pop(row_number, None)
+        if old_hash != hash_row(row, new_strings if resolve else None):
+            new_rows[row_number] = row
+            if old_hash is not None:
+                old_needed.add(row_number)
+    old_needed.update(old_hashes)
+
+    differing = old_needed | set(new_rows)
+    if not differing:
+        return []
+
+    # stream the old sheet again, keeping only the rows that differ,
+    # and stop as soon as all of them are found
+    old_rows = {}
+    if old_needed:
+        for row_number, row in iter_sheet_rows(old_zf, old_part):
+            if row_number in old_needed:
+                old_rows[row_number] = row
+                if len(old_rows) == len(old_needed):
+                    break
+
+    # compare the differing rows cell by cell
+    changes = []
+    for row_number in sorted(differing):
+        old_cells = parse_row_cells(old_rows[row_number], old_strings) if row_number in old_rows else {}
+        new_cells = parse_row_cells(new_rows[row_number], new_strings) if row_number in new_rows else {}
+        refs = list(old_cells) + [ref for ref in new_cells if ref not in old_cells]
+        refs.sort(key=lambda ref: (len(ref.rstrip("0123456789")), ref))
+        for ref in refs:
+            old_value, old_formula = old_cells.get(ref, (None, None))
+            new_value, new_formula = new_cells.get(ref, (None, None))
+            # booleans are not the same as the numbers 1 and 0
+            if (old_value, old_formula) == (new_value, new_formula) \
+                    and isinstance(old_value, bool) == isinstance(new_value, bool):
+                continue
+            change = {'cell': ref, 'old': old_value, 'new': new_value}
+            if old_formula is not None or new_formula is not None:
+                change['old_formula'] = old_formula
+                change['new_formula'] = new_formula
+            changes.append(change)
+    return changes
+
+
+def read_defined_names(zf):
+    """
+    Description
+    -----------
+    Read the defined names of a workbook package, without loading
+    the workbook.
+
+    Parameters
+    ----------
+    zf : zipfile.ZipFile or MappedZip
+        The workbook package.
+
+    Returns
+    -------
+    dict
+        Dictionary where the keys are the names and the values are their
+        destinations. Names that belong to one sheet are keyed as
+        "Sheet!name", the same as in `NameIndex`.
+
+    Imports
+    -------
+    xml.etree.ElementTree
+    .get_sheet_parts
+
+    Examples
+    --------
+    >>> read_defined_names(zf)
+    {'Premium': 'Summary!$B$2', 'Detail!Total': 'Detail!$D$100'}
+    """
+    root = ET.fromstring(zf.read(get_workbook_part(zf)))
+    sheet_names = [sheet.get("name") for sheet in root.iter(f"{{{MAIN_NS}}}sheet")]
+
+    names = {}
+    for defined_name in root.iter(f"{{{MAIN_NS}}}definedName"):
+        name = defined_name.get("name")
+        local_sheet_id = defined_name.get("localSheetId")
+        if local_sheet_id is not None and int(local_sheet_id) < len(sheet_names):
+            name = f"{sheet_names[int(local_sheet_id)]}!{name}"
+        names[name] = defined_name.text or ""
+    return names
+
+
+def diff_workbooks(old_file_path, new_file_path):
+    """
+    Description
+    -----------
+    Compare two versions of a workbook and report the cells, defined names
+    and links that differ, without loading either workbook.
+
+    Sheets are matched by name. A sheet whose part is byte for byte the same
+    in both workbooks (the same CRC and size in the zip file) is skipped
+    without reading it, as long as the shared strings are the same too.
+    The other sheets are compared with `diff_sheet`, which streams their
+    rows and only parses the rows whose hash differs.
+
+    Only values and formulas are compared, not styles.
+
+    Parameters
+    ----------
+    old_file_path : str
+        The file path of the old workbook, e.g. the input of a session.
+    new_file_path : str
+        The file path of the new workbook, e.g. the saved output.
+
+    Returns
+    -------
+    dict
+        Dictionary of the form:
+            {
+                'equal': bool,
+                'sheets': {
+                    'added': [sheet names],
+                    'removed': [sheet names],
+                    'changed': {sheet name: [changed cells]},
+                    },
+                'names': {
+                    'added': {name: destination},
+                    'removed': {name: destination},
+                    'changed': {name: {'old': destination, 'new': destination}},
+                    },
+                'links': {
+                    'added': [links],
+                    'removed': [links],
+                    },
+            }
+        where the changed cells are given as in `diff_sheet`.
+
+    Raises
+    ------
+    ValueError
+        If either workbook is an xlsb file.
+
+    Imports
+    -------
+    .find_links
+    .get_sheet_parts
+    .mapped_zip
+    .read_shared_strings
+
+    Examples
+    --------
+    >>> diff = diff_workbooks("report.xlsx", "report_copy.xlsx")
+    >>> diff['equal']
+    False
+    >>> diff['sheets']['changed']
+    {'Summary': [{'cell': 'B2', 'old': 10, 'new': 12}]}
+    """
+    # check that neither workbook is an xlsb file
+    for file_path in (old_file_path, new_file_path):
+        if file_path.lower().endswith(".xlsb"):
+            raise ValueError(f"The workbook {file_path} is an xlsb file, which cannot be compared.")
+
+    with get_mapped_zip(old_file_path) as old_zf, get_mapped_zip(new_file_path) as new_zf:
+        old_sheets = get_sheet_parts(old_zf)
+        new_sheets = get_sheet_parts(new_zf)
+
+        # the shared strings are only read if a sheet has to be compared,
+        # and the sheets can only be skipped if the shared strings are the same
+        old_strings_part = get_shared_strings_part(old_zf)
+        new_strings_part = get_shared_strings_part(new_zf)
+        same_strings = (old_strings_part is None) == (new_strings_part is None) and (
+            old_strings_part is None
+            or (old_zf.getinfo(old_strings_part).CRC, old_zf.getinfo(old_strings_part).file_size)
+            == (new_zf.getinfo(new_strings_part).CRC, new_zf.getinfo(new_strings_part).file_size))
+        strings = {}
+
+        # compare the sheets that are in both workbooks
+        changed = {}
+        for sheet_name, new_part in new_sheets.items():
+            if sheet_name not in old_sheets:
+                continue
+            old_part = old_sheets[sheet_name]
+            old_info, new_info = old_zf.getinfo(old_part), new_zf.getinfo(new_part)
+            if same_strings and (old_info.CRC, old_info.file_size) == (new_info.CRC, new_info.file_size):
+                continue
+
+            if not strings:
+                strings['old'] = read_shared_strings(old_zf)
+                strings['new'] = strings['old'] if same_strings else read_shared_strings(new_zf)
+            changes = diff_sheet(old_zf, old_part, strings['old'], new_zf, new_part, strings['new'])
+            if changes:
+                changed[sheet_name] = changes
+
+        # compare the defined names
+        old_names, new_names = read_defined_names(old_zf), read_defined_names(new_zf)
+
+    # compare the links
+    old_links, new_links = find_links_openpyxl(old_file_path), find_links_openpyxl(new_file_path)
+
+    diff = {
+        'sheets': {
+            'added': [name for name in new_sheets if name not in old_sheets],
+            'removed': [name for name in old_sheets if name not in new_sheets],
+            'changed': changed,
+            },
+        'names': {
+            'added': {name: new_names[name] for name in new_names if name not in old_names},
+            'removed': {name: old_names[name] for name in old_names if name not in new_names},
+            'changed': {name: {'old': old_names[name], 'new': new_names[name]}
+                        for name in new_names
+                        if name in old_names and old_names[name] != new_names[name]},
+            },
+        'links': {
+            'added': [link for link in new_links if link not in old_links],
+            'removed': [link for link in old_links if link not in new_links],
+            },
+    }
+    diff['equal'] = not any(any(section.values()) for section in diff.values())
+    return {'equal': diff.pop('equal'), **diff}
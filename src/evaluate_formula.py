@@ -0,0 +1,801 @@
+"""
+evaluate_formula.py
+"""
+import math
+import re
+from decimal import ROUND_HALF_UP, Decimal
+
+from openpyxl.formula.tokenizer import Token, Tokenizer
+
+from .formula_references import Reference, parse_reference, unquote_sheet_name
+from .read_sheet_rows import ErrorValue
+
+
+# the binary operators, and how tightly each one binds
+BINARY_OPERATORS = {
+    "=": 1, "<>": 1, "<": 1, ">": 1, "<=": 1, ">=": 1,
+    "&": 2,
+    "+": 3, "-": 3,
+    "*": 4, "/": 4,
+    "^": 5,
+    }
+
+# the operators that can start a condition of SUMIF and SUMIFS
+CRITERIA_OPERATORS = ("<=", ">=", "<>", "<", ">", "=")
+
+
+class FormulaError(Exception):
+    """
+    Description
+    -----------
+    Raised while a formula is evaluated when its result is an Excel error
+    (e.g. "#DIV/0!"). Functions like IFERROR catch it, and otherwise the
+    error becomes the value of the cell.
+
+    Parameters
+    ----------
+    code : str
+        The Excel error, e.g. "#DIV/0!".
+    """
+    def __init__(self, code):
+        super().__init__(code)
+        self.code = code
+
+
+class UnsupportedFormula(Exception):
+    """
+    Description
+    -----------
+    Raised when a formula uses something the evaluator does not support
+    (a function outside of the supported subset, an array constant, an
+    external reference, ...). The cell keeps the value it had.
+    """
+
+
+class RangeValue:
+    """
+    Description
+    -----------
+    The values of a rectangular range of cells, the result of evaluating
+    a reference. Functions that take ranges (SUM, VLOOKUP, ...) read the
+    rows of values, and everything else uses the single value of a
+    one-cell range.
+
+    Parameters
+    ----------
+    sheet : str
+        The name of the sheet of the range.
+    min_row, min_col : int
+        The row and column of the top left cell.
+    rows : list
+        The values, as a list of rows.
+    """
+    __slots__ = ("sheet", "min_row", "min_col", "rows")
+
+    def __init__(self, sheet, min_row, min_col, rows):
+        self.sheet = sheet
+        self.min_row = min_row
+        self.min_col = min_col
+        self.rows = rows
+
+    @property
+    def height(self):
+        return len(self.rows)
+
+    @property
+    def width(self):
+        return len(self.rows[0]) if self.rows else 0
+
+    def values(self):
+        # every value of the range, row by row
+        for row in self.rows:
+            yield from row
+
+
+def check_error(value):
+    # raise the error if the value is an Excel error
+    if isinstance(value, ErrorValue):
+        raise FormulaError(str(value))
+    return value
+
+
+def to_scalar(value):
+    """
+    Get the single value of a result: the value of a one-cell range,
+    or the value itself. Ranges of more than one cell are #VALUE!.
+    """
+    if isinstance(value, RangeValue):
+        if value.height != 1 or value.width != 1:
+            raise FormulaError("#VALUE!")
+        value = value.rows[0][0]
+    return check_error(value)
+
+
+def to_number(value):
+    """
+    Convert a value to a number the way Excel does in arithmetic.
+    """
+    value = to_scalar(value)
+    if value is None:
+        return 0
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (int, float)):
+        return value
+    try:
+        return float(value.strip())
+    except ValueError:
+        raise FormulaError("#VALUE!")
+
+
+def to_text(value):
+    """
+    Convert a value to text the way Excel does when joining with "&".
+    """
+    value = to_scalar(value)
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, float):
+        return str(int(value)) if value.is_integer() else format(value, ".15g")
+    return str(value)
+
+
+def to_bool(value):
+    """
+    Convert a value to a boolean the way Excel does in conditions.
+    """
+    value = to_scalar(value)
+    if value is None:
+        return False
+    if isinstance(value, (bool, int, float)):
+        return bool(value)
+    if value.upper() in ("TRUE", "FALSE"):
+        return value.upper() == "TRUE"
+    raise FormulaError("#VALUE!")
+
+
+def compare(left, right):
+    """
+    Compare two values the way Excel does: numbers sort before text, and
+    text before booleans, text is compared without case, and an empty
+    cell counts as the empty version of the other value.
+    Returns -1, 0 or 1.
+    """
+    if left is None:
+        left = "" if isinstance(right, str) else False if isinstance(right, bool) else 0
+    if right is None:
+        right = "" if isinstance(left, str) else False if isinstance(left, bool) else 0
+
+    def rank(value):
+        return 2 if isinstance(value, bool) else 1 if isinstance(value, str) else 0
+
+    if rank(left) != rank(right):
+        return -1 if rank(left) < rank(right) else 1
+    if isinstance(left, str):
+        left, right = left.lower(), right.lower()
+    return (left > right) - (left < right)
+
+
+def wildcard_pattern(text):
+    """
+    Build a regular expression from text with Excel wildcards
+    (* and ?, with ~ to escape them), matched without case.
+    """
+    pattern = []
+    escaped = False
+    for character in text:
+        if escaped:
+            pattern.append(re.escape(character))
+            escaped = False
+        elif character == "~":
+            escaped = True
+        elif character == "*":
+            pattern.append(".*")
+        elif character == "?":
+            pattern.append(".")
+        else:
+            pattern.append(re.escape(character))
+    return re.compile("".join(pattern), re.IGNORECASE | re.DOTALL)
+
+
+def make_criteria(criteria):
+    """
+    Build a function that tests a value against a condition of SUMIF or
+    SUMIFS, e.g. 10, ">=10", "<>", "North", or "N*".
+    """
+    criteria = to_scalar(criteria)
+
+    # numbers and booleans match equal values
+    if not isinstance(criteria, str):
+        if criteria is None:
+            criteria = 0
+        return lambda value: value is not None and not isinstance(value, ErrorValue) \
+            and compare(value, criteria) == 0 and isinstance(value, bool) == isinstance(criteria, bool)
+
+    # split off the operator, if there is one
+    operator = "="
+    for candidate in CRITERIA_OPERATORS:
+        if criteria.startswith(candidate):
+            operator, criteria = candidate, criteria[len(candidate):]
+            break
+
+    # an empty condition matches empty cells ("=" or "") or cells that are not empty ("<>")
+    if criteria == "":
+        if operator == "<>":
+            return lambda value: value is not None and value != ""
+        return lambda value: value is None or value == ""
+
+    # a number matches numbers (and "<>" matches everything else too)
+    try:
+        number = float(criteria)
+    except ValueError:
+        number = None
+    if number is not None:
+        tests = {
+            "=": lambda value: value == number, "<>": lambda value: value != number,
+            "<": lambda value: value < number, ">": lambda value: value > number,
+            "<=": lambda value: value <= number, ">=": lambda value: value >= number,
+            }
+        test = tests[operator]
+        if operator == "<>":
+            return lambda value: not isinstance(value, (int, float)) or isinstance(value, bool) \
+                or test(value)
+        return lambda value: isinstance(value, (int, float)) and not isinstance(value, bool) \
+            and test(value)
+
+    # text matches text, with wildcards for "=" and "<>"
+    if operator in ("=", "<>"):
+        pattern = wildcard_pattern(criteria)
+        if operator == "=":
+            return lambda value: isinstance(value, str) and pattern.fullmatch(value) is not None
+        return lambda value: not isinstance(value, str) or pattern.fullmatch(value) is None
+    tests = {"<": lambda order: order < 0, ">": lambda order: order > 0,
+             "<=": lambda order: order <= 0, ">=": lambda order: order >= 0}
+    test = tests[operator]
+    return lambda value: isinstance(value, str) and not isinstance(value, ErrorValue) \
+        and test(compare(value, criteria))
+
+
+def parse_formula(formula):
+    """
+    Description
+    -----------
+    Parse a formula into a tree of nodes that `FormulaEvaluator` can
+    evaluate. The formula is split into tokens with openpyxl's tokenizer.
+
+    Nodes are tuples, where the first item is the kind of node:
+        ('value', value)
+        ('reference', text)                 a reference or a defined name
+        ('operator', operator, left, right)
+        ('negate', node)
+        ('percent', node)
+        ('function', name, [nodes])
+        ('missing',)                        an argument that was left out
+
+    Parameters
+    ----------
+    formula : str
+        The formula, with or without the leading "=".
+
+    Returns
+    -------
+    tuple
+        The root node of the tree.
+
+    Raises
+    ------
+    UnsupportedFormula
+        If the formula uses something the evaluator does not support
+        (array constants, the range, union and intersection operators).
+
+    Imports
+    -------
+    openpyxl.formula.tokenizer
+
+    Examples
+    --------
+    >>> parse_formula("=SUM(A1:A3)*2")
+    ('operator', '*', ('function', 'SUM', [('reference', 'A1:A3')]), ('value', 2))
+    """
+    if not formula.startswith("="):
+        formula = "=" + formula
+    try:
+        tokens = [token for token in Tokenizer(formula).items if token.type != Token.WSPACE]
+    except Exception as error:
+        raise UnsupportedFormula(f"The formula {formula} could not be tokenized: {error}")
+    position = 0
+
+    def peek():
+        return tokens[position] if position < len(tokens) else None
+
+    def parse_expression(min_precedence):
+        nonlocal position
+        left = parse_unary()
+        while True:
+            token = peek()
+            if token is None or token.type != Token.OP_IN:
+                return left
+            if token.value not in BINARY_OPERATORS:
+                raise UnsupportedFormula(f"The operator {token.value} is not supported.")
+            precedence = BINARY_OPERATORS[token.value]
+            if precedence < min_precedence:
+                return left
+            position += 1
+            left = ("operator", token.value, left, parse_expression(precedence + 1))
+
+    def parse_unary():
+        nonlocal position
+        token = peek()
+        if token is not None and token.type == Token.OP_PRE:
+            position += 1
+            operand = parse_unary()
+            return ("negate", operand) if token.value == "-" else operand
+        node = parse_primary()
+        while peek() is not None and peek().type == Token.OP_POST:
+            position += 1
+            node = ("percent", node)
+        return node
+
+    def parse_primary():
+        nonlocal position
+        token = peek()
+        if token is None:
+            raise UnsupportedFormula(f"The formula {formula} ends too soon.")
+        position += 1
+
+        if token.type == Token.OPERAND:
+            if token.subtype == Token.NUMBER:
+                number = float(token.value)
+                return ("value", int(number) if number.is_integer() and "." not in token.value
+                        and "E" not in token.value.upper() else number)
+            if token.subtype == Token.TEXT:
+                return ("value", token.value[1:-1].replace('""', '"'))
+            if token.subtype == Token.LOGICAL:
+                return ("value", token.value.upper() == "TRUE")
+            if token.subtype == Token.ERROR:
+                return ("value", ErrorValue(token.value))
+            return ("reference", token.value)
+
+        if token.type == Token.FUNC and token.subtype == Token.OPEN:
+            name = token.value[:-1].upper()
+            if name.startswith("_XLFN."):
+                name = name[len("_XLFN."):]
+            if not name:
+                raise UnsupportedFormula("Array constants are not supported.")
+            arguments = []
+            # functions without arguments close right away
+            if peek() is not None and peek().type == Token.FUNC and peek().subtype == Token.CLOSE:
+                position += 1
+                return ("function", name, arguments)
+            while True:
+                token = peek()
+                if token is not None and (token.type == Token.SEP or
+                                          (token.type == Token.FUNC and token.subtype == Token.CLOSE)):
+                    arguments.append(("missing",))
+                else:
+                    arguments.append(parse_expression(1))
+                token = peek()
+                position += 1
+                if token is None:
+                    raise UnsupportedFormula(f"The formula {formula} ends too soon.")
+                if token.type == Token.FUNC and token.subtype == Token.CLOSE:
+                    return ("function", name, arguments)
+                if token.type != Token.SEP or token.subtype != Token.ARG:
+                    raise UnsupportedFormula(f"Unexpected {token.value} in the formula {formula}.")
+
+        if token.type == Token.PAREN and token.subtype == Token.OPEN:
+            node = parse_expression(1)
+            token = peek()
+            position += 1
+            if token is None or token.type != Token.PAREN or token.subtype != Token.CLOSE:
+                raise UnsupportedFormula(f"Unbalanced parentheses in the formula {formula}.")
+            return node
+
+        raise UnsupportedFormula(f"Unexpected {token.value} in the formula {formula}.")
+
+    node = parse_expression(1)
+    if position != len(tokens):
+        raise UnsupportedFormula(f"Unexpected {tokens[position].value} in the formula {formula}.")
+    return node
+
+
+class FormulaEvaluator:
+    """
+    Description
+    -----------
+    Evaluates formulas against the values of the cells of a workbook.
+
+    Supports numbers, text, booleans and errors, the arithmetic,
+    comparison and "&" operators, references to cells and ranges on any
+    sheet, defined names, and the functions SUM, SUMIF, SUMIFS, INDEX,
+    MATCH, VLOOKUP, IF, IFERROR, AND, OR, NOT, MIN, MAX, AVERAGE, COUNT,
+    ROUND and ABS. Anything else raises UnsupportedFormula.
+
+    Parameters
+    ----------
+    get_cell : function
+        Function that takes a sheet name, a row number and a column number
+        and returns the value of the cell (None for empty cells).
+    get_dimensions : function
+        Function that takes a sheet name and returns the tuple
+        (max row, max column) of the cells in use on the sheet,
+        or None if the workbook has no such sheet.
+    get_name : function
+        Function that takes the name of the sheet the formula is on and
+        a defined name, and returns the text the name refers to
+        (e.g. "Inputs!$B$2" or "0.05"), or None if there is no such name.
+
+    Methods
+    -------
+    evaluate
+        Evaluate a formula of a cell and get its value.
+
+    Examples
+    --------
+    >>> evaluator = FormulaEvaluator(get_cell, get_dimensions, get_name)
+    >>> evaluator.evaluate(parse_formula("=SUM(A1:A3)"), "Sheet1")
+    6
+    """
+    def __init__(self, get_cell, get_dimensions, get_name):
+        self.get_cell = get_cell
+        self.get_dimensions = get_dimensions
+        self.get_name = get_name
+
+        # the parsed formulas of the defined names
+        self._names = {}
+
+        self.functions = {
+            "SUM": self._sum, "MIN": self._min, "MAX": self._max,
+            "AVERAGE": self._average, "COUNT": self._count,
+            "SUMIF": self._sumif, "SUMIFS": self._sumifs,
+            "INDEX": self._index, "MATCH": self._match, "VLOOKUP": self._vlookup,
+            "IF": self._if, "IFERROR": self._iferror,
+            "AND": self._and, "OR": self._or, "NOT": self._not,
+            "ROUND": self._round, "ABS": self._abs,
+            }
+
+    def evaluate(self, node, sheet):
+        """
+        Evaluate the tree of a formula (from `parse_formula`) of a cell on
+        a sheet, and get the value of the cell. Excel errors are returned
+        as ErrorValue, and empty results as 0, the same as Excel.
+        """
+        try:
+            value = to_scalar(self._evaluate(node, sheet))
+        except FormulaError as error:
+            return ErrorValue(error.code)
+        if value is None:
+            return 0
+        if isinstance(value, float) and not math.isfinite(value):
+            return ErrorValue("#NUM!")
+        return value
+
+    def _evaluate(self, node, sheet):
+        kind = node[0]
+        if kind == "value":
+            return node[1]
+        if kind == "reference":
+            return self._reference(node[1], sheet)
+        if kind == "operator":
+            return self._operator(node[1], self._evaluate(node[2], sheet), self._evaluate(node[3], sheet))
+        if kind == "negate":
+            return -to_number(self._evaluate(node[1], sheet))
+        if kind == "percent":
+            return to_number(self._evaluate(node[1], sheet)) / 100
+        if kind == "function":
+            if node[1] not in self.functions:
+                raise UnsupportedFormula(f"The function {node[1]} is not supported.")
+            return self.functions[node[1]](node[2], sheet)
+        if kind == "missing":
+            return None
+        raise UnsupportedFormula(f"Unknown node {kind}.")
+
+    def _range(self, reference):
+        # get the values of a reference, cut down to the cells in use
+        dimensions = self.get_dimensions(reference.sheet)
+        if dimensions is None:
+            raise FormulaError("#REF!")
+        max_row = min(reference.max_row, max(dimensions[0], reference.min_row))
+        max_col = min(reference.max_col, max(dimensions[1], reference.min_col))
+        rows = [[self.get_cell(reference.sheet, row, col)
+                 for col in range(reference.min_col, max_col + 1)]
+                for row in range(reference.min_row, max_row + 1)]
+        return RangeValue(reference.sheet, reference.min_row, reference.min_col, rows)
+
+    def _reference(self, text, sheet):
+        if "[" in text:
+            raise UnsupportedFormula(f"The external or structured reference {text} is not supported.")
+        reference = parse_reference(text, sheet)
+        if reference is not None:
+            return self._range(reference)
+
+        # otherwise it is a defined name, which can be scoped to a sheet
+        if "!" in text:
+            name_sheet, name = text.rsplit("!", 1)
+            name_sheet = unquote_sheet_name(name_sheet)
+        else:
+            name_sheet, name = sheet, text
+        if text.upper() == "#REF!" or name.upper().startswith("#REF"):
+            raise FormulaError("#REF!")
+        definition = self.get_name(name_sheet, name)
+        if definition is None:
+            raise FormulaError("#NAME?")
+        if definition not in self._names:
+            self._names[definition] = parse_formula(definition)
+        return self._evaluate(self._names[definition], name_sheet)
+
+    def _operator(self, operator, left, right):
+        if operator == "&":
+            return to_text(left) + to_text(right)
+        if operator in ("=", "<>", "<", ">", "<=", ">="):
+            order = compare(to_scalar(left), to_scalar(right))
+            return {"=": order == 0, "<>": order != 0, "<": order < 0,
+                    ">": order > 0, "<=": order <= 0, ">=": order >= 0}[operator]
+        left, right = to_number(left), to_number(right)
+        if operator == "+":
+            return left + right
+        if operator == "-":
+            return left - right
+        if operator == "*":
+            return left * right
+        if operator == "/":
+            if right == 0:
+                raise FormulaError("#DIV/0!")
+            return left / right
+        # operator == "^"
+        if left == 0 and right < 0:
+            raise FormulaError("#DIV/0!")
+        try:
+            result = left ** right
+        except (OverflowError, ZeroDivisionError):
+            raise FormulaError("#NUM!")
+        if isinstance(result, complex):
+            raise FormulaError("#NUM!")
+        return result
+
+    def _numbers(self, arguments, sheet):
+        # the numbers of the arguments of SUM, MIN, MAX, ...
+        # ranges only give their numbers, other arguments are converted
+        for argument in arguments:
+            value = self._evaluate(argument, sheet)
+            if isinstance(value, RangeValue):
+                for item in value.values():
+                    check_error(item)
+                    if isinstance(item, (int, float)) and not isinstance(item, bool):
+                        yield item
+            elif argument[0] != "missing":
+                yield to_number(value)
+
+    def _sum(self, arguments, sheet):
+        return sum(self._numbers(arguments, sheet))
+
+    def _min(self, arguments, sheet):
+        return min(self._numbers(arguments, sheet), default=0)
+
+    def _max(self, arguments, sheet):
+        return max(self._numbers(arguments, sheet), default=0)
+
+    def _average(self, arguments, sheet):
+        numbers = list(self._numbers(arguments, sheet))
+        if not numbers:
+            raise FormulaError("#DIV/0!")
+        return sum(numbers) / len(numbers)
+
+    def _count(self, arguments, sheet):
+        count = 0
+        for argument in arguments:
+            value = self._evaluate(argument, sheet)
+            items = value.values() if isinstance(value, RangeValue) else [value]
+            count += sum(1 for item in items
+                         if isinstance(item, (int, float)) and not isinstance(item, bool))
+        return count
+
+    def _resize(self, value, height, width):
+        # the range of the same size as another range, from its top left cell
+        # (the way SUMIF uses its sum range)
+        if not isinstance(value, RangeValue):
+            raise FormulaError("#VALUE!")
+        if value.height == height and value.width == width:
+            return value
+        return self._range(Reference(value.sheet, value.min_row, value.min_col,
+                                     value.min_row + height - 1, value.min_col + width - 1))
+
+    def _sumif(self, arguments, sheet):
+        if len(arguments) not in (2, 3):
+            raise FormulaError("#VALUE!")
+        criteria_range = self._evaluate(arguments[0], sheet)
+        if not isinstance(criteria_range, RangeValue):
+            raise FormulaError("#VALUE!")
+        test = make_criteria(self._evaluate(arguments[1], sheet))
+        sum_range = criteria_range
+        if len(arguments) == 3 and arguments[2][0] != "missing":
+            sum_range = self._resize(self._evaluate(arguments[2], sheet),
+                                     criteria_range.height, criteria_range.width)
+        total = 0
+        for value, item in zip(criteria_range.values(), sum_range.values()):
+            if test(value):
+                check_error(item)
+                if isinstance(item, (int, float)) and not isinstance(item, bool):
+                    total += item
+        return total
+
+    def _sumifs(self, arguments, sheet):
+        if len(arguments) < 3 or len(arguments) % 2 == 0:
+            raise FormulaError("#VALUE!")
+        sum_range = self._evaluate(arguments[0], sheet)
+        if not isinstance(sum_range, RangeValue):
+            raise FormulaError("#VALUE!")
+        matches = [True] * (sum_range.height * sum_range.width)
+        for index in range(1, len(arguments), 2):
+            criteria_range = self._evaluate(arguments[index], sheet)
+            if not isinstance(criteria_range, RangeValue) or \
+                    (criteria_range.height, criteria_range.width) != (sum_range.height, sum_range.width):
+                raise FormulaError("#VALUE!")
+            test = make_criteria(self._evaluate(arguments[index + 1], sheet))
+            for position, value in enumerate(criteria_range.values()):
+                if matches[position] and not test(value):
+                    matches[position] = False
+        total = 0
+        for matched, item in zip(matches, sum_range.values()):
+            if matched:
+                check_error(item)
+                if isinstance(item, (int, float)) and not isinstance(item, bool):
+                    total += item
+        return total
+
+    def _index(self, arguments, sheet):
+        if len(arguments) not in (2, 3):
+            raise FormulaError("#VALUE!")
+        array = self._evaluate(arguments[0], sheet)
+        if not isinstance(array, RangeValue):
+            array = RangeValue(sheet, 0, 0, [[to_scalar(array)]])
+        row = int(to_number(self._evaluate(arguments[1], sheet)))
+        column = int(to_number(self._evaluate(arguments[2], sheet))) if len(arguments) == 3 else None
+
+        # with one index, a single row is indexed by column
+        if column is None:
+            if array.height == 1:
+                row, column = 1, row
+            elif array.width == 1:
+                column = 1
+            else:
+                raise FormulaError("#REF!")
+        if row < 0 or column < 0 or row > array.height or column > array.width:
+            raise FormulaError("#REF!")
+
+        # an index of 0 gives the whole column or row
+        rows = array.rows if row == 0 else [array.rows[row - 1]]
+        rows = [list(values) if column == 0 else [values[column - 1]] for values in rows]
+        return RangeValue(array.sheet, array.min_row + max(row - 1, 0),
+                          array.min_col + max(column - 1, 0), rows)
+
+    def _lookup_position(self, lookup, values, match_type):
+        # the position (from 0) of a value in a list of values, for MATCH
+        # and VLOOKUP, or None if it is not found
+        if match_type == 0:
+            if isinstance(lookup, str):
+                pattern = wildcard_pattern(lookup)
+                for position, value in enumerate(values):
+                    if isinstance(value, str) and pattern.fullmatch(value):
+                        return position
+                return None
+            for position, value in enumerate(values):
+                if value is not None and not isinstance(value, str) and compare(value, lookup) == 0 \
+                        and isinstance(value, bool) == isinstance(lookup, bool):
+                    return position
+            return None
+
+        # approximate matches expect sorted values, and stop at the first
+        # value past the lookup value, the same as on sorted values in Excel
+        found = None
+        for position, value in enumerate(values):
+            if value is None or isinstance(value, ErrorValue) or \
+                    isinstance(value, str) != isinstance(lookup, str):
+                continue
+            order = compare(value, lookup)
+            if (match_type > 0 and order <= 0) or (match_type < 0 and order >= 0):
+                found = position
+            else:
+                break
+        return found
+
+    def _match(self, arguments, sheet):
+        if len(arguments) not in (2, 3):
+            raise FormulaError("#VALUE!")
+        lookup = to_scalar(self._evaluate(arguments[0], sheet))
+        array = self._evaluate(arguments[1], sheet)
+        if not isinstance(array, RangeValue) or (array.height != 1 and array.width != 1):
+            raise FormulaError("#N/A")
+        match_type = 1
+        if len(arguments) == 3 and arguments[2][0] != "missing":
+            match_type = int(to_number(self._evaluate(arguments[2], sheet)))
+        position = self._lookup_position(lookup, list(array.values()), match_type)
+        if position is None:
+            raise FormulaError("#N/A")
+        return position + 1
+
+    def _vlookup(self, arguments, sheet):
+        if len(arguments) not in (3, 4):
+            raise FormulaError("#VALUE!")
+        lookup = to_scalar(self._evaluate(arguments[0], sheet))
+        table = self._evaluate(arguments[1], sheet)
+        if not isinstance(table, RangeValue):
+            raise FormulaError("#N/A")
+        column = int(to_number(self._evaluate(arguments[2], sheet)))
+        approximate = True
+        if len(arguments) == 4 and arguments[3][0] != "missing":
+            approximate = to_bool(self._evaluate(arguments[3], sheet))
+        if column < 1:
+            raise FormulaError("#VALUE!")
+        if column > table.width:
+            raise FormulaError("#REF!")
+        position = self._lookup_position(lookup, [row[0] for row in table.rows], 1 if approximate else 0)
+        if position is None:
+            raise FormulaError("#N/A")
+        return table.rows[position][column - 1]
+
+    def _if(self, arguments, sheet):
+        if len(arguments) not in (1, 2, 3):
+            raise FormulaError("#VALUE!")
+        condition = to_bool(self._evaluate(arguments[0], sheet))
+        if condition:
+            if len(arguments) < 2:
+                return True
+            return 0 if arguments[1][0] == "missing" else self._evaluate(arguments[1], sheet)
+        if len(arguments) < 3:
+            return False
+        return 0 if arguments[2][0] == "missing" else self._evaluate(arguments[2], sheet)
+
+    def _iferror(self, arguments, sheet):
+        if len(arguments) != 2:
+            raise FormulaError("#VALUE!")
+        try:
+            return to_scalar(self._evaluate(arguments[0], sheet))
+        except FormulaError:
+            return self._evaluate(arguments[1], sheet)
+
+    def _booleans(self, arguments, sheet):
+        # the booleans of the arguments of AND and OR
+        # ranges skip their text and empty cells
+        for argument in arguments:
+            value = self._evaluate(argument, sheet)
+            if isinstance(value, RangeValue):
+                for item in value.values():
+                    check_error(item)
+                    if isinstance(item, (bool, int, float)):
+                        yield bool(item)
+            else:
+                yield to_bool(value)
+
+    def _and(self, arguments, sheet):
+        values = list(self._booleans(arguments, sheet))
+        if not values:
+            raise FormulaError("#VALUE!")
+        return all(values)
+
+    def _or(self, arguments, sheet):
+        values = list(self._booleans(arguments, sheet))
+        if not values:
+            raise FormulaError("#VALUE!")
+        return any(values)
+
+    def _not(self, arguments, sheet):
+        if len(arguments) != 1:
+            raise FormulaError("#VALUE!")
+        return not to_bool(self._evaluate(arguments[0], sheet))
+
+    def _round(self, arguments, sheet):
+        if len(arguments) != 2:
+            raise FormulaError("#VALUE!")
+        number = to_number(self._evaluate(arguments[0], sheet))
+        digits = int(to_number(self._evaluate(arguments[1], sheet)))
+        # Excel rounds halves away from zero
+        rounded = Decimal(repr(number)).scaleb(digits).quantize(Decimal(1), rounding=ROUND_HALF_UP).scaleb(-digits)
+        return int(rounded) if digits <= 0 else float(rounded)
+
+    def _abs(self, arguments, sheet):
+        if len(arguments) != 1:
+            raise FormulaError("#VALUE!")
+        return abs(to_number(self._evaluate(arguments[0], sheet)))
@@ -0,0 +1,591 @@
+"""
+excel_dates.py
+"""
+import sys
+
+from openpyxl.utils.cell import range_boundaries
+from openpyxl.utils.datetime import MAC_EPOCH, WINDOWS_EPOCH
+
+from .export_sheets import iter_export_rows
+from .get_sheet_parts import get_sheet_parts, get_workbook_part
+from .is_xlsb import is_xlsb
+from .mapped_zip import get_mapped_zip
+from .read_sheet_rows import iter_row_cells, iter_sheet_rows
+from .read_shared_strings import read_shared_strings
+
+
+# the number of milliseconds and microseconds in a day
+MILLISECONDS_PER_DAY = 86400000
+MICROSECONDS_PER_DAY = 86400000000
+
+# the serial numbers of the 1900 date system before 1900-03-01 are one
+# day off, since Excel counts 1900-02-29, which did not happen
+# (openpyxl reads serial 60, that day, as 1900-02-28)
+LEAP_BUG_SERIAL = 60
+
+
+def import_numpy():
+    """
+    Import numpy, which is only needed to convert dates in blocks,
+    with an error that says how to install it if it is missing.
+    """
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("numpy is needed to convert dates in blocks. Install it with: pip install numpy") from None
+    return numpy
+
+
+def get_workbook_epoch(zf):
+    """
+    Description
+    -----------
+    Get the date system of a workbook package: the day its serial
+    numbers count from, as openpyxl gives it in `wb.epoch`.
+
+    Parameters
+    ----------
+    zf : zipfile.ZipFile or MappedZip
+        The workbook package.
+
+    Returns
+    -------
+    datetime.datetime
+        openpyxl.utils.datetime.MAC_EPOCH (1904-01-01) if the workbook
+        uses the 1904 date system, otherwise WINDOWS_EPOCH (1899-12-30).
+
+    Imports
+    -------
+    openpyxl
+    .get_sheet_parts
+
+    Examples
+    --------
+    >>> with get_mapped_zip("report.xlsx") as zf:
+    ...     get_workbook_epoch(zf)
+    datetime.datetime(1899, 12, 30, 0, 0)
+    """
+    workbook_xml = zf.read(get_workbook_part(zf))
+    if b'date1904="1"' in workbook_xml or b'date1904="true"' in workbook_xml:
+        return MAC_EPOCH
+    return WINDOWS_EPOCH
+
+
+def as_datetime64(dates):
+    """
+    Description
+    -----------
+    Get dates as a numpy datetime64 array: numpy arrays, pandas Series
+    and DatetimeIndexes (without time zones), and lists of datetimes,
+    dates, numpy or pandas timestamps. None and NaT are NaT.
+
+    Parameters
+    ----------
+    dates : array-like
+        The dates.
+
+    Returns
+    -------
+    numpy.ndarray
+        The dates, as datetime64 (in the unit they have, or in
+        microseconds if they were not datetime64 yet).
+
+    Raises
+    ------
+    ValueError
+        If the dates can not be read as dates.
+    ImportError
+        If numpy is not installed.
+
+    Imports
+    -------
+    numpy
+
+    Examples
+    --------
+    >>> as_datetime64([datetime.date(2024, 3, 31), None])
+    array(['2024-03-31T00:00:00.000000', 'NaT'], dtype='datetime64[us]')
+    """
+    np = import_numpy()
+    values = np.asarray(dates)
+    if values.dtype.kind == "M":
+        return values
+    try:
+        return values.astype("datetime64[us]")
+    except (TypeError, ValueError):
+        raise ValueError("The dates are not dates, datetimes or timestamps.") from None
+
+
+def serials_to_datetime64(serials, epoch=WINDOWS_EPOCH):
+    """
+    Description
+    -----------
+    Convert Excel serial numbers to dates, all at once, the way openpyxl
+    converts each one: the whole days count from the epoch, with the
+    serials of the 1900 date system before 1900-03-01 moved a day
+    (Excel counts 1900-02-29), and the fraction of the day is rounded
+    to the millisecond. Serials below 1 (times of day) are on the
+    epoch day, instead of being times, so the result is one array.
+
+    Parameters
+    ----------
+    serials : array-like
+        The serial numbers. None and NaN give NaT.
+    epoch : datetime.datetime, optional
+        The date system of the workbook, as given by `wb.epoch` or
+        `get_workbook_epoch`.
+        Default is openpyxl.utils.datetime.WINDOWS_EPOCH (the 1900 date system).
+
+    Returns
+    -------
+    numpy.ndarray
+        The dates, as datetime64[ms], with the shape of the serials.
+
+    Raises
+    ------
+    ImportError
+        If numpy is not installed.
+
+    Imports
+    -------
+    numpy
+    openpyxl
+
+    Examples
+    --------
+    >>> serials_to_datetime64([45382, 45382.5, None])
+    array(['2024-03-31T00:00:00.000', '2024-03-31T12:00:00.000', 'NaT'], dtype='datetime64[ms]')
+    >>> serials_to_datetime64([0], epoch=MAC_EPOCH)
+    array(['1904-01-01T00:00:00.000'], dtype='datetime64[ms]')
+    """
+    np = import_numpy()
+    values = np.asarray(serials, dtype=float)
+    valid = np.isfinite(values)
+    values = np.where(valid, values, 0.0)
+
+    days = np.floor(values)
+    milliseconds = np.round((values - days) * MILLISECONDS_PER_DAY)
+    if epoch == WINDOWS_EPOCH:
+        days += (values > 0) & (values < LEAP_BUG_SERIAL)
+
+    offsets = (days.astype("int64") * MILLISECONDS_PER_DAY + milliseconds.astype("int64")).astype("timedelta64[ms]")
+    dates = np.datetime64(epoch, "ms") + offsets
+    dates[~valid] = np.datetime64("NaT")
+    return dates
+
+
+def datetime64_to_serials(dates, epoch=WINDOWS_EPOCH):
+    """
+    Description
+    -----------
+    Convert dates to Excel serial numbers, all at once, the way openpyxl
+    converts each one when it saves: the days from the epoch, with the
+    days of the 1900 date system before 1900-03-01 moved back a day,
+    plus the time of day as a fraction of a day.
+
+    Parameters
+    ----------
+    dates : array-like
+        The dates (see `as_datetime64`). NaT gives NaN.
+    epoch : datetime.datetime, optional
+        The date system of the workbook, as given by `wb.epoch` or
+        `get_workbook_epoch`.
+        Default is openpyxl.utils.datetime.WINDOWS_EPOCH (the 1900 date system).
+
+    Returns
+    -------
+    numpy.ndarray
+        The serial numbers, as float64, with the shape of the dates.
+
+    Raises
+    ------
+    ValueError
+        If the dates can not be read as dates.
+    ImportError
+        If numpy is not installed.
+
+    Imports
+    -------
+    numpy
+    openpyxl
+
+    Examples
+    --------
+    >>> datetime64_to_serials(numpy.array(["2024-03-31T12:00", "NaT"], dtype="datetime64[m]"))
+    array([45382.5,     nan])
+    """
+    np = import_numpy()
+    values = as_datetime64(dates)
+    valid = ~np.isnat(values)
+
+    microseconds = (values.astype("datetime64[us]") - np.datetime64(epoch, "us")).astype("int64")
+    microseconds = np.where(valid, microseconds, 0)
+    days, remainder = np.divmod(microseconds, MICROSECONDS_PER_DAY)
+    if epoch == WINDOWS_EPOCH:
+        days -= (days > 0) & (days <= LEAP_BUG_SERIAL)
+
+    serials = days + remainder / MICROSECONDS_PER_DAY
+    serials[~valid] = np.nan
+    return serials
+
+
+def get_date_quarters(dates):
+    """
+    Description
+    -----------
+    Get the year and the quarter of each date, all at once, to bucket
+    date columns by quarter.
+
+    Parameters
+    ----------
+    dates : array-like
+        The dates (see `as_datetime64`).
+
+    Returns
+    -------
+    years : numpy.ndarray
+        The years, as int64. 0 for NaT.
+    quarters : numpy.ndarray
+        The quarters, 1-4, as int64. 0 for NaT.
+
+    Raises
+    ------
+    ValueError
+        If the dates can not be read as dates.
+    ImportError
+        If numpy is not installed.
+
+    Imports
+    -------
+    numpy
+
+    Examples
+    --------
+    >>> years, quarters = get_date_quarters(["2023-12-31", "2024-01-01", None])
+    >>> years
+    array([2023, 2024,    0])
+    >>> quarters
+    array([4, 1, 0])
+    """
+    np = import_numpy()
+    values = as_datetime64(dates)
+    valid = ~np.isnat(values)
+
+    months = np.where(valid, values.astype("datetime64[M]").astype("int64"), 0)
+    years = np.where(valid, months // 12 + 1970, 0)
+    quarters = np.where(valid, months % 12 // 3 + 1, 0)
+    return years, quarters
+
+
+def shift_quarters(years, quarters, periods=1):
+    """
+    Description
+    -----------
+    Move quarters forward or back, all at once, like
+    `get_next_quarter_year` and `get_prior_quarter_year` do one at a time.
+
+    Parameters
+    ----------
+    years : array-like
+        The years.
+    quarters : array-like
+        The quarters, 1-4, or 0 for missing quarters (as given by
+        `get_date_quarters` for NaT), which stay missing.
+    periods : int, optional
+        The number of quarters to move, back if negative.
+        Default is 1.
+
+    Returns
+    -------
+    years : numpy.ndarray
+        The years of the moved quarters, as int64.
+    quarters : numpy.ndarray
+        The moved quarters, as int64.
+
+    Raises
+    ------
+    ValueError
+        If a quarter is not a number 0-4.
+    ImportError
+        If numpy is not installed.
+
+    Imports
+    -------
+    numpy
+
+    Examples
+    --------
+    >>> shift_quarters([2024, 2024], [1, 4], periods=-1)
+    (array([2023, 2024]), array([4, 3]))
+    """
+    np = import_numpy()
+    years = np.asarray(years, dtype="int64")
+    quarters = np.asarray(quarters, dtype="int64")
+    if ((quarters < 0) | (quarters > 4)).any():
+        raise ValueError("The quarters are not all numbers 1-4 (or 0 for missing quarters).")
+    valid = quarters > 0
+
+    shifted = years * 4 + quarters - 1 + periods
+    return np.where(valid, shifted // 4, years), np.where(valid, shifted % 4 + 1, 0)
+
+
+def get_quarter_labels(years, quarters):
+    """
+    Description
+    -----------
+    Get the labels of quarters, as the file names of quarterly workbooks
+    have them (e.g. "4Q2024"), all at once.
+
+    Parameters
+    ----------
+    years : array-like
+        The years.
+    quarters : array-like
+        The quarters, 1-4, or 0 for missing quarters, which get "".
+
+    Returns
+    -------
+    numpy.ndarray
+        The labels, as strings.
+
+    Raises
+    ------
+    ImportError
+        If numpy is not installed.
+
+    Imports
+    -------
+    numpy
+
+    Examples
+    --------
+    >>> get_quarter_labels(*get_date_quarters(["2024-11-30", None]))
+    array(['4Q2024', ''], dtype='<U11')
+    """
+    np = import_numpy()
+    years = np.asarray(years, dtype="int64")
+    quarters = np.asarray(quarters, dtype="int64")
+    labels = np.char.add(np.char.add(quarters.astype(str), "Q"), years.astype(str))
+    return np.where(quarters > 0, labels, "")
+
+
+def to_cell_values(block):
+    """
+    Description
+    -----------
+    Get the values of a numpy array, pandas Series or pandas DataFrame
+    as lists of the values cells take, converting each column at once
+    instead of each value: datetime64 columns to datetimes (or dates,
+    for columns of days), timedelta64 columns to timedeltas, the missing
+    values (NaT, NaN and pandas.NA) to None, and numpy numbers to Python
+    numbers.
+
+    Parameters
+    ----------
+    block : numpy.ndarray, pandas.Series or pandas.DataFrame
+        The values. A DataFrame gives its rows, without the index or the
+        column names.
+
+    Returns
+    -------
+    list
+        A flat list for one dimensional blocks, or a list of rows.
+
+    Raises
+    ------
+    ValueError
+        If the block has more than two dimensions.
+    ImportError
+        If numpy is not installed.
+
+    Imports
+    -------
+    sys
+    numpy
+
+    Examples
+    --------
+    >>> to_cell_values(numpy.array(["2024-03-31", "NaT"], dtype="datetime64[D]"))
+    [datetime.date(2024, 3, 31), None]
+    >>> to_cell_values(pandas.Series([1.5, numpy.nan, pandas.NA], dtype="Float64"))
+    [1.5, None, None]
+    >>> to_cell_values(pandas.DataFrame({"id": [1, 2], "date": pandas.to_datetime(["2024-01-05", "2024-02-10"])}))
+    [[1, datetime.datetime(2024, 1, 5, 0, 0)], [2, datetime.datetime(2024, 2, 10, 0, 0)]]
+    """
+    np = import_numpy()
+
+    def column_values(values):
+        # the missing values, found by pandas for its own types (and for
+        # pandas.NA, which only pandas makes), or as NaN for floats
+        pandas = sys.modules.get("pandas")
+        missing = values.isna() if hasattr(values, "isna") else None
+        # the nullable types of pandas keep their values as Python objects
+        if missing is not None and not isinstance(values.dtype, np.dtype):
+            values = values.to_numpy(dtype=object)
+        values = np.asarray(values)
+        if missing is not None:
+            missing = np.asarray(missing, dtype=bool)
+        elif values.dtype.kind in "fc":
+            missing = np.isnan(values)
+        elif values.dtype.kind == "O" and pandas is not None:
+            missing = np.asarray(pandas.isna(values), dtype=bool)
+
+        if values.dtype.kind == "M":
+            unit = np.datetime_data(values.dtype)[0]
+            values = values.astype("datetime64[D]" if unit in ("Y", "M", "W", "D") else "datetime64[us]")
+        elif values.dtype.kind == "m":
+            values = values.astype("timedelta64[us]")
+        if missing is not None and missing.any():
+            values = values.astype(object)
+            values[missing] = None
+        return values.tolist()
+
+    # the columns of a DataFrame can each have their own type
+    if hasattr(block, "columns"):
+        columns = [column_values(block.iloc[:, index]) for index in range(len(block.columns))]
+        return [list(row) for row in zip(*columns)]
+
+    values = np.asarray(block)
+    if values.ndim > 2:
+        raise ValueError(f"The block of values has {values.ndim} dimensions, not one or two.")
+    return column_values(values)
+
+
+def read_serials(file_path, sheet, cell_range):
+    """
+    Description
+    -----------
+    Read the numbers in a range of a sheet as an array, straight from
+    the workbook file, without loading the sheet and without making a
+    date of each date cell: dates are read as their serial numbers,
+    to be converted all at once (see `read_dates`).
+
+    Parameters
+    ----------
+    file_path : str
+        The file path of the workbook. xlsx, xlsm and xlsb files are read.
+    sheet : str
+        The name of the sheet.
+    cell_range : str
+        The range of cells, in A1 notation (e.g. "C2:C500000").
+
+    Returns
+    -------
+    numpy.ndarray
+        The numbers, as float64, with one row for each row of the range
+        and one column for each column. Empty cells, and cells that do
+        not hold numbers, are NaN.
+
+    Raises
+    ------
+    ValueError
+        If the sheet is not in the workbook, or the range is not a range of cells.
+    ImportError
+        If numpy is not installed.
+
+    Imports
+    -------
+    numpy
+    openpyxl
+    .export_sheets
+    .get_sheet_parts
+    .mapped_zip
+    .read_shared_strings
+    .read_sheet_rows
+
+    Examples
+    --------
+    >>> read_serials("claims.xlsx", "Claims", "C2:C4")
+    array([[45382.],
+           [45383.],
+           [   nan]])
+    """
+    np = import_numpy()
+    try:
+        min_col, min_row, max_col, max_row = range_boundaries(cell_range.replace("$", ""))
+    except (AttributeError, TypeError, ValueError):
+        raise ValueError(f"The cell range {cell_range} is not in A1 notation.") from None
+    if None in (min_col, min_row, max_col, max_row):
+        raise ValueError(f"The cell range {cell_range} is not a range of cells.")
+    serials = np.full((max_row - min_row + 1, max_col - min_col + 1), np.nan)
+
+    def is_number(value):
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+    # xlsb dates are serial numbers already
+    if is_xlsb(file_path):
+        rows = next(iter_export_rows(file_path, [(sheet, min_row, min_col, max_row, max_col)]))
+        for index, row in enumerate(rows):
+            serials[index, :len(row)] = [value if is_number(value) else np.nan for value in row]
+        return serials
+
+    with get_mapped_zip(file_path) as zf:
+        sheet_parts = get_sheet_parts(zf)
+        if sheet not in sheet_parts:
+            raise ValueError(f"The sheet {sheet} is not in the workbook {file_path}.")
+        shared_strings = read_shared_strings(zf)
+        for row_number, row in iter_sheet_rows(zf, sheet_parts[sheet]):
+            if row_number < min_row:
+                continue
+            if row_number > max_row:
+                break
+            for _, column, value, _, _ in iter_row_cells(row, shared_strings):
+                if min_col <= column <= max_col and is_number(value):
+                    serials[row_number - min_row, column - min_col] = value
+    return serials
+
+
+def read_dates(file_path, sheet, cell_range, epoch=None):
+    """
+    Description
+    -----------
+    Read the dates in a range of a sheet as a datetime64 array, straight
+    from the workbook file: the serial numbers of the range are read
+    (see `read_serials`) and converted all at once, in the date system
+    of the workbook (see `serials_to_datetime64`).
+
+    Parameters
+    ----------
+    file_path : str
+        The file path of the workbook. xlsx, xlsm and xlsb files are read.
+    sheet : str
+        The name of the sheet.
+    cell_range : str
+        The range of cells, in A1 notation (e.g. "C2:C500000").
+    epoch : datetime.datetime, optional
+        The date system of the workbook.
+        Default is None, which reads it from xlsx and xlsm files, and
+        uses the 1900 date system for xlsb files.
+
+    Returns
+    -------
+    numpy.ndarray
+        The dates, as datetime64[ms], with one row for each row of the
+        range and one column for each column. Empty cells, and cells that
+        do not hold numbers, are NaT.
+
+    Raises
+    ------
+    ValueError
+        If the sheet is not in the workbook, or the range is not a range of cells.
+    ImportError
+        If numpy is not installed.
+
+    Imports
+    -------
+    numpy
+    openpyxl
+    .mapped_zip
+
+    Examples
+    --------
+    >>> dates = read_dates("claims.xlsx", "Claims", "C2:C500001")[:, 0]
+    >>> years, quarters = get_date_quarters(dates)
+    """
+    if epoch is None:
+        if is_xlsb(file_path):
+            epoch = WINDOWS_EPOCH
+        else:
+            with get_mapped_zip(file_path) as zf:
+                epoch = get_workbook_epoch(zf)
+    return serials_to_datetime64(read_serials(file_path, sheet, cell_range), epoch=epoch)
@@ -0,0 +1,513 @@
+"""
+export_sheets.py
+"""
+import datetime
+import itertools
+import os
+import re
+
+import openpyxl
+
+from .diff_workbooks import read_defined_names
+from .formula_references import find_references
+from .get_sheet_parts import get_sheet_parts
+from .is_xlsb import is_xlsb
+from .mapped_zip import get_mapped_zip
+from .open_workbook import open_workbook_pyxlsb
+
+
+# the file formats that can be written, by file extension
+EXPORT_FORMATS = {"parquet": ".parquet", "feather": ".feather"}
+
+
+def import_pyarrow():
+    """
+    Import pyarrow, which is only needed to export sheets,
+    with an error that says how to install it if it is missing.
+    """
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError("pyarrow is needed to export sheets. Install it with: pip install pyarrow") from None
+    return pyarrow
+
+
+def iter_export_rows(file_path, sources):
+    """
+    Description
+    -----------
+    Iterate over the values of the rows of sheets and named ranges of a
+    workbook file, one row at a time, without loading the sheets: xlsx and
+    xlsm files are read with openpyxl in read-only mode, and xlsb files
+    with the row iterator of pyxlsb.
+
+    Parameters
+    ----------
+    file_path : str
+        The file path of the workbook.
+    sources : list
+        Tuples of the form (sheet, min_row, min_col, max_row, max_col),
+        where the bounds are None to read the whole sheet.
+
+    Returns
+    -------
+    generator
+        Yields a generator of the rows of each source in turn, where
+        each row is a tuple of the values of its cells. Each generator
+        must be used up before the next one is asked for.
+
+    Imports
+    -------
+    itertools
+    openpyxl
+    .mapped_zip
+    .open_workbook
+
+    Examples
+    --------
+    >>> for rows in iter_export_rows("report.xlsx", [("Detail", None, None, None, None)]):
+    ...     next(rows)
+    ('Name', 'Value')
+    """
+    if is_xlsb(file_path):
+        wb = open_workbook_pyxlsb(file_path)
+        try:
+            for sheet, min_row, min_col, max_row, max_col in sources:
+                yield _iter_pyxlsb_rows(wb, sheet, min_row, min_col, max_row, max_col)
+        finally:
+            wb.close()
+        return
+
+    with get_mapped_zip(file_path) as mapped_zip:
+        wb = openpyxl.load_workbook(mapped_zip.open_file(), read_only=True, data_only=True)
+        try:
+            for sheet, min_row, min_col, max_row, max_col in sources:
+                yield wb[sheet].iter_rows(min_row=min_row, min_col=min_col, max_row=max_row,
+                                          max_col=max_col, values_only=True)
+        finally:
+            wb.close()
+
+
+def _iter_pyxlsb_rows(wb, sheet, min_row, min_col, max_row, max_col):
+    # pyxlsb rows and columns are from 0, and every row has every column
+    with wb.get_sheet(sheet) as ws:
+        rows = ws.rows(sparse=False)
+        if min_row is not None:
+            rows = itertools.islice(rows, min_row - 1, max_row)
+        columns = slice(None if min_col is None else min_col - 1, max_col)
+        for row in rows:
+            yield tuple(cell.v for cell in row[columns])
+
+
+def get_export_sources(file_path, sheets=None, named_ranges=None):
+    """
+    Description
+    -----------
+    Get the sheets and the ranges of the named ranges to export,
+    read from the workbook file without loading it.
+
+    Parameters
+    ----------
+    file_path : str
+        The file path of the workbook.
+    sheets : list, optional
+        The names of the sheets to export.
+        Default is None, which exports every sheet if no named ranges are given.
+    named_ranges : list, optional
+        The names of the named ranges to export. Each must refer to a
+        single range of cells. Not supported for xlsb files.
+
+    Returns
+    -------
+    dict
+        Dictionary where the keys are the sheet names and named range names,
+        and the values are tuples of the form
+        (sheet, min_row, min_col, max_row, max_col).
+
+    Raises
+    ------
+    ValueError
+        If a sheet or named range is not in the workbook.
+    ValueError
+        If a named range does not refer to a single range of cells.
+    ValueError
+        If named ranges are given for an xlsb file.
+
+    Imports
+    -------
+    .diff_workbooks
+    .formula_references
+    .get_sheet_parts
+    .mapped_zip
+    .open_workbook
+
+    Examples
+    --------
+    >>> get_export_sources("report.xlsx", sheets=["Detail"], named_ranges=["rate"])
+    {'Detail': ('Detail', None, None, None, None), 'rate': ('Inputs', 1, 2, 1, 2)}
+    """
+    # get the sheets of the workbook, and its named ranges
+    if is_xlsb(file_path):
+        if named_ranges:
+            raise ValueError("Named ranges cannot be exported from xlsb files. Export their sheets instead.")
+        wb = open_workbook_pyxlsb(file_path)
+        sheet_names = list(wb.sheets)
+        wb.close()
+        names = {}
+    else:
+        with get_mapped_zip(file_path) as zf:
+            sheet_names = list(get_sheet_parts(zf))
+            names = {name.lower(): destination for name, destination in read_defined_names(zf).items()}
+
+    # export every sheet if nothing is picked
+    if not sheets and not named_ranges:
+        sheets = sheet_names
+    missing = [sheet for sheet in sheets or [] if sheet not in sheet_names]
+    if missing:
+        raise ValueError(f"The sheets {missing} are not in the workbook {file_path}.")
+
+    sources = {sheet: (sheet, None, None, None, None) for sheet in sheets or []}
+    for named_range in named_ranges or []:
+        destination = names.get(named_range.lower())
+        if destination is None:
+            raise ValueError(f"The named range {named_range} is not found.")
+        references, _ = find_references(destination, None)
+        if len(references) != 1 or references[0].sheet is None:
+            raise ValueError(f"The named range {named_range} does not refer to a single range of cells.")
+        reference = references[0]
+        sources[named_range] = (reference.sheet, reference.min_row, reference.min_col,
+                                reference.max_row, reference.max_col)
+    return sources
+
+
+def get_column_names(header, width):
+    """
+    Description
+    -----------
+    Get the names of the columns from a header row, naming blank
+    columns by their position and making repeated names unique.
+
+    Parameters
+    ----------
+    header : tuple or None
+        The values of the header row, or None to name every column by its position.
+    width : int
+        The number of columns.
+
+    Returns
+    -------
+    list
+        The column names.
+
+    Examples
+    --------
+    >>> get_column_names(("Name", None, "Name"), 3)
+    ['Name', 'column_2', 'Name_2']
+    """
+    names = []
+    for index in range(width):
+        value = header[index] if header is not None and index < len(header) else None
+        name = f"column_{index + 1}" if value is None or str(value).strip() == "" else str(value).strip()
+        unique_name, count = name, 1
+        while unique_name in names:
+            count += 1
+            unique_name = f"{name}_{count}"
+        names.append(unique_name)
+    return names
+
+
+def infer_column_type(pa, values):
+    """
+    Description
+    -----------
+    Infer the Arrow type of a column from a sample of its values. Numbers
+    are doubles, as they are in Excel; booleans, timestamps, dates and
+    times keep their types if every value in the sample has it; and
+    anything else (text, errors, or a mix of types) is text.
+
+    Parameters
+    ----------
+    pa : module
+        pyarrow.
+    values : list
+        The sample of the values of the column.
+
+    Returns
+    -------
+    pyarrow.DataType
+        The type of the column.
+
+    Examples
+    --------
+    >>> infer_column_type(pa, [1, 2.5, None])
+    DataType(double)
+    >>> infer_column_type(pa, [1, "n/a"])
+    DataType(string)
+    """
+    kinds = {type(value) for value in values if value is not None}
+    if not kinds:
+        return pa.string()
+    if kinds == {bool}:
+        return pa.bool_()
+    if kinds <= {int, float}:
+        return pa.float64()
+    if kinds == {datetime.datetime}:
+        return pa.timestamp("us")
+    if kinds == {datetime.date}:
+        return pa.date32()
+    if kinds == {datetime.time}:
+        return pa.time64("us")
+    if kinds == {datetime.timedelta}:
+        return pa.duration("us")
+    return pa.string()
+
+
+def fit_column_values(pa, values, column_type):
+    """
+    Description
+    -----------
+    Convert the values of a column to its type. Text columns take the
+    text of any value. Values that do not fit any other type (e.g. a
+    "Total" label in a column of numbers) become nulls, and are counted.
+
+    Parameters
+    ----------
+    pa : module
+        pyarrow.
+    values : list
+        The values of the column.
+    column_type : pyarrow.DataType
+        The type of the column.
+
+    Returns
+    -------
+    tuple
+        Tuple of the form (values, mismatched), where mismatched is
+        the number of values that became nulls.
+
+    Examples
+    --------
+    >>> fit_column_values(pa, [1, "Total"], pa.float64())
+    ([1.0, None], 1)
+    """
+    if column_type == pa.string():
+        return [None if value is None else str(value) for value in values], 0
+    if column_type == pa.float64():
+        fits = lambda value: isinstance(value, (int, float)) and not isinstance(value, bool)
+    elif column_type == pa.bool_():
+        fits = lambda value: isinstance(value, bool)
+    elif column_type == pa.timestamp("us"):
+        fits = lambda value: isinstance(value, datetime.datetime)
+    elif column_type == pa.date32():
+        fits = lambda value: isinstance(value, datetime.date) and not isinstance(value, datetime.datetime)
+    elif column_type == pa.time64("us"):
+        fits = lambda value: isinstance(value, datetime.time)
+    else:
+        fits = lambda value: isinstance(value, datetime.timedelta)
+    fitted = [value if value is None or fits(value) else None for value in values]
+    return fitted, sum(1 for value, fit in zip(values, fitted) if value is not None and fit is None)
+
+
+def write_record_batches(pa, rows, file_path, file_format="parquet", header=True,
+                         batch_size=65536, infer_rows=10000, strict=False):
+    """
+    Description
+    -----------
+    Write rows to a Parquet or Feather file as Arrow record batches,
+    holding only one batch of rows in memory at a time.
+
+    The column types are inferred from the first rows (see
+    `infer_column_type`), and the width of the table is the width
+    of the widest of those rows. A later row with a value to the right
+    of it raises an error, since the schema of the file cannot be
+    widened once rows are written.
+
+    Parameters
+    ----------
+    pa : module
+        pyarrow.
+    rows : iterable
+        The rows, as tuples of values.
+    file_path : str
+        The file path to write to.
+    file_format : str, optional
+        "parquet" or "feather". Default is "parquet".
+    header : bool, optional
+        Whether the first row has the column names. Default is True.
+    batch_size : int, optional
+        The number of rows in each record batch. Default is 65536.
+    infer_rows : int, optional
+        The number of rows to infer the column types from.
+        Default is 10000.
+    strict : bool, optional
+        Whether to raise an error for a value that does not fit the type
+        of its column, instead of writing it as a null.
+        Default is False.
+
+    Returns
+    -------
+    dict
+        Dictionary of the form
+        {'path': str, 'rows': int, 'columns': {name: type}, 'mismatched': {name: int}},
+        where mismatched has the number of values of each column that
+        did not fit its type and were written as nulls.
+
+    Raises
+    ------
+    ValueError
+        If a row after the first infer_rows rows has a value to the right
+        of the widest of them.
+    ValueError
+        If strict is True, and a value does not fit the type of its column.
+
+    Imports
+    -------
+    itertools
+    pyarrow
+
+    Examples
+    --------
+    >>> write_record_batches(pa, rows, "detail.parquet")
+    {'path': 'detail.parquet', 'rows': 20, 'columns': {'Name': 'string', 'Value': 'double'}, 'mismatched': {}}
+    """
+    rows = iter(rows)
+    header_row = next(rows, None) if header else None
+    sample = list(itertools.islice(rows, max(infer_rows, 1)))
+    width = max([len(row) for row in sample] + [len(header_row or ())])
+    names = get_column_names(header_row, width)
+    types = [infer_column_type(pa, [row[index] if index < len(row) else None for row in sample])
+             for index in range(width)]
+    schema = pa.schema(list(zip(names, types)))
+
+    if file_format == "parquet":
+        import pyarrow.parquet
+        writer = pyarrow.parquet.ParquetWriter(file_path, schema)
+    else:
+        import pyarrow.ipc
+        writer = pyarrow.ipc.new_file(file_path, schema)
+
+    # the number of the first row of the rows, for errors
+    first_row = 2 if header_row is not None else 1
+
+    count = 0
+    mismatched = dict.fromkeys(names, 0)
+    try:
+        batch_rows = itertools.chain(sample, rows)
+        while True:
+            batch = list(itertools.islice(batch_rows, batch_size))
+            if not batch:
+                break
+
+            # the cells to the right of the table are only allowed to be empty
+            for position, row in enumerate(batch):
+                if len(row) > width and any(value is not None for value in row[width:]):
+                    raise ValueError(f"Row {first_row + count + position} has values to the right of the "
+                                     f"{width} columns found in the first {len(sample)} rows. "
+                                     f"Export with a larger infer_rows.")
+
+            arrays = []
+            for index, (name, column_type) in enumerate(zip(names, types)):
+                column = [row[index] if index < len(row) else None for row in batch]
+                values, missed = fit_column_values(pa, column, column_type)
+                if missed and strict:
+                    position = next(position for position, (value, fitted) in enumerate(zip(column, values))
+                                    if value is not None and fitted is None)
+                    raise ValueError(f"The value {column[position]!r} of row {first_row + count + position} "
+                                     f"does not fit the type {column_type} of the column {name}.")
+                mismatched[name] += missed
+                arrays.append(pa.array(values, type=column_type))
+            writer.write_batch(pa.record_batch(arrays, schema=schema))
+            count += len(batch)
+    finally:
+        writer.close()
+
+    return {
+        'path': file_path,
+        'rows': count,
+        'columns': {name: str(column_type) for name, column_type in zip(names, types)},
+        'mismatched': {name: missed for name, missed in mismatched.items() if missed},
+    }
+
+
+def export_sheets(file_path, output_dir, sheets=None, named_ranges=None, file_format="parquet",
+                  header=True, batch_size=65536, infer_rows=10000, strict=False):
+    """
+    Description
+    -----------
+    Export sheets and named ranges of a workbook file to columnar
+    snapshots (Parquet or Feather files), one file for each sheet or
+    named range, reading the rows as a stream and writing them in
+    Arrow record batches, so a sheet is never held in memory.
+
+    The values are the values saved in the file (the cached values of
+    formulas). xlsx and xlsm files are read with openpyxl in read-only
+    mode, and xlsb files with pyxlsb, whose dates are serial numbers.
+
+    Parameters
+    ----------
+    file_path : str
+        The file path of the workbook.
+    output_dir : str
+        The directory to write the files to. It is made if it does not
+        exist. Each file is named after its sheet or named range.
+    sheets : list, optional
+        The names of the sheets to export.
+        Default is None, which exports every sheet if no named ranges are given.
+    named_ranges : list, optional
+        The names of the named ranges to export. Not supported for xlsb files.
+    file_format : str, optional
+        "parquet" or "feather". Default is "parquet".
+    header : bool, optional
+        Whether the first row of each sheet or named range has the
+        column names. Default is True.
+    batch_size : int, optional
+        The number of rows in each record batch. Default is 65536.
+    infer_rows : int, optional
+        The number of rows to infer the column types from. Default is 10000.
+    strict : bool, optional
+        Whether to raise an error for a value that does not fit the type
+        of its column, instead of writing it as a null. Default is False.
+
+    Returns
+    -------
+    dict
+        Dictionary where the keys are the sheet names and named range names
+        and the values are as given by `write_record_batches`.
+
+    Raises
+    ------
+    ValueError
+        If the file format is not "parquet" or "feather".
+    ValueError
+        If a sheet or named range is not in the workbook (see `get_export_sources`).
+    ValueError
+        If a row is wider than the first infer_rows rows, or strict is True
+        and a value does not fit its column (see `write_record_batches`).
+    ImportError
+        If pyarrow is not installed.
+
+    Imports
+    -------
+    os
+    re
+    pyarrow
+
+    Examples
+    --------
+    >>> export_sheets("report.xlsx", "snapshots", sheets=["Detail"])
+    {'Detail': {'path': 'snapshots/Detail.parquet', 'rows': 20, ...}}
+    """
+    if file_format not in EXPORT_FORMATS:
+        raise ValueError(f"The file format {file_format} is not one of {list(EXPORT_FORMATS)}.")
+    pa = import_pyarrow()
+
+    sources = get_export_sources(file_path, sheets=sheets, named_ranges=named_ranges)
+
+    os.makedirs(output_dir, exist_ok=True)
+    results = {}
+    for name, rows in zip(sources, iter_export_rows(file_path, list(sources.values()))):
+        file_name = re.sub(r"[^\w.-]+", "_", name).strip("_") + EXPORT_FORMATS[file_format]
+        results[name] = write_record_batches(
+            pa, rows, os.path.join(output_dir, file_name), file_format=file_format,
+            header=header, batch_size=batch_size, infer_rows=infer_rows, strict=strict)
+    return results
@@ -0,0 +1,408 @@
+"""
+fan_out_template.py
+"""
+import concurrent.futures
+import html
+import os
+import re
+from xml.sax.saxutils import escape
+
+from .column_letter_from_index import column_letter_from_index
+from .date_styles import DateStyles, get_styles_part
+from .diff_workbooks import read_defined_names
+from .excel_dates import get_workbook_epoch
+from .find_links import EXTERNAL_LINK_TYPE
+from .formula_references import find_references, unquote_sheet_name
+from .get_sheet_parts import get_relationships, get_rels_part, get_sheet_parts, get_workbook_part
+from .mapped_zip import get_mapped_zip
+from .rewrite_package import rewrite_package
+from .splice_cells import set_full_calc_on_load, splice_sheet_cells
+
+
+# the relationship of an external link part, and its target
+RELATIONSHIP_PATTERN = re.compile(rb"<(?:\w+:)?Relationship\b[^>]*>")
+TARGET_PATTERN = re.compile(rb'\sTarget="([^"]*)"')
+
+# the template of each worker process and its plan,
+# set once per process by `_init_worker`
+_WORKER_TEMPLATE = {}
+
+
+def plan_template(template_path):
+    """
+    Description
+    -----------
+    Read what generating variants of a template needs from the template
+    package once: the parts of its sheets, its defined names, the parts
+    of its external links, its workbook part, its date system and its
+    styles (which dates written to its cells need).
+
+    Parameters
+    ----------
+    template_path : str
+        The file path of the template workbook (.xlsx, .xlsm or .xltx).
+
+    Returns
+    -------
+    dict
+        Dictionary of the form
+        {'sheet_parts': {sheet: part}, 'names': {lower case name: destination},
+         'links': {target: rels part}, 'workbook_part': part, 'has_calc_chain': bool,
+         'epoch': datetime.datetime, 'styles_part': part, 'styles_xml': bytes}.
+
+    Raises
+    ------
+    ValueError
+        If the template is an xlsb file.
+
+    Imports
+    -------
+    .date_styles
+    .diff_workbooks
+    .excel_dates
+    .find_links
+    .get_sheet_parts
+    .mapped_zip
+
+    Examples
+    --------
+    >>> plan_template("regional_template.xlsx")['sheet_parts']
+    {'Inputs': 'xl/worksheets/sheet1.xml', 'Summary': 'xl/worksheets/sheet2.xml'}
+    """
+    if template_path.lower().endswith(".xlsb"):
+        raise ValueError(f"The template {template_path} is an xlsb file, which cannot be written.")
+
+    with get_mapped_zip(template_path) as zf:
+        workbook_part = get_workbook_part(zf)
+        links = {}
+        for rel_type, part in get_relationships(zf, workbook_part).values():
+            if rel_type != EXTERNAL_LINK_TYPE:
+                continue
+            for link_type, target in get_relationships(zf, part).values():
+                if link_type.endswith("/externalLinkPath"):
+                    links[target] = get_rels_part(part)
+        styles_part = get_styles_part(zf)
+        return {
+            'sheet_parts': get_sheet_parts(zf),
+            'names': {name.lower(): destination for name, destination in read_defined_names(zf).items()},
+            'links': links,
+            'workbook_part': workbook_part,
+            'has_calc_chain': "xl/calcChain.xml" in zf.NameToInfo,
+            'epoch': get_workbook_epoch(zf),
+            'styles_part': styles_part,
+            'styles_xml': None if styles_part is None else zf.read(styles_part),
+        }
+
+
+def get_variant_cells(plan, variant):
+    """
+    Description
+    -----------
+    Get the cells a variant of a template writes, by sheet, from its
+    cells and its named ranges, checking them against the template.
+
+    Parameters
+    ----------
+    plan : dict
+        The plan of the template, as given by `plan_template`.
+    variant : dict
+        The variant, as given to `fan_out_template`.
+
+    Returns
+    -------
+    dict
+        Dictionary where the keys are sheet names and the values are
+        dictionaries of the new values, keyed by cell reference.
+
+    Raises
+    ------
+    ValueError
+        If a sheet, named range or link is not in the template.
+    ValueError
+        If a named range does not refer to cells of the template, or its
+        value is not a list of the same length as the named range.
+
+    Imports
+    -------
+    .column_letter_from_index
+    .formula_references
+
+    Examples
+    --------
+    >>> get_variant_cells(plan, {'file_path': 'east.xlsx', 'cells': {'Inputs': {'B1': 'East'}},
+    ...                          'named_ranges': {'growth_rate': 0.07}})
+    {'Inputs': {'B1': 'East', 'B2': 0.07}}
+    """
+    cells = {}
+    for sheet, values in variant.get('cells', {}).items():
+        if sheet not in plan['sheet_parts']:
+            raise ValueError(f"The sheet name \"{sheet}\" is not in the template.")
+        cells.setdefault(sheet, {}).update(values)
+
+    for named_range, value in variant.get('named_ranges', {}).items():
+        # a sheet-scoped name can also be written as Sheet1!name
+        keys = [named_range.lower()]
+        if "!" in named_range:
+            sheet, name = named_range.rsplit("!", 1)
+            keys = [f"{unquote_sheet_name(sheet)}!{name}".lower(), name.lower()]
+        destination = next((plan['names'][key] for key in keys if key in plan['names']), None)
+        if destination is None:
+            raise ValueError(f"The named range {named_range} is not found.")
+
+        references, _ = find_references(destination, None)
+        refs = [(reference.sheet, f"{column_letter_from_index(column)}{row}")
+                for reference in references
+                for row in range(reference.min_row, reference.max_row + 1)
+                for column in range(reference.min_col, reference.max_col + 1)]
+        if not refs or any(sheet not in plan['sheet_parts'] for sheet, _ in refs):
+            raise ValueError(f"The named range {named_range} does not refer to cells of the template.")
+        values = value if isinstance(value, list) else [value]
+        if len(values) != len(refs):
+            raise ValueError(f"The value for {named_range} is not a list " +
+                             "of the same length as the named range.")
+        for (sheet, ref), item in zip(refs, values):
+            cells.setdefault(sheet, {})[ref] = item
+
+    for link in variant.get('links', {}):
+        if link not in plan['links']:
+            raise ValueError(f"The link {link} is not in the template.")
+    return cells
+
+
+def replace_link_targets(rels_xml, links):
+    """
+    Description
+    -----------
+    Replace the targets of the external link relationships of an
+    external link part, keeping the rest of the xml as it is.
+
+    Parameters
+    ----------
+    rels_xml : bytes
+        The xml of the relationships part of the external link part.
+    links : dict
+        Dictionary where the keys are the old targets and the values are the new targets.
+
+    Returns
+    -------
+    bytes
+        The new xml.
+
+    Imports
+    -------
+    html
+    re
+    xml.sax.saxutils
+
+    Examples
+    --------
+    >>> replace_link_targets(rels_xml, {"Data2Q2024.xlsx": "Data3Q2024.xlsx"})
+    b'<?xml ...><Relationships ...><Relationship ... Target="Data3Q2024.xlsx" TargetMode="External"/></Relationships>'
+    """
+    def replace_relationship(match):
+        relationship = match.group(0)
+        if b"externalLinkPath" not in relationship:
+            return relationship
+        target = TARGET_PATTERN.search(relationship)
+        old = html.unescape(target.group(1).decode("utf-8")) if target else None
+        if old not in links:
+            return relationship
+        new = escape(links[old], {'"': "&quot;"}).encode("utf-8")
+        return relationship[:target.start(1)] + new + relationship[target.end(1):]
+
+    return RELATIONSHIP_PATTERN.sub(replace_relationship, rels_xml)
+
+
+def generate_variant(template_path, plan, variant):
+    """
+    Description
+    -----------
+    Write one variant of a template: the sheets with cells to write are
+    spliced (see `splice_sheet_cells`), the link parts with links to
+    replace are rewritten, and every other part of the template package
+    is copied without decompressing it. If any cells are written, the
+    calculation chain is dropped and the workbook is marked to be fully
+    recalculated when Excel opens it. Dates are written in the date system
+    of the template, and the cell formats they need are added to its styles.
+
+    A cell written over the first cell of a shared formula does not take
+    the formula away from the other cells of the shared formula: they get
+    the formula written into them as the sheet is spliced (see
+    `splice_sheet_rows`), so the template can be planned without looking
+    for shared formulas.
+
+    Parameters
+    ----------
+    template_path : str
+        The file path of the template workbook.
+    plan : dict
+        The plan of the template, as given by `plan_template`.
+    variant : dict
+        The variant, as given to `fan_out_template`.
+
+    Returns
+    -------
+    dict
+        Dictionary of the form {'file_path': str, 'cells': int, 'parts': [rewritten parts]}.
+
+    Raises
+    ------
+    ValueError
+        If the variant is not valid (see `get_variant_cells`).
+
+    Imports
+    -------
+    .date_styles
+    .mapped_zip
+    .rewrite_package
+    .splice_cells
+
+    Examples
+    --------
+    >>> generate_variant("template.xlsx", plan, {'file_path': 'east.xlsx', 'cells': {'Inputs': {'B1': 'East'}}})
+    {'file_path': 'east.xlsx', 'cells': 1, 'parts': ['xl/worksheets/sheet1.xml', 'xl/workbook.xml']}
+    """
+    cells = get_variant_cells(plan, variant)
+
+    # the cell formats of the template, with the ones this variant adds
+    date_styles = DateStyles(plan['styles_xml'], part=plan['styles_part'])
+
+    def splice(part, values):
+        def write_part(dst):
+            with get_mapped_zip(template_path) as zf, zf.open(part) as src:
+                splice_sheet_cells(src, dst, values, epoch=plan['epoch'], date_styles=date_styles)
+        return write_part
+
+    replace_parts = {plan['sheet_parts'][sheet]: splice(plan['sheet_parts'][sheet], values)
+                     for sheet, values in cells.items() if values}
+    drop_parts = set()
+
+    with get_mapped_zip(template_path) as zf:
+        # the link parts with links to replace
+        links = variant.get('links', {})
+        for rels_part in {plan['links'][link] for link in links}:
+            replace_parts[rels_part] = replace_link_targets(zf.read(rels_part), links)
+
+        # the formulas that depend on the cells need to be recalculated
+        if replace_parts and any(values for values in cells.values()):
+            replace_parts[plan['workbook_part']] = set_full_calc_on_load(zf.read(plan['workbook_part']))
+            if plan['has_calc_chain']:
+                drop_parts.add("xl/calcChain.xml")
+
+            # the styles are written after the sheets, once the cell formats
+            # of their dates are known
+            if date_styles.part is not None:
+                replace_parts[date_styles.part] = date_styles.write_xml
+
+    rewrite_package(template_path, variant['file_path'], replace_parts=replace_parts, drop_parts=drop_parts,
+                    write_last={date_styles.part})
+    return {
+        'file_path': variant['file_path'],
+        'cells': sum(len(values) for values in cells.values()),
+        'parts': sorted(replace_parts),
+    }
+
+
+def _init_worker(template_path, plan):
+    # each worker process gets the template and its plan once
+    _WORKER_TEMPLATE.update({'template_path': template_path, 'plan': plan})
+
+
+def _generate_in_worker(variant):
+    return _generate_variant_result(_WORKER_TEMPLATE['template_path'], _WORKER_TEMPLATE['plan'], variant)
+
+
+def _generate_variant_result(template_path, plan, variant):
+    # the result of a variant, with its error instead of raising it,
+    # so one bad variant does not stop the others
+    try:
+        return {'ok': True, **generate_variant(template_path, plan, variant)}
+    except Exception as error:
+        return {'file_path': variant.get('file_path'), 'ok': False, 'error': f"{type(error).__name__}: {error}"}
+
+
+def fan_out_template(template_path, variants, max_workers=None, use_processes=True):
+    """
+    Description
+    -----------
+    Generate many workbooks from one template, each with some cells,
+    named ranges and links changed, without loading the template with
+    openpyxl. The template package is read once, and each variant is
+    written by copying the unchanged parts of the template as they are
+    and regenerating only the parts that change (see `generate_variant`),
+    so the time to write a variant depends on its changes, not on the
+    size of the template. The variants are written in parallel, in a
+    pool of processes.
+
+    Strings are written as inline strings, so the shared strings of the
+    template are not changed. Formulas that depend on the written cells
+    are recalculated by Excel when it opens each workbook.
+
+    Parameters
+    ----------
+    template_path : str
+        The file path of the template workbook (.xlsx, .xlsm or .xltx).
+    variants : list
+        The variants, as dictionaries of the form
+            {
+                'file_path': file path of the workbook to write,
+                'cells': {sheet name: {cell reference: value}},  (optional)
+                'named_ranges': {named range: value},  (optional)
+                'links': {old link: new link},  (optional)
+            }
+        Named range values are as for `update_named_ranges`: a list with
+        one value for every cell, or a single value for a single cell.
+    max_workers : int, optional
+        The number of processes (or threads) to use.
+        Default is None, which uses the number of processors.
+    use_processes : bool, optional
+        Whether to use processes (True) or threads (False).
+        Default is True.
+
+    Returns
+    -------
+    list
+        The results of the variants, in order, as dictionaries of the form
+        {'file_path': str, 'ok': True, 'cells': int, 'parts': list}, or
+        {'file_path': str, 'ok': False, 'error': str} for variants that failed.
+
+    Raises
+    ------
+    ValueError
+        If the template is an xlsb file, a variant has no file path, or
+        two variants (or a variant and the template) have the same file path.
+
+    Imports
+    -------
+    concurrent.futures
+    os
+
+    Examples
+    --------
+    >>> variants = [{'file_path': f"reports/{region}.xlsx", 'named_ranges': {'region': region}}
+    ...             for region in regions]
+    >>> results = fan_out_template("regional_template.xlsx", variants)
+    >>> sum(result['ok'] for result in results)
+    300
+    """
+    plan = plan_template(template_path)
+
+    # check the file paths before writing anything
+    file_paths = [os.path.abspath(variant['file_path']) if variant.get('file_path') else None
+                  for variant in variants]
+    if None in file_paths:
+        raise ValueError("Every variant needs a file_path to write to.")
+    if len(set(file_paths)) != len(file_paths) or os.path.abspath(template_path) in file_paths:
+        raise ValueError("The variants need different file paths from each other and from the template.")
+
+    if len(variants) <= 1 or max_workers == 1:
+        return [_generate_variant_result(template_path, plan, variant) for variant in variants]
+
+    if use_processes:
+        executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=max_workers, initializer=_init_worker, initargs=(template_path, plan))
+        with executor:
+            return list(executor.map(_generate_in_worker, variants, chunksize=max(1, len(variants) // 64)))
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(lambda variant: _generate_variant_result(template_path, plan, variant), variants))
@@ -1,10 +1,15 @@
 """
 find_links.py
 """
-import openpyxl
 import pyxlsb
 
+from .get_sheet_parts import REL_NS, get_relationships, get_workbook_part
 from .is_xlsb import is_xlsb
+from .mapped_zip import get_mapped_zip
+
+
+# the relationship type of the external link parts of a workbook
+EXTERNAL_LINK_TYPE = REL_NS + "/externalLink"
 
 
 def find_links_pyxlsb(wb):
@@ -31,6 +36,7 @@ def find_links_pyxlsb(wb):
     Imports
     -------
     pyxlsb
+    .mapped_zip
 
     Examples
     --------
@@ -43,8 +49,10 @@ def find_links_pyxlsb(wb):
     # try to read the workbook with pyxlsb
     # if the workbook is not able to be read by pyxlsb, raise a value error
     try:
-        # use pxlsb to open the workbook and create the wb object
-        with pyxlsb.open_workbook(wb) as wb:
+        # use pxlsb to open the workbook from its memory mapping
+        # and create the wb object
+        with get_mapped_zip(wb) as mapped_zip, \
+                pyxlsb.open_workbook(mapped_zip.open_file()) as wb:
             # get the list of links in the workbook
             links = [link[0] for link in wb.links]
     except:
@@ -75,7 +83,8 @@ def find_links_openpyxl(wb):
 
     Imports
     -------
-    openpyxl
+    .get_sheet_parts
+    .mapped_zip
 
     Examples
     --------
@@ -85,17 +94,22 @@ def find_links_openpyxl(wb):
     >>> links
     ['C:\\Users\\test\\test2.xlsx']
     """
-    # try to read the workbook with openpyxl
-    # if the workbook is not able to be read by openpyxl,
-    # raise a value error
+    # read the targets of the external link parts straight from the
+    # memory-mapped workbook package, without loading the workbook
+    # if the workbook package is not able to be read, raise a value error
     try:
-        wb = openpyxl.load_workbook(wb)
+        with get_mapped_zip(wb) as mapped_zip:
+            workbook_part = get_workbook_part(mapped_zip)
+            links = []
+            for rel_type, part in get_relationships(mapped_zip, workbook_part).values():
+                if rel_type != EXTERNAL_LINK_TYPE:
+                    continue
+                # the linked file is the external target of the link part
+                links.extend(target for link_type, target in get_relationships(mapped_zip, part).values()
+                             if link_type.endswith("/externalLinkPath"))
     except:
         raise ValueError("The workbook object is not able to be read by openpyxl.")
 
-    # get the list of links in the workbook
-    links = [link.target for link in wb._external_links]
-
     # return the list of links in the workbook
     return links
 
@@ -0,0 +1,461 @@
+"""
+formula_graph.py
+"""
+import datetime
+from collections import defaultdict, deque
+
+from openpyxl.formula.translate import Translator
+from openpyxl.utils.datetime import to_excel
+
+from .column_letter_from_index import column_letter_from_index
+from .diff_workbooks import read_defined_names
+from .evaluate_formula import FormulaEvaluator, UnsupportedFormula, parse_formula
+from .excel_dates import get_workbook_epoch
+from .formula_references import find_references, move_reference
+from .get_sheet_parts import get_sheet_parts
+from .load_sheet_subset import UnloadedWorksheet
+from .mapped_zip import get_mapped_zip
+from .read_shared_strings import read_shared_strings
+from .read_sheet_rows import ErrorValue, iter_row_cells, iter_sheet_rows
+
+
+# ranges that span more columns than this are not indexed by column
+WIDE_RANGE_COLUMNS = 64
+
+
+class FormulaGraph:
+    """
+    Description
+    -----------
+    The formulas of a workbook, the cells each formula depends on, and the
+    values of the cells (with the cached values of the formulas), read
+    from the sheet xml of the workbook file. Use `build_formula_graph`
+    to build one.
+
+    When input cells change, only the formulas that depend on them
+    (directly or through other formulas) are recalculated, in dependency
+    order, with `FormulaEvaluator`. Formulas the evaluator does not support
+    keep their cached values, and are listed in `unsupported`.
+
+    Shared formulas are not translated for each cell when the graph is
+    built: the references of the first cell of a shared formula are moved
+    to each cell that shares it, and the formula itself is only translated
+    if the cell has to be recalculated.
+
+    Parameters
+    ----------
+    names : dict
+        The defined names of the workbook, as given by `read_defined_names`.
+    epoch : datetime.datetime, optional
+        The date system of the workbook, used to convert dates to serial
+        numbers. Default is the 1900 date system.
+
+    Attributes
+    ----------
+    values : dict
+        Dictionary where the keys are the sheet names and the values are
+        dictionaries of the values of the cells, keyed by (row, column).
+    formulas : dict
+        Dictionary where the keys are the cells with formulas, as tuples of
+        the form (sheet, row, column), and the values are the formulas
+        without the leading "=" (None until a shared formula is translated).
+    unsupported : set
+        The formula cells that could not be recalculated the last time
+        they were dirty, because the evaluator does not support them
+        or they are part of a circular reference.
+    recalculated : set
+        The formula cells whose values changed since the graph was built.
+
+    Methods
+    -------
+    add_sheet
+        Add the cells of a sheet, read from its xml.
+    set_value
+        Set the value of a cell, and mark it as changed.
+    set_formula
+        Set the formula of a cell, and mark it as changed.
+    update_from_workbook
+        Find the cells of an openpyxl workbook that changed since the
+        graph was built (or last updated), and mark them as changed.
+    get_dependents
+        Get the formula cells that depend directly on a cell.
+    recalculate
+        Recalculate the formulas that depend on the changed cells.
+    get_cached_values
+        Get the values of all of the formula cells, by sheet and reference.
+
+    Examples
+    --------
+    >>> graph = build_formula_graph("report.xlsx")
+    >>> graph.set_value("Inputs", 2, 2, 0.07)
+    >>> graph.recalculate()
+    {('Summary', 'B10'): 10700.0, ('Summary', 'B11'): 749.0}
+    """
+    def __init__(self, names, epoch=None):
+        self.names = {}
+        for name, definition in names.items():
+            sheet, _, local_name = name.rpartition("!")
+            self.names[(sheet or None, local_name.lower())] = definition
+        self.epoch = epoch
+
+        self.values = {}
+        self.formulas = {}
+        self.unsupported = set()
+        self.recalculated = set()
+
+        # the largest row and column in use on each sheet
+        self._dimensions = {}
+
+        # the shared formulas, by (sheet, shared index), as tuples of the
+        # form (formula, row, column, reference parts), and the shared
+        # index of each cell that shares a formula
+        self._shared_formulas = {}
+        self._shared_cells = {}
+
+        # the cells each formula depends on, and the reverse:
+        # the formulas that depend on each single cell, and on each range
+        # (indexed by sheet and column, or by sheet for very wide ranges)
+        self._precedents = {}
+        self._cell_dependents = defaultdict(set)
+        self._column_dependents = defaultdict(list)
+        self._wide_dependents = defaultdict(list)
+
+        # the cells that changed since the last recalculation
+        self._changed = set()
+
+        # the parsed formulas
+        self._parsed = {}
+
+        self.evaluator = FormulaEvaluator(self._get_cell, self._get_dimensions, self._get_name)
+
+    def _get_cell(self, sheet, row, column):
+        return self.values[sheet].get((row, column))
+
+    def _get_dimensions(self, sheet):
+        return self._dimensions.get(sheet)
+
+    def _get_name(self, sheet, name):
+        return self.names.get((sheet, name.lower()), self.names.get((None, name.lower())))
+
+    def add_sheet(self, sheet, rows, shared_strings):
+        """
+        Add the cells of a sheet, from the rows of its xml
+        (as given by `iter_sheet_rows`).
+        """
+        values = self.values.setdefault(sheet, {})
+        max_row, max_column = self._dimensions.get(sheet, (0, 0))
+        for _, row in rows:
+            for row_number, column, value, formula, attributes in iter_row_cells(row, shared_strings):
+                values[(row_number, column)] = value
+                max_row, max_column = max(max_row, row_number), max(max_column, column)
+                if formula is None:
+                    continue
+                key = (sheet, row_number, column)
+                if attributes.get("t") == "shared":
+                    shared_key = (sheet, attributes.get("si"))
+                    if formula:
+                        # the first cell of a shared formula holds its text
+                        self._shared_formulas[shared_key] = (
+                            formula, row_number, column, self._find_references(formula, sheet))
+                        self.formulas[key] = formula
+                        self._add_precedents(key, self._shared_formulas[shared_key][3])
+                    elif shared_key in self._shared_formulas:
+                        # the other cells move its references to where they are
+                        _, first_row, first_column, parts = self._shared_formulas[shared_key]
+                        self.formulas[key] = None
+                        self._shared_cells[key] = shared_key
+                        self._add_precedents(key, parts, row_number - first_row, column - first_column)
+                elif attributes.get("t") != "dataTable" and formula:
+                    self.formulas[key] = formula
+                    self._add_precedents(key, self._find_references(formula, sheet))
+        self._dimensions[sheet] = (max_row, max_column)
+
+    def _find_references(self, formula, sheet, seen=None):
+        # the reference parts a formula uses, with the references of the
+        # defined names it uses (and the names they use) in its place
+        references, names = find_references(formula, sheet)
+        seen = set() if seen is None else seen
+        for name_sheet, name in names:
+            definition = self._get_name(name_sheet or sheet, name)
+            if definition is not None and definition not in seen:
+                seen.add(definition)
+                references.extend(self._find_references(definition, name_sheet or sheet, seen))
+        return references
+
+    def _add_precedents(self, key, parts, row_offset=0, column_offset=0):
+        # index the formula under each of the cells and ranges it depends on
+        references = [reference for reference in
+                      (move_reference(part, row_offset, column_offset) for part in parts)
+                      if reference is not None]
+        self._precedents[key] = references
+        for reference in references:
+            if reference.min_row == reference.max_row and reference.min_col == reference.max_col:
+                self._cell_dependents[(reference.sheet, reference.min_row, reference.min_col)].add(key)
+            elif reference.max_col - reference.min_col < WIDE_RANGE_COLUMNS:
+                for column in range(reference.min_col, reference.max_col + 1):
+                    self._column_dependents[(reference.sheet, column)].append(
+                        (reference.min_row, reference.max_row, key))
+            else:
+                self._wide_dependents[reference.sheet].append(reference + (key,))
+
+    def get_dependents(self, sheet, row, column):
+        """
+        Get the formula cells that depend directly on a cell,
+        as a set of tuples of the form (sheet, row, column).
+        """
+        dependents = {key for key in self._cell_dependents.get((sheet, row, column), ())}
+        for min_row, max_row, key in self._column_dependents.get((sheet, column), ()):
+            if min_row <= row <= max_row:
+                dependents.add(key)
+        for reference in self._wide_dependents.get(sheet, ()):
+            if reference[1] <= row <= reference[3] and reference[2] <= column <= reference[4]:
+                dependents.add(reference[5])
+        # formulas that were replaced by values no longer depend on anything
+        return {key for key in dependents if key in self.formulas}
+
+    def get_formula(self, key):
+        """
+        Get the formula of a formula cell, without the leading "=",
+        translating shared formulas the first time they are needed.
+        """
+        formula = self.formulas[key]
+        if formula is None:
+            shared_formula, first_row, first_column, _ = self._shared_formulas[self._shared_cells[key]]
+            origin = f"{column_letter_from_index(first_column)}{first_row}"
+            target = f"{column_letter_from_index(key[2])}{key[1]}"
+            formula = Translator("=" + shared_formula, origin=origin).translate_formula(target)[1:]
+            self.formulas[key] = formula
+        return formula
+
+    def set_value(self, sheet, row, column, value):
+        """
+        Set the value of a cell, replacing its formula if it has one,
+        and mark the cell as changed.
+        """
+        key = (sheet, row, column)
+        if isinstance(value, (datetime.datetime, datetime.date, datetime.time, datetime.timedelta)):
+            value = to_excel(value) if self.epoch is None else to_excel(value, self.epoch)
+        if key in self.formulas:
+            del self.formulas[key]
+            self._parsed.pop(key, None)
+        self.values.setdefault(sheet, {})[(row, column)] = value
+        max_row, max_column = self._dimensions.get(sheet, (0, 0))
+        self._dimensions[sheet] = (max(max_row, row), max(max_column, column))
+        self._changed.add(key)
+
+    def set_formula(self, sheet, row, column, formula):
+        """
+        Set the formula of a cell (with or without the leading "="),
+        and mark the cell as changed.
+        """
+        key = (sheet, row, column)
+        formula = formula[1:] if formula.startswith("=") else formula
+        self.formulas[key] = formula
+        self._shared_cells.pop(key, None)
+        self._parsed.pop(key, None)
+        self._add_precedents(key, self._find_references(formula, sheet))
+        self.values.setdefault(sheet, {}).setdefault((row, column), None)
+        max_row, max_column = self._dimensions.get(sheet, (0, 0))
+        self._dimensions[sheet] = (max(max_row, row), max(max_column, column))
+        self._changed.add(key)
+
+    def update_from_workbook(self, wb):
+        """
+        Description
+        -----------
+        Find the cells of an openpyxl workbook that differ from the graph
+        (the cells written since the graph was built, or last updated),
+        and mark them as changed. Cells that now hold a value in place of
+        a formula, or a formula in place of a value, are updated too.
+        The formulas of cells that still hold a formula are not compared.
+        Sheets that were not loaded are skipped.
+
+        Parameters
+        ----------
+        wb : openpyxl.Workbook
+            The workbook.
+
+        Returns
+        -------
+        int
+            The number of cells that changed.
+        """
+        changed = len(self._changed)
+        for ws in wb.worksheets:
+            sheet = ws.title
+            values = self.values.setdefault(sheet, {})
+            if not hasattr(ws, "_cells") or isinstance(ws, UnloadedWorksheet):
+                continue
+
+            for (row, column), cell in ws._cells.items():
+                key = (sheet, row, column)
+                value = cell._value
+                if cell.data_type == "f":
+                    # a formula where there was none
+                    if key not in self.formulas:
+                        self.set_formula(sheet, row, column, getattr(value, "text", None) or str(value))
+                    continue
+                if cell.data_type == "e":
+                    value = ErrorValue(value)
+                elif isinstance(value, (datetime.datetime, datetime.date, datetime.time, datetime.timedelta)):
+                    value = to_excel(value, wb.epoch)
+                old_value = values.get((row, column))
+                if key in self.formulas or old_value != value or \
+                        isinstance(old_value, bool) != isinstance(value, bool) or \
+                        isinstance(old_value, ErrorValue) != isinstance(value, ErrorValue):
+                    self.set_value(sheet, row, column, value)
+
+            # cells that were deleted
+            for row, column in values.keys() - ws._cells.keys():
+                if values[(row, column)] is not None or (sheet, row, column) in self.formulas:
+                    self.set_value(sheet, row, column, None)
+
+        return len(self._changed) - changed
+
+    def recalculate(self):
+        """
+        Description
+        -----------
+        Recalculate the formulas that depend on the cells that changed since
+        the last recalculation, directly or through other formulas, and
+        nothing else. The dirty formulas are evaluated in dependency order,
+        so each formula is evaluated once, after everything it depends on.
+
+        Formulas the evaluator does not support, and formulas that are part
+        of a circular reference, keep their cached values and are added to
+        `unsupported`. The formulas that depend on them are still evaluated,
+        with the cached values.
+
+        Returns
+        -------
+        dict
+            Dictionary where the keys are tuples of the form
+            (sheet, cell reference) and the values are the new values,
+            for each formula whose value changed.
+        """
+        changed, self._changed = self._changed, set()
+
+        # find the dirty formulas, and the order they depend on each other
+        dirty = {key for key in changed if key in self.formulas}
+        edges = defaultdict(set)
+        queue = deque(changed)
+        while queue:
+            key = queue.popleft()
+            for dependent in self.get_dependents(*key):
+                if key in self.formulas and key != dependent:
+                    edges[key].add(dependent)
+                if dependent not in dirty:
+                    dirty.add(dependent)
+                    queue.append(dependent)
+        for key in dirty:
+            edges.setdefault(key, set())
+
+        # put the dirty formulas in dependency order
+        waiting = {key: 0 for key in dirty}
+        for key in dirty:
+            for dependent in edges[key]:
+                if dependent in waiting:
+                    waiting[dependent] += 1
+        ready = deque(key for key, count in waiting.items() if count == 0)
+        order = []
+        while ready:
+            key = ready.popleft()
+            order.append(key)
+            for dependent in edges[key]:
+                if dependent in waiting:
+                    waiting[dependent] -= 1
+                    if waiting[dependent] == 0:
+                        ready.append(dependent)
+
+        # the formulas left over are part of a circular reference
+        circular = dirty.difference(order)
+        self.unsupported -= dirty
+        self.unsupported |= circular
+
+        # evaluate the dirty formulas
+        results = {}
+        for key in order:
+            sheet, row, column = key
+            try:
+                if key not in self._parsed:
+                    self._parsed[key] = parse_formula(self.get_formula(key))
+                value = self.evaluator.evaluate(self._parsed[key], sheet)
+            except UnsupportedFormula:
+                self.unsupported.add(key)
+                continue
+            old_value = self.values[sheet].get((row, column))
+            self.values[sheet][(row, column)] = value
+            if old_value != value or type(old_value) is not type(value):
+                results[(sheet, f"{column_letter_from_index(column)}{row}")] = value
+                self.recalculated.add(key)
+        return results
+
+    def get_cached_values(self, sheets=None, changed_only=False):
+        """
+        Get the values of the formula cells, as a dictionary where
+        the keys are the sheet names and the values are dictionaries of
+        the values, keyed by cell reference (e.g. "B10").
+        Only the formulas of the given sheets are included, if sheets is
+        given, and only the formulas whose values changed since the graph
+        was built, if changed_only is True.
+        """
+        cached_values = defaultdict(dict)
+        for key in (self.recalculated if changed_only else self.formulas):
+            sheet, row, column = key
+            if sheets is not None and sheet not in sheets or key not in self.formulas:
+                continue
+            value = self.values[sheet].get((row, column))
+            cached_values[sheet][f"{column_letter_from_index(column)}{row}"] = value
+        return dict(cached_values)
+
+
+def build_formula_graph(file_path):
+    """
+    Description
+    -----------
+    Build the formula graph of a workbook file, from the xml of its sheets
+    (the formulas and their cached values), without loading the workbook.
+
+    Parameters
+    ----------
+    file_path : str
+        The file path of the workbook. Must be an .xlsx, .xlsm, or .xltx file.
+
+    Returns
+    -------
+    FormulaGraph
+        The formula graph of the workbook.
+
+    Raises
+    ------
+    ValueError
+        If the workbook is an xlsb file.
+
+    Imports
+    -------
+    .diff_workbooks
+    .excel_dates
+    .get_sheet_parts
+    .mapped_zip
+    .read_shared_strings
+    .read_sheet_rows
+
+    Examples
+    --------
+    >>> graph = build_formula_graph("report.xlsx")
+    >>> len(graph.formulas)
+    1250
+    """
+    # check that the workbook is not an xlsb file
+    if file_path.lower().endswith(".xlsb"):
+        raise ValueError(f"The workbook {file_path} is an xlsb file, which has no sheet xml.")
+
+    with get_mapped_zip(file_path) as zf:
+        # the date system of the workbook
+        epoch = get_workbook_epoch(zf)
+        graph = FormulaGraph(read_defined_names(zf), epoch=epoch)
+        shared_strings = read_shared_strings(zf)
+        for sheet, part in get_sheet_parts(zf).items():
+            if part in zf.NameToInfo and "worksheets/" in part:
+                graph.add_sheet(sheet, iter_sheet_rows(zf, part), shared_strings)
+    return graph
@@ -0,0 +1,258 @@
+"""
+formula_references.py
+"""
+import re
+from collections import namedtuple
+
+from .column_index_from_string import column_index_from_string
+
+
+# the largest row and column numbers of a sheet
+MAX_ROW = 1048576
+MAX_COLUMN = 16384
+
+# a sheet name, quoted or not, followed by "!"
+SHEET_PREFIX = r"(?:(?P<sheet>'(?:[^']|'')+'|[^\W\d][\w.]*)!)?"
+
+# a reference to a cell, an area, whole columns, or whole rows, with an
+# optional sheet name. References inside external references ([1]Sheet!A1),
+# function names (LOG10) and structured references (Table1[Column]) do not match
+REFERENCE_PATTERN = re.compile(
+    r"(?<![\w.$'!\]:])" + SHEET_PREFIX
+    + r"(?:(?P<abs_col1>\$?)(?P<col1>[A-Za-z]{1,3})(?P<abs_row1>\$?)(?P<row1>\d+)"
+    + r"(?::(?P<abs_col2>\$?)(?P<col2>[A-Za-z]{1,3})(?P<abs_row2>\$?)(?P<row2>\d+))?"
+    + r"|(?P<abs_cols1>\$?)(?P<cols1>[A-Za-z]{1,3}):(?P<abs_cols2>\$?)(?P<cols2>[A-Za-z]{1,3})"
+    + r"|(?P<abs_rows1>\$?)(?P<rows1>\d+):(?P<abs_rows2>\$?)(?P<rows2>\d+))"
+    + r"(?![\w.(!:\[])")
+
+# a defined name, with an optional sheet name
+NAME_PATTERN = re.compile(
+    r"(?<![\w.$'!\]:])" + SHEET_PREFIX + r"(?P<name>[^\W\d][\w.]*)(?![\w.(!\[])")
+
+# string literals and error values, which are removed before looking
+# for references
+STRING_PATTERN = re.compile(r'"(?:[^"]|"")*"|#(?:NULL!|DIV/0!|VALUE!|REF!|NAME\?|NUM!|N/A|GETTING_DATA)')
+
+# a reference to a cell or area of a sheet, e.g. ('Sheet1', 1, 1, 10, 2)
+# for Sheet1!A1:B10
+Reference = namedtuple("Reference", ["sheet", "min_row", "min_col", "max_row", "max_col"])
+
+# the parts of a reference as they are written in a formula, with whether
+# each part is absolute ($), so it can be moved with the formula
+ReferenceParts = namedtuple("ReferenceParts", [
+    "sheet",
+    "min_row", "min_row_absolute", "min_col", "min_col_absolute",
+    "max_row", "max_row_absolute", "max_col", "max_col_absolute",
+    ])
+
+
+def unquote_sheet_name(sheet):
+    """
+    Description
+    -----------
+    Remove the quotes from a sheet name as it is written in a formula.
+
+    Parameters
+    ----------
+    sheet : str
+        The sheet name, e.g. "'My Sheet'" or "Sheet1".
+
+    Returns
+    -------
+    str
+        The sheet name, e.g. "My Sheet" or "Sheet1".
+
+    Examples
+    --------
+    >>> unquote_sheet_name("'Bob''s Sheet'")
+    "Bob's Sheet"
+    """
+    if sheet.startswith("'") and sheet.endswith("'"):
+        return sheet[1:-1].replace("''", "'")
+    return sheet
+
+
+def get_reference_parts(match, default_sheet):
+    """
+    Description
+    -----------
+    Get the parts of a reference from a match of REFERENCE_PATTERN.
+
+    Parameters
+    ----------
+    match : re.Match
+        The match of the reference.
+    default_sheet : str
+        The sheet the formula is on, used when the reference
+        does not name a sheet.
+
+    Returns
+    -------
+    ReferenceParts
+        The parts of the reference. Whole columns run from row 1 to
+        MAX_ROW, and whole rows run from column 1 to MAX_COLUMN.
+
+    Imports
+    -------
+    .column_index_from_string
+
+    Examples
+    --------
+    >>> get_reference_parts(REFERENCE_PATTERN.search("SUM($A1:B$10)"), "Sheet1")
+    ReferenceParts(sheet='Sheet1', min_row=1, min_row_absolute=False, min_col=1, ...)
+    """
+    sheet = unquote_sheet_name(match.group("sheet")) if match.group("sheet") else default_sheet
+    groups = match.groupdict()
+
+    if groups["col1"] is not None:
+        min_row, min_col = int(groups["row1"]), column_index_from_string(groups["col1"].upper())
+        min_row_absolute, min_col_absolute = bool(groups["abs_row1"]), bool(groups["abs_col1"])
+        if groups["col2"] is not None:
+            max_row, max_col = int(groups["row2"]), column_index_from_string(groups["col2"].upper())
+            max_row_absolute, max_col_absolute = bool(groups["abs_row2"]), bool(groups["abs_col2"])
+        else:
+            max_row, max_col = min_row, min_col
+            max_row_absolute, max_col_absolute = min_row_absolute, min_col_absolute
+    elif groups["cols1"] is not None:
+        min_row, max_row, min_row_absolute, max_row_absolute = 1, MAX_ROW, True, True
+        min_col, max_col = column_index_from_string(groups["cols1"].upper()), \
+            column_index_from_string(groups["cols2"].upper())
+        min_col_absolute, max_col_absolute = bool(groups["abs_cols1"]), bool(groups["abs_cols2"])
+    else:
+        min_col, max_col, min_col_absolute, max_col_absolute = 1, MAX_COLUMN, True, True
+        min_row, max_row = int(groups["rows1"]), int(groups["rows2"])
+        min_row_absolute, max_row_absolute = bool(groups["abs_rows1"]), bool(groups["abs_rows2"])
+
+    return ReferenceParts(sheet, min_row, min_row_absolute, min_col, min_col_absolute,
+                          max_row, max_row_absolute, max_col, max_col_absolute)
+
+
+def move_reference(parts, row_offset=0, column_offset=0):
+    """
+    Description
+    -----------
+    Get the reference that the parts of a reference point to once the
+    formula they are in is moved (or shared) by a number of rows and
+    columns. Absolute parts stay where they are.
+
+    Parameters
+    ----------
+    parts : ReferenceParts
+        The parts of the reference.
+    row_offset : int, optional
+        The number of rows the formula is moved by.
+        Default is 0.
+    column_offset : int, optional
+        The number of columns the formula is moved by.
+        Default is 0.
+
+    Returns
+    -------
+    Reference or None
+        The reference, with its corners in order,
+        or None if the reference moves off the sheet.
+
+    Examples
+    --------
+    >>> parts = get_reference_parts(REFERENCE_PATTERN.search("A$1"), "Sheet1")
+    >>> move_reference(parts, row_offset=4, column_offset=1)
+    Reference(sheet='Sheet1', min_row=1, min_col=2, max_row=1, max_col=2)
+    """
+    min_row = parts.min_row if parts.min_row_absolute else parts.min_row + row_offset
+    max_row = parts.max_row if parts.max_row_absolute else parts.max_row + row_offset
+    min_col = parts.min_col if parts.min_col_absolute else parts.min_col + column_offset
+    max_col = parts.max_col if parts.max_col_absolute else parts.max_col + column_offset
+    min_row, max_row = min(min_row, max_row), max(min_row, max_row)
+    min_col, max_col = min(min_col, max_col), max(min_col, max_col)
+    if min_row < 1 or min_col < 1 or max_row > MAX_ROW or max_col > MAX_COLUMN:
+        return None
+    return Reference(parts.sheet, min_row, min_col, max_row, max_col)
+
+
+def parse_reference(text, default_sheet):
+    """
+    Description
+    -----------
+    Parse a reference written the way it is in a formula.
+
+    Parameters
+    ----------
+    text : str
+        The reference, e.g. "'My Sheet'!$A$1:$B$10", "A:A", or "B2".
+    default_sheet : str
+        The sheet to use when the reference does not name a sheet.
+
+    Returns
+    -------
+    Reference or None
+        The reference, or None if the text is not a reference
+        (e.g. a defined name).
+
+    Examples
+    --------
+    >>> parse_reference("'My Sheet'!$A$1:$B$10", "Sheet1")
+    Reference(sheet='My Sheet', min_row=1, min_col=1, max_row=10, max_col=2)
+    >>> parse_reference("Premium", "Sheet1") is None
+    True
+    """
+    match = REFERENCE_PATTERN.fullmatch(text.strip())
+    if match is None:
+        return None
+    return move_reference(get_reference_parts(match, default_sheet))
+
+
+def find_references(formula, default_sheet):
+    """
+    Description
+    -----------
+    Find the references and defined names a formula uses, without
+    tokenizing it. String literals and error values are skipped.
+
+    Parameters
+    ----------
+    formula : str
+        The formula, with or without the leading "=".
+    default_sheet : str
+        The sheet the formula is on.
+
+    Returns
+    -------
+    tuple
+        Tuple of the form (references, names), where references is a list
+        of ReferenceParts and names is a list of tuples of the form
+        (sheet or None, name).
+
+    Imports
+    -------
+    re
+
+    Examples
+    --------
+    >>> references, names = find_references("=SUM(A1:A10)*Rate+Inputs!B2", "Sheet1")
+    >>> len(references), names
+    (2, [(None, 'Rate')])
+    """
+    text = STRING_PATTERN.sub(lambda match: " " * len(match.group(0)), formula)
+
+    # find the references, and blank them out so they are not taken as names
+    references = []
+    pieces = []
+    position = 0
+    for match in REFERENCE_PATTERN.finditer(text):
+        references.append(get_reference_parts(match, default_sheet))
+        pieces.append(text[position:match.start()])
+        pieces.append(" " * (match.end() - match.start()))
+        position = match.end()
+    pieces.append(text[position:])
+    text = "".join(pieces)
+
+    # what is left that looks like a name is a defined name
+    # (function names are followed by "(", and so do not match)
+    names = []
+    for match in NAME_PATTERN.finditer(text):
+        if match.group("name").upper() in ("TRUE", "FALSE"):
+            continue
+        sheet = unquote_sheet_name(match.group("sheet")) if match.group("sheet") else None
+        names.append((sheet, match.group("name")))
+
+    return references, names
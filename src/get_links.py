@@ -103,16 +103,8 @@ def get_links_openpyxl(wb):
     if not isinstance(wb, openpyxl.Workbook):
         raise ValueError("The wb object is not a wb object.")
 
-    # checks that the wb object points to a file that
-    # ends in .xlsx, .xlsm, or .xltx
-    # if the wb object does not point to a file that
-    # ends in .xlsx, .xlsm, or .xltx, raise a value error
-    if not wb.path.endswith((".xlsx", ".xlsm", ".xltx")):
-        raise ValueError("The wb object does not point to a file " +
-        "that ends in .xlsx, .xlsm, or .xltx.")
-
-    # get the links
-    links = wb._external_links
+    # get the targets of the links
+    links = [link.file_link.Target for link in wb._external_links]
 
     # return the links
     return links
@@ -0,0 +1,79 @@
+"""
+get_macro_sheets.py
+"""
+from .diff_workbooks import read_defined_names
+from .formula_references import find_references, unquote_sheet_name
+from .get_sheet_parts import get_sheet_parts
+from .mapped_zip import get_mapped_zip
+
+
+def get_macro_sheets(cosmo_macro, file_path):
+    """
+    Description
+    -----------
+    Get the sheets of a workbook that a cosmo macro writes to, read from
+    the workbook file without loading it, so the macro can be run on a
+    workbook where only those sheets are loaded (see `load_sheet_subset`).
+
+    The named ranges of each update_named_ranges action are looked up in
+    the defined names of the workbook, and the sheets they point to are
+    the sheets the macro writes to, along with the sheets of the writes of
+    each update_range action. The other actions work on the workbook
+    file, or on every sheet, and do not need any sheet to be loaded.
+
+    Parameters
+    ----------
+    cosmo_macro : dict
+        The cosmo macro, of the form {'cosmo_log': [actions]}.
+    file_path : str
+        The file path of the workbook the macro is run on.
+
+    Returns
+    -------
+    list
+        The names of the sheets the macro writes to, in workbook order.
+
+    Raises
+    ------
+    ValueError
+        If a named range of the macro is not in the workbook.
+
+    Imports
+    -------
+    .diff_workbooks
+    .formula_references
+    .get_sheet_parts
+    .mapped_zip
+
+    Examples
+    --------
+    >>> get_macro_sheets({'cosmo_log': [{'action': 'update_named_ranges',
+    ...                                   'named_ranges': {'growth_rate': 0.07}}]}, "report.xlsx")
+    ['Inputs']
+    """
+    with get_mapped_zip(file_path) as zf:
+        sheet_names = list(get_sheet_parts(zf))
+        names = {name.lower(): destination for name, destination in read_defined_names(zf).items()}
+
+    sheets = set()
+    for action in cosmo_macro.get("cosmo_log", []):
+        if action["action"] == "update_range":
+            sheets.update(write["sheet"] for write in action["writes"])
+            continue
+        if action["action"] != "update_named_ranges":
+            continue
+        for named_range in action["named_ranges"]:
+            # a sheet-scoped name can also be written as Sheet1!name,
+            # and is looked up in the scope of its sheet first
+            keys = [named_range.lower()]
+            if "!" in named_range:
+                sheet, name = named_range.rsplit("!", 1)
+                keys = [f"{unquote_sheet_name(sheet)}!{name}".lower(), name.lower()]
+            destination = next((names[key] for key in keys if key in names), None)
+            if destination is None:
+                raise ValueError(f"The named range {named_range} is not found.")
+
+            references, _ = find_references(destination, None)
+            sheets.update(reference.sheet for reference in references if reference.sheet is not None)
+
+    return [sheet for sheet in sheet_names if sheet in sheets]
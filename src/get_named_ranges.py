@@ -2,11 +2,11 @@
 get_named_ranges.py
 """
 
-import re
 import openpyxl
 import pyxlsb
 
 from .is_xlsb import is_xlsb
+from .name_index import get_name_index
 
 def get_named_ranges_pyxlsb(wb):
     """
@@ -83,13 +83,12 @@ def get_named_ranges_openpyxl(wb):
     Raises
     ------
     ValueError
-        If the wb is not an openpyxl workbook object,
-        with file extension ".xlsx", ".xlsm", or ".xltx".
+        If the wb is not an openpyxl workbook object.
 
     Imports
     -------
     openpyxl
-    re
+    .name_index
 
     Examples
     --------
@@ -98,23 +97,9 @@ def get_named_ranges_openpyxl(wb):
     """
     # test if the workbook is an openpyxl workbook object
     if isinstance(wb, openpyxl.Workbook):
-        # test if the workbook is an openpyxl workbook object
-        # with file extension ".xlsx", ".xlsm", or ".xltx"
-        if re.search(r"\.(xlsx|xlsm|xltx)$", wb.path) is not None:
-            # return the named ranges in the workbook
-            named_ranges = {}
-
-            # loop through the named ranges in the workbook
-            for name in wb.defined_names.definedName:
-                # add the name and value of the named range to the dictionary
-                named_ranges[name.name] = name.value
-            return named_ranges
-        # if the workbook is not an openpyxl workbook object
-        # with file extension ".xlsx", ".xlsm", or ".xltx",
-        # return nothing and raise a value error
-        else:
-            raise ValueError("""wb is not an openpyxl workbook object,
-            with file extension '.xlsx', '.xlsm', or '.xltx'""")
+        # the names are read from the name index of the workbook,
+        # which is built once per workbook instead of on every call
+        return get_name_index(wb).to_dict()
     # if the workbook is not an openpyxl workbook object,
     # return nothing and raise a value error
     else:
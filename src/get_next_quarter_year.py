@@ -0,0 +1,81 @@
+"""
+get_next_quarter_year.py
+"""
+
+
+
+def get_next_quarter_year(year, quarter):
+    """
+    Description
+    -----------
+    Get the quarter and year of the next quarter.
+
+    Parameters
+    ----------
+    year : int
+        The year.
+    quarter : int
+        The quarter.
+
+    Returns
+    -------
+    next_year : int
+        The year of the next quarter.
+    next_qtr : int
+        The quarter of the next quarter.
+
+    Raises
+    ------
+    ValueError
+        If the year is not an integer.
+    ValueError
+        If the quarter is not an integer.
+    ValueError
+        If the quarter is not a number 1-4.
+
+    Imports
+    -------
+    None
+
+    Examples
+    --------
+    >>> next_year, next_qtr = get_next_quarter_year(2018, 4)
+    >>> next_year
+    2019
+    >>> next_qtr
+    1
+
+    >>> next_year, next_qtr = get_next_quarter_year(2018, 1)
+    >>> next_year
+    2018
+    >>> next_qtr
+    2
+    """
+    # checks that the year is an integer
+    # if the year is not an integer, raise a value error
+    if not isinstance(year, int):
+        raise ValueError(f"The year {year} is not an integer.")
+
+    # checks that the quarter is an integer
+    # if the quarter is not an integer, raise a value error
+    if not isinstance(quarter, int):
+        raise ValueError(f"The quarter {quarter} is not an integer.")
+
+    # checks that the quarter is a number 1-4
+    # if the quarter is not a number 1-4, raise a value error
+    if not 1 <= quarter <= 4:
+        raise ValueError(f"The quarter {quarter} is not a number 1-4.")
+
+    # if the quarter is 4, the next quarter is 1 of the next year
+    if quarter == 4:
+        next_year = year + 1
+        next_qtr = 1
+
+    # if the quarter is not 4, the next quarter is
+    # the current quarter plus 1, in the current year
+    else:
+        next_year = year
+        next_qtr = quarter + 1
+
+    # return the year and quarter of the next quarter
+    return next_year, next_qtr
@@ -0,0 +1,197 @@
+"""
+get_sheet_parts.py
+"""
+import posixpath
+import xml.etree.ElementTree as ET
+
+
+# namespaces used in the workbook part and in the relationship parts
+MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+PACKAGE_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+OFFICE_DOCUMENT_TYPE = REL_NS + "/officeDocument"
+
+
+def get_rels_part(part):
+    """
+    Description
+    -----------
+    Get the name of the relationship part that belongs to a part
+    of the workbook package.
+
+    Parameters
+    ----------
+    part : str
+        The name of the part, e.g. "xl/workbook.xml".
+
+    Returns
+    -------
+    str
+        The name of the relationship part, e.g. "xl/_rels/workbook.xml.rels".
+
+    Examples
+    --------
+    >>> get_rels_part("xl/workbook.xml")
+    'xl/_rels/workbook.xml.rels'
+    >>> get_rels_part("xl/worksheets/sheet1.xml")
+    'xl/worksheets/_rels/sheet1.xml.rels'
+    """
+    directory, file_name = posixpath.split(part)
+    return posixpath.join(directory, "_rels", file_name + ".rels")
+
+
+def resolve_part_target(source_part, target):
+    """
+    Description
+    -----------
+    Resolve the target of a relationship to the name of a part
+    in the workbook package. Targets are either absolute
+    ("/xl/worksheets/sheet1.xml") or relative to the directory
+    of the part the relationship belongs to ("worksheets/sheet1.xml").
+
+    Parameters
+    ----------
+    source_part : str
+        The name of the part the relationship belongs to,
+        e.g. "xl/workbook.xml". Use "" for the package relationships.
+    target : str
+        The target of the relationship.
+
+    Returns
+    -------
+    str
+        The name of the part in the package, without a leading slash.
+
+    Imports
+    -------
+    posixpath
+
+    Examples
+    --------
+    >>> resolve_part_target("xl/workbook.xml", "worksheets/sheet1.xml")
+    'xl/worksheets/sheet1.xml'
+    >>> resolve_part_target("xl/workbook.xml", "/xl/worksheets/sheet1.xml")
+    'xl/worksheets/sheet1.xml'
+    """
+    if target.startswith("/"):
+        return target.lstrip("/")
+    return posixpath.normpath(posixpath.join(posixpath.dirname(source_part), target))
+
+
+def get_relationships(zf, part):
+    """
+    Description
+    -----------
+    Read the relationships of a part of the workbook package.
+
+    Parameters
+    ----------
+    zf : zipfile.ZipFile or MappedZip
+        The workbook package.
+    part : str
+        The name of the part, e.g. "xl/workbook.xml".
+        Use "" for the package relationships ("_rels/.rels").
+
+    Returns
+    -------
+    dict
+        Dictionary where the keys are the relationship ids and the values
+        are tuples of the form (type, part name). Relationships to
+        external targets (like linked workbooks) keep their target as is.
+
+    Imports
+    -------
+    xml.etree.ElementTree
+
+    Examples
+    --------
+    >>> get_relationships(zf, "xl/workbook.xml")
+    {'rId1': ('http://.../worksheet', 'xl/worksheets/sheet1.xml'), ...}
+    """
+    # get the name of the relationship part
+    rels_part = "_rels/.rels" if part == "" else get_rels_part(part)
+
+    # a part without a relationship part has no relationships
+    if rels_part not in zf.NameToInfo:
+        return {}
+
+    relationships = {}
+    root = ET.fromstring(zf.read(rels_part))
+    for rel in root.iter(f"{{{PACKAGE_REL_NS}}}Relationship"):
+        target = rel.get("Target")
+        if rel.get("TargetMode") != "External":
+            target = resolve_part_target(part, target)
+        relationships[rel.get("Id")] = (rel.get("Type"), target)
+    return relationships
+
+
+def get_workbook_part(zf):
+    """
+    Description
+    -----------
+    Get the name of the workbook part of the workbook package,
+    which is almost always "xl/workbook.xml".
+
+    Parameters
+    ----------
+    zf : zipfile.ZipFile or MappedZip
+        The workbook package.
+
+    Returns
+    -------
+    str
+        The name of the workbook part.
+
+    Examples
+    --------
+    >>> get_workbook_part(zf)
+    'xl/workbook.xml'
+    """
+    for rel_type, target in get_relationships(zf, "").values():
+        if rel_type == OFFICE_DOCUMENT_TYPE:
+            return target
+    return "xl/workbook.xml"
+
+
+def get_sheet_parts(zf):
+    """
+    Description
+    -----------
+    Get the names of the parts of the workbook package that hold
+    each sheet, read from the workbook part and its relationships
+    (without loading the workbook).
+
+    Parameters
+    ----------
+    zf : zipfile.ZipFile or MappedZip
+        The workbook package.
+
+    Returns
+    -------
+    dict
+        Dictionary where the keys are the sheet names, in workbook order,
+        and the values are the names of the sheet parts.
+
+    Imports
+    -------
+    xml.etree.ElementTree
+
+    Examples
+    --------
+    >>> import zipfile
+    >>> with zipfile.ZipFile("test.xlsx") as zf:
+    ...     get_sheet_parts(zf)
+    {'Sheet1': 'xl/worksheets/sheet1.xml', 'Sheet2': 'xl/worksheets/sheet2.xml'}
+    """
+    # get the workbook part and its relationships
+    workbook_part = get_workbook_part(zf)
+    relationships = get_relationships(zf, workbook_part)
+
+    # map the sheet names to the parts of their relationships
+    sheet_parts = {}
+    root = ET.fromstring(zf.read(workbook_part))
+    for sheet in root.iter(f"{{{MAIN_NS}}}sheet"):
+        rel_id = sheet.get(f"{{{REL_NS}}}id")
+        if rel_id in relationships:
+            sheet_parts[sheet.get("name")] = relationships[rel_id][1]
+    return sheet_parts
@@ -0,0 +1,434 @@
+"""
+incremental_refresh.py
+"""
+import datetime
+import hashlib
+import json
+import os
+import tempfile
+
+from .check_links import read_workbook_links, resolve_link_target
+
+
+# the version of the manifest format, kept in the manifest
+MANIFEST_VERSION = 1
+
+# the number of bytes to read at a time when hashing a file
+HASH_CHUNK_SIZE = 1 << 20
+
+
+def get_file_key(file_path):
+    """
+    Description
+    -----------
+    Get the key of a file in a refresh manifest: its absolute path,
+    in the case the file system compares paths in.
+
+    Parameters
+    ----------
+    file_path : str
+        The file path.
+
+    Returns
+    -------
+    str
+        The key of the file.
+
+    Imports
+    -------
+    os
+
+    Examples
+    --------
+    >>> get_file_key("reports/../data/Data2Q2024.xlsx")
+    '/share/finance/data/Data2Q2024.xlsx'
+    """
+    return os.path.normcase(os.path.abspath(file_path))
+
+
+def fingerprint_file(file_path, known=None):
+    """
+    Description
+    -----------
+    Get the fingerprint of the content of a file: its SHA-256 hash, with
+    its size and modification time. If the file has the size and the
+    modification time of a fingerprint it had before, the hash of that
+    fingerprint is used instead of reading the file again, so only the
+    files that were saved since they were last fingerprinted are read.
+
+    Parameters
+    ----------
+    file_path : str
+        The file path.
+    known : dict, optional
+        A fingerprint of the file from before.
+        Default is None.
+
+    Returns
+    -------
+    dict or None
+        The fingerprint, of the form {'size': int, 'mtime_ns': int, 'sha256': str},
+        or None if the file is not there.
+
+    Imports
+    -------
+    hashlib
+    os
+
+    Examples
+    --------
+    >>> fingerprint_file("Data2Q2024.xlsx")
+    {'size': 48213, 'mtime_ns': 1718000000000000000, 'sha256': '9f86d08...'}
+    >>> fingerprint_file("Data3Q2024.xlsx")
+    None
+    """
+    try:
+        stat = os.stat(file_path)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    if known is not None and known['size'] == stat.st_size and known['mtime_ns'] == stat.st_mtime_ns:
+        return known
+
+    # the size and modification time are taken before the file is read,
+    # so a file saved while it is read is read again the next time
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest.hexdigest()}
+
+
+def fingerprint_macro(cosmo_macro):
+    """
+    Description
+    -----------
+    Get the fingerprint of a cosmo macro: the SHA-256 hash of its actions,
+    without their timestamps, so a macro that is saved again with the same
+    actions has the same fingerprint.
+
+    Parameters
+    ----------
+    cosmo_macro : dict
+        The cosmo macro, as given by `load_cosmo_macro`.
+
+    Returns
+    -------
+    str
+        The fingerprint of the macro.
+
+    Imports
+    -------
+    hashlib
+    json
+
+    Examples
+    --------
+    >>> fingerprint_macro({'cosmo_log': [{'action': 'update_named_ranges', 'named_ranges': {'rate': 0.05}}]})
+    '5d41402...'
+    """
+    actions = [{key: value for key, value in action.items() if key != 'timestamp'}
+               for action in cosmo_macro['cosmo_log']]
+    text = json.dumps(actions, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def load_refresh_manifest(manifest_path):
+    """
+    Description
+    -----------
+    Load a refresh manifest (see `refresh_workbooks`), or start an empty
+    one if the file is not there.
+
+    Parameters
+    ----------
+    manifest_path : str
+        The file path of the manifest.
+
+    Returns
+    -------
+    dict
+        The manifest, of the form
+        {'version': int, 'files': {file: fingerprint},
+         'workbooks': {workbook: {'macro': str, 'inputs': {file: str or None}, 'refreshed': str}}}.
+
+    Raises
+    ------
+    ValueError
+        If the file is not a refresh manifest of this version.
+
+    Imports
+    -------
+    json
+    os
+
+    Examples
+    --------
+    >>> load_refresh_manifest("nightly.manifest.json")["workbooks"].keys()
+    dict_keys(['/share/finance/Report2Q2024.xlsx'])
+    """
+    if not os.path.exists(manifest_path):
+        return {'version': MANIFEST_VERSION, 'files': {}, 'workbooks': {}}
+    with open(manifest_path, encoding="utf-8") as fh:
+        manifest = json.load(fh)
+    if not isinstance(manifest, dict) or manifest.get('version') != MANIFEST_VERSION:
+        raise ValueError(f"The file {manifest_path} is not a refresh manifest of version {MANIFEST_VERSION}.")
+    manifest.setdefault('files', {})
+    manifest.setdefault('workbooks', {})
+    return manifest
+
+
+def save_refresh_manifest(manifest, manifest_path):
+    """
+    Description
+    -----------
+    Save a refresh manifest to a json file. The manifest is written to a
+    temporary file next to it first, which then replaces the manifest,
+    so a run that stops part way never leaves half a manifest.
+
+    Parameters
+    ----------
+    manifest : dict
+        The manifest, as given by `load_refresh_manifest`.
+    manifest_path : str
+        The file path of the manifest.
+
+    Returns
+    -------
+    None
+
+    Imports
+    -------
+    json
+    os
+    tempfile
+
+    Examples
+    --------
+    >>> save_refresh_manifest(manifest, "nightly.manifest.json")
+    """
+    directory = os.path.dirname(os.path.abspath(manifest_path))
+    fd, temp_path = tempfile.mkstemp(suffix=".json", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as fh:
+            json.dump(manifest, fh, indent=1, sort_keys=True)
+        os.replace(temp_path, manifest_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def order_workbooks(dependencies):
+    """
+    Description
+    -----------
+    Put workbooks in dependency order, as levels: every workbook comes in
+    a level after the workbooks it depends on, and the workbooks of a level
+    do not depend on each other, so they can be run at the same time.
+    Workbooks that depend on each other in a cycle are put in a last level,
+    in the order they were given, with a warning.
+
+    Parameters
+    ----------
+    dependencies : dict
+        Dictionary where the keys are the workbooks, in order, and the
+        values are the sets of the workbooks they depend on.
+
+    Returns
+    -------
+    list
+        The levels, as lists of workbooks in the order they were given.
+
+    Examples
+    --------
+    >>> order_workbooks({"Summary.xlsx": {"Data.xlsx"}, "Data.xlsx": set(), "Other.xlsx": set()})
+    [['Data.xlsx', 'Other.xlsx'], ['Summary.xlsx']]
+    """
+    levels = []
+    done = set()
+    remaining = list(dependencies)
+    while remaining:
+        level = [workbook for workbook in remaining if dependencies[workbook] <= done]
+        if not level:
+            print(f"Warning: the workbooks {remaining} link to each other in a cycle, "
+                  "so they are run in the order they were given.")
+            levels.append(remaining)
+            break
+        levels.append(level)
+        done.update(level)
+        remaining = [workbook for workbook in remaining if workbook not in done]
+    return levels
+
+
+def refresh_workbooks(file_paths, cosmo_macro, manifest_path, run, force=False, dry_run=False):
+    """
+    Description
+    -----------
+    Run a cosmo macro on only the workbooks whose inputs changed since it
+    was last run on them, the way make rebuilds only what is out of date.
+
+    The inputs of a workbook are the workbook itself, the files its links
+    point to, and the macro. A manifest keeps a content fingerprint of each
+    of them (see `fingerprint_file` and `fingerprint_macro`) from the last
+    successful run, and a workbook is run again if any fingerprint changed,
+    if its links changed, or if it is not in the manifest yet. Files whose
+    size and modification time did not change are not read again.
+
+    Workbooks that link to other workbooks being refreshed are run after
+    them, and their fingerprints are taken then, so a workbook is run again
+    when a workbook it links to changes in this run. A workbook that links
+    to one that failed is not run, and neither is recorded in the manifest,
+    so both are tried again the next time. The manifest is saved after
+    each level of workbooks (see `order_workbooks`).
+
+    Parameters
+    ----------
+    file_paths : list
+        The file paths of the workbooks.
+    cosmo_macro : dict
+        The cosmo macro, as given by `load_cosmo_macro`.
+    manifest_path : str
+        The file path of the manifest. It is made if it does not exist.
+    run : callable
+        Function that runs the macro on a list of workbooks (which can
+        be run at the same time) and gives a list of results, in the same
+        order, as dictionaries with an 'ok' key.
+    force : bool, optional
+        Whether to run every workbook, whether or not its inputs changed,
+        and record the new fingerprints. Default is False.
+    dry_run : bool, optional
+        Whether to only show which workbooks would be run, and why, without
+        running them or saving the manifest. A workbook that links to one
+        that would be run is shown as one that would be run too.
+        Default is False.
+
+    Returns
+    -------
+    list
+        The workbooks, in the order they were given, as dictionaries of the
+        form {'file': str, 'ok': bool, 'status': str, 'changed': list, ...},
+        where 'status' is
+            'refreshed' if the macro was run,
+            'current' if nothing changed,
+            'stale' if the macro would be run (with dry_run),
+            'failed' if the links could not be read or the macro failed, or
+            'blocked' if a workbook it links to failed,
+        and 'changed' lists what changed: 'new', 'forced', 'macro', or the
+        keys (see `get_file_key`) of the files that changed. The results of
+        run are added to the workbooks that were run.
+
+    Imports
+    -------
+    datetime
+    .check_links
+
+    Examples
+    --------
+    >>> macro = load_cosmo_macro("roll_forward.cosmomacro")
+    >>> results = refresh_workbooks(glob.glob("reports/*.xlsx"), macro, "nightly.manifest.json",
+    ...                             run=lambda paths: [run_macro(path) for path in paths])
+    >>> [(result['file'], result['changed']) for result in results if result['status'] == 'refreshed']
+    [('reports/Summary2Q2024.xlsx', ['/share/finance/data/Data2Q2024.xlsx'])]
+    """
+    manifest = load_refresh_manifest(manifest_path)
+    macro_fingerprint = fingerprint_macro(cosmo_macro)
+    paths = {}
+    for file_path in file_paths:
+        paths.setdefault(get_file_key(file_path), file_path)
+
+    # the fingerprints of the files in this run,
+    # taken the first time each file is needed
+    fingerprints = {}
+
+    def fingerprint(key):
+        if key not in fingerprints:
+            fingerprints[key] = fingerprint_file(key, manifest['files'].get(key))
+        return fingerprints[key]
+
+    def get_inputs(key):
+        # the workbook and the files its links point to
+        links, _ = read_workbook_links(paths[key])
+        targets = (resolve_link_target(paths[key], link) for link in links)
+        return [key] + sorted({get_file_key(target) for target in targets if target is not None} - {key})
+
+    # read the links of every workbook, to find the workbooks each one depends on
+    inputs = {}
+    results = {}
+    for key, file_path in paths.items():
+        try:
+            inputs[key] = get_inputs(key)
+        except Exception as error:
+            results[key] = {'file': file_path, 'ok': False, 'status': 'failed', 'changed': [],
+                            'error': f"{type(error).__name__}: {error}"}
+    dependencies = {key: {target for target in inputs.get(key, [])[1:] if target in paths}
+                    for key in paths}
+
+    for level in order_workbooks(dependencies):
+        stale = []
+        for key in level:
+            if key in results:
+                continue
+            file_path = paths[key]
+            blocked = [paths[dependency] for dependency in sorted(dependencies[key])
+                       if results.get(dependency, {}).get('status') in ('failed', 'blocked')]
+            if blocked:
+                results[key] = {'file': file_path, 'ok': False, 'status': 'blocked',
+                                'changed': [], 'blocked_by': blocked}
+                continue
+
+            # compare the fingerprints with the ones of the last run
+            record = manifest['workbooks'].get(key)
+            if record is None:
+                changed = ['new']
+            else:
+                changed = ['macro'] if record['macro'] != macro_fingerprint else []
+                current = {target: (fingerprint(target) or {}).get('sha256') for target in inputs[key]}
+                changed += [target for target in sorted(set(current) | set(record['inputs']))
+                            if current.get(target) != record['inputs'].get(target)
+                            or (target in current) != (target in record['inputs'])]
+            if dry_run:
+                changed += [get_file_key(paths[dependency]) for dependency in sorted(dependencies[key])
+                            if results.get(dependency, {}).get('status') == 'stale'
+                            and get_file_key(paths[dependency]) not in changed]
+            if force and not changed:
+                changed = ['forced']
+            results[key] = {'file': file_path, 'ok': True,
+                            'status': ('stale' if dry_run else 'refreshed') if changed else 'current',
+                            'changed': changed}
+            if changed:
+                stale.append(key)
+
+        if dry_run:
+            continue
+
+        # run the workbooks of the level that are out of date,
+        # and record the fingerprints of the ones that succeeded
+        for key, run_result in zip(stale, run([paths[key] for key in stale])):
+            results[key].update({item: value for item, value in run_result.items() if item != 'file'})
+            if not run_result['ok']:
+                results[key]['status'] = 'failed'
+                continue
+
+            # the macro may have saved over the workbook, or changed its links
+            fingerprints.pop(key, None)
+            try:
+                inputs[key] = get_inputs(key)
+            except Exception as error:
+                results[key].update({'ok': False, 'status': 'failed',
+                                     'error': f"{type(error).__name__}: {error}"})
+                continue
+            for target in inputs[key]:
+                if fingerprint(target) is not None:
+                    manifest['files'][target] = fingerprint(target)
+            manifest['workbooks'][key] = {
+                'macro': macro_fingerprint,
+                'inputs': {target: (fingerprint(target) or {}).get('sha256') for target in inputs[key]},
+                'refreshed': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            }
+
+        # keep the fingerprints of every file read, so the files that were
+        # touched without changing are not read again the next time
+        manifest['files'].update({target: fingerprint for target, fingerprint in fingerprints.items()
+                                  if fingerprint is not None})
+        save_refresh_manifest(manifest, manifest_path)
+
+    return [results[key] for key in paths]
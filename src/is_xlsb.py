@@ -15,8 +15,8 @@ def is_xlsb(wb):
 
     Parameters
     ----------
-    wb : openpyxl.Workbook or pyxlsb.Workbook
-        Workbook object to be checked.
+    wb : openpyxl.Workbook, pyxlsb.Workbook, or str
+        Workbook object or file path to be checked.
 
     Returns
     -------
@@ -39,9 +39,16 @@ def is_xlsb(wb):
     >>> is_xlsb(wb)
     True
 
+    >>> is_xlsb("C:\\Users\\test\\test1Q2018.xlsb")
+    True
+
     >>> is_xlsb(245)
-    False
+    ValueError: wb is not a workbook object
     """
+    # if a file path is passed, check the file extension of the path
+    if isinstance(wb, str):
+        return re.search(r"\.xlsb$", wb, re.IGNORECASE) is not None
+
     # test if the object passed is a workbook object,
     # and if not, raise a value error
     if (
@@ -49,11 +56,9 @@ def is_xlsb(wb):
         not isinstance(wb, pyxlsb.Workbook)
         ):
         raise ValueError("wb is not a workbook object")
-    # otherwise, test if the workbook is an xlsb file by
-    # checking the file extension
-    # if the workbook is an xlsb file, return True
-    # if the workbook is not an xlsb file, return False
+    # otherwise, the workbook is an xlsb file if it was opened
+    # with pyxlsb, since openpyxl cannot open xlsb files
+    # (neither workbook object keeps the path of the file it was
+    # opened from, so the file extension cannot be checked)
     else:
-        # test if the workbook is an xlsb file by checking the file extension
-        # using a regular expression
-        return re.search(r"\.xlsb$", wb.path) is not None
+        return isinstance(wb, pyxlsb.Workbook)
@@ -0,0 +1,315 @@
+"""
+load_cached_values.py
+"""
+import types
+
+import openpyxl
+import openpyxl.reader.excel
+from openpyxl.reader.excel import ExcelReader
+from openpyxl.utils.cell import range_boundaries
+from openpyxl.utils.datetime import from_excel, from_ISO8601
+from openpyxl.worksheet._reader import VALUE_TAG, WorkSheetParser, WorksheetReader, _cast_number
+
+from .read_sheet_rows import ErrorValue
+
+
+# the openpyxl versions whose private parser and reader these readers build on
+OPENPYXL_VERSIONS = ("3.1.",)
+
+
+def check_openpyxl_version():
+    """
+    Check that the installed openpyxl is a version whose private worksheet
+    parser and reader the readers of this module are built on, since
+    their attributes change between versions.
+    """
+    if not openpyxl.__version__.startswith(OPENPYXL_VERSIONS):
+        raise ImportError(f"openpyxl 3.1 is needed to load workbooks with these readers, "
+                          f"not openpyxl {openpyxl.__version__}. "
+                          f"Install it with: pip install \"openpyxl>=3.1,<3.2\"")
+
+
+def with_worksheet_reader(function, worksheet_reader):
+    """
+    Description
+    -----------
+    Copy a function of openpyxl.reader.excel, so that it makes its
+    worksheet readers with another class than openpyxl's WorksheetReader.
+    The copy looks up the names of the module in a copy of its namespace,
+    so openpyxl itself, and every other workbook it loads, is unchanged.
+
+    Parameters
+    ----------
+    function : function
+        The function, e.g. ExcelReader.read_worksheets.
+    worksheet_reader : type
+        The worksheet reader class to use.
+
+    Returns
+    -------
+    function
+        The copy of the function.
+
+    Imports
+    -------
+    types
+    openpyxl
+
+    Examples
+    --------
+    >>> read_worksheets = with_worksheet_reader(ExcelReader.read_worksheets, CachedValueWorksheetReader)
+    >>> read_worksheets(reader)
+    """
+    namespace = dict(vars(openpyxl.reader.excel), WorksheetReader=worksheet_reader)
+    return types.FunctionType(function.__code__, namespace, function.__name__,
+                              function.__defaults__, function.__closure__)
+
+
+class CachedValueParser(WorkSheetParser):
+    """
+    Description
+    -----------
+    The openpyxl worksheet parser, which also keeps the cached value of
+    each formula cell as it parses the cell, instead of dropping it.
+
+    Attributes
+    ----------
+    cached_values : dict
+        Dictionary where the keys are (row, column) tuples of the formula
+        cells and the values are their cached values (None if the formula
+        was never calculated).
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cached_values = {}
+
+    def parse_cell(self, element):
+        cell = super().parse_cell(element)
+        if cell['data_type'] == 'f':
+            self.cached_values[(cell['row'], cell['column'])] = self.parse_cached_value(element, cell['style_id'])
+        return cell
+
+    def parse_cached_value(self, element, style_id):
+        # the same conversions openpyxl makes when it loads with data_only=True
+        # openpyxl writes an empty value element for formulas without a value
+        value = element.findtext(VALUE_TAG, None) or None
+        if value is None:
+            return None
+        data_type = element.get('t', 'n')
+        if data_type == 'n':
+            value = _cast_number(value)
+            if style_id in self.date_formats:
+                try:
+                    return from_excel(value, self.epoch, timedelta=style_id in self.timedelta_formats)
+                except (OverflowError, ValueError):
+                    return ErrorValue("#VALUE!")
+            return value
+        if data_type == 's':
+            return self.shared_strings[int(value)]
+        if data_type == 'b':
+            return bool(int(value))
+        if data_type == 'e':
+            return ErrorValue(value)
+        if data_type == 'd':
+            return from_ISO8601(value)
+        return value
+
+
+class CachedValueWorksheetReader(WorksheetReader):
+    """
+    Description
+    -----------
+    The openpyxl worksheet reader, which parses worksheets with
+    `CachedValueParser` when the workbook was opened with
+    `load_workbook_with_cached_values`, and keeps the cached values
+    on the worksheet as `_cached_values`. Other workbooks are read
+    exactly as openpyxl reads them.
+    """
+    def __init__(self, ws, xml_source, shared_strings, data_only, rich_text):
+        super().__init__(ws, xml_source, shared_strings, data_only, rich_text)
+        if getattr(ws.parent, "_keep_cached_values", False) and not data_only:
+            self.parser = CachedValueParser(xml_source, shared_strings, data_only, ws.parent.epoch,
+                                            ws.parent._date_formats, ws.parent._timedelta_formats, rich_text)
+
+    def bind_cells(self):
+        super().bind_cells()
+        if isinstance(self.parser, CachedValueParser):
+            self.ws._cached_values = self.parser.cached_values
+
+
+class CachedValueExcelReader(ExcelReader):
+    """
+    The openpyxl workbook reader, which marks the workbook it reads
+    so its worksheets keep their cached values, and reads its worksheets
+    with `worksheet_reader` (see `with_worksheet_reader`).
+    """
+    worksheet_reader = CachedValueWorksheetReader
+
+    def read_workbook(self):
+        super().read_workbook()
+        self.wb._keep_cached_values = True
+
+    def read_worksheets(self):
+        with_worksheet_reader(ExcelReader.read_worksheets, self.worksheet_reader)(self)
+
+
+def load_workbook_with_cached_values(filename):
+    """
+    Description
+    -----------
+    Load a workbook with openpyxl, keeping both the formulas and the
+    cached values of the formula cells, in one pass over the sheet xml.
+    openpyxl otherwise keeps either the formulas or the cached values
+    (with data_only=True), so getting both means loading the workbook twice.
+
+    The formulas are the values of the cells, as usual, and the cached
+    values are read with `get_cached_value`.
+
+    The worksheets are read with `CachedValueWorksheetReader`, without
+    changing openpyxl, so other workbooks are read as openpyxl reads them.
+    The reader builds on private parts of openpyxl, so it needs openpyxl 3.1.
+
+    Parameters
+    ----------
+    filename : str or file object
+        The workbook file.
+
+    Returns
+    -------
+    openpyxl.Workbook
+        The workbook object.
+
+    Raises
+    ------
+    ImportError
+        If openpyxl is not version 3.1.
+
+    Imports
+    -------
+    openpyxl
+
+    Examples
+    --------
+    >>> wb = load_workbook_with_cached_values("report.xlsx")
+    >>> wb["Summary"]["B10"].value
+    '=B8+B9'
+    >>> get_cached_value(wb["Summary"], 10, 2)
+    10700.0
+    """
+    check_openpyxl_version()
+    reader = CachedValueExcelReader(filename)
+    reader.read()
+    return reader.wb
+
+
+def has_cached_values(ws):
+    """
+    Check whether a worksheet was loaded with its cached values.
+    """
+    return hasattr(ws, "_cached_values")
+
+
+def get_cached_value(ws, row, column):
+    """
+    Description
+    -----------
+    Get the value of a cell: the cached value of a formula cell, as it
+    was saved in the workbook file, or the value of any other cell.
+    A formula written after the workbook was loaded has no cached value.
+
+    Parameters
+    ----------
+    ws : openpyxl.worksheet.worksheet.Worksheet
+        The worksheet, of a workbook loaded with `load_workbook_with_cached_values`.
+    row : int
+        The row number, from 1.
+    column : int
+        The column number, from 1.
+
+    Returns
+    -------
+    object
+        The value. Errors are given as ErrorValue.
+
+    Raises
+    ------
+    ValueError
+        If the worksheet was not loaded with its cached values.
+
+    Examples
+    --------
+    >>> get_cached_value(wb["Summary"], 10, 2)
+    10700.0
+    """
+    if not has_cached_values(ws):
+        raise ValueError(f"The sheet {ws.title} was not loaded with its cached values.")
+    cell = ws._cells.get((row, column))
+    if cell is None:
+        return None
+    if cell.data_type == 'f':
+        return ws._cached_values.get((row, column))
+    return cell.value
+
+
+def read_range(ws, cell_range):
+    """
+    Description
+    -----------
+    Read the values and the formulas of a range of cells, where the value
+    of a formula cell is its cached value (see `get_cached_value`).
+    No cells are made for the empty cells of the range.
+
+    Parameters
+    ----------
+    ws : openpyxl.worksheet.worksheet.Worksheet
+        The worksheet, of a workbook loaded with `load_workbook_with_cached_values`.
+    cell_range : str
+        The range of cells, in A1 notation (e.g. "B2:C10").
+
+    Returns
+    -------
+    list
+        The rows of the range, where each row is a list of tuples of the
+        form (row, column, value, formula), and formula is the text of the
+        formula (with the leading "="), or None for cells without one.
+
+    Raises
+    ------
+    ValueError
+        If the worksheet was not loaded with its cached values.
+    ValueError
+        If the range is not a range of cells.
+
+    Imports
+    -------
+    openpyxl
+
+    Examples
+    --------
+    >>> read_range(wb["Summary"], "B9:B10")
+    [[(9, 2, 700.0, None)], [(10, 2, 10700.0, '=B8+B9')]]
+    """
+    if not has_cached_values(ws):
+        raise ValueError(f"The sheet {ws.title} was not loaded with its cached values.")
+    try:
+        min_col, min_row, max_col, max_row = range_boundaries(cell_range.replace("$", ""))
+    except (TypeError, ValueError):
+        raise ValueError(f"The cell range {cell_range} is not in A1 notation.") from None
+    if None in (min_col, min_row, max_col, max_row):
+        raise ValueError(f"The cell range {cell_range} is not a range of cells.")
+
+    rows = []
+    for row in range(min_row, max_row + 1):
+        cells = []
+        for column in range(min_col, max_col + 1):
+            cell = ws._cells.get((row, column))
+            if cell is None:
+                cells.append((row, column, None, None))
+            elif cell.data_type == 'f':
+                # array formulas keep their text on the formula object
+                formula = cell.value if isinstance(cell.value, str) else getattr(cell.value, "text", str(cell.value))
+                cells.append((row, column, ws._cached_values.get((row, column)), formula))
+            else:
+                cells.append((row, column, cell.value, None))
+        rows.append(cells)
+    return rows
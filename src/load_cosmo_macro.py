@@ -0,0 +1,55 @@
+"""
+load_cosmo_macro.py
+"""
+import json
+
+from .macro_msgpack import is_msgpack_macro, load_cosmo_macro_msgpack
+
+
+def load_cosmo_macro(cosmo_macro):
+    """
+    Description
+    -----------
+    Load a cosmo macro from a json or msgpack file (see `save_cosmo_macro`),
+    and check that it has the form of a cosmo macro. The format is told
+    from the first byte of the file. The blocks of values of a msgpack
+    macro that are in sidecar arrays are not read until the macro runs
+    (see `load_cosmo_macro_msgpack`).
+
+    Parameters
+    ----------
+    cosmo_macro : str or dict
+        The file path of the cosmo macro, or the cosmo macro itself.
+
+    Returns
+    -------
+    dict
+        The cosmo macro, of the form {'cosmo_log': [actions]}.
+
+    Raises
+    ------
+    ValueError
+        If the cosmo macro does not have a cosmo_log list of actions.
+
+    Imports
+    -------
+    json
+    .macro_msgpack
+
+    Examples
+    --------
+    >>> load_cosmo_macro("roll_forward.cosmomacro")
+    {'cosmo_log': [{'action': 'update_named_ranges', 'named_ranges': {...}, ...}]}
+    """
+    # read the cosmo macro from its file
+    if isinstance(cosmo_macro, str) and is_msgpack_macro(cosmo_macro):
+        cosmo_macro = load_cosmo_macro_msgpack(cosmo_macro)
+    elif isinstance(cosmo_macro, str):
+        with open(cosmo_macro, encoding="utf-8") as fh:
+            cosmo_macro = json.load(fh)
+
+    # check that it is a list of actions
+    if not isinstance(cosmo_macro, dict) or not isinstance(cosmo_macro.get("cosmo_log"), list) \
+            or not all(isinstance(action, dict) and "action" in action for action in cosmo_macro["cosmo_log"]):
+        raise ValueError("The cosmo macro is not a dictionary with a cosmo_log list of actions.")
+    return cosmo_macro
@@ -0,0 +1,226 @@
+"""
+load_parallel.py
+"""
+import concurrent.futures
+
+from openpyxl.cell.cell import Cell
+from openpyxl.worksheet._reader import WorkSheetParser
+
+from .load_cached_values import (CachedValueExcelReader, CachedValueParser, CachedValueWorksheetReader,
+                                 check_openpyxl_version)
+from .mapped_zip import get_mapped_zip
+
+
+# the smallest worksheet part (uncompressed, in bytes) worth parsing
+# in a worker process, since smaller parts take less time to parse
+# than their cells take to send back
+PARALLEL_MIN_PART_SIZE = 1 << 20
+
+# the attributes of a worksheet parser that only matter while it parses
+PARSER_ONLY_ATTRIBUTES = {"source", "shared_strings", "date_formats", "timedelta_formats", "shared_formulae"}
+
+# the shared strings and styles of the workbook a worker process parses
+# worksheets of, set once per process by `_init_worker`
+_WORKER_WORKBOOK = {}
+
+
+def _init_worker(file_path, shared_strings, epoch, date_formats, timedelta_formats, rich_text, cached_values):
+    # keep what every worksheet of the workbook is parsed with,
+    # so it is sent to each worker process once, not with every sheet
+    _WORKER_WORKBOOK.update({
+        'file_path': file_path, 'shared_strings': shared_strings, 'epoch': epoch,
+        'date_formats': date_formats, 'timedelta_formats': timedelta_formats,
+        'rich_text': rich_text, 'cached_values': cached_values,
+    })
+
+
+def parse_worksheet_part(part):
+    """
+    Description
+    -----------
+    Parse a worksheet part of the workbook of this worker process (see
+    `_init_worker`) with the openpyxl worksheet parser, and get its cells
+    and everything else the parser read, ready to send back to the
+    process that loads the workbook.
+
+    Parameters
+    ----------
+    part : str
+        The name of the worksheet part, e.g. "xl/worksheets/sheet1.xml".
+
+    Returns
+    -------
+    dict
+        Dictionary with the cells of the sheet, as 'cells', a list of
+        (row, column, value, data_type, style_id) tuples in order, and the
+        attributes of the parser (merged cells, column widths, views, ...),
+        including 'cached_values' if the cached values are kept.
+
+    Imports
+    -------
+    openpyxl
+    .load_cached_values
+    .mapped_zip
+
+    Examples
+    --------
+    >>> _init_worker("consolidation.xlsx", shared_strings, wb.epoch, wb._date_formats,
+    ...              wb._timedelta_formats, False, True)
+    >>> parse_worksheet_part("xl/worksheets/sheet1.xml")["cells"][:2]
+    [(1, 1, 'Entity', 's', 3), (1, 2, 'Amount', 's', 3)]
+    """
+    workbook = _WORKER_WORKBOOK
+    parser_type = CachedValueParser if workbook['cached_values'] else WorkSheetParser
+    with get_mapped_zip(workbook['file_path']) as zf, zf.open(part) as fh:
+        parser = parser_type(fh, workbook['shared_strings'], False, workbook['epoch'],
+                             workbook['date_formats'], workbook['timedelta_formats'], workbook['rich_text'])
+        cells = [(cell['row'], cell['column'], cell['value'], cell['data_type'], cell['style_id'])
+                 for _, row in parser.parse() for cell in row]
+    parsed = {name: value for name, value in vars(parser).items() if name not in PARSER_ONLY_ATTRIBUTES}
+    parsed['cells'] = cells
+    return parsed
+
+
+class ParsedWorksheet:
+    """
+    Description
+    -----------
+    A worksheet parsed in a worker process (see `parse_worksheet_part`),
+    standing in for the openpyxl worksheet parser while the worksheet is
+    put together: it has the attributes the parser would have after
+    parsing, and its cells as tuples.
+    """
+    def __init__(self, parsed):
+        self.cached_values = None
+        self.__dict__.update(parsed)
+
+
+class ParallelWorksheetReader(CachedValueWorksheetReader):
+    """
+    Description
+    -----------
+    The openpyxl worksheet reader, which puts together the worksheets
+    that were parsed in worker processes for workbooks loaded with
+    `load_workbook_parallel`, instead of parsing them. Other worksheets
+    are read as `CachedValueWorksheetReader` reads them.
+    """
+    def __init__(self, ws, xml_source, shared_strings, data_only, rich_text):
+        super().__init__(ws, xml_source, shared_strings, data_only, rich_text)
+        parsed = getattr(ws.parent, "_parsed_worksheets", {}).get(getattr(xml_source, "name", None))
+        if parsed is not None:
+            self.parser = ParsedWorksheet(parsed.result())
+
+    def bind_cells(self):
+        if not isinstance(self.parser, ParsedWorksheet):
+            super().bind_cells()
+            return
+
+        # the same cells openpyxl makes, without the dictionaries
+        ws = self.ws
+        cells = ws._cells
+        cell_styles = ws.parent._cell_styles
+        for row, column, value, data_type, style_id in self.parser.cells:
+            cell = Cell(ws, row=row, column=column, style_array=cell_styles[style_id])
+            cell._value = value
+            cell.data_type = data_type
+            cells[(row, column)] = cell
+        if cells:
+            ws._current_row = ws.max_row
+        if self.parser.cached_values is not None:
+            ws._cached_values = self.parser.cached_values
+
+
+class ParallelExcelReader(CachedValueExcelReader):
+    """
+    Description
+    -----------
+    The openpyxl workbook reader, which parses the large worksheets of
+    the workbook in worker processes, all at once, while the workbook is
+    put together in order. The shared strings and styles are read once,
+    before the worksheets, and sent to each worker process once.
+    """
+    worksheet_reader = ParallelWorksheetReader
+
+    def __init__(self, file_path, cached_values=False, max_workers=None):
+        super().__init__(file_path)
+        self.file_path = file_path
+        self.cached_values = cached_values
+        self.max_workers = max_workers
+
+    def read_workbook(self):
+        super().read_workbook()
+        self.wb._keep_cached_values = self.cached_values
+
+    def read_worksheets(self):
+        # the worksheet parts that are worth parsing in a worker process
+        parts = [rel.target for _, rel in self.parser.find_sheets()
+                 if rel.target in self.valid_files and "chartsheet" not in rel.Type
+                 and self.archive.getinfo(rel.target).file_size >= PARALLEL_MIN_PART_SIZE]
+        if len(parts) < 2:
+            super().read_worksheets()
+            return
+
+        initargs = (self.file_path, list(self.shared_strings), self.wb.epoch, self.wb._date_formats,
+                    self.wb._timedelta_formats, self.rich_text, self.cached_values)
+        with concurrent.futures.ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_worker,
+                                                    initargs=initargs) as executor:
+            self.wb._parsed_worksheets = {part: executor.submit(parse_worksheet_part, part) for part in parts}
+            try:
+                super().read_worksheets()
+            finally:
+                del self.wb._parsed_worksheets
+
+
+def load_workbook_parallel(file_path, cached_values=False, max_workers=None):
+    """
+    Description
+    -----------
+    Load a workbook with openpyxl, parsing its worksheets in worker
+    processes at the same time instead of one after another. The shared
+    strings and styles are read first, and sent to each worker process
+    once. Each worker parses whole worksheet parts, and the cells it
+    sends back are made into the worksheets in order, while the other
+    worksheets are still being parsed. The workbook is the same as the
+    one openpyxl loads.
+
+    Only worksheets of at least 1 MB of xml are parsed in worker
+    processes, and only when there are two or more of them, since a
+    process takes longer to start than a small sheet takes to parse.
+
+    Parameters
+    ----------
+    file_path : str
+        The file path of the workbook. Must be an .xlsx or .xlsm file.
+    cached_values : bool, optional
+        Whether to keep the cached values of the formula cells as well as
+        the formulas (see `load_workbook_with_cached_values`).
+        Default is False.
+    max_workers : int, optional
+        The number of worker processes to use.
+        Default is None, which uses the number of processors.
+
+    Returns
+    -------
+    openpyxl.Workbook
+        The workbook object.
+
+    Raises
+    ------
+    ImportError
+        If openpyxl is not version 3.1 (see `check_openpyxl_version`).
+
+    Imports
+    -------
+    concurrent.futures
+    openpyxl
+
+    Examples
+    --------
+    >>> wb = load_workbook_parallel("consolidation_4Q2024.xlsx", cached_values=True)
+    >>> len(wb.worksheets)
+    40
+    """
+    check_openpyxl_version()
+    reader = ParallelExcelReader(file_path, cached_values=cached_values, max_workers=max_workers)
+    reader.read()
+    return reader.wb
@@ -0,0 +1,296 @@
+"""
+load_sheet_subset.py
+"""
+import contextlib
+import io
+import zipfile
+
+import openpyxl
+from openpyxl.worksheet.worksheet import Worksheet
+
+from .copy_zip_member import copy_zip_member
+from .get_sheet_parts import REL_NS, get_relationships, get_rels_part, get_sheet_parts, get_workbook_part
+from .load_cached_values import load_workbook_with_cached_values
+from .mapped_zip import get_mapped_zip
+
+
+# the relationship types of worksheets, and of the pivot tables on them
+WORKSHEET_TYPE = REL_NS + "/worksheet"
+PIVOT_TABLE_TYPE = REL_NS + "/pivotTable"
+
+# the xml openpyxl loads in place of a sheet that is not loaded
+PLACEHOLDER_SHEET_XML = (
+    b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    b'<sheetData/></worksheet>')
+
+
+class UnloadedWorksheet(Worksheet):
+    """
+    Description
+    -----------
+    A worksheet of a workbook opened with `load_sheet_subset` that was
+    not loaded. It keeps its place, name and state in the workbook, but
+    has no cells: reading or writing its cells raises a ValueError,
+    instead of quietly giving an empty sheet. When the workbook is saved
+    with `save_workbook`, the sheet is copied from the original file as
+    it is (see `splice_unloaded_sheets`).
+
+    Examples
+    --------
+    >>> wb = load_sheet_subset("report.xlsx", ["Inputs"])
+    >>> wb["Summary"]["B2"].value
+    Traceback (most recent call last):
+    ...
+    ValueError: The sheet Summary was not loaded. Open the workbook with Summary in sheets to use it.
+    """
+    def _not_loaded(self):
+        raise ValueError(f"The sheet {self.title} was not loaded. "
+                         f"Open the workbook with {self.title} in sheets to use it.")
+
+    def _get_cell(self, row, column):
+        self._not_loaded()
+
+    def __getitem__(self, key):
+        self._not_loaded()
+
+    def iter_rows(self, min_row=None, max_row=None, min_col=None, max_col=None, values_only=False):
+        self._not_loaded()
+
+    def iter_cols(self, min_col=None, max_col=None, min_row=None, max_row=None, values_only=False):
+        self._not_loaded()
+
+    def append(self, iterable):
+        self._not_loaded()
+
+    def _move_cells(self, min_row=None, min_col=None, offset=0, row_or_col="row"):
+        self._not_loaded()
+
+    def merge_cells(self, range_string=None, start_row=None, start_column=None, end_row=None, end_column=None):
+        self._not_loaded()
+
+
+def _put_placeholder(wb, index):
+    # put a placeholder in place of the worksheet at an index, keeping
+    # what of the sheet is written to the workbook part, and get the sheet
+    # (it is taken out first, so the placeholder gets its name as it is)
+    ws = wb._sheets.pop(index)
+    placeholder = UnloadedWorksheet(wb, title=ws.title)
+    wb._sheets.insert(index, placeholder)
+    placeholder.sheet_state = ws.sheet_state
+    placeholder.defined_names = ws.defined_names
+    placeholder._print_rows = ws._print_rows
+    placeholder._print_cols = ws._print_cols
+    placeholder._print_area = ws._print_area
+    placeholder.auto_filter = ws.auto_filter
+    return ws
+
+
+@contextlib.contextmanager
+def placeholder_sheets(wb, sheets):
+    """
+    Description
+    -----------
+    Put placeholders in place of loaded worksheets for as long as the
+    context lasts, so that saving the workbook with openpyxl does not
+    write their cells, and they can be copied from the original file
+    instead (see `splice_unloaded_sheets`). The placeholders keep the
+    name, state, defined names, print titles, print area and filter of
+    their sheets, which are written to the workbook part. The worksheets
+    are put back when the context ends.
+
+    Worksheets with pivot tables keep their place,
+    since their pivot caches are written with the workbook.
+
+    Parameters
+    ----------
+    wb : openpyxl.Workbook
+        The workbook.
+    sheets : list
+        The names of the worksheets to put placeholders in place of.
+
+    Yields
+    ------
+    list
+        The names of the sheets that have placeholders, in workbook order.
+
+    Imports
+    -------
+    contextlib
+
+    Examples
+    --------
+    >>> with placeholder_sheets(wb, ["Summary", "Detail"]) as replaced:
+    ...     wb.save("report_saved.xlsx")
+    ...     splice_unloaded_sheets("report.xlsx", "report_saved.xlsx", replaced)
+    """
+    originals = {}
+    try:
+        for index, ws in enumerate(list(wb._sheets)):
+            if ws.title not in sheets or type(ws) is not Worksheet or ws._pivots:
+                continue
+            originals[index] = _put_placeholder(wb, index)
+        yield [wb._sheets[index].title for index in sorted(originals)]
+    finally:
+        for index, ws in originals.items():
+            wb._sheets[index] = ws
+
+
+def unload_sheets(wb, sheets):
+    """
+    Description
+    -----------
+    Put placeholders in place of loaded worksheets for good, as if they
+    had not been loaded, for sheets whose cells were rewritten in the
+    workbook file: their loaded cells are out of date, and saving the
+    workbook copies them from the file instead (see `splice_unloaded_sheets`).
+
+    Worksheets with pivot tables cannot be unloaded,
+    since their pivot caches are written with the workbook.
+
+    Parameters
+    ----------
+    wb : openpyxl.Workbook
+        The workbook.
+    sheets : list
+        The names of the worksheets to unload.
+
+    Returns
+    -------
+    list
+        The names of the sheets that were unloaded, in workbook order.
+
+    Examples
+    --------
+    >>> unload_sheets(wb, ["Detail"])
+    ['Detail']
+    >>> get_unloaded_sheets(wb)
+    ['Detail']
+    """
+    unloaded = []
+    for index, ws in enumerate(list(wb._sheets)):
+        if ws.title in sheets and type(ws) is Worksheet and not ws._pivots:
+            _put_placeholder(wb, index)
+            unloaded.append(ws.title)
+    return unloaded
+
+
+def get_unloaded_sheets(wb):
+    """
+    Description
+    -----------
+    Get the names of the sheets of a workbook that were not loaded.
+
+    Parameters
+    ----------
+    wb : openpyxl.Workbook or pyxlsb.Workbook
+        The workbook.
+
+    Returns
+    -------
+    list
+        The names of the sheets that were not loaded, in workbook order.
+        Empty if every sheet was loaded.
+
+    Examples
+    --------
+    >>> wb = load_sheet_subset("report.xlsx", ["Inputs"])
+    >>> get_unloaded_sheets(wb)
+    ['Summary', 'Detail']
+    """
+    return [ws.title for ws in getattr(wb, "worksheets", []) if isinstance(ws, UnloadedWorksheet)]
+
+
+def load_sheet_subset(file_name, sheets, cached_values=False):
+    """
+    Description
+    -----------
+    Open an Excel workbook with openpyxl, loading the cells of only some of
+    its worksheets. openpyxl is given a copy of the workbook package (in
+    memory) where every other worksheet is an empty placeholder without
+    relationships, so their cells, comments, drawings and tables are never
+    parsed. The placeholders become `UnloadedWorksheet` objects, which
+    raise a ValueError if their cells are used.
+
+    The parts of the copy are copied without decompressing them, so
+    building it costs little next to parsing the sheets that are loaded.
+
+    Worksheets with pivot tables are always loaded, since their pivot
+    caches belong to the workbook, and so are chartsheets.
+
+    Parameters
+    ----------
+    file_name : str
+        The name of the file to open.
+        Must have the file extension .xlsx or .xlsm.
+    sheets : list
+        The names of the worksheets to load.
+    cached_values : bool, optional
+        Whether to keep the cached values of the formula cells as well as
+        the formulas (see `load_workbook_with_cached_values`).
+        Default is False.
+
+    Returns
+    -------
+    wb : Workbook
+        The workbook object, with every sheet in place.
+
+    Raises
+    ------
+    ValueError
+        If any of the sheets is not in the workbook.
+
+    Imports
+    -------
+    io
+    zipfile
+    openpyxl
+    .copy_zip_member
+    .get_sheet_parts
+    .load_cached_values
+    .mapped_zip
+
+    Examples
+    --------
+    >>> wb = load_sheet_subset("report.xlsx", ["Inputs"])
+    >>> wb["Inputs"]["B2"].value
+    0.05
+    """
+    with get_mapped_zip(file_name) as zf:
+        sheet_parts = get_sheet_parts(zf)
+
+        # check that every sheet is in the workbook
+        missing = [sheet for sheet in sheets if sheet not in sheet_parts]
+        if missing:
+            raise ValueError(f"The sheets {missing} are not in the workbook {file_name}.")
+
+        # find the worksheets that are not loaded
+        worksheet_parts = {target for rel_type, target in get_relationships(zf, get_workbook_part(zf)).values()
+                           if rel_type == WORKSHEET_TYPE}
+        unloaded = {}
+        for sheet, part in sheet_parts.items():
+            if sheet in sheets or part not in worksheet_parts or part not in zf.NameToInfo:
+                continue
+            if any(rel_type == PIVOT_TABLE_TYPE for rel_type, _ in get_relationships(zf, part).values()):
+                continue
+            unloaded[sheet] = part
+
+        # copy the package, with placeholders for the worksheets that are not loaded
+        placeholders = set(unloaded.values())
+        skipped = {get_rels_part(part) for part in placeholders}
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as target_zip:
+            for info in zf.infolist():
+                if info.filename in placeholders:
+                    target_zip.writestr(info.filename, PLACEHOLDER_SHEET_XML)
+                elif info.filename not in skipped:
+                    copy_zip_member(zf, target_zip, info)
+
+    buffer.seek(0)
+    wb = load_workbook_with_cached_values(buffer) if cached_values else openpyxl.load_workbook(buffer)
+
+    # the placeholders keep their place in the workbook,
+    # but raise an error if their cells are used
+    for sheet in unloaded:
+        wb[sheet].__class__ = UnloadedWorksheet
+    return wb
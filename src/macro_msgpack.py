@@ -0,0 +1,439 @@
+"""
+macro_msgpack.py
+"""
+import datetime
+import hashlib
+import numbers
+import os
+import re
+import shutil
+import tempfile
+
+
+# the file formats a cosmo macro can be saved in
+MACRO_FORMATS = ("json", "msgpack")
+
+# the smallest block of values (in cells) of an update_range write that
+# is saved as a sidecar array instead of in the macro file, since small
+# blocks load faster from the macro file than from a file of their own
+SIDECAR_MIN_CELLS = 1024
+
+# the largest integer a float holds exactly, so blocks of integers and
+# floats can be saved as floats
+MAX_EXACT_FLOAT_INT = 1 << 53
+
+# the msgpack extension types of the values json cannot hold,
+# and of the references to sidecar arrays
+EXT_BLOCK = 1
+EXT_DATETIME = 2
+EXT_DATE = 3
+EXT_TIME = 4
+EXT_TIMEDELTA = 5
+
+# the names of the sidecar arrays, the SHA-256 hash of their contents
+BLOCK_NAME = re.compile(r"^[0-9a-f]{64}\.npy$")
+
+
+def import_msgpack():
+    """
+    Import msgpack, which is only needed to save and load cosmo macros
+    in the msgpack format, with an error that says how to install it if it is missing.
+    """
+    try:
+        import msgpack
+    except ImportError:
+        raise ImportError("msgpack is needed for cosmo macros in the msgpack format. "
+                          "Install it with: pip install msgpack") from None
+    return msgpack
+
+
+def import_numpy():
+    """
+    Import numpy, which is only needed for the sidecar arrays of cosmo
+    macros in the msgpack format, with an error that says how to install it if it is missing.
+    """
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("numpy is needed for the value blocks of cosmo macros in the msgpack format. "
+                          "Install it with: pip install numpy") from None
+    return numpy
+
+
+def get_blocks_dir(file_path):
+    """
+    Get the directory of the sidecar arrays of a cosmo macro file,
+    e.g. "roll_forward.cosmomacro.blocks" for "roll_forward.cosmomacro".
+    """
+    return f"{file_path}.blocks"
+
+
+def is_msgpack_macro(file_path):
+    """
+    Description
+    -----------
+    Check whether a cosmo macro file is in the msgpack format, from its
+    first byte: a msgpack macro starts with a map, a json macro with "{"
+    (or white space).
+
+    Parameters
+    ----------
+    file_path : str
+        The file path of the cosmo macro.
+
+    Returns
+    -------
+    bool
+        True if the cosmo macro is in the msgpack format.
+
+    Examples
+    --------
+    >>> is_msgpack_macro("roll_forward.cosmomacro")
+    True
+    """
+    with open(file_path, "rb") as fh:
+        first = fh.read(1)
+    return bool(first) and (0x80 <= first[0] <= 0x8f or first[0] in (0xde, 0xdf))
+
+
+class MacroBlock:
+    """
+    Description
+    -----------
+    A block of values of an update_range write of a cosmo macro, kept in
+    a sidecar array (a .npy file) next to the macro file, and read from
+    the file (memory-mapped) only when its rows are iterated, so loading
+    a macro does not read its values. Iterating gives the rows as tuples
+    of cell values, the same as the rows of the write it was saved from.
+
+    Parameters
+    ----------
+    path : str
+        The file path of the sidecar array.
+    shape : tuple
+        The number of rows and columns of the block.
+
+    Attributes
+    ----------
+    digest : str
+        The SHA-256 hash of the block, which is also the name of its file.
+
+    Examples
+    --------
+    >>> block = MacroBlock("roll_forward.cosmomacro.blocks/5d41...e5.npy", (50000, 4))
+    >>> len(block)
+    50000
+    >>> next(iter(block))
+    (1.5, 2.0, None, 7.25)
+    """
+    __slots__ = ("path", "shape", "digest")
+
+    def __init__(self, path, shape):
+        self.path = path
+        self.shape = tuple(shape)
+        self.digest = os.path.splitext(os.path.basename(path))[0]
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __iter__(self):
+        numpy = import_numpy()
+        array = numpy.load(self.path, mmap_mode="r", allow_pickle=False)
+        if array.shape != self.shape:
+            raise ValueError(f"The value block {self.path} has the shape {array.shape}, not {self.shape}.")
+        # floats stand for the empty cells with NaN, and dates with NaT
+        # (which tolist already gives as None, with the other dates as
+        # datetime.datetime for datetime64[us] and datetime.date for datetime64[D])
+        if array.dtype.kind == "f":
+            for row in array:
+                yield tuple(None if value != value else value for value in row.tolist())
+        else:
+            for row in array:
+                yield tuple(row.tolist())
+
+    def __repr__(self):
+        # the digest stands for the values, so a macro fingerprint
+        # changes when they do, without reading them
+        return f"MacroBlock({self.digest}, {self.shape[0]}x{self.shape[1]})"
+
+    def to_list(self):
+        """
+        Get the values of the block as a list of rows.
+        """
+        return [list(row) for row in self]
+
+
+def to_block_array(values):
+    """
+    Description
+    -----------
+    Get a block of values as a numpy array that can be saved as a sidecar
+    array and read back with the same values, if it has one: blocks of
+    booleans, of integers, of numbers (floats, with empty cells as NaN), of
+    strings, or of dates and times, or of dates (with empty cells as NaT,
+    and dates as datetime64[D], so they come back as dates). Other blocks,
+    like ones that mix strings and numbers, are kept in the macro file.
+
+    Parameters
+    ----------
+    values : list
+        The values, as a list of rows of the same length.
+
+    Returns
+    -------
+    numpy.ndarray or None
+        The array, or None if the block cannot be saved as one.
+
+    Imports
+    -------
+    numpy
+
+    Examples
+    --------
+    >>> to_block_array([[1.5, None], [2, 3.25]])
+    array([[1.5 ,  nan],
+           [2.  , 3.25]])
+    >>> to_block_array([[1.5, "East"]]) is None
+    True
+    """
+    types = set()
+    for row in values:
+        types.update(map(type, row))
+    numpy = import_numpy()
+
+    if types == {bool}:
+        return numpy.array(values, dtype=bool)
+    if types == {int}:
+        try:
+            return numpy.array(values, dtype=numpy.int64)
+        except OverflowError:
+            return None
+    if types <= {int, float, type(None)}:
+        # NaN stands for the empty cells, so the values can not be NaN,
+        # and the integers must be ones a float holds exactly
+        for row in values:
+            for value in row:
+                if value is not None and (value != value or (type(value) is int and
+                                                             abs(value) > MAX_EXACT_FLOAT_INT)):
+                    return None
+        return numpy.array([[numpy.nan if value is None else value for value in row] for row in values],
+                           dtype=numpy.float64)
+    if types == {str}:
+        # numpy drops the null characters at the end of strings
+        if any(value.endswith("\x00") for row in values for value in row):
+            return None
+        return numpy.array(values, dtype=str)
+    if types <= {datetime.datetime, type(None)} and datetime.datetime in types:
+        if any(value is not None and value.tzinfo is not None for row in values for value in row):
+            return None
+        return numpy.array(values, dtype="datetime64[us]")
+    if types <= {datetime.date, type(None)} and datetime.date in types:
+        return numpy.array(values, dtype="datetime64[D]")
+    return None
+
+
+def _hash_array(array):
+    # the hash of the type, shape and contents of an array
+    digest = hashlib.sha256(f"{array.dtype.str}{array.shape}".encode("ascii"))
+    digest.update(array.tobytes())
+    return digest.hexdigest()
+
+
+def _write_block(blocks_dir, values):
+    # write a block of values to a sidecar array, if it can be one,
+    # and get the name of its file, or None
+    if isinstance(values, MacroBlock):
+        name = os.path.basename(values.path)
+        target = os.path.join(blocks_dir, name)
+        if not os.path.exists(target):
+            shutil.copyfile(values.path, target)
+        return name, values.shape
+    rows = len(values)
+    columns = len(values[0]) if rows else 0
+    if rows * columns < SIDECAR_MIN_CELLS:
+        return None
+    array = to_block_array(values)
+    if array is None:
+        return None
+    name = f"{_hash_array(array)}.npy"
+    target = os.path.join(blocks_dir, name)
+    if not os.path.exists(target):
+        numpy = import_numpy()
+        fd, temp_path = tempfile.mkstemp(suffix=".tmp", dir=blocks_dir)
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                numpy.save(fh, array, allow_pickle=False)
+            os.replace(temp_path, target)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+    return name, array.shape
+
+
+def _pack_value(value):
+    # the msgpack form of the values msgpack does not pack itself
+    msgpack = import_msgpack()
+    if isinstance(value, datetime.datetime):
+        return msgpack.ExtType(EXT_DATETIME, value.isoformat().encode("ascii"))
+    if isinstance(value, datetime.date):
+        return msgpack.ExtType(EXT_DATE, value.isoformat().encode("ascii"))
+    if isinstance(value, datetime.time):
+        return msgpack.ExtType(EXT_TIME, value.isoformat().encode("ascii"))
+    if isinstance(value, datetime.timedelta):
+        return msgpack.ExtType(EXT_TIMEDELTA, msgpack.packb([value.days, value.seconds, value.microseconds]))
+    if isinstance(value, numbers.Integral):
+        return int(value)
+    if isinstance(value, numbers.Number):
+        return float(value)
+    return str(value)
+
+
+def save_cosmo_macro_msgpack(cosmo_macro, file_path):
+    """
+    Description
+    -----------
+    Save a cosmo macro in the msgpack format: the actions are saved in
+    one msgpack file, and the large blocks of values of update_range
+    writes (of at least 1024 cells) are saved as sidecar arrays (.npy
+    files) in a directory next to it, named after the macro file with
+    ".blocks" added. The arrays are named by the hash of their values, so
+    saving the macro again only writes the blocks that changed, and the
+    ones that are no longer used are removed.
+
+    Blocks that cannot be saved as one array with the same values (like
+    blocks that mix strings and numbers) are kept in the msgpack file.
+    Blocks of integers and floats are saved as floats, which Excel
+    stores the same.
+
+    Parameters
+    ----------
+    cosmo_macro : dict
+        The cosmo macro, of the form {'cosmo_log': [actions]}.
+    file_path : str
+        The file path to save the cosmo macro to.
+
+    Returns
+    -------
+    str
+        The file path of the saved cosmo macro.
+
+    Raises
+    ------
+    ImportError
+        If msgpack is not installed, or numpy is not installed and the
+        macro has a block to save as a sidecar array.
+
+    Imports
+    -------
+    datetime
+    hashlib
+    msgpack
+    numpy
+    os
+    shutil
+    tempfile
+
+    Examples
+    --------
+    >>> save_cosmo_macro_msgpack(cosmo.cosmo_macro, "roll_forward.cosmomacro")
+    'roll_forward.cosmomacro'
+    >>> os.listdir("roll_forward.cosmomacro.blocks")
+    ['5d41...e5.npy']
+    """
+    msgpack = import_msgpack()
+    blocks_dir = get_blocks_dir(file_path)
+    os.makedirs(blocks_dir, exist_ok=True)
+
+    # swap the large blocks of values for references to their arrays
+    used = set()
+    actions = []
+    for action in cosmo_macro['cosmo_log']:
+        if action.get('action') == 'update_range':
+            writes = []
+            for write in action['writes']:
+                block = _write_block(blocks_dir, write['values'])
+                if block is not None:
+                    name, shape = block
+                    used.add(name)
+                    write = dict(write, values=msgpack.ExtType(EXT_BLOCK, msgpack.packb([name, *shape])))
+                writes.append(write)
+            action = dict(action, writes=writes)
+        actions.append(action)
+
+    # write the macro file in one go, so it is never half written
+    directory = os.path.dirname(os.path.abspath(file_path))
+    fd, temp_path = tempfile.mkstemp(suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(msgpack.packb(dict(cosmo_macro, cosmo_log=actions), default=_pack_value))
+        os.replace(temp_path, file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    # remove the arrays of blocks the macro no longer has
+    for name in os.listdir(blocks_dir):
+        if BLOCK_NAME.match(name) and name not in used:
+            os.remove(os.path.join(blocks_dir, name))
+    if not os.listdir(blocks_dir):
+        os.rmdir(blocks_dir)
+    return file_path
+
+
+def load_cosmo_macro_msgpack(file_path):
+    """
+    Description
+    -----------
+    Load a cosmo macro saved in the msgpack format (see
+    `save_cosmo_macro_msgpack`). The blocks of values in sidecar arrays
+    are not read: they are loaded as `MacroBlock` objects, which read
+    their arrays when the macro is run, so the time to load a macro does
+    not grow with the values its writes carry.
+
+    Parameters
+    ----------
+    file_path : str
+        The file path of the cosmo macro.
+
+    Returns
+    -------
+    dict
+        The cosmo macro, of the form {'cosmo_log': [actions]}.
+
+    Raises
+    ------
+    ImportError
+        If msgpack is not installed.
+
+    Imports
+    -------
+    datetime
+    msgpack
+
+    Examples
+    --------
+    >>> load_cosmo_macro_msgpack("roll_forward.cosmomacro")['cosmo_log'][0]['writes'][0]['values']
+    MacroBlock(5d41...e5, 50000x4)
+    """
+    msgpack = import_msgpack()
+    blocks_dir = get_blocks_dir(file_path)
+
+    def ext_hook(code, data):
+        if code == EXT_BLOCK:
+            name, rows, columns = msgpack.unpackb(data)
+            return MacroBlock(os.path.join(blocks_dir, name), (rows, columns))
+        if code == EXT_DATETIME:
+            return datetime.datetime.fromisoformat(data.decode("ascii"))
+        if code == EXT_DATE:
+            return datetime.date.fromisoformat(data.decode("ascii"))
+        if code == EXT_TIME:
+            return datetime.time.fromisoformat(data.decode("ascii"))
+        if code == EXT_TIMEDELTA:
+            days, seconds, microseconds = msgpack.unpackb(data)
+            return datetime.timedelta(days=days, seconds=seconds, microseconds=microseconds)
+        return msgpack.ExtType(code, data)
+
+    with open(file_path, "rb") as fh:
+        return msgpack.unpackb(fh.read(), ext_hook=ext_hook, strict_map_key=False)
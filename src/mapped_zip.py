@@ -0,0 +1,402 @@
+"""
+mapped_zip.py
+"""
+import io
+import mmap
+import os
+import struct
+import threading
+import weakref
+import zipfile
+import zlib
+
+
+# size of the fixed part of a local file header in a zip file
+LOCAL_HEADER_SIZE = 30
+
+# the number of compressed bytes to inflate at a time
+INFLATE_CHUNK_SIZE = 1 << 16
+
+# the mapped zip files that are open in this process, keyed by
+# (real path, size, modification time), so every reader of the same
+# file shares one mapping (and the same pages of memory)
+_MAPPED_ZIPS = weakref.WeakValueDictionary()
+_MAPPED_ZIPS_LOCK = threading.Lock()
+
+
+class MappedFile(io.RawIOBase):
+    """
+    Description
+    -----------
+    A read-only, seekable file object over a memoryview, with its own
+    position. Many MappedFile objects can read the same mapped file at
+    once without copying it or sharing a position.
+
+    Parameters
+    ----------
+    view : memoryview
+        The bytes to read.
+    owner : object, optional
+        An object to keep alive while the file object is in use
+        (the MappedZip the view belongs to).
+
+    Examples
+    --------
+    >>> fh = MappedFile(memoryview(b"abcdef"))
+    >>> fh.read(3)
+    b'abc'
+    """
+    def __init__(self, view, owner=None):
+        super().__init__()
+        self._view = view
+        self._owner = owner
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        # copy as many bytes as fit from the current position
+        size = min(len(b), len(self._view) - self._position)
+        if size <= 0:
+            return 0
+        b[:size] = self._view[self._position:self._position + size]
+        self._position += size
+        return size
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._position + offset
+        elif whence == io.SEEK_END:
+            position = len(self._view) + offset
+        else:
+            raise ValueError(f"Invalid whence ({whence})")
+        if position < 0:
+            raise ValueError(f"Negative seek position {position}")
+        self._position = position
+        return position
+
+    def tell(self):
+        return self._position
+
+    def close(self):
+        # drop the view, so the mapping can be unmapped once it is released
+        self._view = memoryview(b"")
+        super().close()
+
+
+class InflatingReader(io.RawIOBase):
+    """
+    Description
+    -----------
+    A read-only file object that inflates a deflated zip member as it is
+    read, a chunk at a time, straight from the mapped compressed bytes.
+    The CRC of the inflated bytes is checked when the end is reached.
+
+    Parameters
+    ----------
+    view : memoryview
+        The compressed bytes of the member.
+    info : zipfile.ZipInfo
+        The info of the member.
+    owner : object, optional
+        An object to keep alive while the file object is in use.
+
+    Examples
+    --------
+    >>> fh = InflatingReader(mapped_zip.raw_member("xl/workbook.xml"), info)
+    >>> fh.read(50)
+    b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    """
+    def __init__(self, view, info, owner=None):
+        super().__init__()
+        self._view = view
+        self._info = info
+        self._owner = owner
+        self._position = 0
+        self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        self._buffer = b""
+        self._offset = 0
+        self._crc = 0
+        self._eof = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        # inflate more bytes when the buffer is used up
+        while self._offset >= len(self._buffer) and not self._eof:
+            data = self._decompressor.unconsumed_tail
+            if not data:
+                data = self._view[self._position:self._position + INFLATE_CHUNK_SIZE]
+                self._position += len(data)
+            if not data:
+                self._buffer = self._decompressor.flush()
+                self._eof = True
+            else:
+                self._buffer = self._decompressor.decompress(data, max(len(b), INFLATE_CHUNK_SIZE))
+                self._eof = self._decompressor.eof
+            self._offset = 0
+            self._crc = zlib.crc32(self._buffer, self._crc)
+
+            # check the CRC once the whole member is inflated
+            if self._eof and self._crc != self._info.CRC:
+                raise zipfile.BadZipFile(f"Bad CRC-32 for file {self._info.filename!r}")
+
+        # copy as many bytes as fit from the buffer
+        size = min(len(b), len(self._buffer) - self._offset)
+        b[:size] = self._buffer[self._offset:self._offset + size]
+        self._offset += size
+        return size
+
+
+class MappedZip:
+    """
+    Description
+    -----------
+    A workbook package (zip file) that is memory-mapped instead of read
+    through buffered file i/o. Stored members are exposed as zero-copy
+    memoryview slices of the mapping, and deflated members are inflated
+    as they are read, straight from the mapping.
+
+    Has the same read methods as zipfile.ZipFile (`namelist`, `infolist`,
+    `getinfo`, `read`, `open`, `NameToInfo`), so it can be passed to the
+    functions in this package that take an open workbook package.
+    Use `get_mapped_zip` to get one, so every reader of the same file in
+    this process shares the same mapping.
+
+    Parameters
+    ----------
+    file_path : str
+        The file path of the workbook.
+
+    Attributes
+    ----------
+    file_path : str
+        The absolute file path of the workbook.
+    filename : str
+        Alias for file_path, the same as zipfile.ZipFile.
+
+    Methods
+    -------
+    open_file
+        Open the whole workbook file as a file object over the mapping,
+        to pass to openpyxl or pyxlsb.
+    raw_member
+        Get the compressed bytes of a member as a memoryview.
+    read_member
+        Get the bytes of a member, as a memoryview for stored members.
+    iter_member
+        Iterate over the bytes of a member in chunks.
+    open
+        Open a member as a file object.
+    release
+        Stop using the mapping, and unmap it once no one else is using it.
+
+    Raises
+    ------
+    ValueError
+        If the file is empty.
+    zipfile.BadZipFile
+        If the file is not a zip file.
+
+    Examples
+    --------
+    >>> with get_mapped_zip("test.xlsx") as mapped_zip:
+    ...     view = mapped_zip.read_member("xl/worksheets/sheet1.xml")
+    ...     wb = openpyxl.load_workbook(mapped_zip.open_file())
+    """
+    def __init__(self, file_path):
+        self.file_path = os.path.abspath(file_path)
+        self.filename = self.file_path
+
+        # map the whole file, read-only
+        with open(self.file_path, "rb") as fh:
+            if os.fstat(fh.fileno()).st_size == 0:
+                raise ValueError(f"The file {file_path} is empty.")
+            self._mmap = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+
+        # read the central directory of the zip file from the mapping
+        with zipfile.ZipFile(MappedFile(self._view)) as zf:
+            self._infolist = zf.infolist()
+        self.NameToInfo = {info.filename: info for info in self._infolist}
+
+        # offsets of the compressed bytes of each member, found lazily
+        self._data_offsets = {}
+
+        # the number of users of the mapping,
+        # counted under the lock of the shared mappings
+        self._users = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+    def namelist(self):
+        return [info.filename for info in self._infolist]
+
+    def infolist(self):
+        return list(self._infolist)
+
+    def getinfo(self, name):
+        if name not in self.NameToInfo:
+            raise KeyError(f"There is no item named {name!r} in the archive")
+        return self.NameToInfo[name]
+
+    def open_file(self):
+        """
+        Open the whole workbook file as a seekable file object over the
+        mapping, with its own position, to pass to openpyxl or pyxlsb
+        in place of the file path.
+        """
+        return MappedFile(self._view[:], owner=self)
+
+    def raw_member(self, name):
+        """
+        Get the compressed bytes of a member as a memoryview
+        of the mapping, without copying them.
+        """
+        info = self.getinfo(name)
+        if name not in self._data_offsets:
+            # the compressed bytes follow the local file header
+            header = self._view[info.header_offset:info.header_offset + LOCAL_HEADER_SIZE]
+            if bytes(header[:4]) != b"PK\x03\x04":
+                raise zipfile.BadZipFile(f"The zip member {name} has an invalid local header.")
+            name_length, extra_length = struct.unpack("<HH", header[26:30])
+            self._data_offsets[name] = (info.header_offset + LOCAL_HEADER_SIZE
+                                        + name_length + extra_length)
+        start = self._data_offsets[name]
+        return self._view[start:start + info.compress_size]
+
+    def read_member(self, name):
+        """
+        Get the bytes of a member. Stored members are returned as a
+        zero-copy memoryview of the mapping, and deflated members are
+        inflated into bytes.
+        """
+        info = self.getinfo(name)
+        if info.compress_type == zipfile.ZIP_STORED:
+            return self.raw_member(name)
+        return self.open(name).read()
+
+    def read(self, name):
+        """
+        Get the bytes of a member as bytes, the same as zipfile.ZipFile.read.
+        """
+        return bytes(self.read_member(name))
+
+    def iter_member(self, name, chunk_size=INFLATE_CHUNK_SIZE):
+        """
+        Iterate over the bytes of a member in chunks. Stored members
+        yield memoryview slices of the mapping, and deflated members are
+        inflated a chunk at a time.
+        """
+        info = self.getinfo(name)
+        if info.compress_type == zipfile.ZIP_STORED:
+            view = self.raw_member(name)
+            for start in range(0, len(view), chunk_size):
+                yield view[start:start + chunk_size]
+        else:
+            with self.open(name) as fh:
+                while True:
+                    chunk = fh.read(chunk_size)
+                    if not chunk:
+                        break
+                    yield chunk
+
+    def open(self, name, mode="r"):
+        """
+        Open a member as a read-only file object. Stored members are read
+        straight from the mapping, and deflated members are inflated as
+        they are read.
+        """
+        if mode != "r":
+            raise ValueError("A mapped zip file can only be read.")
+        info = self.getinfo(name)
+        if info.compress_type == zipfile.ZIP_STORED:
+            return io.BufferedReader(MappedFile(self.raw_member(name), owner=self))
+        if info.compress_type == zipfile.ZIP_DEFLATED:
+            return io.BufferedReader(InflatingReader(self.raw_member(name), info, owner=self))
+        raise ValueError(f"The zip member {name} uses an unsupported compression method.")
+
+    def release(self):
+        """
+        Stop using the mapping. Once every user of the mapping has
+        released it, the file is unmapped (or, if file objects over the
+        mapping are still open, it is unmapped once they are closed).
+        """
+        # stop sharing the mapping once it has no users left
+        with _MAPPED_ZIPS_LOCK:
+            self._users -= 1
+            if self._users > 0:
+                return
+            for key, mapped_zip in list(_MAPPED_ZIPS.items()):
+                if mapped_zip is self:
+                    del _MAPPED_ZIPS[key]
+
+        # unmap the file, unless file objects over the mapping are still open
+        try:
+            self._view.release()
+            self._mmap.close()
+        except BufferError:
+            pass
+
+
+def get_mapped_zip(file_path):
+    """
+    Description
+    -----------
+    Get the memory-mapped workbook package of a file. Every reader of
+    the same file in this process gets the same mapping, as long as the
+    file has not changed since it was mapped.
+    Call `release` (or use the mapped zip in a with statement)
+    when done with it.
+
+    Parameters
+    ----------
+    file_path : str
+        The file path of the workbook.
+
+    Returns
+    -------
+    MappedZip
+        The memory-mapped workbook package.
+
+    Raises
+    ------
+    ValueError
+        If the file is empty.
+    zipfile.BadZipFile
+        If the file is not a zip file.
+
+    Imports
+    -------
+    os
+    threading
+    weakref
+
+    Examples
+    --------
+    >>> with get_mapped_zip("test.xlsx") as mapped_zip:
+    ...     mapped_zip.namelist()
+    ['[Content_Types].xml', '_rels/.rels', 'xl/workbook.xml', ...]
+    """
+    # the mapping is shared as long as the file has not changed
+    stat = os.stat(file_path)
+    key = (os.path.realpath(file_path), stat.st_size, stat.st_mtime_ns)
+
+    with _MAPPED_ZIPS_LOCK:
+        mapped_zip = _MAPPED_ZIPS.get(key)
+        if mapped_zip is None:
+            mapped_zip = MappedZip(file_path)
+            _MAPPED_ZIPS[key] = mapped_zip
+        mapped_zip._users += 1
+    return mapped_zip
@@ -0,0 +1,418 @@
+"""
+name_index.py
+"""
+import bisect
+import re
+import weakref
+
+import openpyxl
+from openpyxl.workbook.defined_name import DefinedName
+from openpyxl.worksheet.cell_range import CellRange
+
+
+# cache of name indexes, one per workbook object
+# the workbook is held weakly, so the index goes away with the workbook
+_NAME_INDEXES = weakref.WeakKeyDictionary()
+
+
+def iter_defined_names(wb):
+    """
+    Description
+    -----------
+    Iterate over every defined name in an openpyxl workbook,
+    including names that are scoped to a single sheet.
+    Works with both the openpyxl 3.1+ api (dictionaries on the
+    workbook and on each worksheet) and the older api
+    (a single `definedName` list with `localSheetId` set).
+
+    Parameters
+    ----------
+    wb : openpyxl.Workbook
+        The workbook object.
+
+    Returns
+    -------
+    generator
+        Yields tuples of the form (scope, defined_name), where scope is
+        the title of the sheet the name is scoped to, or None for names
+        scoped to the whole workbook.
+
+    Imports
+    -------
+    openpyxl
+
+    Examples
+    --------
+    >>> list(iter_defined_names(wb))
+    [(None, <DefinedName 'named_range_1'>), ('Sheet1', <DefinedName 'local_name'>)]
+    """
+    # older versions of openpyxl keep every name in one list
+    # and use localSheetId to mark sheet-scoped names
+    if hasattr(wb.defined_names, "definedName"):
+        for defined_name in wb.defined_names.definedName:
+            if defined_name.localSheetId is None:
+                yield None, defined_name
+            else:
+                yield wb.sheetnames[defined_name.localSheetId], defined_name
+        return
+
+    # newer versions keep workbook names on the workbook
+    # and sheet-scoped names on each worksheet
+    for defined_name in wb.defined_names.values():
+        yield None, defined_name
+    for ws in wb.worksheets:
+        for defined_name in ws.defined_names.values():
+            yield ws.title, defined_name
+
+
+def parse_destinations(defined_name):
+    """
+    Description
+    -----------
+    Parse the destinations of a defined name into a list of
+    (sheet, CellRange) tuples, one for each area of the name.
+    Names that do not refer to a range (constants, formulas, external
+    references) have no destinations and return an empty list.
+
+    Parameters
+    ----------
+    defined_name : openpyxl.workbook.defined_name.DefinedName
+        The defined name.
+
+    Returns
+    -------
+    list
+        List of (sheet, CellRange) tuples.
+
+    Imports
+    -------
+    openpyxl
+
+    Examples
+    --------
+    >>> parse_destinations(wb.defined_names["named_range_1"])
+    [('Sheet1', <CellRange A1:A2>)]
+    >>> parse_destinations(wb.defined_names["multi_area"])
+    [('Sheet1', <CellRange A1:A2>), ('Sheet2', <CellRange B5>)]
+    """
+    # external names cannot be resolved to a local sheet
+    if defined_name.is_external:
+        return []
+
+    # try to parse the destinations, some names (like #REF! names)
+    # look like ranges but cannot be parsed
+    try:
+        return [
+            (sheet.replace("''", "'"), CellRange(cells.replace("$", "")))
+            for sheet, cells in defined_name.destinations
+        ]
+    except (ValueError, TypeError, AttributeError):
+        return []
+
+
+class NameIndex:
+    """
+    Description
+    -----------
+    An index of the defined names in an openpyxl workbook,
+    built once per workbook.
+
+    Maps each name (including names scoped to a single sheet) to its
+    parsed destinations, a list of (sheet, CellRange) tuples with one
+    entry per area of the name. Destinations are parsed the first time
+    a name is looked up and cached until that name is edited, so
+    updating hundreds of names does not re-resolve all of them.
+
+    Names are case-insensitive, the same as in Excel. A lookup with a
+    sheet given (either as the sheet argument, or written as Sheet1!name)
+    checks the names scoped to that sheet first, and then the
+    workbook-scoped names.
+
+    Parameters
+    ----------
+    wb : openpyxl.Workbook
+        The workbook object.
+
+    Attributes
+    ----------
+    wb : openpyxl.Workbook
+        The workbook object.
+
+    Methods
+    -------
+    get
+        Get the destinations of a name.
+    get_defined_name
+        Get the openpyxl DefinedName object of a name.
+    set
+        Add or change a name, invalidating only that name.
+    remove
+        Remove a name, invalidating only that name.
+    invalidate
+        Drop the cached destinations of one name, or of every name.
+    refresh
+        Rebuild the index from the workbook.
+    find_prefix
+        Find the names starting with a prefix.
+    find_regex
+        Find the names matching a regular expression.
+    to_dict
+        Return a dictionary of names and their reference strings.
+
+    Examples
+    --------
+    >>> index = NameIndex(wb)
+    >>> index.get("named_range_1")
+    [('Sheet1', <CellRange A1:A2>)]
+    >>> index.find_prefix("named_")
+    ['named_range_1', 'named_range_2']
+    """
+    def __init__(self, wb):
+        # check that the workbook is an openpyxl workbook
+        if not isinstance(wb, openpyxl.Workbook):
+            raise ValueError("wb is not an openpyxl workbook object")
+
+        self.wb = wb
+
+        # (scope, lower case name) -> DefinedName
+        self._names = {}
+
+        # (scope, lower case name) -> (attr_text, destinations)
+        # the attr_text is kept so an edit made directly on the
+        # DefinedName object is noticed and the name is re-parsed
+        self._destinations = {}
+
+        # lower case names in any scope, for membership tests
+        self._lower_names = set()
+
+        # sorted list of lower case names, built lazily for prefix lookups
+        self._sorted_names = None
+
+        # build the index
+        self.refresh()
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, name):
+        return name.lower() in self._lower_names
+
+    def __iter__(self):
+        return (defined_name.name for defined_name in self._names.values())
+
+    def _keys(self, name, sheet=None):
+        # a sheet-scoped name can also be written as Sheet1!name
+        if sheet is None and "!" in name:
+            sheet, name = name.rsplit("!", 1)
+            sheet = sheet.strip("'").replace("''", "'")
+
+        # the keys to try for a name, sheet scope first
+        keys = []
+        if sheet is not None:
+            keys.append((sheet, name.lower()))
+        keys.append((None, name.lower()))
+        return [key for key in keys if key in self._names]
+
+    def refresh(self):
+        """
+        Rebuild the index from the workbook.
+        Only needed if names were added or removed on the workbook
+        directly, instead of through `set` and `remove`.
+        """
+        self._names = {
+            (scope, defined_name.name.lower()): defined_name
+            for scope, defined_name in iter_defined_names(self.wb)
+        }
+        self._lower_names = {key[1] for key in self._names}
+        self._destinations = {}
+        self._sorted_names = None
+
+    def invalidate(self, name=None, sheet=None):
+        """
+        Drop the cached destinations of one name, or of every name
+        if no name is given. The name is re-parsed the next time it is
+        looked up.
+        """
+        if name is None:
+            self._destinations = {}
+        else:
+            self._destinations.pop((sheet, name.lower()), None)
+
+    def get_defined_name(self, name, sheet=None):
+        """
+        Get the openpyxl DefinedName object of a name.
+
+        Raises
+        ------
+        ValueError
+            If the named range is not found.
+        """
+        keys = self._keys(name, sheet)
+        if not keys:
+            raise ValueError(f"The named range {name} is not found.")
+        return self._names[keys[0]]
+
+    def get(self, name, sheet=None):
+        """
+        Get the destinations of a name, as a list of (sheet, CellRange)
+        tuples with one entry per area of the name.
+
+        Raises
+        ------
+        ValueError
+            If the named range is not found.
+        """
+        keys = self._keys(name, sheet)
+        if not keys:
+            raise ValueError(f"The named range {name} is not found.")
+        key = keys[0]
+        defined_name = self._names[key]
+
+        # use the cached destinations unless the name has been edited
+        cached = self._destinations.get(key)
+        if cached is None or cached[0] != defined_name.attr_text:
+            cached = (defined_name.attr_text, parse_destinations(defined_name))
+            self._destinations[key] = cached
+        return cached[1]
+
+    def set(self, name, value, sheet=None):
+        """
+        Add a name or change the reference of an existing name,
+        on the workbook and in the index. Only this name is invalidated.
+        If sheet is given, the name is scoped to that sheet.
+        """
+        key = (sheet, name.lower())
+
+        # edit the existing DefinedName object if there is one
+        if key in self._names:
+            self._names[key].attr_text = value
+            self.invalidate(name, sheet)
+            return
+
+        # otherwise add a new DefinedName to the workbook
+        defined_name = DefinedName(name, attr_text=value)
+        if hasattr(self.wb.defined_names, "definedName"):
+            if sheet is not None:
+                defined_name.localSheetId = self.wb.sheetnames.index(sheet)
+            self.wb.defined_names.append(defined_name)
+        elif sheet is None:
+            self.wb.defined_names[name] = defined_name
+        else:
+            self.wb[sheet].defined_names[name] = defined_name
+
+        self._names[key] = defined_name
+        self._lower_names.add(key[1])
+        self._sorted_names = None
+
+    def remove(self, name, sheet=None):
+        """
+        Remove a name from the workbook and from the index.
+
+        Raises
+        ------
+        ValueError
+            If the named range is not found.
+        """
+        key = (sheet, name.lower())
+        if key not in self._names:
+            raise ValueError(f"The named range {name} is not found.")
+        defined_name = self._names.pop(key)
+
+        # remove the DefinedName from the workbook
+        if hasattr(self.wb.defined_names, "definedName"):
+            self.wb.defined_names.definedName.remove(defined_name)
+        elif sheet is None:
+            del self.wb.defined_names[defined_name.name]
+        else:
+            del self.wb[sheet].defined_names[defined_name.name]
+
+        # keep the name as a member if it is still defined in another scope
+        if not any((scope, key[1]) in self._names for scope in [None, *self.wb.sheetnames]):
+            self._lower_names.discard(key[1])
+
+        self.invalidate(name, sheet)
+        self._sorted_names = None
+
+    def find_prefix(self, prefix):
+        """
+        Find the names starting with a prefix (case-insensitive),
+        using a binary search over the sorted names.
+        """
+        if self._sorted_names is None:
+            self._sorted_names = sorted(
+                (key[1], defined_name.name) for key, defined_name in self._names.items()
+                )
+        prefix = prefix.lower()
+        start = bisect.bisect_left(self._sorted_names, (prefix, ""))
+        names = []
+        for lower_name, name in self._sorted_names[start:]:
+            if not lower_name.startswith(prefix):
+                break
+            names.append(name)
+        return names
+
+    def find_regex(self, pattern, flags=re.IGNORECASE):
+        """
+        Find the names matching a regular expression.
+        """
+        regex = re.compile(pattern, flags)
+        return [
+            defined_name.name for defined_name in self._names.values()
+            if regex.search(defined_name.name) is not None
+            ]
+
+    def to_dict(self):
+        """
+        Return a dictionary where the keys are the names and the values
+        are the reference strings of the names, the same as
+        `get_named_ranges` returns. Names scoped to a sheet are keyed as
+        "Sheet!name", the same as in `read_defined_names`, so they do not
+        collide with a workbook-scoped name of the same name.
+        """
+        return {
+            (defined_name.name if scope is None else f"{scope}!{defined_name.name}"): defined_name.attr_text
+            for (scope, _), defined_name in self._names.items()
+            }
+
+
+def get_name_index(wb):
+    """
+    Description
+    -----------
+    Get the NameIndex for a workbook, building it the first time
+    it is asked for and reusing it on every later call.
+
+    Parameters
+    ----------
+    wb : openpyxl.Workbook
+        The workbook object.
+
+    Returns
+    -------
+    NameIndex
+        The name index of the workbook.
+
+    Raises
+    ------
+    ValueError
+        If the wb is not an openpyxl workbook object.
+
+    Imports
+    -------
+    openpyxl
+    weakref
+
+    Examples
+    --------
+    >>> index = get_name_index(wb)
+    >>> index is get_name_index(wb)
+    True
+    """
+    # check that the workbook is an openpyxl workbook
+    if not isinstance(wb, openpyxl.Workbook):
+        raise ValueError("wb is not an openpyxl workbook object")
+
+    # build the index the first time, reuse it after that
+    if wb not in _NAME_INDEXES:
+        _NAME_INDEXES[wb] = NameIndex(wb)
+    return _NAME_INDEXES[wb]
@@ -6,12 +6,16 @@ import pyxlsb
 
 from .is_xlsb import is_xlsb
 from .is_wb import is_wb
+from .mapped_zip import get_mapped_zip
+from .load_sheet_subset import load_sheet_subset
+from .load_cached_values import load_workbook_with_cached_values
+from .load_parallel import load_workbook_parallel
 
 # function to open an excel workbook
 # takes an input file name as a string
 # returns a workbook object
 # this version is for use with the openpyxl module
-def open_workbook_openpyxl(file_name):
+def open_workbook_openpyxl(file_name, sheets=None, cached_values=False, parallel=False):
     """
     Description
     -----------
@@ -22,6 +26,18 @@ def open_workbook_openpyxl(file_name):
     file_name : str
         The name of the file to open.
         Must have the file extension .xlsx or .xlsm.
+    sheets : list, optional
+        The names of the worksheets to load.
+        Default is None, which loads every sheet.
+        The other worksheets are not loaded (see `load_sheet_subset`).
+    cached_values : bool, optional
+        Whether to keep the cached values of the formula cells as well as
+        the formulas, read in the same pass (see `load_workbook_with_cached_values`).
+        Default is False.
+    parallel : bool, optional
+        Whether to parse the large worksheets in worker processes at the
+        same time (see `load_workbook_parallel`). Ignored if sheets is given.
+        Default is False.
 
     Returns
     -------
@@ -35,18 +51,40 @@ def open_workbook_openpyxl(file_name):
     Imports
     -------
     openpyxl
+    .mapped_zip
+    .load_sheet_subset
+    .load_cached_values
+    .load_parallel
 
     Examples
     --------
     >>> wb = open_workbook_openpyxl('test.xlsx')
+    >>> wb = open_workbook_openpyxl('test.xlsx', sheets=['Inputs'])
+    >>> wb = open_workbook_openpyxl('test.xlsx', cached_values=True)
+    >>> wb = open_workbook_openpyxl('consolidation.xlsx', parallel=True)
     """
     # check if the file is an xlsb file
     # if it is, raise an error
     if is_xlsb(file_name):
         raise Exception('File is an xlsb file. Use open_workbook_pyxlsb() instead.')
 
-    # open the workbook
-    wb = openpyxl.load_workbook(file_name)
+    # only load some of the sheets, if asked to
+    if sheets is not None:
+        return load_sheet_subset(file_name, sheets, cached_values=cached_values)
+
+    # parse the worksheets in worker processes, which read the file themselves
+    if parallel:
+        return load_workbook_parallel(file_name, cached_values=cached_values)
+
+    # open the workbook from the memory mapping of the file,
+    # which is shared with every other reader of the file in this process
+    # openpyxl reads everything it needs while loading,
+    # so the mapping can be released once the workbook is loaded
+    with get_mapped_zip(file_name) as mapped_zip:
+        if cached_values:
+            wb = load_workbook_with_cached_values(mapped_zip.open_file())
+        else:
+            wb = openpyxl.load_workbook(mapped_zip.open_file())
     return wb
 
 # similar funciton to above but for use with the pyxlsb module
@@ -65,7 +103,8 @@ def open_workbook_pyxlsb(file_name):
     Returns
     -------
     wb : Workbook
-        The workbook object.
+        The workbook object. Close it (or use it in a with statement)
+        when done with it, to release the memory mapping of the file.
 
     Raises
     ------
@@ -74,18 +113,45 @@ def open_workbook_pyxlsb(file_name):
     Imports
     -------
     pyxlsb
+    .mapped_zip
 
     Examples
     --------
-    >>> wb = open_workbook_pyxlsb('test.xlsb')
+    >>> with open_workbook_pyxlsb('test.xlsb') as wb:
+    ...     wb.sheets
+    ['Sheet1']
     """
     # check if the file is an xlsb file
     # if it is NOT, raise an error
     if not is_xlsb(file_name):
         raise Exception('File is not an xlsb file. Use open_workbook_openpyxl() instead.')
 
-    # open the workbook
-    wb = pyxlsb.open_workbook(file_name)
+    # open the workbook from the memory mapping of the file,
+    # which is shared with every other reader of the file in this process
+    # pyxlsb reads the sheets as they are asked for, so the
+    # mapping stays in use until the workbook object is closed
+    mapped_zip = get_mapped_zip(file_name)
+    fh = mapped_zip.open_file()
+    try:
+        wb = pyxlsb.open_workbook(fh)
+    except BaseException:
+        fh.close()
+        mapped_zip.release()
+        raise
+
+    # pyxlsb does not close file objects it was given, so closing the
+    # workbook also closes the file object and releases the mapping, once
+    close_workbook = wb.close
+
+    def close():
+        try:
+            close_workbook()
+        finally:
+            if not fh.closed:
+                fh.close()
+                mapped_zip.release()
+
+    wb.close = close
     return wb
 
 # function to open an excel workbook
@@ -95,7 +161,7 @@ def open_workbook_pyxlsb(file_name):
 # first test if the file is an xlsb file using is_xlsb()
 # if it is, use open_workbook_pyxlsb()
 # if it is not, use open_workbook_openpyxl()
-def open_workbook(file_name):
+def open_workbook(file_name, sheets=None, cached_values=False, parallel=False):
     """
     Description
     -----------
@@ -106,6 +172,17 @@ def open_workbook(file_name):
     file_name : str
         The name of the file to open.
         Must have the file extension .xlsx, .xlsm, or .xlsb.
+    sheets : list, optional
+        The names of the worksheets to load.
+        Default is None, which loads every sheet.
+        Ignored for xlsb files, whose sheets are only read when they are used.
+    cached_values : bool, optional
+        Whether to keep the cached values of the formula cells as well as
+        the formulas. Ignored for xlsb files. Default is False.
+    parallel : bool, optional
+        Whether to parse the large worksheets in worker processes at the
+        same time. Ignored for xlsb files, and if sheets is given.
+        Default is False.
 
     Returns
     -------
@@ -125,6 +202,7 @@ def open_workbook(file_name):
     --------
     >>> wb = open_workbook('test.xlsx')
     >>> wb = open_workbook('test.xlsb')
+    >>> wb = open_workbook('test.xlsx', sheets=['Inputs'])
     """
     # check if the file is an xlsb file
     # if it is, use open_workbook_pyxlsb()
@@ -132,5 +210,5 @@ def open_workbook(file_name):
         wb = open_workbook_pyxlsb(file_name)
     # if it is not, use open_workbook_openpyxl()
     else:
-        wb = open_workbook_openpyxl(file_name)
+        wb = open_workbook_openpyxl(file_name, sheets=sheets, cached_values=cached_values, parallel=parallel)
     return wb
@@ -0,0 +1,579 @@
+"""
+paged_sheet.py
+"""
+import collections
+import pickle
+import tempfile
+import zipfile
+import zlib
+
+from openpyxl.formula.translate import Translator
+from openpyxl.utils.cell import range_boundaries
+from openpyxl.utils.datetime import to_excel
+
+from .column_letter_from_index import column_letter_from_index
+from .date_styles import get_date_kind, read_date_styles
+from .excel_dates import get_workbook_epoch
+from .get_sheet_parts import get_sheet_parts, get_workbook_part
+from .mapped_zip import get_mapped_zip
+from .read_shared_strings import read_shared_strings
+from .read_sheet_rows import iter_row_cells, iter_sheet_rows
+from .rewrite_package import rewrite_package
+from .splice_cells import set_full_calc_on_load, splice_sheet_rows
+from .values_equal import values_equal
+
+
+# the number of rows in each block of a paged sheet
+PAGE_BLOCK_ROWS = 1024
+
+# the number of rows of each paged sheet kept in memory, by default
+PAGE_MAX_ROWS = 65536
+
+# the zlib level blocks are spilled with: fast, since blocks are spilled
+# and read back often, and still several times smaller than pickled
+SPILL_COMPRESSION_LEVEL = 1
+
+
+class _PageBlock:
+    # the cells of a block of rows, as {row: {column: (value, formula)}},
+    # the values written to them, as {row: {column: value}}, and whether
+    # the block changed since it was last spilled
+    __slots__ = ("cells", "changes", "dirty")
+
+    def __init__(self, cells, changes, dirty):
+        self.cells = cells
+        self.changes = changes
+        self.dirty = dirty
+
+
+def is_formula(value):
+    """
+    Check whether a value is written as a formula (see `format_cell_xml`).
+    """
+    return isinstance(value, str) and value.startswith("=") and len(value) > 1
+
+
+class PagedSheet:
+    """
+    Description
+    -----------
+    A worksheet of a workbook file whose cells are kept in blocks of rows,
+    with only a bounded number of blocks in memory, for sheets too big to
+    load. The sheet is read once, a row at a time, when it is opened, and
+    the blocks that do not fit in memory are spilled to a temporary file
+    (pickled and compressed). The blocks are read back when their rows are
+    used, and the least recently used blocks are spilled again to make room.
+
+    Values can be written to the cells of the sheet, and the rows with new
+    values are spliced into the sheet of a saved workbook file, a block at
+    a time (see `save_paged_sheets`). The cells keep their styles.
+
+    Numbers in cells with a date format are read as dates, times or
+    timedeltas, in the date system of the workbook, as openpyxl reads them.
+
+    Parameters
+    ----------
+    file_path : str
+        The file path of the workbook (.xlsx or .xlsm).
+    sheet : str
+        The name of the worksheet.
+    max_rows : int, optional
+        The number of rows to keep in memory, in blocks of block_rows.
+        Default is 65536.
+    block_rows : int, optional
+        The number of rows in each block. Default is 1024.
+    spill_dir : str, optional
+        The directory of the temporary file blocks are spilled to.
+        Default is None, which uses the temporary directory.
+
+    Attributes
+    ----------
+    file_path : str
+        The file path of the workbook.
+    sheet : str
+        The name of the worksheet.
+    block_rows : int
+        The number of rows in each block.
+    max_blocks : int
+        The number of blocks kept in memory.
+    max_row : int
+        The last row with cells, including the rows written to.
+    max_column : int
+        The last column with cells, including the columns written to.
+    epoch : datetime.datetime
+        The date system of the workbook.
+    page_reads : int
+        The number of times a block was read back from the temporary file.
+    page_writes : int
+        The number of times a block was spilled to the temporary file.
+
+    Raises
+    ------
+    ValueError
+        If the sheet is not a worksheet of the workbook.
+
+    Examples
+    --------
+    >>> with PagedSheet("consolidation.xlsx", "Detail", max_rows=100000) as paged:
+    ...     paged.write_values(2, 5, [[0.07], [0.08]])
+    ...     paged.read_range("E2:E3")
+    (2, 0)
+    [[(2, 5, 0.07, None)], [(3, 5, 0.08, None)]]
+    """
+    def __init__(self, file_path, sheet, max_rows=PAGE_MAX_ROWS, block_rows=PAGE_BLOCK_ROWS, spill_dir=None):
+        self.file_path = file_path
+        self.sheet = sheet
+        self.block_rows = block_rows
+        self.max_blocks = max(1, max_rows // block_rows)
+        self.max_row = 0
+        self.max_column = 0
+        self.epoch = None
+        self.page_reads = 0
+        self.page_writes = 0
+
+        # the blocks in memory, least recently used first,
+        # where each block is in the temporary file, and the blocks
+        # with values written to them
+        self._blocks = collections.OrderedDict()
+        self._spilled = {}
+        self._changed_blocks = set()
+        self._spill_file = tempfile.TemporaryFile(prefix="paged_sheet_", dir=spill_dir)
+
+        try:
+            self._read_sheet()
+        except BaseException:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        Close the temporary file the blocks are spilled to, which deletes it.
+        """
+        self._spill_file.close()
+
+    @property
+    def changed(self):
+        """
+        Whether any values were written to the sheet.
+        """
+        return bool(self._changed_blocks)
+
+    def _read_sheet(self):
+        # read the cells of the sheet into blocks, a row at a time,
+        # with the formulas that share the formula of another cell
+        # translated to their own cells, and the numbers of cells with
+        # a date format read as dates, as openpyxl does
+        with get_mapped_zip(self.file_path) as zf:
+            sheet_parts = get_sheet_parts(zf)
+            part = sheet_parts.get(self.sheet)
+            if part is None or "worksheets/" not in part:
+                raise ValueError(f"The sheet {self.sheet} is not a worksheet of the workbook {self.file_path}.")
+            shared_strings = read_shared_strings(zf)
+            self.epoch = get_workbook_epoch(zf)
+            date_styles = read_date_styles(zf)
+            shared_formulas = {}
+            for row_number, row in iter_sheet_rows(zf, part):
+                cells = {}
+                for _, column, value, formula, attributes in iter_row_cells(row, shared_strings, date_styles,
+                                                                             self.epoch):
+                    if formula is not None and attributes.get("t") == "shared" and "si" in attributes:
+                        ref = f"{column_letter_from_index(column)}{row_number}"
+                        if formula:
+                            shared_formulas[attributes["si"]] = ("=" + formula, ref)
+                            formula = "=" + formula
+                        elif attributes["si"] in shared_formulas:
+                            text, origin = shared_formulas[attributes["si"]]
+                            formula = Translator(text, origin=origin).translate_formula(ref)
+                        else:
+                            formula = None
+                    elif formula is not None:
+                        formula = "=" + formula if formula else None
+                    cells[column] = (value, formula)
+                if cells:
+                    block = self._get_block((row_number - 1) // self.block_rows, create=True)
+                    block.cells[row_number] = cells
+                    self.max_row = max(self.max_row, row_number)
+                    self.max_column = max(self.max_column, max(cells))
+
+    def _get_block(self, index, create=False):
+        # get a block, reading it back from the temporary file if it was
+        # spilled, and spilling the least recently used blocks to make room
+        block = self._blocks.get(index)
+        if block is not None:
+            self._blocks.move_to_end(index)
+            return block
+
+        if index in self._spilled:
+            offset, length = self._spilled[index]
+            self._spill_file.seek(offset)
+            cells, changes = pickle.loads(zlib.decompress(self._spill_file.read(length)))
+            block = _PageBlock(cells, changes, False)
+            self.page_reads += 1
+        elif create:
+            block = _PageBlock({}, {}, True)
+        else:
+            return None
+
+        self._blocks[index] = block
+        while len(self._blocks) > self.max_blocks:
+            spilled_index, spilled_block = self._blocks.popitem(last=False)
+            if spilled_block.dirty:
+                self._spill(spilled_index, spilled_block)
+        return block
+
+    def _spill(self, index, block):
+        # write a block to the temporary file, over its last copy if it fits
+        data = zlib.compress(pickle.dumps((block.cells, block.changes), pickle.HIGHEST_PROTOCOL),
+                             SPILL_COMPRESSION_LEVEL)
+        offset, length = self._spilled.get(index, (None, 0))
+        if len(data) > length:
+            self._spill_file.seek(0, 2)
+            offset = self._spill_file.tell()
+        else:
+            self._spill_file.seek(offset)
+        self._spill_file.write(data)
+        self._spilled[index] = (offset, len(data))
+        self.page_writes += 1
+
+    def _get_cell(self, block, row, column):
+        # the value and formula of a cell, with the value written to it
+        if block is None:
+            return None, None
+        changes = block.changes.get(row)
+        if changes is not None and column in changes:
+            value = changes[column]
+            return (None, value) if is_formula(value) else (value, None)
+        return block.cells.get(row, {}).get(column, (None, None))
+
+    def _values_equal(self, old_value, value):
+        # a cell with a date is compared as the serial number it is saved as,
+        # since writing the same date (or its serial number) leaves it as it is
+        if get_date_kind(old_value) is None:
+            return values_equal(old_value, value)
+        if get_date_kind(value) is not None:
+            value = to_excel(value, self.epoch)
+        return values_equal(to_excel(old_value, self.epoch), value)
+
+    def read_range(self, cell_range):
+        """
+        Description
+        -----------
+        Read the values and the formulas of a range of cells, where the
+        value of a formula cell is its cached value, and the cells that
+        were written to have their new values. Numbers in cells with a
+        date format are dates, as in a loaded sheet.
+
+        Parameters
+        ----------
+        cell_range : str
+            The range of cells, in A1 notation (e.g. "B2:C10").
+
+        Returns
+        -------
+        list
+            The rows of the range, where each row is a list of tuples of the
+            form (row, column, value, formula), as given by `read_range`.
+
+        Raises
+        ------
+        ValueError
+            If the range is not a range of cells.
+
+        Examples
+        --------
+        >>> paged.read_range("B9:B10")
+        [[(9, 2, 700.0, None)], [(10, 2, 10700.0, '=B8+B9')]]
+        """
+        try:
+            min_col, min_row, max_col, max_row = range_boundaries(cell_range.replace("$", ""))
+        except (AttributeError, TypeError, ValueError):
+            raise ValueError(f"The cell range {cell_range} is not in A1 notation.") from None
+        if None in (min_col, min_row, max_col, max_row):
+            raise ValueError(f"The cell range {cell_range} is not a range of cells.")
+
+        rows = []
+        for row in range(min_row, max_row + 1):
+            block = self._get_block((row - 1) // self.block_rows)
+            rows.append([(row, column, *self._get_cell(block, row, column))
+                         for column in range(min_col, max_col + 1)])
+        return rows
+
+    def write_values(self, min_row, min_col, values, elide=False):
+        """
+        Description
+        -----------
+        Write a block of values to the cells of the sheet, starting at a
+        cell. Values are written as by `format_cell_xml` when the sheet is
+        saved: strings starting with "=" are formulas, and None empties a cell.
+
+        Dates and times are saved as serial numbers in the date system of
+        the workbook, with a date format (see `format_cell_xml`), and read
+        back as they were written.
+
+        With elide, each value is compared with the value of its cell first
+        (see `values_equal`), and writes that would not change the cell are
+        skipped. A cell with a date is compared as the serial number it is
+        saved as. A value is never equal to a formula.
+
+        Parameters
+        ----------
+        min_row : int
+            The row of the first cell, from 1.
+        min_col : int
+            The column of the first cell, from 1.
+        values : iterable
+            The values, as rows of values.
+        elide : bool, optional
+            Whether to skip the writes that would not change their cells.
+            Default is False.
+
+        Returns
+        -------
+        tuple
+            Tuple of the form (written, elided), the number of cells
+            written and skipped.
+
+        Examples
+        --------
+        >>> paged.write_values(2, 2, [[0.07, "East"], [0.08, "=B2*2"]])
+        (4, 0)
+        """
+        written = 0
+        elided = 0
+        for row, row_values in enumerate(values, start=min_row):
+            index = (row - 1) // self.block_rows
+            block = self._get_block(index, create=True)
+            row_changes = None
+            for column, value in enumerate(row_values, start=min_col):
+                if elide:
+                    old_value, old_formula = self._get_cell(block, row, column)
+                    if is_formula(value):
+                        unchanged = value == old_formula
+                    else:
+                        unchanged = old_formula is None and self._values_equal(old_value, value)
+                    if unchanged:
+                        elided += 1
+                        continue
+                if row_changes is None:
+                    row_changes = block.changes.setdefault(row, {})
+                row_changes[column] = value
+                written += 1
+                self.max_column = max(self.max_column, column)
+            if row_changes is not None:
+                block.dirty = True
+                self._changed_blocks.add(index)
+                self.max_row = max(self.max_row, row)
+        return written, elided
+
+    def iter_changed_rows(self):
+        """
+        Description
+        -----------
+        Iterate over the rows with values written to them, in order,
+        a block at a time, as `splice_sheet_rows` takes them.
+
+        Returns
+        -------
+        generator
+            Yields tuples of the form (row number, values), where values
+            is a dictionary of the values written, keyed by column number.
+
+        Examples
+        --------
+        >>> list(paged.iter_changed_rows())
+        [(2, {2: 0.07, 3: 'East'}), (3, {2: 0.08, 3: '=B2*2'})]
+        """
+        for index in sorted(self._changed_blocks):
+            changes = self._get_block(index).changes
+            for row in sorted(changes):
+                yield row, changes[row]
+
+
+def open_paged_sheets(file_path, sheets, max_rows=PAGE_MAX_ROWS, spill_dir=None):
+    """
+    Description
+    -----------
+    Open sheets of a workbook file as paged sheets (see `PagedSheet`).
+
+    Parameters
+    ----------
+    file_path : str
+        The file path of the workbook (.xlsx or .xlsm).
+    sheets : list
+        The names of the worksheets.
+    max_rows : int, optional
+        The number of rows of each sheet to keep in memory.
+        Default is 65536.
+    spill_dir : str, optional
+        The directory of the temporary files blocks are spilled to.
+        Default is None, which uses the temporary directory.
+
+    Returns
+    -------
+    dict
+        Dictionary where the keys are the sheet names and the values
+        are the paged sheets.
+
+    Raises
+    ------
+    ValueError
+        If the workbook is an xlsb file, or a sheet is not a worksheet of it.
+
+    Examples
+    --------
+    >>> open_paged_sheets("consolidation.xlsx", ["Detail"])
+    {'Detail': <PagedSheet ...>}
+    """
+    if file_path.lower().endswith(".xlsb"):
+        raise ValueError(f"The workbook {file_path} is an xlsb file, which cannot be paged.")
+
+    paged_sheets = {}
+    try:
+        for sheet in sheets:
+            paged_sheets[sheet] = PagedSheet(file_path, sheet, max_rows=max_rows, spill_dir=spill_dir)
+    except BaseException:
+        for paged in paged_sheets.values():
+            paged.close()
+        raise
+    return paged_sheets
+
+
+def execute_paged_write_requests(paged_sheets, requests, elide=False, counts=None):
+    """
+    Description
+    -----------
+    Write checked writes to paged sheets, in order, as
+    `execute_write_requests` writes them to an openpyxl workbook.
+
+    Parameters
+    ----------
+    paged_sheets : dict
+        Dictionary of the paged sheets, keyed by sheet name.
+    requests : list
+        The writes, as given by `build_write_request`, to the paged sheets.
+    elide : bool, optional
+        Whether to skip the writes that would not change their cells.
+        Default is False.
+    counts : dict, optional
+        Dictionary to add the number of cells written and skipped on each
+        sheet to, as {sheet: {'written': int, 'elided': int}}.
+        Default is None.
+
+    Returns
+    -------
+    int
+        The number of cells written.
+
+    Examples
+    --------
+    >>> execute_paged_write_requests(paged_sheets, build_write_requests(sheet_names, {"Detail": "E2:E3"}, [1, 2]))
+    2
+    """
+    count = 0
+    for request in requests:
+        written, elided = paged_sheets[request.sheet].write_values(
+            request.min_row, request.min_col, request.values, elide=elide)
+        count += written
+        if counts is not None:
+            sheet_counts = counts.setdefault(request.sheet, {'written': 0, 'elided': 0})
+            sheet_counts['written'] += written
+            sheet_counts['elided'] += elided
+    return count
+
+
+def save_paged_sheets(file_path, paged_sheets, new_file_path=None, compression=zipfile.ZIP_DEFLATED):
+    """
+    Description
+    -----------
+    Write the values written to paged sheets into the sheets of a workbook
+    file (usually the file the workbook was just saved to, where the sheets
+    were copied from the file they were paged from). Each sheet is copied
+    a row at a time, and the rows with new values are spliced in from the
+    blocks of the paged sheet, one block at a time (see `splice_sheet_rows`),
+    so memory use stays within the blocks the paged sheet keeps.
+
+    Strings are written as inline strings, and dates and times in the date
+    system of the workbook, with a date format. The calculation chain is
+    dropped and the workbook is marked to be fully recalculated when Excel
+    opens it, so the formulas that depend on the cells are right.
+
+    Parameters
+    ----------
+    file_path : str
+        The file path of the workbook to write the values into.
+    paged_sheets : iterable
+        The paged sheets.
+    new_file_path : str, optional
+        The file path to write the new workbook to.
+        Default is None, which rewrites the workbook in place.
+    compression : int, optional
+        The compression used for the sheets that are rewritten.
+        Default is zipfile.ZIP_DEFLATED.
+
+    Returns
+    -------
+    int
+        The number of cells written.
+
+    Raises
+    ------
+    ValueError
+        If a paged sheet with values written to it is not in the workbook.
+
+    Imports
+    -------
+    zipfile
+    .date_styles
+    .excel_dates
+    .get_sheet_parts
+    .mapped_zip
+    .rewrite_package
+    .splice_cells
+
+    Examples
+    --------
+    >>> save_paged_sheets("consolidation_saved.xlsx", paged_sheets.values())
+    250000
+    """
+    changed = [paged for paged in paged_sheets if paged.changed]
+
+    with get_mapped_zip(file_path) as zf:
+        sheet_parts = get_sheet_parts(zf)
+        missing = [paged.sheet for paged in changed if paged.sheet not in sheet_parts]
+        if missing:
+            raise ValueError(f"The sheets {missing} are not in the workbook {file_path}.")
+        workbook_part = get_workbook_part(zf)
+        workbook_xml = zf.read(workbook_part)
+        epoch = get_workbook_epoch(zf)
+        date_styles = read_date_styles(zf)
+
+    count = []
+
+    def splice(part, paged):
+        def write_part(dst):
+            with get_mapped_zip(file_path) as zf, zf.open(part) as src:
+                count.append(splice_sheet_rows(src, dst, paged.iter_changed_rows(), epoch=epoch,
+                                               date_styles=date_styles))
+        return write_part
+
+    if not changed:
+        if new_file_path is not None:
+            rewrite_package(file_path, new_file_path)
+        return 0
+
+    replace_parts = {sheet_parts[paged.sheet]: splice(sheet_parts[paged.sheet], paged) for paged in changed}
+    replace_parts[workbook_part] = set_full_calc_on_load(workbook_xml)
+
+    # the styles are written after the sheets, once the cell formats
+    # of their dates are known
+    if date_styles.part is not None:
+        replace_parts[date_styles.part] = date_styles.write_xml
+    rewrite_package(file_path, new_file_path, replace_parts=replace_parts, drop_parts={"xl/calcChain.xml"},
+                    compression=compression, write_last={date_styles.part})
+    return sum(count)
@@ -0,0 +1,429 @@
+"""
+range_index.py
+"""
+import math
+
+from openpyxl.utils.cell import range_boundaries
+
+from .column_letter_from_index import column_letter_from_index
+from .name_index import iter_defined_names, parse_destinations
+from .write_request import parse_range
+
+
+# the most children of a node of a packed tree
+NODE_SIZE = 16
+
+# the most entries kept unpacked before they are packed into a tree
+BUFFER_SIZE = 64
+
+
+def get_bounds(cell_range):
+    """
+    Description
+    -----------
+    Get the bounds of a cell range, the same as `parse_range`, but also
+    taking (min_row, min_col, max_row, max_col) tuples as they are.
+
+    Parameters
+    ----------
+    cell_range : str or tuple
+        The cell range, in A1 notation, a (row, column) tuple for a single
+        cell, or a (min_row, min_col, max_row, max_col) tuple.
+
+    Returns
+    -------
+    tuple
+        Tuple of the form (min_row, min_col, max_row, max_col).
+
+    Raises
+    ------
+    ValueError
+        If the cell range is not a cell range.
+
+    Imports
+    -------
+    .write_request
+
+    Examples
+    --------
+    >>> get_bounds("B2:C3")
+    (2, 2, 3, 3)
+    >>> get_bounds((2, 2, 3, 3))
+    (2, 2, 3, 3)
+    """
+    if isinstance(cell_range, tuple) and len(cell_range) == 4:
+        min_row, min_col, max_row, max_col = cell_range
+        if min_row > max_row or min_col > max_col:
+            raise ValueError(f"The cell range {cell_range} is not a cell range.")
+        return cell_range
+    return parse_range(cell_range)
+
+
+def format_bounds(bounds):
+    """
+    Format the bounds of a cell range in A1 notation, e.g. "B2:C3" (or "B2" for one cell).
+    """
+    min_row, min_col, max_row, max_col = bounds
+    start = f"{column_letter_from_index(min_col)}{min_row}"
+    if (min_row, min_col) == (max_row, max_col):
+        return start
+    return f"{start}:{column_letter_from_index(max_col)}{max_row}"
+
+
+def _sort_tile(boxes):
+    # sort-tile-recursive order: slices by row, each sorted by column
+    if len(boxes) <= NODE_SIZE:
+        return boxes
+    node_count = math.ceil(len(boxes) / NODE_SIZE)
+    slice_size = NODE_SIZE * math.ceil(math.sqrt(node_count))
+    boxes = sorted(boxes, key=lambda box: box[0] + box[2])
+    tiled = []
+    for start in range(0, len(boxes), slice_size):
+        tiled.extend(sorted(boxes[start:start + slice_size], key=lambda box: box[1] + box[3]))
+    return tiled
+
+
+class PackedTree:
+    """
+    Description
+    -----------
+    A static R-tree over the cell ranges of one sheet, packed bottom up
+    with the sort-tile-recursive method, so every node is full and
+    neighbouring ranges share nodes. Queries visit only the nodes whose
+    bounding boxes meet the query, which is logarithmic in the number
+    of ranges for the small, scattered ranges of names and writes.
+
+    Parameters
+    ----------
+    entries : list
+        The entries, as tuples of the form
+        (min_row, min_col, max_row, max_col, sequence, item).
+
+    Attributes
+    ----------
+    entries : list
+        The entries, in the order of the leaves of the tree.
+    levels : list
+        The nodes of each level of the tree, from the leaves up, as tuples
+        of the form (min_row, min_col, max_row, max_col, start, end), where
+        start and end are the positions of the children in the level below
+        (or in the entries, for the leaves).
+    """
+    def __init__(self, entries):
+        self.entries = _sort_tile(list(entries))
+        self.levels = []
+        children = self.entries
+        while True:
+            nodes = []
+            for start in range(0, len(children), NODE_SIZE):
+                group = children[start:start + NODE_SIZE]
+                nodes.append((min(box[0] for box in group), min(box[1] for box in group),
+                              max(box[2] for box in group), max(box[3] for box in group),
+                              start, start + len(group)))
+            self.levels.append(nodes)
+            if len(nodes) <= 1:
+                break
+            # the nodes of the next level are tiled too, and
+            # their children stay where they are in the level below
+            children = _sort_tile(nodes)
+            self.levels[-1] = children
+
+    def __len__(self):
+        return len(self.entries)
+
+    def search(self, min_row, min_col, max_row, max_col):
+        """
+        Get the entries whose ranges meet a range.
+        """
+        found = []
+        stack = [(len(self.levels) - 1, node) for node in self.levels[-1]]
+        while stack:
+            level, node = stack.pop()
+            if node[0] > max_row or node[2] < min_row or node[1] > max_col or node[3] < min_col:
+                continue
+            if level == 0:
+                found.extend(entry for entry in self.entries[node[4]:node[5]]
+                             if not (entry[0] > max_row or entry[2] < min_row
+                                     or entry[1] > max_col or entry[3] < min_col))
+            else:
+                stack.extend((level - 1, child) for child in self.levels[level - 1][node[4]:node[5]])
+        return found
+
+
+class RangeIndex:
+    """
+    Description
+    -----------
+    A spatial index of cell ranges and the items they belong to (names,
+    writes, or anything else), by sheet, for finding which items cover
+    a cell, meet a range, contain a range or lie inside a range without
+    comparing against every item.
+
+    Each sheet keeps a few packed R-trees (see `PackedTree`) of doubling
+    sizes and a small buffer of the latest ranges. Adding a range puts
+    it in the buffer, and a full buffer is packed into a tree, merging
+    trees of about the same size, so ranges can be added at any time
+    (as writes are logged) and queries stay logarithmic.
+
+    Items are given back in the order they were added.
+
+    Methods
+    -------
+    add
+        Add the range of an item.
+    at
+        Get the items whose ranges cover a cell.
+    overlapping
+        Get the items whose ranges meet a range.
+    containing
+        Get the items whose ranges contain a range.
+    within
+        Get the items whose ranges lie inside a range.
+
+    Examples
+    --------
+    >>> index = RangeIndex()
+    >>> index.add("Inputs", "B2:D20", "rates")
+    >>> index.add("Inputs", "D14", "growth_rate")
+    >>> index.at("Inputs", "D14")
+    ['rates', 'growth_rate']
+    >>> index.within("Inputs", "C10:E15")
+    ['growth_rate']
+    """
+    def __init__(self):
+        # sheet -> list of packed trees, largest first
+        self._trees = {}
+        # sheet -> list of entries not packed yet
+        self._buffers = {}
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def sheets(self):
+        """
+        The sheets with ranges in the index.
+        """
+        return list(self._buffers)
+
+    def add(self, sheet, cell_range, item):
+        """
+        Add the range of an item.
+
+        Parameters
+        ----------
+        sheet : str
+            The name of the sheet.
+        cell_range : str or tuple
+            The cell range (see `get_bounds`).
+        item : object
+            The item the range belongs to.
+
+        Raises
+        ------
+        ValueError
+            If the cell range is not a cell range.
+        """
+        min_row, min_col, max_row, max_col = get_bounds(cell_range)
+        buffer = self._buffers.setdefault(sheet, [])
+        buffer.append((min_row, min_col, max_row, max_col, self._count, item))
+        self._count += 1
+        if len(buffer) < BUFFER_SIZE:
+            return
+
+        # pack the buffer, and merge the trees that are no bigger than it
+        trees = self._trees.setdefault(sheet, [])
+        entries = list(buffer)
+        buffer.clear()
+        while trees and len(trees[-1]) <= 2 * len(entries):
+            entries.extend(trees.pop().entries)
+        trees.append(PackedTree(entries))
+
+    def _search(self, sheet, bounds):
+        min_row, min_col, max_row, max_col = bounds
+        found = []
+        for tree in self._trees.get(sheet, []):
+            found.extend(tree.search(min_row, min_col, max_row, max_col))
+        found.extend(entry for entry in self._buffers.get(sheet, [])
+                     if not (entry[0] > max_row or entry[2] < min_row
+                             or entry[1] > max_col or entry[3] < min_col))
+        found.sort(key=lambda entry: entry[4])
+        return found
+
+    def at(self, sheet, cell):
+        """
+        Get the items whose ranges cover a cell ("D14" or a (row, column) tuple).
+        """
+        return [entry[5] for entry in self._search(sheet, get_bounds(cell))]
+
+    def overlapping(self, sheet, cell_range, with_ranges=False):
+        """
+        Get the items whose ranges meet a range, or (item, range) tuples
+        with the ranges in A1 notation if with_ranges is True.
+        """
+        found = self._search(sheet, get_bounds(cell_range))
+        if with_ranges:
+            return [(entry[5], format_bounds(entry[:4])) for entry in found]
+        return [entry[5] for entry in found]
+
+    def containing(self, sheet, cell_range):
+        """
+        Get the items whose ranges contain all of a range.
+        """
+        min_row, min_col, max_row, max_col = get_bounds(cell_range)
+        return [entry[5] for entry in self._search(sheet, (min_row, min_col, max_row, max_col))
+                if entry[0] <= min_row and entry[1] <= min_col and entry[2] >= max_row and entry[3] >= max_col]
+
+    def within(self, sheet, cell_range):
+        """
+        Get the items whose ranges lie inside a range.
+        """
+        min_row, min_col, max_row, max_col = get_bounds(cell_range)
+        return [entry[5] for entry in self._search(sheet, (min_row, min_col, max_row, max_col))
+                if entry[0] >= min_row and entry[1] >= min_col and entry[2] <= max_row and entry[3] <= max_col]
+
+
+def get_range_bounds(cell_range):
+    # the bounds of a CellRange, or None for whole rows and columns,
+    # which the index does not keep
+    min_col, min_row, max_col, max_row = range_boundaries(cell_range.coord)
+    if None in (min_col, min_row, max_col, max_row):
+        return None
+    return min_row, min_col, max_row, max_col
+
+
+def build_name_range_index(wb):
+    """
+    Description
+    -----------
+    Build a spatial index of the defined names of a workbook, with one
+    range for each area of each name. Names scoped to a sheet are given
+    as "Sheet!name", the same as in `read_defined_names`.
+
+    Parameters
+    ----------
+    wb : openpyxl.Workbook
+        The workbook object.
+
+    Returns
+    -------
+    RangeIndex
+        The index, where the items are the names.
+
+    Imports
+    -------
+    openpyxl
+    .name_index
+
+    Examples
+    --------
+    >>> index = build_name_range_index(wb)
+    >>> index.at("Inputs", "D14")
+    ['growth_rate', 'Inputs!print_area']
+    """
+    index = RangeIndex()
+    for scope, defined_name in iter_defined_names(wb):
+        name = defined_name.name if scope is None else f"{scope}!{defined_name.name}"
+        for sheet, cell_range in parse_destinations(defined_name):
+            bounds = get_range_bounds(cell_range)
+            if bounds is not None:
+                index.add(sheet, bounds, name)
+    return index
+
+
+def iter_logged_writes(cosmo_log, name_index=None, start=0):
+    """
+    Description
+    -----------
+    Iterate over the ranges written by the actions of a cosmo log: the
+    ranges of update_range actions, and the ranges of the names of
+    update_named_ranges actions (if a name index is given to find them).
+
+    Parameters
+    ----------
+    cosmo_log : list
+        The actions of the cosmo log.
+    name_index : NameIndex, optional
+        The index of the names of the workbook.
+        Default is None, which leaves out the named ranges.
+    start : int, optional
+        The position of the first action to look at. Default is 0.
+
+    Returns
+    -------
+    generator
+        Yields tuples of the form (sheet, bounds, write), where write is a
+        dictionary of the form {'index': position of the action in the log,
+        'action': str, 'target': the range (as "Sheet!B2:C3") or the name}.
+
+    Examples
+    --------
+    >>> list(iter_logged_writes([{'action': 'update_range',
+    ...                           'writes': [{'sheet': 'Inputs', 'range': 'B2', 'values': [[1]]}]}]))
+    [('Inputs', (2, 2, 2, 2), {'index': 0, 'action': 'update_range', 'target': 'Inputs!B2'})]
+    """
+    for position, action in enumerate(cosmo_log[start:], start):
+        if action['action'] == 'update_range':
+            for write in action['writes']:
+                bounds = get_bounds(write['range'])
+                yield write['sheet'], bounds, {'index': position, 'action': 'update_range',
+                                               'target': f"{write['sheet']}!{write['range']}"}
+        elif action['action'] == 'update_named_ranges' and name_index is not None:
+            for name in action['named_ranges']:
+                try:
+                    destinations = name_index.get(name)
+                except ValueError:
+                    continue
+                for sheet, cell_range in destinations:
+                    bounds = get_range_bounds(cell_range)
+                    if bounds is not None:
+                        yield sheet, bounds, {'index': position, 'action': 'update_named_ranges',
+                                              'target': name}
+
+
+def find_write_conflicts(cosmo_log, name_index=None):
+    """
+    Description
+    -----------
+    Find the writes of a cosmo log (or macro) that write over cells an
+    earlier write of the log wrote, so the earlier value is lost. Each
+    write is only checked against the earlier writes that meet it, found
+    through a spatial index (see `RangeIndex`), instead of against every
+    earlier write.
+
+    Parameters
+    ----------
+    cosmo_log : list
+        The actions of the cosmo log.
+    name_index : NameIndex, optional
+        The index of the names of the workbook, to find the ranges of the
+        names of update_named_ranges actions.
+        Default is None, which leaves out the named ranges.
+
+    Returns
+    -------
+    list
+        The conflicts, as dictionaries of the form
+        {'sheet': str, 'range': the cells written twice,
+         'first': the earlier write, 'second': the later write},
+        where the writes are as given by `iter_logged_writes`.
+
+    Examples
+    --------
+    >>> find_write_conflicts(cosmo_macro['cosmo_log'], get_name_index(wb))
+    [{'sheet': 'Inputs', 'range': 'D14',
+      'first': {'index': 0, 'action': 'update_named_ranges', 'target': 'growth_rate'},
+      'second': {'index': 2, 'action': 'update_range', 'target': 'Inputs!B10:D20'}}]
+    """
+    index = RangeIndex()
+    conflicts = []
+    for sheet, bounds, write in iter_logged_writes(cosmo_log, name_index):
+        for earlier, earlier_range in index.overlapping(sheet, bounds, with_ranges=True):
+            earlier_bounds = get_bounds(earlier_range)
+            overlap = (max(bounds[0], earlier_bounds[0]), max(bounds[1], earlier_bounds[1]),
+                       min(bounds[2], earlier_bounds[2]), min(bounds[3], earlier_bounds[3]))
+            conflicts.append({'sheet': sheet, 'range': format_bounds(overlap),
+                              'first': earlier, 'second': write})
+        index.add(sheet, bounds, write)
+    return conflicts
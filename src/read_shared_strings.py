@@ -0,0 +1,99 @@
+"""
+read_shared_strings.py
+"""
+import xml.etree.ElementTree as ET
+
+from .get_sheet_parts import MAIN_NS, REL_NS, get_relationships, get_workbook_part
+
+
+# the relationship type of the shared strings part of a workbook
+SHARED_STRINGS_TYPE = REL_NS + "/sharedStrings"
+
+
+def get_shared_strings_part(zf):
+    """
+    Description
+    -----------
+    Get the name of the shared strings part of the workbook package,
+    which is usually "xl/sharedStrings.xml".
+
+    Parameters
+    ----------
+    zf : zipfile.ZipFile or MappedZip
+        The workbook package.
+
+    Returns
+    -------
+    str or None
+        The name of the shared strings part,
+        or None if the workbook has no shared strings.
+
+    Imports
+    -------
+    .get_sheet_parts
+
+    Examples
+    --------
+    >>> get_shared_strings_part(zf)
+    'xl/sharedStrings.xml'
+    """
+    for rel_type, target in get_relationships(zf, get_workbook_part(zf)).values():
+        if rel_type == SHARED_STRINGS_TYPE and target in zf.NameToInfo:
+            return target
+    return None
+
+
+def read_shared_strings(zf):
+    """
+    Description
+    -----------
+    Read the shared strings of a workbook package, in order, without
+    loading the workbook. Rich text strings are joined into plain text,
+    and phonetic hints are left out (the same text openpyxl gives).
+
+    Parameters
+    ----------
+    zf : zipfile.ZipFile or MappedZip
+        The workbook package.
+
+    Returns
+    -------
+    list
+        The shared strings, where the index of each string is the
+        index the cells of the sheets refer to.
+        Empty if the workbook has no shared strings.
+
+    Imports
+    -------
+    xml.etree.ElementTree
+    .get_sheet_parts
+
+    Examples
+    --------
+    >>> read_shared_strings(zf)[:3]
+    ['Policy', 'Premium', 'Loss']
+    """
+    part = get_shared_strings_part(zf)
+    if part is None:
+        return []
+
+    si_tag = f"{{{MAIN_NS}}}si"
+    t_tag = f"{{{MAIN_NS}}}t"
+    r_tag = f"{{{MAIN_NS}}}r"
+
+    # parse the strings one at a time, clearing each one once it is read
+    strings = []
+    with zf.open(part) as fh:
+        for _, element in ET.iterparse(fh, events=("end",)):
+            if element.tag != si_tag:
+                continue
+            # the text is either in a t element or in the runs of rich text
+            text = []
+            for child in element:
+                if child.tag == t_tag:
+                    text.append(child.text or "")
+                elif child.tag == r_tag:
+                    text.extend(t.text or "" for t in child.iter(t_tag))
+            strings.append("".join(text))
+            element.clear()
+    return strings
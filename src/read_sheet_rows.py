@@ -0,0 +1,216 @@
+"""
+read_sheet_rows.py
+"""
+import html
+import re
+
+from openpyxl.utils.datetime import WINDOWS_EPOCH
+
+from .column_index_from_string import column_index_from_string
+
+
+# the rows of the sheet data, and the parts of a row and its cells
+ROW_START_PATTERN = re.compile(rb"<((?:\w+:)?)row[\s>/]")
+ROW_NUMBER_PATTERN = re.compile(rb'\sr="(\d+)"')
+CELL_PATTERN = re.compile(rb"<(?:\w+:)?c\b([^>]*?)(?:/>|>(.*?)</(?:\w+:)?c>)", re.S)
+ATTRIBUTE_PATTERN = re.compile(rb'([\w:]+)="([^"]*)"')
+VALUE_PATTERN = re.compile(rb"<(?:\w+:)?v>(.*?)</(?:\w+:)?v>", re.S)
+FORMULA_PATTERN = re.compile(rb"<(?:\w+:)?f\b([^>]*?)(?:/>|>(.*?)</(?:\w+:)?f>)", re.S)
+TEXT_PATTERN = re.compile(rb"<(?:\w+:)?t\b[^>]*?(?:/>|>(.*?)</(?:\w+:)?t>)", re.S)
+PHONETIC_PATTERN = re.compile(rb"<(?:\w+:)?rPh\b.*?</(?:\w+:)?rPh>", re.S)
+
+
+class ErrorValue(str):
+    """
+    Description
+    -----------
+    The value of a cell that holds an Excel error, e.g. "#N/A" or "#DIV/0!".
+    Compares equal to the text of the error, but can be told apart from
+    a cell that holds the same text as a string.
+
+    Examples
+    --------
+    >>> value = ErrorValue("#N/A")
+    >>> value == "#N/A", isinstance(value, ErrorValue)
+    (True, True)
+    """
+    __slots__ = ()
+
+    def __repr__(self):
+        return f"ErrorValue({str(self)!r})"
+
+
+def iter_sheet_rows(zf, part, chunk_size=1 << 20):
+    """
+    Description
+    -----------
+    Iterate over the rows of a worksheet part as raw xml, a chunk of the
+    part at a time, without parsing the rows or keeping the sheet in memory.
+
+    Parameters
+    ----------
+    zf : zipfile.ZipFile or MappedZip
+        The workbook package.
+    part : str
+        The name of the worksheet part.
+    chunk_size : int, optional
+        The number of bytes to read at a time.
+        Default is 1 MB.
+
+    Returns
+    -------
+    generator
+        Yields tuples of the form (row number, row xml as bytes).
+
+    Imports
+    -------
+    re
+
+    Examples
+    --------
+    >>> next(iter_sheet_rows(zf, "xl/worksheets/sheet1.xml"))
+    (1, b'<row r="1"><c r="A1" t="s"><v>0</v></c></row>')
+    """
+    buffer = b""
+    row_number = 0
+    start_tag = end_tag = None
+    with zf.open(part) as fh:
+        while True:
+            chunk = fh.read(chunk_size)
+            buffer += chunk
+
+            # get the tags of the rows, with the namespace prefix they use
+            if start_tag is None:
+                match = ROW_START_PATTERN.search(buffer)
+                if match is None:
+                    if not chunk:
+                        return
+                    continue
+                start_tag = b"<" + match.group(1) + b"row"
+                end_tag = b"</" + match.group(1) + b"row>"
+                empty_row_pattern = re.compile(re.escape(start_tag) + rb"\b[^>]*/>")
+
+            # split the buffer after each complete row, and keep the rest
+            # for the next chunk (splitting on the end tag is much faster
+            # than finding each row with a regular expression)
+            pieces = buffer.split(end_tag)
+            buffer = pieces.pop()
+            if not chunk:
+                # the rest can only hold rows without cells
+                pieces.append(buffer)
+            for index, piece in enumerate(pieces):
+                # a row is the last start tag of its piece,
+                # and any start tags before it are rows without cells
+                start = piece.rfind(start_tag) if index < len(pieces) - 1 or chunk else -1
+                rows = [piece[start:] + end_tag] if start >= 0 else []
+                if start != piece.find(start_tag):
+                    rows[:0] = empty_row_pattern.findall(piece, 0, start if start >= 0 else len(piece))
+                for row in rows:
+                    # rows without a row number follow the row before them
+                    number = ROW_NUMBER_PATTERN.search(row, 0, row.find(b">"))
+                    row_number = int(number.group(1)) if number else row_number + 1
+                    yield row_number, row
+
+            if not chunk:
+                return
+
+
+def iter_row_cells(row, shared_strings, date_styles=None, epoch=WINDOWS_EPOCH):
+    """
+    Description
+    -----------
+    Iterate over the cells of a row of a worksheet part, parsing their
+    values and formulas and resolving shared strings. When the cell
+    formats of the workbook are given, numbers in cells with a date
+    format are read as dates, times or timedeltas, as openpyxl reads them.
+
+    Parameters
+    ----------
+    row : bytes
+        The xml of the row, as given by `iter_sheet_rows`.
+    shared_strings : list
+        The shared strings of the workbook.
+    date_styles : DateStyles, optional
+        The cell formats of the workbook (see `read_date_styles`).
+        Default is None, which gives the serial numbers of dates as they are.
+    epoch : datetime.datetime, optional
+        The date system of the workbook, as given by `get_workbook_epoch`.
+        Default is openpyxl.utils.datetime.WINDOWS_EPOCH.
+
+    Returns
+    -------
+    generator
+        Yields tuples of the form
+        (row number, column number, value, formula, formula attributes).
+        Error values are given as ErrorValue. The formula is the text of the
+        formula without the leading "=", "" for cells that share the formula
+        of another cell, or None for cells without one. The formula
+        attributes are a dictionary of the attributes of the formula
+        element (e.g. {'t': 'shared', 'si': '0'}), or None.
+        Cells with neither a value nor a formula (that only hold a style)
+        are skipped.
+
+    Imports
+    -------
+    html
+    re
+    openpyxl.utils.datetime
+    .column_index_from_string
+
+    Examples
+    --------
+    >>> list(iter_row_cells(b'<row r="2"><c r="A2"><v>1.5</v></c>'
+    ...                     b'<c r="B2"><f>A2*2</f><v>3</v></c></row>', []))
+    [(2, 1, 1.5, None, None), (2, 2, 3, 'A2*2', {})]
+    """
+    row_number = ROW_NUMBER_PATTERN.search(row, 0, row.find(b">"))
+    row_number = int(row_number.group(1)) if row_number else 0
+    column = 0
+    for match in CELL_PATTERN.finditer(row):
+        attributes = dict(ATTRIBUTE_PATTERN.findall(match.group(1)))
+        content = match.group(2) or b""
+
+        # cells without a reference follow the cell before them
+        if b"r" in attributes:
+            ref = attributes[b"r"].decode("ascii")
+            column = column_index_from_string(ref.rstrip("0123456789"))
+        else:
+            column += 1
+
+        # get the formula of the cell
+        formula = formula_attributes = None
+        formula_match = FORMULA_PATTERN.search(content)
+        if formula_match is not None:
+            text = formula_match.group(2)
+            formula = html.unescape(text.decode("utf-8")) if text else ""
+            formula_attributes = {name.decode("ascii"): html.unescape(value.decode("utf-8"))
+                                  for name, value in ATTRIBUTE_PATTERN.findall(formula_match.group(1))}
+
+        # get the value of the cell according to its type
+        cell_type = attributes.get(b"t", b"n")
+        if cell_type == b"inlineStr":
+            text = PHONETIC_PATTERN.sub(b"", content)
+            value = html.unescape(b"".join(t or b"" for t in TEXT_PATTERN.findall(text)).decode("utf-8"))
+        else:
+            value_match = VALUE_PATTERN.search(content)
+            value = None
+            if value_match is not None:
+                text = html.unescape(value_match.group(1).decode("utf-8"))
+                if cell_type == b"s":
+                    value = shared_strings[int(text)]
+                elif cell_type == b"b":
+                    value = text == "1"
+                elif cell_type == b"e":
+                    value = ErrorValue(text)
+                elif cell_type in (b"str", b"d"):
+                    value = text
+                else:
+                    try:
+                        value = int(text)
+                    except ValueError:
+                        value = float(text)
+                    if date_styles is not None and b"s" in attributes:
+                        value = date_styles.decode(value, attributes[b"s"].decode("ascii"), epoch)
+
+        if value is not None or formula is not None:
+            yield row_number, column, value, formula, formula_attributes
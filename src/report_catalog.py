@@ -0,0 +1,443 @@
+"""
+report_catalog.py
+"""
+import datetime
+import os
+import re
+import sqlite3
+
+from .get_prior_quarter_year import get_prior_quarter_year
+
+
+# the file extensions of the workbooks to catalog
+WORKBOOK_EXTENSIONS = (".xlsx", ".xlsm", ".xlsb", ".xltx", ".xls")
+
+# a quarter and year, written the ways `get_quarter_year` reads them,
+# quarter first ("2Q2024") and then year first ("2024Q2")
+QUARTER_FIRST_PATTERN = re.compile(r"(?<!\d)([1-4])Q(\d{4})(?!\d)", re.IGNORECASE)
+YEAR_FIRST_PATTERN = re.compile(r"(?<!\d)(\d{4})Q([1-4])(?!\d)", re.IGNORECASE)
+
+# what the quarter and year are replaced with in the family of a report
+FAMILY_QUARTER = "{q}"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS directories (
+    path TEXT PRIMARY KEY,
+    parent TEXT,
+    mtime_ns INTEGER NOT NULL,
+    scanned_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS directories_parent ON directories (parent);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    directory TEXT NOT NULL,
+    name TEXT NOT NULL,
+    family TEXT NOT NULL,
+    quarter INTEGER,
+    year INTEGER,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_directory ON files (directory);
+CREATE INDEX IF NOT EXISTS files_period ON files (year, quarter);
+CREATE INDEX IF NOT EXISTS files_family ON files (family, year, quarter, mtime_ns);
+"""
+
+
+def get_report_quarter_year(file_path):
+    """
+    Description
+    -----------
+    Get the quarter and year of a report from its file path, the same
+    way as `get_quarter_year`, but looking at the file name before the
+    directories, and giving None instead of an error if there is none.
+
+    Parameters
+    ----------
+    file_path : str
+        The file path.
+
+    Returns
+    -------
+    tuple
+        Tuple of the form (quarter, year), or (None, None).
+
+    Imports
+    -------
+    os
+    re
+
+    Examples
+    --------
+    >>> get_report_quarter_year("/share/2Q2024 Analysis/summary 2024q3.xlsx")
+    (3, 2024)
+    >>> get_report_quarter_year("/share/templates/summary.xlsx")
+    (None, None)
+    """
+    for text in (os.path.basename(file_path), file_path):
+        match = QUARTER_FIRST_PATTERN.search(text)
+        if match is not None:
+            return int(match.group(1)), int(match.group(2))
+        match = YEAR_FIRST_PATTERN.search(text)
+        if match is not None:
+            return int(match.group(2)), int(match.group(1))
+    return None, None
+
+
+def get_report_family(file_path):
+    """
+    Description
+    -----------
+    Get the family of a report: its file path without the extension,
+    in lower case, with every quarter and year replaced by "{q}", so the
+    versions of a report for different quarters have the same family.
+
+    Parameters
+    ----------
+    file_path : str
+        The file path.
+
+    Returns
+    -------
+    str
+        The family of the report.
+
+    Imports
+    -------
+    os
+    re
+
+    Examples
+    --------
+    >>> get_report_family("/share/2Q2024 Analysis/Summary 2Q2024.xlsx")
+    '/share/{q} analysis/summary {q}'
+    >>> get_report_family("/share/3Q2024 Analysis/Summary 3Q2024.xlsx")
+    '/share/{q} analysis/summary {q}'
+    """
+    family = os.path.splitext(os.path.normcase(os.path.abspath(file_path)))[0].lower()
+    family = QUARTER_FIRST_PATTERN.sub(FAMILY_QUARTER, family)
+    return YEAR_FIRST_PATTERN.sub(FAMILY_QUARTER, family)
+
+
+class ReportCatalog:
+    """
+    Description
+    -----------
+    An index of the workbook files under one or more directories, by
+    quarter and year, report family and modification time, kept in a
+    local SQLite file so it can be queried without walking the share.
+
+    The catalog is updated with `scan`. Each directory's modification
+    time is kept, and only the directories that changed since the last
+    scan (files or directories added, removed or renamed) are listed
+    again; every other directory costs one stat. A file saved in place
+    does not change its directory, so its size and mtime are only
+    refreshed when its directory changes, or with `scan(full=True)`.
+
+    Parameters
+    ----------
+    catalog_path : str
+        The file path of the SQLite file. It is made if it does not exist.
+
+    Methods
+    -------
+    scan
+        Update the catalog from a directory, listing only the directories that changed.
+    find
+        Find the reports of a quarter, a family or a directory.
+    latest
+        Get the newest report of a family, for a quarter or for any quarter.
+    prior
+        Get the newest report of the same family for the quarter before a report.
+    families
+        Get the report families, with how many files each has.
+    close
+        Close the SQLite connection.
+
+    Examples
+    --------
+    >>> with ReportCatalog("reports.sqlite") as catalog:
+    ...     catalog.scan("/share/finance")
+    ...     catalog.prior("/share/finance/3Q2024/Summary 3Q2024.xlsx")
+    {'path': '/share/finance/2Q2024/Summary 2Q2024.xlsx', 'quarter': 2, 'year': 2024, ...}
+    """
+    def __init__(self, catalog_path):
+        self.catalog_path = catalog_path
+        self.connection = sqlite3.connect(catalog_path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        Close the SQLite connection.
+        """
+        self.connection.close()
+
+    def _scan_directory(self, directory, mtime_ns, now):
+        # list a directory, replacing its files and subdirectories
+        files = []
+        subdirectories = {}
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirectories[entry.path] = entry.stat(follow_symlinks=False).st_mtime_ns
+                    elif (entry.name.lower().endswith(WORKBOOK_EXTENSIONS)
+                          and not entry.name.startswith("~$") and entry.is_file()):
+                        stat = entry.stat()
+                        quarter, year = get_report_quarter_year(entry.path)
+                        files.append((entry.path, directory, entry.name, get_report_family(entry.path),
+                                      quarter, year, stat.st_size, stat.st_mtime_ns))
+                except OSError:
+                    # the entry went away while the directory was listed
+                    continue
+
+        self.connection.execute("DELETE FROM files WHERE directory = ?", (directory,))
+        self.connection.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?)", files)
+        self.connection.execute("INSERT OR REPLACE INTO directories VALUES (?, ?, ?, ?)",
+                                (directory, os.path.dirname(directory), mtime_ns, now))
+
+        # forget the subdirectories that are gone
+        gone = [row[0] for row in self.connection.execute(
+            "SELECT path FROM directories WHERE parent = ?", (directory,)) if row[0] not in subdirectories]
+        for subdirectory in gone:
+            self._forget(subdirectory)
+        return subdirectories, len(files), len(gone)
+
+    def _forget(self, directory):
+        # remove a directory and everything under it from the catalog
+        prefix = os.path.join(directory, "")
+        for table, column in (("files", "directory"), ("directories", "path")):
+            self.connection.execute(
+                f"DELETE FROM {table} WHERE {column} = ? OR substr({column}, 1, ?) = ?",
+                (directory, len(prefix), prefix))
+
+    def scan(self, root, full=False):
+        """
+        Description
+        -----------
+        Update the catalog from a directory and everything under it.
+        Directories whose modification time has not changed since the last
+        scan are not listed again; their subdirectories are still checked,
+        one stat each.
+
+        Parameters
+        ----------
+        root : str
+            The directory to scan.
+        full : bool, optional
+            Whether to list every directory, to refresh the size and
+            modification time of files saved in place.
+            Default is False.
+
+        Returns
+        -------
+        dict
+            Dictionary of the form
+            {'directories': int, 'scanned': int, 'files': int, 'removed': int},
+            with the number of directories checked, the number listed again,
+            the number of files in the directories listed again, and the
+            number of directories that were removed.
+
+        Raises
+        ------
+        ValueError
+            If the root is not a directory.
+
+        Imports
+        -------
+        datetime
+        os
+        sqlite3
+
+        Examples
+        --------
+        >>> catalog.scan("/share/finance")
+        {'directories': 8214, 'scanned': 3, 'files': 41, 'removed': 0}
+        """
+        root = os.path.normcase(os.path.abspath(root))
+        if not os.path.isdir(root):
+            raise ValueError(f"The root {root} is not a directory.")
+
+        known = {row["path"]: row["mtime_ns"] for row in self.connection.execute(
+            "SELECT path, mtime_ns FROM directories WHERE path = ? OR substr(path, 1, ?) = ?",
+            (root, len(os.path.join(root, "")), os.path.join(root, "")))}
+        now = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        counts = {'directories': 0, 'scanned': 0, 'files': 0, 'removed': 0}
+
+        with self.connection:
+            stack = [(root, os.stat(root).st_mtime_ns)]
+            while stack:
+                directory, mtime_ns = stack.pop()
+                counts['directories'] += 1
+
+                # a directory that did not change keeps its files,
+                # and its subdirectories are checked from the catalog
+                if not full and known.get(directory) == mtime_ns:
+                    for (subdirectory,) in self.connection.execute(
+                            "SELECT path FROM directories WHERE parent = ?", (directory,)).fetchall():
+                        try:
+                            stack.append((subdirectory, os.stat(subdirectory).st_mtime_ns))
+                        except OSError:
+                            self._forget(subdirectory)
+                            counts['removed'] += 1
+                    continue
+
+                try:
+                    subdirectories, files, removed = self._scan_directory(directory, mtime_ns, now)
+                except OSError:
+                    # the directory went away, or cannot be read
+                    self._forget(directory)
+                    counts['removed'] += 1
+                    continue
+                counts['scanned'] += 1
+                counts['files'] += files
+                counts['removed'] += removed
+                stack.extend(subdirectories.items())
+
+        return counts
+
+    def find(self, quarter=None, year=None, family=None, directory=None):
+        """
+        Description
+        -----------
+        Find the reports of a quarter, a year, a family or a directory
+        (and the directories under it). Only the filters given are used.
+
+        Parameters
+        ----------
+        quarter : int, optional
+            The quarter.
+        year : int, optional
+            The year.
+        family : str, optional
+            The family of the reports (see `get_report_family`), or the
+            file path of one of them.
+        directory : str, optional
+            The directory the reports are under.
+
+        Returns
+        -------
+        list
+            The reports, as dictionaries with the keys path, directory,
+            name, family, quarter, year, size and modified, newest first.
+
+        Examples
+        --------
+        >>> [report['name'] for report in catalog.find(quarter=3, year=2023)]
+        ['Summary 3Q2023.xlsx', 'Detail 3Q2023.xlsb']
+        """
+        conditions, parameters = [], []
+        if quarter is not None:
+            conditions.append("quarter = ?")
+            parameters.append(quarter)
+        if year is not None:
+            conditions.append("year = ?")
+            parameters.append(year)
+        if family is not None:
+            conditions.append("family = ?")
+            parameters.append(family if FAMILY_QUARTER in family else get_report_family(family))
+        if directory is not None:
+            directory = os.path.normcase(os.path.abspath(directory))
+            prefix = os.path.join(directory, "")
+            conditions.append("(directory = ? OR substr(directory, 1, ?) = ?)")
+            parameters.extend([directory, len(prefix), prefix])
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = self.connection.execute(
+            f"SELECT * FROM files {where} ORDER BY mtime_ns DESC, path", parameters)
+        return [self._report(row) for row in rows]
+
+    def latest(self, family, quarter=None, year=None):
+        """
+        Description
+        -----------
+        Get the newest report of a family, for a quarter and year,
+        or for the latest quarter the family has if none is given.
+
+        Parameters
+        ----------
+        family : str
+            The family of the report (see `get_report_family`),
+            or the file path of one of its reports.
+        quarter : int, optional
+            The quarter.
+        year : int, optional
+            The year.
+
+        Returns
+        -------
+        dict or None
+            The report, as given by `find`, or None if there is none.
+
+        Examples
+        --------
+        >>> catalog.latest("/share/finance/Summary 3Q2024.xlsx")['name']
+        'Summary 4Q2024.xlsx'
+        """
+        family = family if FAMILY_QUARTER in family else get_report_family(family)
+        if quarter is None or year is None:
+            row = self.connection.execute(
+                "SELECT * FROM files WHERE family = ? AND year IS NOT NULL "
+                "ORDER BY year DESC, quarter DESC, mtime_ns DESC LIMIT 1", (family,)).fetchone()
+        else:
+            row = self.connection.execute(
+                "SELECT * FROM files WHERE family = ? AND year = ? AND quarter = ? "
+                "ORDER BY mtime_ns DESC LIMIT 1", (family, year, quarter)).fetchone()
+        return None if row is None else self._report(row)
+
+    def prior(self, file_path):
+        """
+        Description
+        -----------
+        Get the newest report of the same family as a report,
+        for the quarter before the quarter of the report.
+
+        Parameters
+        ----------
+        file_path : str
+            The file path of the report. It does not need to exist,
+            or to be in the catalog.
+
+        Returns
+        -------
+        dict or None
+            The report, as given by `find`, or None if there is none.
+
+        Raises
+        ------
+        ValueError
+            If the file path has no quarter and year.
+
+        Imports
+        -------
+        .get_prior_quarter_year
+
+        Examples
+        --------
+        >>> catalog.prior("/share/finance/3Q2024/Summary 3Q2024.xlsx")['path']
+        '/share/finance/2Q2024/Summary 2Q2024.xlsx'
+        """
+        quarter, year = get_report_quarter_year(file_path)
+        if quarter is None:
+            raise ValueError(f"The file path {file_path} does not have a quarter and year.")
+        prior_year, prior_quarter = get_prior_quarter_year(year, quarter)
+        return self.latest(get_report_family(file_path), quarter=prior_quarter, year=prior_year)
+
+    def families(self):
+        """
+        Get the report families, with how many files each has.
+        """
+        return {row[0]: row[1] for row in self.connection.execute(
+            "SELECT family, count(*) FROM files GROUP BY family ORDER BY family")}
+
+    @staticmethod
+    def _report(row):
+        report = {key: row[key] for key in ("path", "directory", "name", "family", "quarter", "year", "size")}
+        report["modified"] = datetime.datetime.fromtimestamp(row["mtime_ns"] / 1e9).strftime('%Y-%m-%d %H:%M:%S')
+        return report
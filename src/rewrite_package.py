@@ -0,0 +1,218 @@
+"""
+rewrite_package.py
+"""
+import contextlib
+import os
+import re
+import tempfile
+import zipfile
+
+from .copy_zip_member import copy_zip_member
+from .get_sheet_parts import get_rels_part, resolve_part_target
+from .mapped_zip import get_mapped_zip
+
+
+def remove_part_references(zf, drop_parts):
+    """
+    Description
+    -----------
+    Build new versions of the content types part and of the relationship
+    parts of a workbook package, with every reference to the dropped
+    parts removed.
+
+    Parameters
+    ----------
+    zf : zipfile.ZipFile or MappedZip
+        The workbook package.
+    drop_parts : set
+        The names of the parts that are dropped, e.g. {"xl/calcChain.xml"}.
+
+    Returns
+    -------
+    dict
+        Dictionary where the keys are the names of the parts that changed
+        and the values are their new contents as bytes.
+
+    Imports
+    -------
+    re
+
+    Examples
+    --------
+    >>> remove_part_references(zf, {"xl/calcChain.xml"})
+    {'[Content_Types].xml': b'...', 'xl/_rels/workbook.xml.rels': b'...'}
+    """
+    new_parts = {}
+
+    # remove the content type overrides of the dropped parts
+    content_types = zf.read("[Content_Types].xml").decode("utf-8")
+    new_content_types = re.sub(
+        r'<Override\b[^>]*PartName="/?([^"]+)"[^>]*/>',
+        lambda match: "" if match.group(1) in drop_parts else match.group(0),
+        content_types)
+    if new_content_types != content_types:
+        new_parts["[Content_Types].xml"] = new_content_types.encode("utf-8")
+
+    # remove the relationships that point to the dropped parts
+    for name in zf.namelist():
+        if not name.endswith(".rels") or name in drop_parts:
+            continue
+
+        # get the part the relationships belong to
+        # e.g. "xl/_rels/workbook.xml.rels" belongs to "xl/workbook.xml"
+        directory, file_name = name.rsplit("/", 1) if "/" in name else ("", name)
+        source_part = (directory[:-len("_rels")] + file_name[:-len(".rels")]).lstrip("/")
+
+        rels = zf.read(name).decode("utf-8")
+
+        def keep(match, source_part=source_part):
+            target = re.search(r'Target="([^"]+)"', match.group(0))
+            if target is None or 'TargetMode="External"' in match.group(0):
+                return match.group(0)
+            return "" if resolve_part_target(source_part, target.group(1)) in drop_parts \
+                else match.group(0)
+
+        new_rels = re.sub(r"<Relationship\b[^>]*/>", keep, rels)
+        if new_rels != rels:
+            new_parts[name] = new_rels.encode("utf-8")
+
+    return new_parts
+
+
+def rewrite_package(file_path, new_file_path=None, replace_parts=None, drop_parts=None,
+                    compression=zipfile.ZIP_DEFLATED, copy_parts=None, write_last=None):
+    """
+    Description
+    -----------
+    Write a new version of a workbook package where only some parts
+    are regenerated. Every part that is not replaced or dropped is copied
+    as it is (without decompressing it), so the cost of the rewrite scales
+    with the size of the parts that change, not the size of the workbook.
+    The workbook is read through its memory mapping (see `get_mapped_zip`).
+
+    The new package is written to a temporary file next to the target
+    and then moved into place, so the workbook can be rewritten in place.
+
+    Parameters
+    ----------
+    file_path : str
+        The file path of the workbook package to rewrite.
+    new_file_path : str, optional
+        The file path to write the new package to.
+        Default is None, which rewrites the workbook in place.
+    replace_parts : dict, optional
+        Dictionary where the keys are the names of the parts to replace
+        (or add) and the values are either the new contents as bytes,
+        or a function that takes a writable binary file object and writes
+        the new contents to it (so large parts can be streamed).
+    drop_parts : set, optional
+        The names of the parts to drop. Their content type overrides
+        and the relationships that point to them are removed too.
+    compression : int, optional
+        The compression used for the replaced parts.
+        Default is zipfile.ZIP_DEFLATED.
+    copy_parts : dict, optional
+        Dictionary where the keys are the names of parts to replace (or add)
+        with parts of another workbook package, and the values are tuples
+        of the form (file path of the other package, name of the part in it).
+        These are copied without decompressing them, like unchanged parts.
+    write_last : iterable, optional
+        The names of replaced parts to write after every other part, for
+        parts whose contents are only known once the other parts are
+        written (e.g. the cell formats that the rewritten sheets add).
+        Default is None.
+
+    Returns
+    -------
+    str
+        The file path of the new package.
+
+    Imports
+    -------
+    contextlib
+    os
+    tempfile
+    zipfile
+    .copy_zip_member
+    .mapped_zip
+
+    Examples
+    --------
+    >>> rewrite_package("test.xlsx", "test_new.xlsx",
+    ...     replace_parts={"xl/worksheets/sheet1.xml": new_sheet_xml},
+    ...     drop_parts={"xl/calcChain.xml"})
+    'test_new.xlsx'
+    """
+    # if no new file path is given, rewrite the workbook in place
+    if new_file_path is None:
+        new_file_path = file_path
+
+    replace_parts = dict(replace_parts or {})
+    drop_parts = set(drop_parts or ())
+    copy_parts = dict(copy_parts or {})
+    last_parts = {name: replace_parts.pop(name) for name in (write_last or ()) if name in replace_parts}
+
+    # write to a temporary file in the same directory,
+    # so it can be moved into place when it is complete
+    directory = os.path.dirname(os.path.abspath(new_file_path))
+    fd, temp_path = tempfile.mkstemp(suffix=".tmp", dir=directory)
+    os.close(fd)
+
+    try:
+        with contextlib.ExitStack() as stack:
+            source_zip = stack.enter_context(get_mapped_zip(file_path))
+            target_zip = stack.enter_context(
+                zipfile.ZipFile(temp_path, "w", compression=compression, allowZip64=True))
+
+            # drop the relationship parts of the dropped parts as well,
+            # and remove every reference to the dropped parts
+            if drop_parts:
+                drop_parts |= {get_rels_part(part) for part in drop_parts}
+                for name, content in remove_part_references(source_zip, drop_parts).items():
+                    replace_parts.setdefault(name, content)
+
+            # the other packages that parts are copied from
+            other_zips = {other_path: stack.enter_context(get_mapped_zip(other_path))
+                          for other_path, _ in copy_parts.values()}
+
+            def write_part(name, content):
+                # write a replaced part, either from bytes, by streaming,
+                # or by copying it from another package
+                if name in copy_parts:
+                    other_path, other_name = copy_parts.pop(name)
+                    other_zip = other_zips[other_path]
+                    copy_zip_member(other_zip, target_zip, other_zip.getinfo(other_name), name=name)
+                elif callable(content):
+                    with target_zip.open(name, "w", force_zip64=True) as dst:
+                        content(dst)
+                else:
+                    target_zip.writestr(name, content)
+
+            # copy or replace the parts in their original order
+            for info in source_zip.infolist():
+                if info.filename in drop_parts or info.filename in last_parts:
+                    continue
+                if info.filename in replace_parts or info.filename in copy_parts:
+                    write_part(info.filename, replace_parts.pop(info.filename, None))
+                else:
+                    copy_zip_member(source_zip, target_zip, info)
+
+            # add the new parts that were not in the original package
+            for name, content in replace_parts.items():
+                write_part(name, content)
+            for name in list(copy_parts):
+                write_part(name, None)
+
+            # write the parts that depend on the parts written before them
+            for name, content in last_parts.items():
+                write_part(name, content)
+
+        # move the new package into place
+        os.replace(temp_path, new_file_path)
+    except BaseException:
+        # remove the partial file if anything went wrong
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    return new_file_path
@@ -0,0 +1,49 @@
+"""
+roll_quarter_text.py
+"""
+import re
+
+
+def roll_quarter_text(text, year, quarter, new_year, new_quarter):
+    """
+    Description
+    -----------
+    Replace a quarter and year written in a piece of text (like a file
+    path or a link) with another quarter and year, written the same way.
+    Both of the ways `get_quarter_year` reads are rolled: the quarter
+    first ("2Q2024") and the year first ("2024Q2"), with the "Q" in the
+    same case as it was. Other quarters and years are left alone.
+
+    Parameters
+    ----------
+    text : str
+        The text, e.g. "C:\\Reports\\2Q2024\\summary 2Q2024.xlsx".
+    year : int
+        The year to replace.
+    quarter : int
+        The quarter to replace.
+    new_year : int
+        The year to replace it with.
+    new_quarter : int
+        The quarter to replace it with.
+
+    Returns
+    -------
+    str
+        The text with the quarter and year replaced.
+
+    Imports
+    -------
+    re
+
+    Examples
+    --------
+    >>> roll_quarter_text("C:\\Reports\\2Q2024\\data 2024q2.xlsx", 2024, 2, 2024, 3)
+    'C:\\Reports\\3Q2024\\data 2024q3.xlsx'
+    """
+    # the quarter and year are not part of a longer number
+    quarter_first = re.compile(rf"(?<!\d){quarter}([Qq]){year}(?!\d)")
+    year_first = re.compile(rf"(?<!\d){year}([Qq]){quarter}(?!\d)")
+
+    text = quarter_first.sub(lambda match: f"{new_quarter}{match.group(1)}{new_year}", text)
+    return year_first.sub(lambda match: f"{new_year}{match.group(1)}{new_quarter}", text)
@@ -0,0 +1,68 @@
+"""
+save_cosmo_macro.py
+"""
+import json
+
+from .macro_msgpack import MACRO_FORMATS, MacroBlock, save_cosmo_macro_msgpack
+
+
+def _json_value(value):
+    # the json form of the values json does not write itself
+    if isinstance(value, MacroBlock):
+        return value.to_list()
+    return str(value)
+
+
+def save_cosmo_macro(cosmo_macro, file_path, file_format="json"):
+    """
+    Description
+    -----------
+    Save a cosmo macro to a file, usually with the file extension
+    .cosmomacro, so it can be run again on another workbook.
+
+    Parameters
+    ----------
+    cosmo_macro : dict
+        The cosmo macro, of the form {'cosmo_log': [actions]}.
+    file_path : str
+        The file path to save the cosmo macro to.
+    file_format : str, optional
+        The file format: "json", which is easy to read and diff, or
+        "msgpack", which keeps the large blocks of values of the writes in
+        sidecar arrays (see `save_cosmo_macro_msgpack`), so the size and
+        load time of the macro file do not grow with the values.
+        Default is "json".
+
+    Returns
+    -------
+    str
+        The file path of the saved cosmo macro.
+
+    Raises
+    ------
+    ValueError
+        If the file format is not "json" or "msgpack".
+
+    Notes
+    -----
+    Values that json cannot hold (like dates) are saved as strings
+    in json macros.
+
+    Imports
+    -------
+    json
+    .macro_msgpack
+
+    Examples
+    --------
+    >>> save_cosmo_macro(cosmo.cosmo_macro, "roll_forward.cosmomacro")
+    'roll_forward.cosmomacro'
+    """
+    if file_format not in MACRO_FORMATS:
+        raise ValueError(f"The file format {file_format} is not one of {list(MACRO_FORMATS)}.")
+    if file_format == "msgpack":
+        return save_cosmo_macro_msgpack(cosmo_macro, file_path)
+
+    with open(file_path, "w", encoding="utf-8") as fh:
+        json.dump(cosmo_macro, fh, indent=4, default=_json_value)
+    return file_path
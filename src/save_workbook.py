@@ -5,10 +5,15 @@ save_workbook.py
 # pylance does not recognize the imports
 # pylint: disable=E0401
 # pylint: disable=E0611
-import pyxlsb
 import openpyxl
 import datetime
-from .is_xlsb import is_xlsb
+import os
+import tempfile
+import zipfile
+from openpyxl.writer.excel import ExcelWriter
+from .compress_package import compress_package, get_compression_level
+from .load_sheet_subset import get_unloaded_sheets
+from .splice_unloaded_sheets import splice_unloaded_sheets
 
 # function that takes wb object as input and saves the workbook
 # starts with extremely detailed docstring
@@ -26,7 +31,104 @@ from .is_xlsb import is_xlsb
 # if it is, then it saves the workbook
 # if it is not, then it raises an error
 # either way, prints a message to the console with the file path of the saved workbook
-def save_workbook(wb, is_copy=True, new_filename=None):
+def save_workbook_stored(wb, file_path):
+    """
+    Description
+    -----------
+    Save an openpyxl workbook without compressing its parts, the way
+    openpyxl saves it otherwise, so they can be compressed afterwards
+    (see `compress_package`).
+
+    Parameters
+    ----------
+    wb : openpyxl.Workbook
+        The workbook to save.
+    file_path : str
+        The file path to save the workbook to.
+
+    Returns
+    -------
+    str
+        The file path of the saved workbook.
+
+    Imports
+    -------
+    datetime
+    openpyxl
+    zipfile
+
+    Examples
+    --------
+    >>> save_workbook_stored(wb, "report_stored.xlsx")
+    'report_stored.xlsx'
+    """
+    # the same as openpyxl.writer.excel.save_workbook, without compression
+    with zipfile.ZipFile(file_path, "w", zipfile.ZIP_STORED, allowZip64=True) as archive:
+        wb.properties.modified = datetime.datetime.now(tz=datetime.timezone.utc).replace(tzinfo=None)
+        ExcelWriter(wb, archive).save()
+    return file_path
+
+
+def get_save_path(file_path, is_copy=True, new_filename=None):
+    """
+    Description
+    -----------
+    Get the file path to save a workbook to (see `save_workbook`).
+
+    Parameters
+    ----------
+    file_path : str
+        The file path the workbook was opened from.
+    is_copy : bool
+        Whether the workbook is a copy of the original workbook.
+        Default is True.
+    new_filename : str
+        The new filename to save the workbook as.
+        Default is None.
+
+    Returns
+    -------
+    str
+        The file path to save the workbook to.
+
+    Imports
+    -------
+    datetime
+    os
+
+    Examples
+    --------
+    >>> get_save_path("reports/test.xlsx", is_copy=True)
+    'reports/test_2021-08-01_12-00-00.xlsx'
+    >>> get_save_path("reports/test.xlsx", is_copy=True, new_filename="test2.xlsx")
+    'reports/test2.xlsx'
+    """
+    directory = os.path.dirname(file_path)
+
+    # if is_copy is True,
+    # make a copy of the file and save it to the original file path
+    # with a new filename
+    if is_copy:
+        # test whether or not new_filename is None
+        # if it is, then then save the workbook to the original file path
+        # with the original file name plus a timestamp as the new filename
+        # if it is not, then use the new_filename as the new filename
+        # with no timestamp
+        if new_filename is None:
+            stem, extension = os.path.splitext(os.path.basename(file_path))
+            timestamp = datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+            return os.path.join(directory, f"{stem}_{timestamp}{extension}")
+        # save a copy of the workbook to the original file path
+        # with the new filename
+        return os.path.join(directory, new_filename)
+
+    # if is_copy is False,
+    # save the workbook to the original file path
+    # with the original file name
+    return file_path
+
+
+def save_workbook(wb, is_copy=True, new_filename=None, file_path=None, compression=None, report=None):
     """
     Description
     -----------
@@ -48,15 +150,32 @@ def save_workbook(wb, is_copy=True, new_filename=None):
         Default is None.
         If None, then the workbook is saved with the original filename.
         If not None, then the workbook is saved with the new filename.
+    file_path : str
+        The file path the workbook was opened from.
+        Default is None.
+        Needed for openpyxl workbooks, which do not keep their file path.
+    compression : str, optional
+        The compression profile to save an openpyxl workbook with:
+        "fast", "balanced", "small" or "stored" (see `compress_package`).
+        Default is None, which saves the workbook as openpyxl does.
+    report : list, optional
+        A list to add the compression report of each part to, when a
+        compression profile is given (see `compress_package`).
+        Default is None.
 
     Returns
     -------
-    None
+    str
+        The file path of the saved workbook.
 
     Raises
     ------
     TypeError
         If the workbook is not a wb object that pyxlsb or openpyxl can read.
+    ValueError
+        If the file path of the workbook is not given and the workbook
+        does not keep it, or if the compression profile is not one of
+        the compression profiles.
 
     Notes
     -----
@@ -64,14 +183,23 @@ def save_workbook(wb, is_copy=True, new_filename=None):
     with the original file name plus a timestamp.
     If the workbook is not a copy, then it saves the workbook to the original file path
     with the original file name.
+    If only some of the sheets of the workbook were loaded (see `load_sheet_subset`),
+    then the loaded sheets are saved to a temporary file first, and the sheets that
+    were not loaded are copied into it from the original file as they are.
+    If a compression profile is given, then the workbook is saved without
+    compression first, and its parts are compressed with a pool of threads.
 
 
     Imports
     -------
-    pyxlsb
     openpyxl
     datetime
-    .is_xlsb
+    os
+    tempfile
+    zipfile
+    .compress_package
+    .load_sheet_subset
+    .splice_unloaded_sheets
 
 
     Examples
@@ -105,53 +233,52 @@ def save_workbook(wb, is_copy=True, new_filename=None):
     'C:\\Users\\username\\Documents\\'
     >>> save_workbook(wb, is_copy=True, new_filename='test2.xlsb')
     Saved workbook to C:\\Users\\username\\Documents\\test2.xlsb
+
+    >>> report = []
+    >>> save_workbook(wb, is_copy=False, file_path='test.xlsx', compression='fast', report=report)
+    Saved workbook to test.xlsx
     """
-    # test if the workbook is an xlsb file
-    if is_xlsb(wb):
-        # if is_copy is True,
-        # make a copy of the file and save it to the original file path
-        # with a new filename
-        if is_copy:
-            # test whether or not new_filename is None
-            # if it is, then then save the workbook to the original file path
-            # with the original file name plus a timestamp as the new filename
-            # if it is not, then use the new_filename as the new filename
-            # with no timestamp
-            if new_filename is None:
-                wb.save(wb.original_file_path + wb.file + str(datetime.now()))
+    if compression is not None:
+        get_compression_level(compression)
+
+    # get the file path the workbook was opened from
+    # openpyxl workbooks do not keep it, so it has to be given
+    if file_path is None:
+        file_path = getattr(wb, "original_file_path", None)
+    if file_path is None:
+        raise ValueError("The file path of the workbook is needed to save it.")
+    save_path = get_save_path(file_path, is_copy=is_copy, new_filename=new_filename)
+
+    # save the workbook
+    # (with pyxlsb if the workbook is an xlsb file, otherwise with openpyxl)
+    # if some sheets were not loaded, save the loaded sheets next to the
+    # new file, and copy the other sheets into it from the original file
+    # (which is still in place, even when saving over it)
+    # if a compression profile is given, save the workbook without
+    # compression, and compress it as the last step
+    unloaded_sheets = get_unloaded_sheets(wb)
+    compress = compression is not None and isinstance(wb, openpyxl.Workbook)
+    if unloaded_sheets or compress:
+        fd, temp_path = tempfile.mkstemp(suffix=os.path.splitext(save_path)[1],
+                                         dir=os.path.dirname(os.path.abspath(save_path)))
+        os.close(fd)
+        try:
+            if compress:
+                save_workbook_stored(wb, temp_path)
+                if unloaded_sheets:
+                    splice_unloaded_sheets(file_path, temp_path, unloaded_sheets, compression=zipfile.ZIP_STORED)
+                parts = compress_package(temp_path, save_path, profile=compression)
+                if report is not None:
+                    report.extend(parts)
             else:
-                # save a copy of the workbook to the original file path
-                # with the new filename
-                wb.save(wb.original_file_path + new_filename)
-        # if is_copy is False,
-        # save the workbook to the original file path
-        # with the original file name
-        else:
-            wb.save(wb.original_file_path)
-
-    # if the workbook is not an xlsb file
+                wb.save(temp_path)
+                splice_unloaded_sheets(file_path, temp_path, unloaded_sheets, new_file_path=save_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
     else:
-        # if is_copy is True,
-        # make a copy of the file and save it to the original file path
-        # with a new filename
-        if is_copy:
-            # test whether or not new_filename is None
-            # if it is, then then save the workbook to the original file path
-            # with the original file name plus a timestamp as the new filename
-            # if it is not, then use the new_filename as the new filename
-            # with no timestamp
-            # this uses openpyxl instead of pyxlsb
-            if new_filename is None:
-                wb.save(wb.original_file_path + wb.file + str(datetime.now()))
-            else:
-                # save a copy of the workbook to the original file path
-                # with the new filename
-                wb.save(wb.original_file_path + new_filename)
-        # if is_copy is False,
-        # save the workbook to the original file path
-        # with the original file name
-        else:
-            wb.save(wb.original_file_path)
+        wb.save(save_path)
 
     # print a message to the console with the file path of the saved workbook
-    print("Workbook saved to: " + wb.original_file_path)
+    print("Workbook saved to: " + save_path)
+    return save_path
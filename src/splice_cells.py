@@ -0,0 +1,837 @@
+"""
+splice_cells.py
+"""
+import re
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape, unescape
+
+from openpyxl.formula.translate import Translator
+from openpyxl.utils.cell import range_boundaries
+from openpyxl.utils.datetime import WINDOWS_EPOCH
+
+from .column_index_from_string import column_index_from_string
+from .column_letter_from_index import column_letter_from_index
+from .date_styles import read_date_styles
+from .excel_dates import get_workbook_epoch
+from .get_sheet_parts import MAIN_NS, get_sheet_parts, get_workbook_part
+from .mapped_zip import get_mapped_zip
+from .read_shared_strings import get_shared_strings_part
+from .rewrite_package import rewrite_package
+from .splice_unloaded_sheets import COUNT_ATTRIBUTE_PATTERN, SST_START_PATTERN
+from .stream_rows import DIMENSION_TAG, ILLEGAL_XML_CHARACTERS, SHEET_DATA_START, format_cell_xml
+
+
+# a row of the sheet data, with or without cells, or the end of the sheet data
+ROW_OR_END_PATTERN = re.compile(rb"<(?:\w+:)?row\b([^>]*?)(/?)>|</(?:\w+:)?sheetData>")
+ROW_NUMBER_PATTERN = re.compile(rb'\sr="(\d+)"')
+SPANS_PATTERN = re.compile(rb'\sspans="[^"]*"')
+
+# a cell of a row, and its reference and style
+CELL_PATTERN = re.compile(rb"<(?:\w+:)?c\b([^>]*?)(?:/>|>.*?</(?:\w+:)?c>)", re.S)
+CELL_REF_PATTERN = re.compile(rb'\sr="([A-Z]+)(\d+)"')
+CELL_STYLE_PATTERN = re.compile(rb'\ss="(\d+)"')
+
+# the formula of a cell, and the attributes of a shared formula
+FORMULA_PATTERN = re.compile(rb"<((?:\w+:)?)f\b([^>]*?)(?:/>|>(.*?)</(?:\w+:)?f>)", re.S)
+SHARED_TYPE_PATTERN = re.compile(rb'\st="shared"')
+SHARED_INDEX_PATTERN = re.compile(rb'\ssi="(\d+)"')
+SHARED_RANGE_PATTERN = re.compile(rb'\sref="([^"]+)"')
+
+# the calculation properties of the workbook
+CALC_PR_PATTERN = re.compile(rb"<((?:\w+:)?)calcPr\b([^>]*?)(/?)>")
+FULL_CALC_PATTERN = re.compile(rb'\sfullCalcOnLoad="[^"]*"')
+WORKBOOK_END_PATTERN = re.compile(rb"</((?:\w+:)?)workbook>")
+
+
+def record_shared_formula(cell_xml, shared_formulas):
+    """
+    Description
+    -----------
+    Keep the formula of a cell that is the first cell of a shared formula
+    (the cell the other cells of the shared formula take their formula
+    from), before the cell is overwritten, so the formula can be written
+    into the other cells (see `expand_shared_formulas`).
+
+    Parameters
+    ----------
+    cell_xml : bytes
+        The xml of the cell.
+    shared_formulas : dict
+        Dictionary of the shared formulas kept so far, keyed by their
+        index, which the formula of the cell is added to.
+
+    Returns
+    -------
+    bool
+        Whether the cell is the first cell of a shared formula.
+
+    Imports
+    -------
+    re
+    xml.sax.saxutils
+    openpyxl.utils.cell
+
+    Examples
+    --------
+    >>> record_shared_formula(b'<c r="C2"><f t="shared" ref="C2:C9" si="0">A2*B2</f><v>6</v></c>', shared)
+    True
+    >>> shared
+    {b'0': ('=A2*B2', 'C2', (3, 2, 3, 9))}
+    """
+    formula = FORMULA_PATTERN.search(cell_xml)
+    if formula is None or not formula.group(3) or SHARED_TYPE_PATTERN.search(formula.group(2)) is None:
+        return False
+    index = SHARED_INDEX_PATTERN.search(formula.group(2))
+    bounds = SHARED_RANGE_PATTERN.search(formula.group(2))
+    ref = CELL_REF_PATTERN.search(CELL_PATTERN.match(cell_xml).group(1))
+    if index is None or bounds is None or ref is None:
+        return False
+    text = "=" + unescape(formula.group(3).decode("utf-8"))
+    origin = ref.group(1).decode("ascii") + ref.group(2).decode("ascii")
+    shared_formulas[index.group(1)] = (text, origin, range_boundaries(bounds.group(1).decode("ascii")))
+    return True
+
+
+def expand_shared_formulas(row_xml, row_number, shared_formulas):
+    """
+    Description
+    -----------
+    Write the formulas of the shared formulas whose first cell was
+    overwritten (see `record_shared_formula`) into the other cells of the
+    shared formulas in a row, translated to each cell, as Excel and
+    openpyxl do when they read them. The other cells are kept as they are.
+
+    Parameters
+    ----------
+    row_xml : bytes
+        The xml of the row.
+    row_number : int
+        The row number.
+    shared_formulas : dict
+        Dictionary of the shared formulas whose first cell was
+        overwritten, keyed by their index.
+
+    Returns
+    -------
+    bytes
+        The xml of the new row.
+
+    Imports
+    -------
+    re
+    xml.sax.saxutils
+    openpyxl.formula.translate
+
+    Examples
+    --------
+    >>> expand_shared_formulas(b'<row r="3"><c r="C3"><f t="shared" si="0"/><v>8</v></c></row>', 3, shared)
+    b'<row r="3"><c r="C3"><f>A3*B3</f><v>8</v></c></row>'
+    """
+    def expand(match):
+        cell_xml = match.group(0)
+        formula = FORMULA_PATTERN.search(cell_xml)
+        if formula is None or formula.group(3) or SHARED_TYPE_PATTERN.search(formula.group(2)) is None:
+            return cell_xml
+        index = SHARED_INDEX_PATTERN.search(formula.group(2))
+        ref = CELL_REF_PATTERN.search(match.group(1))
+        if index is None or ref is None or index.group(1) not in shared_formulas:
+            return cell_xml
+        text, origin, (min_column, min_row, max_column, max_row) = shared_formulas[index.group(1)]
+        column = column_index_from_string(ref.group(1).decode("ascii"))
+        if not (min_column <= column <= max_column and min_row <= row_number <= max_row):
+            return cell_xml
+        target = ref.group(1).decode("ascii") + ref.group(2).decode("ascii")
+        translated = Translator(text, origin=origin).translate_formula(target)[1:]
+        prefix = formula.group(1)
+        new_formula = b"<" + prefix + b"f>" + escape(translated).encode("utf-8") + b"</" + prefix + b"f>"
+        return cell_xml[:formula.start()] + new_formula + cell_xml[formula.end():]
+
+    return CELL_PATTERN.sub(expand, row_xml)
+
+
+def splice_row(row_xml, row_number, values, tag_prefix=b"", shared_strings=None, shared_formulas=None,
+               epoch=WINDOWS_EPOCH, date_styles=None):
+    """
+    Description
+    -----------
+    Write new values into the cells of a row of a worksheet part,
+    replacing the cells that are there (keeping their styles) and adding
+    the cells that are not, in column order. The other cells of the row
+    are kept as they are. Dates and times get a cell format with a date
+    format, when their cell does not have one (see `DateStyles.get_style`).
+
+    When shared_formulas is given, the shared formulas whose first cell is
+    overwritten are added to it (see `record_shared_formula`), and the
+    cells of the row that take their formula from one of them get their
+    own formula (see `expand_shared_formulas`), so they are not left
+    without one.
+
+    Parameters
+    ----------
+    row_xml : bytes
+        The xml of the row, or None for a row that is not in the sheet yet.
+    row_number : int
+        The row number.
+    values : dict
+        Dictionary where the keys are column numbers and the values are
+        the new values (written as by `format_cell_xml`).
+    tag_prefix : bytes, optional
+        The namespace prefix used on the tags. Default is b"".
+    shared_strings : dict, optional
+        The indexes of the strings to write as shared strings (see `format_cell_xml`).
+        Default is None, which writes strings as inline strings.
+    shared_formulas : dict, optional
+        Dictionary of the shared formulas whose first cell was overwritten,
+        keyed by their index, which is updated as the row is written.
+        Default is None, which leaves the shared formulas as they are.
+    epoch : datetime.datetime, optional
+        The date system of the workbook (see `format_cell_xml`).
+        Default is openpyxl.utils.datetime.WINDOWS_EPOCH.
+    date_styles : DateStyles, optional
+        The cell formats of the workbook (see `format_cell_xml`).
+        Default is None, which keeps the style of each cell.
+
+    Returns
+    -------
+    bytes
+        The xml of the new row.
+
+    Imports
+    -------
+    re
+    .column_index_from_string
+    .column_letter_from_index
+    .stream_rows
+
+    Examples
+    --------
+    >>> splice_row(b'<row r="2"><c r="A2" s="1"><v>1</v></c></row>', 2, {1: 5, 3: "x"})
+    b'<row r="2"><c r="A2" s="1"><v>5</v></c><c r="C2" t="inlineStr">...</c></row>'
+    """
+    prefix = tag_prefix.decode("ascii")
+    pending = sorted(values)
+
+    def new_cell(column, style=None):
+        ref = f"{column_letter_from_index(column)}{row_number}"
+        return format_cell_xml(ref, values[column], prefix, style, shared_strings, epoch=epoch,
+                               date_styles=date_styles).encode("utf-8")
+
+    # a row that is not in the sheet only has the new cells
+    if row_xml is None:
+        cells = b"".join(new_cell(column) for column in pending)
+        return b"<" + tag_prefix + b"row" + f' r="{row_number}">'.encode("ascii") + cells + \
+            b"</" + tag_prefix + b"row>"
+
+    # the start tag of the row, without its spans (which may no longer be right)
+    start_end = row_xml.find(b">") + 1
+    start_tag = SPANS_PATTERN.sub(b"", row_xml[:start_end])
+    if start_tag.endswith(b"/>"):
+        start_tag, body = start_tag[:-2] + b">", b""
+    else:
+        body = row_xml[start_end:row_xml.rfind(b"</")]
+
+    pieces = []
+    position = 0
+    column = 0
+    for match in CELL_PATTERN.finditer(body):
+        ref = CELL_REF_PATTERN.search(match.group(1))
+        column = column_index_from_string(ref.group(1).decode("ascii")) if ref else column + 1
+
+        # the new cells that come before this one
+        while pending and pending[0] < column:
+            pieces.append(body[position:match.start()])
+            position = match.start()
+            pieces.append(new_cell(pending.pop(0)))
+
+        pieces.append(body[position:match.start()])
+        position = match.end()
+        if pending and pending[0] == column:
+            if shared_formulas is not None:
+                record_shared_formula(match.group(0), shared_formulas)
+            style = CELL_STYLE_PATTERN.search(match.group(1))
+            pieces.append(new_cell(pending.pop(0), None if style is None else style.group(1).decode("ascii")))
+        else:
+            pieces.append(match.group(0))
+
+    pieces.append(body[position:])
+    pieces.extend(new_cell(column) for column in pending)
+    row_xml = start_tag + b"".join(pieces) + b"</" + tag_prefix + b"row>"
+    if shared_formulas:
+        row_xml = expand_shared_formulas(row_xml, row_number, shared_formulas)
+    return row_xml
+
+
+def splice_sheet_cells(src, dst, cells, chunk_size=1 << 20, shared_strings=None, epoch=WINDOWS_EPOCH,
+                       date_styles=None):
+    """
+    Description
+    -----------
+    Copy the xml of a worksheet part, writing new values into some of its
+    cells as it goes by (see `splice_sheet_rows`).
+
+    Parameters
+    ----------
+    src : file object
+        The worksheet part, opened for reading in binary mode.
+    dst : file object
+        The file object to write to, opened for writing in binary mode.
+    cells : dict
+        Dictionary where the keys are cell references (e.g. "B10")
+        and the values are the new values.
+    chunk_size : int, optional
+        The number of bytes to read at a time.
+        Default is 1 MB.
+    shared_strings : dict, optional
+        The indexes of the strings to write as shared strings (see `format_cell_xml`).
+        Default is None, which writes strings as inline strings.
+    epoch : datetime.datetime, optional
+        The date system of the workbook (see `format_cell_xml`).
+        Default is openpyxl.utils.datetime.WINDOWS_EPOCH.
+    date_styles : DateStyles, optional
+        The cell formats of the workbook (see `format_cell_xml`).
+        Default is None, which keeps the style of each cell.
+
+    Returns
+    -------
+    int
+        The number of cells written.
+
+    Raises
+    ------
+    ValueError
+        If a cell reference is not in A1 notation.
+    ValueError
+        If the worksheet part has no sheet data.
+
+    Imports
+    -------
+    re
+    .column_index_from_string
+
+    Examples
+    --------
+    >>> with zf.open("xl/worksheets/sheet1.xml") as src:
+    ...     splice_sheet_cells(src, dst, {"B2": 0.07, "B3": "East"})
+    2
+    """
+    # the new values by row and column
+    rows = {}
+    for ref, value in cells.items():
+        match = re.fullmatch(r"\$?([A-Za-z]{1,3})\$?(\d+)", ref)
+        if match is None:
+            raise ValueError(f"The cell reference {ref} is not in A1 notation.")
+        column = column_index_from_string(match.group(1).upper())
+        rows.setdefault(int(match.group(2)), {})[column] = value
+    return splice_sheet_rows(src, dst, ((number, rows[number]) for number in sorted(rows)),
+                             chunk_size=chunk_size, shared_strings=shared_strings, epoch=epoch,
+                             date_styles=date_styles)
+
+
+def splice_sheet_rows(src, dst, rows, chunk_size=1 << 20, shared_strings=None, epoch=WINDOWS_EPOCH,
+                      date_styles=None):
+    """
+    Description
+    -----------
+    Copy the xml of a worksheet part, writing new values into some of its
+    cells as it goes by. Only the rows with cells to write are rewritten
+    (see `splice_row`), rows that are not in the sheet yet are added in
+    order, and everything else is copied as it is (after the last row to
+    write, without looking at it). The part is read and written a chunk
+    at a time, and the rows to write are taken one at a time, as they are
+    needed, so they can come from a generator and memory use stays flat.
+
+    The dimension element is dropped, since the new cells can be outside
+    of it. Excel works it out again when it opens the workbook.
+
+    When a cell written to is the first cell of a shared formula, the
+    other cells of the shared formula would be left without a formula,
+    so the rows they are in are rewritten too, with the formula written
+    into each of them (see `splice_row`).
+
+    Parameters
+    ----------
+    src : file object
+        The worksheet part, opened for reading in binary mode.
+    dst : file object
+        The file object to write to, opened for writing in binary mode.
+    rows : iterable
+        Iterable of tuples of the form (row number, values), in order of
+        row number, where values is a dictionary of the new values keyed
+        by column number.
+    chunk_size : int, optional
+        The number of bytes to read at a time.
+        Default is 1 MB.
+    shared_strings : dict, optional
+        The indexes of the strings to write as shared strings (see `format_cell_xml`).
+        Default is None, which writes strings as inline strings.
+    epoch : datetime.datetime, optional
+        The date system of the workbook (see `format_cell_xml`).
+        Default is openpyxl.utils.datetime.WINDOWS_EPOCH.
+    date_styles : DateStyles, optional
+        The cell formats of the workbook (see `format_cell_xml`).
+        Default is None, which keeps the style of each cell.
+
+    Returns
+    -------
+    int
+        The number of cells written.
+
+    Raises
+    ------
+    ValueError
+        If the worksheet part has no sheet data.
+
+    Imports
+    -------
+    re
+    .stream_rows
+
+    Examples
+    --------
+    >>> with zf.open("xl/worksheets/sheet1.xml") as src:
+    ...     splice_sheet_rows(src, dst, [(2, {2: 0.07}), (3, {2: "East"})])
+    2
+    """
+    rows = iter(rows)
+    pending = next(rows, None)
+    count = 0
+    shared_formulas = {}
+
+    def write_new_row(row_xml=None):
+        # write the values of the pending row, and move to the next one
+        nonlocal pending, count
+        number, values = pending
+        count += len(values)
+        pending = next(rows, None)
+        return splice_row(row_xml, number, values, tag_prefix, shared_strings, shared_formulas,
+                          epoch=epoch, date_styles=date_styles)
+
+    def next_row():
+        # the next row to look at: the row after the last one while there
+        # are cells of an overwritten shared formula to come, otherwise the
+        # next row to write
+        if shared_formulas:
+            if row_number < max(bounds[3] for _, _, bounds in shared_formulas.values()):
+                return row_number + 1
+            shared_formulas.clear()
+        return None if pending is None else pending[0]
+
+    # copy everything before the sheet data, without the dimension
+    buffer = b""
+    while True:
+        match = SHEET_DATA_START.search(buffer)
+        if match is not None:
+            break
+        chunk = src.read(chunk_size)
+        if not chunk:
+            raise ValueError("The worksheet part has no sheet data.")
+        buffer += chunk
+    tag_prefix = match.group(1)
+    dst.write(DIMENSION_TAG.sub(b"", buffer[:match.start()]))
+
+    # an empty sheet data only gets the new rows
+    if match.group(2) == b"/":
+        dst.write(b"<" + tag_prefix + b"sheetData>")
+        while pending is not None:
+            dst.write(write_new_row())
+        dst.write(b"</" + tag_prefix + b"sheetData>")
+        dst.write(buffer[match.end():])
+        while True:
+            chunk = src.read(chunk_size)
+            if not chunk:
+                return count
+            dst.write(chunk)
+
+    dst.write(buffer[match.start():match.end()])
+    buffer = buffer[match.end():]
+    end_tag = b"</" + tag_prefix + b"row>"
+    row_number = 0
+    written = 0
+    position = 0
+    skipped = None
+    chunks = 0
+    at_end = False
+    while True:
+        next_number = next_row()
+        if next_number is None:
+            break
+
+        # skip to the next row to look at, or past the rows before it,
+        # when the rows are numbered (as they almost always are),
+        # once for each row to look at and buffer
+        if skipped != (next_number, chunks):
+            skipped = (next_number, chunks)
+            target = buffer.find(b"<" + tag_prefix + b'row r="%d"' % next_number, position)
+            if target < 0:
+                # the last row of the buffer with a complete start tag
+                end = buffer.rfind(b">")
+                target = buffer.rfind(b"<" + tag_prefix + b"row ", position, end)
+                number = ROW_NUMBER_PATTERN.search(buffer, target, end) if target >= 0 else None
+                if number is None or int(number.group(1)) >= next_number:
+                    target = position
+            position = target
+        match = ROW_OR_END_PATTERN.search(buffer, position)
+
+        # the end of the sheet data: add the rows that are left
+        if match is not None and match.group(1) is None:
+            dst.write(buffer[written:match.start()])
+            while pending is not None:
+                dst.write(write_new_row())
+            written = match.start()
+            break
+
+        if match is not None:
+            number = ROW_NUMBER_PATTERN.search(match.group(1))
+            current = int(number.group(1)) if number else row_number + 1
+
+            # the rows before the next row to look at are copied as they are,
+            # without looking for their ends
+            if current < next_number:
+                row_number = current
+                position = match.end()
+                continue
+
+            # otherwise write the rows to add before this one, and this row
+            row_end = match.end() if match.group(2) else buffer.find(end_tag, match.end())
+            if row_end >= 0:
+                row_number = current
+                row_end += 0 if match.group(2) else len(end_tag)
+                dst.write(buffer[written:match.start()])
+                while pending is not None and pending[0] < row_number:
+                    dst.write(write_new_row())
+                row_xml = buffer[match.start():row_end]
+                if pending is not None and pending[0] == row_number:
+                    row_xml = write_new_row(row_xml)
+                elif shared_formulas:
+                    row_xml = expand_shared_formulas(row_xml, row_number, shared_formulas)
+                dst.write(row_xml)
+                written = position = row_end
+                continue
+
+        # otherwise the rest of the row (or the sheet data) is in the next chunk
+        if at_end:
+            raise ValueError("The worksheet part has no end to its sheet data.")
+        if match is None:
+            # keep enough of the buffer to find a tag that was split
+            start = max(position, buffer.rfind(b"<", position))
+        else:
+            start = match.start()
+        dst.write(buffer[written:start])
+        buffer = buffer[start:]
+        written = position = 0
+        chunk = src.read(chunk_size)
+        chunks += 1
+        at_end = not chunk
+        buffer += chunk
+    dst.write(buffer[written:])
+
+    # copy the rest of the part
+    while True:
+        chunk = src.read(chunk_size)
+        if not chunk:
+            return count
+        dst.write(chunk)
+
+
+def find_shared_strings(src, strings):
+    """
+    Description
+    -----------
+    Look up strings in a shared strings part, one string of the part at a
+    time, so strings the workbook already has are not added again. Only
+    plain strings are matched, since a rich text string with the same
+    text would bring its formatting with it.
+
+    Parameters
+    ----------
+    src : file object
+        The shared strings part, opened for reading in binary mode.
+    strings : iterable
+        The strings to look up.
+
+    Returns
+    -------
+    tuple
+        Tuple of the form (number of strings, indexes), where indexes is a
+        dictionary of the indexes of the strings that are in the part,
+        keyed by string.
+
+    Imports
+    -------
+    xml.etree.ElementTree
+    .get_sheet_parts
+
+    Examples
+    --------
+    >>> with zf.open("xl/sharedStrings.xml") as src:
+    ...     find_shared_strings(src, ["East", "Q3 review"])
+    (5120, {'East': 17})
+    """
+    wanted = set(strings)
+    si_tag = f"{{{MAIN_NS}}}si"
+    t_tag = f"{{{MAIN_NS}}}t"
+
+    count = 0
+    indexes = {}
+    for _, element in ET.iterparse(src, events=("end",)):
+        if element.tag != si_tag:
+            continue
+        children = list(element)
+        if len(children) == 1 and children[0].tag == t_tag:
+            text = children[0].text or ""
+            if text in wanted and text not in indexes:
+                indexes[text] = count
+        count += 1
+        element.clear()
+    return count, indexes
+
+
+def append_shared_strings(src, dst, strings, unique_count, chunk_size=1 << 20):
+    """
+    Description
+    -----------
+    Copy a shared strings part, adding strings at the end of it, so the
+    strings that are there keep their indexes. The part is read and
+    written a chunk at a time, so memory use stays flat.
+
+    Parameters
+    ----------
+    src : file object
+        The shared strings part, opened for reading in binary mode.
+    dst : file object
+        The file object to write to, opened for writing in binary mode.
+    strings : list
+        The strings to add.
+    unique_count : int
+        The number of strings in the part (see `find_shared_strings`).
+    chunk_size : int, optional
+        The number of bytes to read at a time.
+        Default is 1 MB.
+
+    Returns
+    -------
+    None
+
+    Raises
+    ------
+    ValueError
+        If the part is not a shared strings part.
+
+    Imports
+    -------
+    re
+    xml.sax.saxutils
+    .splice_unloaded_sheets
+
+    Examples
+    --------
+    >>> with zf.open("xl/sharedStrings.xml") as src:
+    ...     append_shared_strings(src, dst, ["East", "West"], 5120)
+    """
+    buffer = b""
+    while True:
+        match = SST_START_PATTERN.search(buffer)
+        if match is not None:
+            break
+        chunk = src.read(chunk_size)
+        if not chunk:
+            raise ValueError("The part is not a shared strings part.")
+        buffer += chunk
+
+    # the start tag, with the new number of strings
+    prefix = match.group(1)
+    opening = COUNT_ATTRIBUTE_PATTERN.sub(b"", match.group(0)[:-len(match.group(2)) - 1].rstrip())
+    opening += b' uniqueCount="%d">' % (unique_count + len(strings))
+    items = b"".join(b"<" + prefix + b'si><' + prefix + b't xml:space="preserve">'
+                     + escape(ILLEGAL_XML_CHARACTERS.sub("", string)).encode("utf-8")
+                     + b"</" + prefix + b"t></" + prefix + b"si>" for string in strings)
+    dst.write(buffer[:match.start()] + opening)
+    if match.group(2):
+        dst.write(items + b"</" + prefix + b"sst>")
+    buffer = buffer[match.end():]
+
+    # copy the rest, with the new strings before the end tag
+    while True:
+        chunk = src.read(chunk_size)
+        buffer += chunk
+        if not chunk:
+            break
+        if len(buffer) > 64:
+            dst.write(buffer[:-64])
+            buffer = buffer[-64:]
+    if not match.group(2):
+        end = buffer.rindex(b"</")
+        buffer = buffer[:end] + items + buffer[end:]
+    dst.write(buffer)
+
+
+def set_full_calc_on_load(workbook_xml):
+    """
+    Description
+    -----------
+    Mark a workbook to be fully recalculated when Excel opens it,
+    so formulas that depend on cells written without Excel are right.
+
+    Parameters
+    ----------
+    workbook_xml : bytes
+        The xml of the workbook part.
+
+    Returns
+    -------
+    bytes
+        The new xml.
+
+    Imports
+    -------
+    re
+
+    Examples
+    --------
+    >>> set_full_calc_on_load(b'<workbook><sheets>...</sheets><calcPr calcId="124519"/></workbook>')
+    b'<workbook><sheets>...</sheets><calcPr calcId="124519" fullCalcOnLoad="1"/></workbook>'
+    """
+    match = CALC_PR_PATTERN.search(workbook_xml)
+    if match is not None:
+        attributes = FULL_CALC_PATTERN.sub(b"", match.group(2)).rstrip() + b' fullCalcOnLoad="1"'
+        tag = b"<" + match.group(1) + b"calcPr" + attributes + (b"/>" if match.group(3) else b">")
+        return workbook_xml[:match.start()] + tag + workbook_xml[match.end():]
+
+    # the calculation properties come after the defined names, or the sheets
+    match = WORKBOOK_END_PATTERN.search(workbook_xml)
+    prefix = match.group(1)
+    tag = b"<" + prefix + b'calcPr fullCalcOnLoad="1"/>'
+    for end_tag in (b"</" + prefix + b"definedNames>", b"</" + prefix + b"sheets>"):
+        position = workbook_xml.find(end_tag)
+        if position >= 0:
+            position += len(end_tag)
+            return workbook_xml[:position] + tag + workbook_xml[position:]
+    return workbook_xml[:match.start()] + tag + workbook_xml[match.start():]
+
+
+def splice_cells(file_path, cells, new_file_path=None, shared_strings=True):
+    """
+    Description
+    -----------
+    Write values into cells of a workbook file without loading it, for
+    small edits to big sheets. Each sheet with cells to write is copied
+    a row at a time, rewriting only the rows with those cells (see
+    `splice_sheet_cells`), and every other part of the workbook package is
+    copied without decompressing it. The cost is one read and one write of
+    each sheet that changes, however many cells it has, and memory use
+    stays flat.
+
+    Strings are written as shared strings (when the workbook has them,
+    and shared_strings is True), reusing the strings the workbook already
+    has (see `find_shared_strings`), or written as inline strings.
+    The calculation chain is dropped and the workbook is marked to be
+    fully recalculated when Excel opens it, so the formulas that depend
+    on the cells are right.
+
+    Parameters
+    ----------
+    file_path : str
+        The file path of the workbook (.xlsx, .xlsm or .xltx).
+    cells : dict
+        Dictionary where the keys are sheet names and the values are
+        dictionaries of the new values, keyed by cell reference
+        (e.g. {"Inputs": {"B2": 0.07, "B3": "East"}}).
+        Values are written as by `format_cell_xml`: strings starting with
+        "=" are formulas, dates and times are serial numbers in the date
+        system of the workbook (with a date format, unless their cell has
+        one), and None empties a cell (keeping its style).
+    new_file_path : str, optional
+        The file path to write the new workbook to.
+        Default is None, which rewrites the workbook in place.
+    shared_strings : bool, optional
+        Whether to add new strings to the shared strings of the workbook.
+        Default is True.
+
+    Returns
+    -------
+    int
+        The number of cells written.
+
+    Raises
+    ------
+    ValueError
+        If the workbook is an xlsb file, or a sheet is not in the workbook.
+
+    Imports
+    -------
+    .date_styles
+    .excel_dates
+    .get_sheet_parts
+    .mapped_zip
+    .read_shared_strings
+    .rewrite_package
+
+    Examples
+    --------
+    >>> splice_cells("claims_detail.xlsx", {"Inputs": {"B2": 0.07, "B3": "East"}})
+    2
+    """
+    if file_path.lower().endswith(".xlsb"):
+        raise ValueError(f"The workbook {file_path} is an xlsb file, which cannot be spliced.")
+
+    with get_mapped_zip(file_path) as zf:
+        sheet_parts = get_sheet_parts(zf)
+        missing = [sheet for sheet in cells if sheet not in sheet_parts]
+        if missing:
+            raise ValueError(f"The sheets {missing} are not in the workbook.")
+        workbook_part = get_workbook_part(zf)
+        workbook_xml = zf.read(workbook_part)
+        strings_part = get_shared_strings_part(zf) if shared_strings else None
+        epoch = get_workbook_epoch(zf)
+        date_styles = read_date_styles(zf)
+
+        # the strings the workbook has keep their indexes,
+        # and the new strings go after them
+        new_strings = {}
+        added = []
+        if strings_part is not None:
+            for values in cells.values():
+                for value in values.values():
+                    if not isinstance(value, str):
+                        continue
+                    text = ILLEGAL_XML_CHARACTERS.sub("", value)
+                    if not (text.startswith("=") and len(text) > 1):
+                        new_strings.setdefault(text, len(new_strings))
+            if new_strings:
+                with zf.open(strings_part) as src:
+                    unique_count, existing = find_shared_strings(src, new_strings)
+                added = [text for text in new_strings if text not in existing]
+                new_strings = {text: unique_count + index for index, text in enumerate(added)}
+                new_strings.update(existing)
+
+    count = []
+
+    def splice(part, values):
+        def write_part(dst):
+            with get_mapped_zip(file_path) as zf, zf.open(part) as src:
+                count.append(splice_sheet_cells(src, dst, values, shared_strings=new_strings or None,
+                                                epoch=epoch, date_styles=date_styles))
+        return write_part
+
+    def write_strings(dst):
+        with get_mapped_zip(file_path) as zf, zf.open(strings_part) as src:
+            append_shared_strings(src, dst, added, unique_count)
+
+    replace_parts = {sheet_parts[sheet]: splice(sheet_parts[sheet], values)
+                     for sheet, values in cells.items() if values}
+    if not replace_parts:
+        if new_file_path is not None:
+            rewrite_package(file_path, new_file_path)
+        return 0
+    if added:
+        replace_parts[strings_part] = write_strings
+    replace_parts[workbook_part] = set_full_calc_on_load(workbook_xml)
+
+    # the styles are written after the sheets, once the cell formats
+    # of their dates are known
+    if date_styles.part is not None:
+        replace_parts[date_styles.part] = date_styles.write_xml
+
+    rewrite_package(file_path, new_file_path, replace_parts=replace_parts, drop_parts={"xl/calcChain.xml"},
+                    write_last={date_styles.part})
+    return sum(count)
@@ -0,0 +1,418 @@
+"""
+splice_unloaded_sheets.py
+"""
+import posixpath
+import re
+import zipfile
+from xml.sax.saxutils import escape, unescape
+
+from .get_sheet_parts import get_rels_part, get_sheet_parts, get_workbook_part, resolve_part_target
+from .mapped_zip import get_mapped_zip
+from .read_shared_strings import SHARED_STRINGS_TYPE, get_shared_strings_part, read_shared_strings
+from .rewrite_package import rewrite_package
+
+
+RELATIONSHIP_PATTERN = re.compile(rb"<(?:\w+:)?Relationship\b[^>]*/>")
+TARGET_PATTERN = re.compile(rb'\sTarget="([^"]*)"')
+OVERRIDE_PATTERN = re.compile(rb'<Override\b[^>]*PartName="/?([^"]+)"[^>]*ContentType="([^"]+)"[^>]*/>')
+DEFAULT_PATTERN = re.compile(rb'<Default\b[^>]*Extension="([^"]+)"[^>]*ContentType="([^"]+)"[^>]*/>')
+SHARED_STRING_CELL_PATTERN = re.compile(rb'(<c\b[^>]*?\st="s"[^>]*>)<v>(\d+)</v>')
+SST_START_PATTERN = re.compile(rb"<((?:\w+:)?)sst\b[^>]*?(/?)>")
+COUNT_ATTRIBUTE_PATTERN = re.compile(rb'\s(?:count|uniqueCount)="\d*"')
+
+
+def get_free_part_name(name, used):
+    """
+    Description
+    -----------
+    Get a name for a part that is not used yet in a workbook package,
+    by numbering the part the way Excel does.
+
+    Parameters
+    ----------
+    name : str
+        The name the part would like, e.g. "xl/drawings/drawing1.xml".
+    used : set
+        The names of the parts that are used.
+
+    Returns
+    -------
+    str
+        The name itself if it is free, otherwise the name with the first
+        free number, e.g. "xl/drawings/drawing2.xml".
+
+    Examples
+    --------
+    >>> get_free_part_name("xl/drawings/drawing1.xml", {"xl/drawings/drawing1.xml"})
+    'xl/drawings/drawing2.xml'
+    """
+    if name not in used:
+        return name
+    stem, extension = posixpath.splitext(name)
+    stem = stem.rstrip("0123456789")
+    number = 1
+    while f"{stem}{number}{extension}" in used:
+        number += 1
+    return f"{stem}{number}{extension}"
+
+
+def copy_sheet_closure(original_zf, original_part, saved_part, used):
+    """
+    Description
+    -----------
+    Work out how to copy a worksheet part of one workbook package into
+    another, along with every part it depends on through its relationships
+    (drawings, charts, images, comments, tables, printer settings and so on).
+    Parts whose names are already used in the other package are renamed,
+    and the relationships are rewritten to point to the new names.
+
+    Parameters
+    ----------
+    original_zf : MappedZip
+        The package to copy from.
+    original_part : str
+        The name of the worksheet part in the package to copy from.
+    saved_part : str
+        The name the worksheet part gets in the package to copy to.
+    used : set
+        The names of the parts used in the package to copy to.
+        The names of the copied parts are added to it.
+
+    Returns
+    -------
+    tuple
+        Tuple of the form (copied, rels), where copied is a dictionary of
+        the new names of the parts to copy and their names in the package
+        to copy from, and rels is a dictionary of the names of the new
+        relationship parts and their contents as bytes.
+
+    Imports
+    -------
+    posixpath
+    re
+    .get_sheet_parts
+
+    Examples
+    --------
+    >>> copied, rels = copy_sheet_closure(zf, "xl/worksheets/sheet2.xml", "xl/worksheets/sheet2.xml", used)
+    >>> copied
+    {'xl/worksheets/sheet2.xml': 'xl/worksheets/sheet2.xml', 'xl/drawings/drawing2.xml': 'xl/drawings/drawing1.xml'}
+    """
+    renamed = {original_part: saved_part}
+    used.add(saved_part)
+    rels = {}
+    queue = [original_part]
+    while queue:
+        part = queue.pop()
+        rels_part = get_rels_part(part)
+        if rels_part not in original_zf.NameToInfo:
+            continue
+        new_part = renamed[part]
+
+        def retarget(match, part=part, new_part=new_part):
+            relationship = match.group(0)
+            target = TARGET_PATTERN.search(relationship)
+            if target is None or b'TargetMode="External"' in relationship:
+                return relationship
+            target_part = resolve_part_target(part, unescape(target.group(1).decode("utf-8")))
+            if target_part not in original_zf.NameToInfo:
+                return relationship
+
+            # copy the part the relationship points to, under a free name
+            if target_part not in renamed:
+                renamed[target_part] = get_free_part_name(target_part, used)
+                used.add(renamed[target_part])
+                queue.append(target_part)
+
+            new_target = posixpath.relpath(renamed[target_part], posixpath.dirname(new_part))
+            return relationship[:target.start(1)] + escape(new_target, {'"': "&quot;"}).encode("utf-8") \
+                + relationship[target.end(1):]
+
+        rels[get_rels_part(new_part)] = RELATIONSHIP_PATTERN.sub(retarget, original_zf.read(rels_part))
+
+    return {new: old for old, new in renamed.items()}, rels
+
+
+def add_content_types(content_types, original_content_types, copied):
+    """
+    Description
+    -----------
+    Add the content types of copied parts to the content types part
+    of a workbook package.
+
+    Parameters
+    ----------
+    content_types : bytes
+        The content types part of the package the parts are copied to.
+    original_content_types : bytes
+        The content types part of the package the parts are copied from.
+    copied : dict
+        Dictionary of the new names of the copied parts and their names
+        in the package they are copied from.
+
+    Returns
+    -------
+    bytes
+        The new content types part.
+
+    Imports
+    -------
+    posixpath
+    re
+
+    Examples
+    --------
+    >>> add_content_types(content_types, original_content_types,
+    ...                   {"xl/drawings/drawing2.xml": "xl/drawings/drawing1.xml"})
+    b'<?xml ...'
+    """
+    overrides = {name.decode("utf-8"): content_type
+                 for name, content_type in OVERRIDE_PATTERN.findall(content_types)}
+    defaults = {extension.lower() for extension, _ in DEFAULT_PATTERN.findall(content_types)}
+    original_overrides = {name.decode("utf-8"): content_type
+                          for name, content_type in OVERRIDE_PATTERN.findall(original_content_types)}
+    original_defaults = {extension.lower(): content_type
+                         for extension, content_type in DEFAULT_PATTERN.findall(original_content_types)}
+
+    added = []
+    for new_name, old_name in copied.items():
+        if old_name in original_overrides:
+            if new_name not in overrides:
+                added.append(b'<Override PartName="/' + escape(new_name).encode("utf-8")
+                             + b'" ContentType="' + original_overrides[old_name] + b'"/>')
+            continue
+        extension = posixpath.splitext(new_name)[1].lstrip(".").lower().encode("utf-8")
+        if extension in original_defaults and extension not in defaults:
+            defaults.add(extension)
+            added.append(b'<Default Extension="' + extension
+                         + b'" ContentType="' + original_defaults[extension] + b'"/>')
+
+    if not added:
+        return content_types
+    end = content_types.rindex(b"</")
+    return content_types[:end] + b"".join(added) + content_types[end:]
+
+
+def add_relationship(rels, rel_type, target):
+    """
+    Description
+    -----------
+    Add a relationship to a relationship part, with the first free id.
+
+    Parameters
+    ----------
+    rels : bytes
+        The relationship part.
+    rel_type : str
+        The type of the relationship.
+    target : str
+        The name of the part the relationship points to.
+
+    Returns
+    -------
+    bytes
+        The new relationship part.
+
+    Imports
+    -------
+    re
+
+    Examples
+    --------
+    >>> add_relationship(rels, SHARED_STRINGS_TYPE, "xl/sharedStrings.xml")
+    b'<Relationships ...><Relationship Id="rId6" Type="..." Target="/xl/sharedStrings.xml"/></Relationships>'
+    """
+    ids = set(re.findall(rb'\sId="([^"]*)"', rels))
+    number = 1
+    while b"rId%d" % number in ids:
+        number += 1
+    relationship = (b'<Relationship Id="rId%d" Type="' % number + rel_type.encode("utf-8")
+                    + b'" Target="/' + escape(target, {'"': "&quot;"}).encode("utf-8") + b'"/>')
+    end = rels.rindex(b"</")
+    return rels[:end] + relationship + rels[end:]
+
+
+def merge_shared_strings(original_zf, saved_zf):
+    """
+    Description
+    -----------
+    Merge the shared strings of a saved workbook into the shared strings
+    of the workbook it was loaded from, so sheets copied from the original
+    workbook keep pointing to the right strings. The original strings keep
+    their places (and their rich text), and the strings that are new in the
+    saved workbook are added after them.
+
+    Parameters
+    ----------
+    original_zf : MappedZip
+        The package of the original workbook.
+    saved_zf : MappedZip
+        The package of the saved workbook.
+
+    Returns
+    -------
+    tuple
+        Tuple of the form (shared_strings, mapping), where shared_strings
+        is the new shared strings part as bytes (None if the original part
+        can be used as it is), and mapping is a list of the new index of
+        each shared string of the saved workbook (None if the indexes
+        do not change).
+
+    Imports
+    -------
+    re
+    .read_shared_strings
+
+    Examples
+    --------
+    >>> shared_strings, mapping = merge_shared_strings(original_zf, saved_zf)
+    >>> mapping
+    [0, 1, 5, 12]
+    """
+    original_strings = read_shared_strings(original_zf)
+    index = {}
+    for position, string in enumerate(original_strings):
+        index.setdefault(string, position)
+
+    new_strings = []
+    mapping = []
+    for string in read_shared_strings(saved_zf):
+        if string not in index:
+            index[string] = len(original_strings) + len(new_strings)
+            new_strings.append(string)
+        mapping.append(index[string])
+    if mapping == list(range(len(mapping))):
+        mapping = None
+    if not new_strings:
+        return None, mapping
+
+    # add the new strings at the end of the original shared strings
+    xml = original_zf.read(get_shared_strings_part(original_zf))
+    start = SST_START_PATTERN.search(xml)
+    prefix = start.group(1)
+    opening = COUNT_ATTRIBUTE_PATTERN.sub(b"", start.group(0)[:-len(start.group(2)) - 1].rstrip())
+    opening += b' uniqueCount="%d">' % (len(original_strings) + len(new_strings))
+    items = b"".join(b"<" + prefix + b'si><' + prefix + b't xml:space="preserve">'
+                     + escape(string).encode("utf-8")
+                     + b"</" + prefix + b"t></" + prefix + b"si>" for string in new_strings)
+    if start.group(2):
+        return xml[:start.start()] + opening + items + b"</" + prefix + b"sst>" + xml[start.end():], mapping
+    end = xml.rindex(b"</")
+    return xml[:start.start()] + opening + xml[start.end():end] + items + xml[end:], mapping
+
+
+def splice_unloaded_sheets(file_path, saved_file_path, sheets, new_file_path=None,
+                           compression=zipfile.ZIP_DEFLATED):
+    """
+    Description
+    -----------
+    Put the sheets that were not loaded back into a workbook saved by
+    openpyxl, copied from the file the workbook was loaded from (see
+    `load_sheet_subset`). The placeholder of each sheet is replaced with
+    its original part, which is copied without decompressing it, along
+    with the parts it depends on. The shared strings are merged so the
+    copied sheets and the saved sheets both point to the right strings.
+
+    If the saved workbook has no shared strings (openpyxl can write
+    strings inline), the original shared strings are copied as they are.
+
+    The cell styles of the copied sheets stay valid, since openpyxl keeps
+    the cell formats of the workbook it loaded in order, and adds new
+    ones after them.
+
+    Parameters
+    ----------
+    file_path : str
+        The file path of the workbook the sheets were not loaded from.
+    saved_file_path : str
+        The file path of the workbook saved by openpyxl.
+    sheets : list
+        The names of the sheets that were not loaded.
+    new_file_path : str, optional
+        The file path to write the new workbook to.
+        Default is None, which rewrites the saved workbook in place.
+    compression : int, optional
+        The compression used for the parts that are rewritten (the copied
+        parts keep the compression they have).
+        Default is zipfile.ZIP_DEFLATED.
+
+    Returns
+    -------
+    str
+        The file path of the new workbook.
+
+    Raises
+    ------
+    ValueError
+        If any of the sheets is not in both workbooks.
+
+    Imports
+    -------
+    re
+    zipfile
+    .get_sheet_parts
+    .mapped_zip
+    .read_shared_strings
+    .rewrite_package
+
+    Examples
+    --------
+    >>> wb = load_sheet_subset("report.xlsx", ["Inputs"])
+    >>> wb.save("report_saved.xlsx")
+    >>> splice_unloaded_sheets("report.xlsx", "report_saved.xlsx", get_unloaded_sheets(wb))
+    'report_saved.xlsx'
+    """
+    copy_parts = {}
+    replace_parts = {}
+
+    with get_mapped_zip(file_path) as original_zf, get_mapped_zip(saved_file_path) as saved_zf:
+        original_parts = get_sheet_parts(original_zf)
+        saved_parts = get_sheet_parts(saved_zf)
+        missing = [sheet for sheet in sheets if sheet not in original_parts or sheet not in saved_parts]
+        if missing:
+            raise ValueError(f"The sheets {missing} are not in both {file_path} and {saved_file_path}.")
+
+        # copy each sheet over its placeholder, with the parts it depends on
+        used = set(saved_zf.NameToInfo)
+        copied = {}
+        for sheet in sheets:
+            sheet_copied, sheet_rels = copy_sheet_closure(
+                original_zf, original_parts[sheet], saved_parts[sheet], used)
+            copied.update(sheet_copied)
+            replace_parts.update(sheet_rels)
+        copy_parts.update({new_name: (file_path, old_name) for new_name, old_name in copied.items()})
+
+        # the copied sheets point to the original shared strings
+        # if the saved workbook has none (its strings are all inline),
+        # copy them over as they are
+        original_strings_part = get_shared_strings_part(original_zf)
+        saved_strings_part = get_shared_strings_part(saved_zf)
+        if original_strings_part is not None and saved_strings_part is None:
+            saved_strings_part = get_free_part_name(original_strings_part, used)
+            copied[saved_strings_part] = original_strings_part
+            workbook_part = get_workbook_part(saved_zf)
+            replace_parts[get_rels_part(workbook_part)] = add_relationship(
+                saved_zf.read(get_rels_part(workbook_part)), SHARED_STRINGS_TYPE, saved_strings_part)
+            copy_parts[saved_strings_part] = (file_path, original_strings_part)
+
+        # otherwise merge the shared strings,
+        # and point the saved sheets to the merged strings
+        elif original_strings_part is not None:
+            shared_strings, mapping = merge_shared_strings(original_zf, saved_zf)
+            if shared_strings is None:
+                copy_parts[saved_strings_part] = (file_path, original_strings_part)
+            else:
+                replace_parts[saved_strings_part] = shared_strings
+            if mapping is not None:
+                def remap(match):
+                    return match.group(1) + b"<v>%d</v>" % mapping[int(match.group(2))]
+                for sheet, part in saved_parts.items():
+                    if sheet not in sheets and "worksheets/" in part:
+                        replace_parts[part] = SHARED_STRING_CELL_PATTERN.sub(remap, saved_zf.read(part))
+
+        # register the content types of the parts that are new
+        replace_parts["[Content_Types].xml"] = add_content_types(
+            saved_zf.read("[Content_Types].xml"), original_zf.read("[Content_Types].xml"), copied)
+
+    return rewrite_package(saved_file_path, new_file_path, replace_parts=replace_parts,
+                           compression=compression, copy_parts=copy_parts)
@@ -0,0 +1,399 @@
+"""
+staging_cache.py
+"""
+import concurrent.futures
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+
+# the size of the reads and writes of a transfer, large so a file
+# crosses the network in few round trips
+TRANSFER_CHUNK_SIZE = 8 << 20
+
+# the number of transfers to or from the share at once
+DEFAULT_MAX_TRANSFERS = 4
+
+# the name of the file that describes each staged file
+ENTRY_FILE = "entry.json"
+
+
+def _transfer(source_path, target_path):
+    # copy a file with large sequential reads and writes, hashing it as
+    # it goes, to a temporary file next to the target that replaces it
+    # at the end, so the target is never half written
+    digest = hashlib.sha256()
+    size = 0
+    directory = os.path.dirname(os.path.abspath(target_path))
+    fd, temp_path = tempfile.mkstemp(prefix=".", suffix=".tmp", dir=directory)
+    try:
+        with open(source_path, "rb", buffering=0) as source, os.fdopen(fd, "wb") as target:
+            for chunk in iter(lambda: source.read(TRANSFER_CHUNK_SIZE), b""):
+                digest.update(chunk)
+                target.write(chunk)
+                size += len(chunk)
+        os.replace(temp_path, target_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return size, digest.hexdigest()
+
+
+def _hash_file(file_path):
+    # the SHA-256 hash of a local file
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(TRANSFER_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class StagingCache:
+    """
+    Description
+    -----------
+    A local copy of the workbooks of a slow file share (like an SMB share),
+    so each one crosses the network once: `stage` copies a file to the
+    local directory the first time it is asked for, and gives the local
+    copy after that, as long as the file on the share keeps its size and
+    modification time (checked with one stat of the share). Saves are
+    written to the local directory and sent back with `upload`, in one
+    sequential copy that replaces the file on the share at the end.
+
+    Only max_transfers copies to or from the share run at once (in this
+    process). Each staged file is kept in a folder of its own, named by the
+    hash of its path on the share, with its own file name, and an entry.json
+    file with the size, modification time and SHA-256 hash it was copied with.
+
+    Parameters
+    ----------
+    cache_dir : str
+        The local directory to keep the copies in. Made if it is not there.
+    max_transfers : int, optional
+        The number of copies to or from the share to run at once.
+        Default is 4.
+    checksum : bool, optional
+        Whether to also check the local copy against the hash it was
+        copied with each time it is staged, which reads the local copy
+        (but not the share), so a local copy that was changed or damaged
+        is copied again.
+        Default is False.
+
+    Attributes
+    ----------
+    stats : dict
+        The number of staged files that were already copied ('hits'), of
+        copies from and to the share ('downloads' and 'uploads'), and of
+        the bytes they sent ('bytes_downloaded' and 'bytes_uploaded').
+
+    Raises
+    ------
+    ValueError
+        If max_transfers is less than 1.
+
+    Examples
+    --------
+    >>> cache = StagingCache("/local/staging", max_transfers=2)
+    >>> cache.stage("/mnt/finance/report_3Q2024.xlsx")
+    '/local/staging/4f1c2a9e0b7d3e55/report_3Q2024.xlsx'
+    >>> cache.stats
+    {'hits': 0, 'downloads': 1, 'uploads': 0, 'bytes_downloaded': 10485760, 'bytes_uploaded': 0}
+    """
+    def __init__(self, cache_dir, max_transfers=DEFAULT_MAX_TRANSFERS, checksum=False):
+        if max_transfers < 1:
+            raise ValueError(f"max_transfers must be at least 1, not {max_transfers}.")
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_transfers = max_transfers
+        self.checksum = checksum
+        self.stats = {'hits': 0, 'downloads': 0, 'uploads': 0, 'bytes_downloaded': 0, 'bytes_uploaded': 0}
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._init_locks()
+
+    def _init_locks(self):
+        # the limit on the transfers, and a lock for each staged file,
+        # so a file that is asked for by two threads at once is copied once
+        self._transfers = threading.BoundedSemaphore(self.max_transfers)
+        self._lock = threading.Lock()
+        self._entry_locks = {}
+
+    def __getstate__(self):
+        # locks cannot be sent to worker processes, which make their own
+        state = dict(self.__dict__)
+        for name in ("_transfers", "_lock", "_entry_locks"):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_locks()
+
+    def _get_entry_dir(self, file_path):
+        # the folder of the copy of a file of the share
+        key = os.path.normcase(os.path.abspath(file_path))
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode("utf-8")).hexdigest()[:16])
+
+    def _get_entry_lock(self, entry_dir):
+        with self._lock:
+            return self._entry_locks.setdefault(entry_dir, threading.Lock())
+
+    def _read_entry(self, entry_dir):
+        try:
+            with open(os.path.join(entry_dir, ENTRY_FILE), encoding="utf-8") as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return None
+
+    def _write_entry(self, entry_dir, entry):
+        fd, temp_path = tempfile.mkstemp(prefix=".", suffix=".tmp", dir=entry_dir)
+        with os.fdopen(fd, "w", encoding="utf-8") as fh:
+            json.dump(entry, fh, indent=4)
+        os.replace(temp_path, os.path.join(entry_dir, ENTRY_FILE))
+
+    def get_local_path(self, file_path):
+        """
+        Description
+        -----------
+        Get the file path of the local copy of a file of the share,
+        whether or not it was staged.
+
+        Parameters
+        ----------
+        file_path : str
+            The file path of the file on the share.
+
+        Returns
+        -------
+        str
+            The file path of its local copy.
+
+        Examples
+        --------
+        >>> cache.get_local_path("/mnt/finance/report_3Q2024.xlsx")
+        '/local/staging/4f1c2a9e0b7d3e55/report_3Q2024.xlsx'
+        """
+        return os.path.join(self._get_entry_dir(file_path), os.path.basename(file_path))
+
+    def is_staged(self, file_path, stat=None):
+        """
+        Description
+        -----------
+        Check whether the local copy of a file of the share is up to
+        date: it was copied with the size and modification time the file
+        has now, and (with checksum) it still has the hash it was copied with.
+
+        Parameters
+        ----------
+        file_path : str
+            The file path of the file on the share.
+        stat : os.stat_result, optional
+            The stat of the file on the share, if it was already read.
+            Default is None, which reads it.
+
+        Returns
+        -------
+        bool
+            True if the local copy is up to date.
+
+        Raises
+        ------
+        FileNotFoundError
+            If the file is not on the share.
+
+        Examples
+        --------
+        >>> cache.is_staged("/mnt/finance/report_3Q2024.xlsx")
+        True
+        """
+        if stat is None:
+            stat = os.stat(file_path)
+        entry_dir = self._get_entry_dir(file_path)
+        entry = self._read_entry(entry_dir)
+        local_path = self.get_local_path(file_path)
+        if entry is None or entry['size'] != stat.st_size or entry['mtime_ns'] != stat.st_mtime_ns:
+            return False
+        try:
+            if os.path.getsize(local_path) != entry['size']:
+                return False
+        except OSError:
+            return False
+        return not self.checksum or _hash_file(local_path) == entry['sha256']
+
+    def stage(self, file_path):
+        """
+        Description
+        -----------
+        Get the local copy of a file of the share, copying the file first
+        if it was not copied before or changed since (see `is_staged`).
+        The copy is one sequential read of the file.
+
+        Parameters
+        ----------
+        file_path : str
+            The file path of the file on the share.
+
+        Returns
+        -------
+        str
+            The file path of its local copy.
+
+        Raises
+        ------
+        FileNotFoundError
+            If the file is not on the share.
+        OSError
+            If the file changed while it was copied.
+
+        Imports
+        -------
+        hashlib
+        json
+        os
+        tempfile
+        threading
+
+        Examples
+        --------
+        >>> cache.stage("/mnt/finance/report_3Q2024.xlsx")
+        '/local/staging/4f1c2a9e0b7d3e55/report_3Q2024.xlsx'
+        """
+        entry_dir = self._get_entry_dir(file_path)
+        local_path = self.get_local_path(file_path)
+        with self._get_entry_lock(entry_dir):
+            stat = os.stat(file_path)
+            if self.is_staged(file_path, stat=stat):
+                self.stats['hits'] += 1
+                return local_path
+
+            os.makedirs(entry_dir, exist_ok=True)
+            with self._transfers:
+                size, sha256 = _transfer(file_path, local_path)
+            if size != stat.st_size:
+                raise OSError(f"The file {file_path} changed while it was copied. Stage it again.")
+            self._write_entry(entry_dir, {'file_path': os.path.abspath(file_path), 'size': stat.st_size,
+                                          'mtime_ns': stat.st_mtime_ns, 'sha256': sha256})
+            self.stats['downloads'] += 1
+            self.stats['bytes_downloaded'] += size
+        return local_path
+
+    def stage_many(self, file_paths):
+        """
+        Description
+        -----------
+        Stage many files of the share, max_transfers at a time.
+
+        Parameters
+        ----------
+        file_paths : list
+            The file paths of the files on the share.
+
+        Returns
+        -------
+        dict
+            Dictionary of the file paths of the local copies, keyed by
+            the file paths on the share. The files that could not be staged
+            are left out, so they fail with their error when they are used.
+
+        Imports
+        -------
+        concurrent.futures
+
+        Examples
+        --------
+        >>> cache.stage_many(["/mnt/finance/a.xlsx", "/mnt/finance/b.xlsx"])
+        {'/mnt/finance/a.xlsx': '/local/staging/0a1b2c3d4e5f6a7b/a.xlsx', ...}
+        """
+        local_paths = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_transfers) as executor:
+            futures = {file_path: executor.submit(self.stage, file_path) for file_path in dict.fromkeys(file_paths)}
+            for file_path, future in futures.items():
+                try:
+                    local_paths[file_path] = future.result()
+                except OSError:
+                    continue
+        return local_paths
+
+    def get_upload_path(self, file_path):
+        """
+        Description
+        -----------
+        Get a new local file path to save a file to before it is uploaded
+        to the share with `upload`, with the file extension of the file.
+
+        Parameters
+        ----------
+        file_path : str
+            The file path the file will have on the share.
+
+        Returns
+        -------
+        str
+            The local file path to save the file to.
+
+        Examples
+        --------
+        >>> cache.get_upload_path("/mnt/finance/report_4Q2024.xlsx")
+        '/local/staging/9c0d1e2f3a4b5c6d/.upload_k2j4h1.xlsx'
+        """
+        entry_dir = self._get_entry_dir(file_path)
+        os.makedirs(entry_dir, exist_ok=True)
+        fd, upload_path = tempfile.mkstemp(prefix=".upload_", suffix=os.path.splitext(file_path)[1], dir=entry_dir)
+        os.close(fd)
+        return upload_path
+
+    def upload(self, local_path, file_path):
+        """
+        Description
+        -----------
+        Upload a local file to the share, in one sequential copy to a
+        temporary file next to the file on the share, which replaces it
+        at the end, so the file on the share is never half written. The
+        local file then becomes the local copy of the file, so staging it
+        again does not copy it back.
+
+        Parameters
+        ----------
+        local_path : str
+            The file path of the local file, usually from `get_upload_path`.
+            It is moved into the cache if it is from `get_upload_path`,
+            and copied otherwise.
+        file_path : str
+            The file path to upload the file to on the share.
+
+        Returns
+        -------
+        str
+            The file path of the uploaded file on the share.
+
+        Imports
+        -------
+        os
+        tempfile
+
+        Examples
+        --------
+        >>> local_path = cache.get_upload_path("/mnt/finance/report_4Q2024.xlsx")
+        >>> wb.save(local_path)
+        >>> cache.upload(local_path, "/mnt/finance/report_4Q2024.xlsx")
+        '/mnt/finance/report_4Q2024.xlsx'
+        """
+        entry_dir = self._get_entry_dir(file_path)
+        target_path = self.get_local_path(file_path)
+        with self._get_entry_lock(entry_dir):
+            with self._transfers:
+                size, sha256 = _transfer(local_path, file_path)
+            stat = os.stat(file_path)
+
+            # keep the uploaded file as the local copy
+            os.makedirs(entry_dir, exist_ok=True)
+            if os.path.dirname(os.path.abspath(local_path)) == entry_dir:
+                os.replace(local_path, target_path)
+            elif os.path.abspath(local_path) != target_path:
+                _transfer(local_path, target_path)
+            self._write_entry(entry_dir, {'file_path': os.path.abspath(file_path), 'size': stat.st_size,
+                                          'mtime_ns': stat.st_mtime_ns, 'sha256': sha256})
+            self.stats['uploads'] += 1
+            self.stats['bytes_uploaded'] += size
+        return file_path
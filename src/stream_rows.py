@@ -0,0 +1,507 @@
+"""
+stream_rows.py
+"""
+import datetime
+import math
+import re
+from xml.sax.saxutils import escape
+
+from openpyxl.utils.datetime import WINDOWS_EPOCH, to_excel
+
+from .column_letter_from_index import column_letter_from_index
+from .date_styles import read_date_styles
+from .excel_dates import get_workbook_epoch
+from .get_sheet_parts import get_sheet_parts
+from .mapped_zip import get_mapped_zip
+from .rewrite_package import rewrite_package
+
+
+# characters that are not allowed in xml, and are dropped from strings
+ILLEGAL_XML_CHARACTERS = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+# the start and end tags of the sheet data, with an optional namespace prefix
+SHEET_DATA_START = re.compile(rb"<((?:\w+:)?)sheetData\b[^>]*?(/?)>")
+DIMENSION_TAG = re.compile(rb"<(?:\w+:)?dimension\b[^>]*/>")
+
+# the start tag of a row, and its row number
+ROW_START = re.compile(rb"<(?:\w+:)?row\b([^>]*)>")
+ROW_NUMBER = re.compile(rb'\br="(\d+)"')
+
+
+def split_sheet_xml(fh, chunk_size=1 << 20):
+    """
+    Description
+    -----------
+    Split the xml of a worksheet part into the part before the sheet data
+    (sheet properties, views, column widths, ...) and the part after it
+    (merged cells, page setup, ...), without keeping the rows of the
+    sheet data in memory. The rows are read through in chunks and dropped.
+
+    The dimension element is removed from the part before the sheet data,
+    since it no longer describes the rows that replace the sheet data.
+
+    Parameters
+    ----------
+    fh : file object
+        The worksheet part, opened for reading in binary mode.
+    chunk_size : int, optional
+        The number of bytes to read at a time.
+        Default is 1 MB.
+
+    Returns
+    -------
+    tuple
+        Tuple of the form (prefix, suffix, tag_prefix), where prefix is the
+        xml before the sheet data, suffix is the xml after the sheet data,
+        and tag_prefix is the namespace prefix used on the tags
+        (usually b"").
+
+    Raises
+    ------
+    ValueError
+        If the worksheet part has no sheet data.
+
+    Imports
+    -------
+    re
+
+    Examples
+    --------
+    >>> with zf.open("xl/worksheets/sheet1.xml") as fh:
+    ...     prefix, suffix, tag_prefix = split_sheet_xml(fh)
+    >>> prefix[-20:]
+    b'defaultRowHeight="15" />'
+    >>> suffix[:12]
+    b'<pageMargins'
+    """
+    # read until the start tag of the sheet data is found
+    buffer = b""
+    while True:
+        match = SHEET_DATA_START.search(buffer)
+        if match is not None:
+            break
+        chunk = fh.read(chunk_size)
+        if not chunk:
+            raise ValueError("The worksheet part has no sheet data.")
+        buffer += chunk
+
+    tag_prefix = match.group(1)
+    prefix = DIMENSION_TAG.sub(b"", buffer[:match.start()])
+    buffer = buffer[match.end():]
+
+    # if the sheet data is empty (<sheetData/>), the rest is the suffix
+    if match.group(2) == b"/":
+        return prefix, buffer + fh.read(), tag_prefix
+
+    # otherwise read through the rows until the end tag is found,
+    # keeping only enough of the buffer to match the end tag
+    end_tag = b"</" + tag_prefix + b"sheetData>"
+    while True:
+        position = buffer.find(end_tag)
+        if position >= 0:
+            return prefix, buffer[position + len(end_tag):] + fh.read(), tag_prefix
+        chunk = fh.read(chunk_size)
+        if not chunk:
+            raise ValueError("The worksheet part has no end to its sheet data.")
+        buffer = buffer[-len(end_tag):] + chunk
+
+
+def copy_sheet_rows(fh, dst, chunk_size=1 << 20):
+    """
+    Description
+    -----------
+    Copy the xml of a worksheet part up to the end of the rows of its
+    sheet data (without the end tag), so rows can be added after the
+    rows it has, and get the part after the sheet data. The rows are read
+    through in chunks as they are copied, and the number of the last row
+    is kept as they go by.
+
+    The dimension element is removed, as by `split_sheet_xml`.
+
+    Parameters
+    ----------
+    fh : file object
+        The worksheet part, opened for reading in binary mode.
+    dst : file object
+        The file object to write to, opened for writing in binary mode.
+    chunk_size : int, optional
+        The number of bytes to read at a time.
+        Default is 1 MB.
+
+    Returns
+    -------
+    tuple
+        Tuple of the form (suffix, tag_prefix, last_row), where suffix is
+        the xml after the sheet data, tag_prefix is the namespace prefix
+        used on the tags, and last_row is the number of the last row of
+        the sheet data (0 if it has none).
+
+    Raises
+    ------
+    ValueError
+        If the worksheet part has no sheet data.
+
+    Imports
+    -------
+    re
+
+    Examples
+    --------
+    >>> with zf.open("xl/worksheets/sheet1.xml") as fh:
+    ...     suffix, tag_prefix, last_row = copy_sheet_rows(fh, dst)
+    >>> last_row
+    250001
+    """
+    # read until the start tag of the sheet data is found
+    buffer = b""
+    while True:
+        match = SHEET_DATA_START.search(buffer)
+        if match is not None:
+            break
+        chunk = fh.read(chunk_size)
+        if not chunk:
+            raise ValueError("The worksheet part has no sheet data.")
+        buffer += chunk
+
+    tag_prefix = match.group(1)
+    dst.write(DIMENSION_TAG.sub(b"", buffer[:match.start()]))
+    dst.write(b"<" + tag_prefix + b"sheetData>")
+    buffer = buffer[match.end():]
+
+    # if the sheet data is empty (<sheetData/>), there are no rows
+    if match.group(2) == b"/":
+        return buffer + fh.read(), tag_prefix, 0
+
+    def count_rows(data, last_row):
+        # rows without a row number follow the row before them
+        for row in ROW_START.finditer(data):
+            number = ROW_NUMBER.search(row.group(1))
+            last_row = int(number.group(1)) if number is not None else last_row + 1
+        return last_row
+
+    # copy the rows until the end tag is found, up to the last tag that
+    # starts in the buffer, so no row tag is split between two chunks
+    end_tag = b"</" + tag_prefix + b"sheetData>"
+    last_row = 0
+    while True:
+        position = buffer.find(end_tag)
+        if position >= 0:
+            last_row = count_rows(buffer[:position], last_row)
+            dst.write(buffer[:position])
+            return buffer[position + len(end_tag):] + fh.read(), tag_prefix, last_row
+        chunk = fh.read(chunk_size)
+        if not chunk:
+            raise ValueError("The worksheet part has no end to its sheet data.")
+        cut = buffer.rfind(b"<")
+        if cut > 0:
+            last_row = count_rows(buffer[:cut], last_row)
+            dst.write(buffer[:cut])
+            buffer = buffer[cut:]
+        buffer += chunk
+
+
+def format_cell_xml(ref, value, prefix="", style=None, shared_strings=None, epoch=WINDOWS_EPOCH,
+                    date_styles=None):
+    """
+    Description
+    -----------
+    Get the xml of a cell with a value. Numbers are written as numbers,
+    booleans as booleans, dates, times and timedeltas as Excel serial
+    numbers (in the date system of the workbook, with a date format), strings
+    starting with "=" as formulas, and all other strings as inline strings
+    (so the shared strings of the workbook do not change), unless they are
+    given shared strings. A None value gives an empty cell, which only
+    keeps its style.
+
+    Parameters
+    ----------
+    ref : str
+        The reference of the cell, e.g. "B2".
+    value : object
+        The value of the cell.
+    prefix : str, optional
+        The namespace prefix to use on the tags.
+        Default is "".
+    style : str, optional
+        The index of the cell format of the cell (its s attribute).
+        Default is None, which gives the cell the default format.
+    shared_strings : dict, optional
+        Dictionary where the keys are strings and the values are their
+        indexes in the shared strings of the workbook. Strings in it are
+        written as shared strings.
+        Default is None, which writes every string as an inline string.
+    epoch : datetime.datetime, optional
+        The date system of the workbook, as given by `wb.epoch` or
+        `get_workbook_epoch`.
+        Default is openpyxl.utils.datetime.WINDOWS_EPOCH (the 1900 date system).
+    date_styles : DateStyles, optional
+        The cell formats of the workbook, which give dates and times a
+        cell format with a date format (see `DateStyles.get_style`).
+        Default is None, which writes them with the style given.
+
+    Returns
+    -------
+    str
+        The xml of the cell.
+
+    Imports
+    -------
+    datetime
+    math
+    xml.sax.saxutils
+    openpyxl.utils.datetime
+
+    Examples
+    --------
+    >>> format_cell_xml("B2", 10.5)
+    '<c r="B2"><v>10.5</v></c>'
+    >>> format_cell_xml("A1", "Total", style="3")
+    '<c r="A1" s="3" t="inlineStr"><is><t xml:space="preserve">Total</t></is></c>'
+    >>> format_cell_xml("A1", "Total", shared_strings={"Total": 12})
+    '<c r="A1" t="s"><v>12</v></c>'
+    >>> format_cell_xml("A2", datetime.date(2024, 1, 1), date_styles=date_styles)
+    '<c r="A2" s="7"><v>45292</v></c>'
+    """
+    cell_tag = prefix + "c"
+    if date_styles is not None:
+        style = date_styles.get_style(value, style)
+    attributes = f' r="{ref}"' if style is None else f' r="{ref}" s="{style}"'
+    if value is None:
+        return f"<{cell_tag}{attributes}/>"
+    if isinstance(value, bool):
+        return f'<{cell_tag}{attributes} t="b"><{prefix}v>{int(value)}</{prefix}v></{cell_tag}>'
+    if isinstance(value, (int, float)):
+        if isinstance(value, float) and not math.isfinite(value):
+            return f'<{cell_tag}{attributes} t="e"><{prefix}v>#NUM!</{prefix}v></{cell_tag}>'
+        return f'<{cell_tag}{attributes}><{prefix}v>{value!r}</{prefix}v></{cell_tag}>'
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time, datetime.timedelta)):
+        # pandas.NaT is a datetime without a serial number
+        serial = to_excel(value, epoch)
+        if serial is None:
+            return f"<{cell_tag}{attributes}/>"
+        return f'<{cell_tag}{attributes}><{prefix}v>{serial!r}</{prefix}v></{cell_tag}>'
+    text = ILLEGAL_XML_CHARACTERS.sub("", str(value))
+    if text.startswith("=") and len(text) > 1:
+        return f'<{cell_tag}{attributes}><{prefix}f>{escape(text[1:])}</{prefix}f></{cell_tag}>'
+    if shared_strings is not None and text in shared_strings:
+        return f'<{cell_tag}{attributes} t="s"><{prefix}v>{shared_strings[text]}</{prefix}v></{cell_tag}>'
+    return (f'<{cell_tag}{attributes} t="inlineStr"><{prefix}is>'
+            f'<{prefix}t xml:space="preserve">{escape(text)}</{prefix}t>'
+            f'</{prefix}is></{cell_tag}>')
+
+
+def write_sheet_rows(dst, rows, start_row=1, tag_prefix=b"", flush_rows=1000, epoch=WINDOWS_EPOCH,
+                     date_styles=None):
+    """
+    Description
+    -----------
+    Write rows of values as the rows of a worksheet's sheet data,
+    one row at a time, so the rows can come from a generator and
+    are never all in memory at once.
+
+    Each value is written as by `format_cell_xml`: numbers as numbers,
+    dates and times as serial numbers with a date format, strings starting
+    with "=" as formulas, and other strings as inline strings (so the
+    shared strings of the workbook do not change). None values are left empty.
+
+    Parameters
+    ----------
+    dst : file object
+        The file object to write to, opened for writing in binary mode.
+    rows : iterable
+        Iterable of rows, where each row is an iterable of values.
+    start_row : int, optional
+        The row number of the first row.
+        Default is 1.
+    tag_prefix : bytes, optional
+        The namespace prefix to use on the tags.
+        Default is b"".
+    flush_rows : int, optional
+        The number of rows to build up before writing them to dst.
+        Default is 1000.
+    epoch : datetime.datetime, optional
+        The date system of the workbook (see `format_cell_xml`).
+        Default is openpyxl.utils.datetime.WINDOWS_EPOCH.
+    date_styles : DateStyles, optional
+        The cell formats of the workbook (see `format_cell_xml`).
+        Default is None.
+
+    Returns
+    -------
+    int
+        The number of rows written.
+
+    Imports
+    -------
+    .column_letter_from_index
+
+    Examples
+    --------
+    >>> write_sheet_rows(dst, [["id", "amount"], [1, 10.5], [2, 11.25]])
+    3
+    """
+    prefix = tag_prefix.decode("ascii")
+    row_tag = prefix + "row"
+
+    # the column letters, built as they are needed
+    letters = [""]
+
+    # the rows that have been built but not written yet
+    pending = []
+    row_count = 0
+
+    for row_number, row in enumerate(rows, start=start_row):
+        cells = []
+        for column_number, value in enumerate(row, start=1):
+            # empty cells are not written
+            if value is None:
+                continue
+
+            # get the reference of the cell
+            while len(letters) <= column_number:
+                letters.append(column_letter_from_index(len(letters)))
+
+            # write the cell according to the type of the value
+            cells.append(format_cell_xml(f"{letters[column_number]}{row_number}", value, prefix,
+                                         epoch=epoch, date_styles=date_styles))
+
+        pending.append(f'<{row_tag} r="{row_number}">{"".join(cells)}</{row_tag}>')
+        row_count += 1
+
+        # write the pending rows every so often, to keep memory flat
+        if len(pending) >= flush_rows:
+            dst.write("".join(pending).encode("utf-8"))
+            pending = []
+
+    dst.write("".join(pending).encode("utf-8"))
+    return row_count
+
+
+def stream_rows(file_path, sheet_name, rows, start_row=None, new_filename=None, replace=False):
+    """
+    Description
+    -----------
+    Append rows from an iterable (usually a generator) to a sheet in a
+    workbook file, after the rows it has, or replace its rows with them
+    (with replace), without loading the workbook.
+
+    The rows are written straight into the xml of the sheet as they
+    are produced, and the new sheet is spliced into the existing workbook
+    package. Every other part of the package is copied as it is, and the
+    sheet keeps everything outside of its rows (column widths, views,
+    merged cells, page setup). When appending, the rows the sheet has are
+    copied through as they are. Memory use stays flat no matter how many
+    rows are written.
+
+    Dates and times are written in the date system of the workbook, and
+    the cell formats they need are added to the styles of the workbook.
+
+    The calculation chain of the workbook is dropped,
+    since it can refer to formulas in the replaced rows.
+    Excel rebuilds it the next time the workbook is opened.
+
+    Parameters
+    ----------
+    file_path : str
+        The file path of the workbook. Must be an .xlsx, .xlsm, or .xltx file.
+    sheet_name : str
+        The name of the sheet to write the rows to.
+    rows : iterable
+        Iterable of rows, where each row is an iterable of values.
+        See `write_sheet_rows` for how each value is written.
+    start_row : int, optional
+        The row number of the first row. When appending, it must be after
+        the last row of the sheet.
+        Default is None, which starts after the last row of the sheet,
+        or at row 1 with replace.
+    new_filename : str, optional
+        The file path to save the new workbook to.
+        Default is None, which rewrites the workbook in place.
+    replace : bool, optional
+        Whether to replace the rows of the sheet instead of appending to them.
+        Default is False.
+
+    Returns
+    -------
+    int
+        The number of rows written.
+
+    Raises
+    ------
+    ValueError
+        If the workbook is an xlsb file.
+    ValueError
+        If the sheet is not in the workbook.
+    ValueError
+        If appending, and start_row is not after the last row of the sheet.
+
+    Imports
+    -------
+    .date_styles
+    .excel_dates
+    .get_sheet_parts
+    .mapped_zip
+    .rewrite_package
+
+    Examples
+    --------
+    >>> def detail_rows():
+    ...     yield ["policy", "premium"]
+    ...     for policy, premium in read_policies():
+    ...         yield [policy, premium]
+    >>> stream_rows("report.xlsx", "Detail", detail_rows(), new_filename="report_new.xlsx", replace=True)
+    250001
+    >>> stream_rows("report_new.xlsx", "Detail", ([policy, premium] for policy, premium in late_policies()))
+    120
+    """
+    # check that the workbook is not an xlsb file
+    if file_path.lower().endswith(".xlsb"):
+        raise ValueError(f"The workbook {file_path} is an xlsb file, which cannot be streamed to.")
+
+    # find the part of the sheet
+    with get_mapped_zip(file_path) as zf:
+        sheet_parts = get_sheet_parts(zf)
+        if sheet_name not in sheet_parts:
+            raise ValueError(f"The sheet name \"{sheet_name}\" is not in the workbook.")
+        sheet_part = sheet_parts[sheet_name]
+        epoch = get_workbook_epoch(zf)
+        date_styles = read_date_styles(zf)
+
+    # the number of rows written, filled in while the sheet is written
+    row_count = []
+
+    def write_sheet(dst):
+        with get_mapped_zip(file_path) as zf, zf.open(sheet_part) as fh:
+            if replace:
+                # split the sheet around its rows, which are dropped
+                prefix, suffix, tag_prefix = split_sheet_xml(fh)
+                dst.write(prefix)
+                dst.write(b"<" + tag_prefix + b"sheetData>")
+                first_row = 1 if start_row is None else start_row
+            else:
+                # copy the rows the sheet has, and add the new ones after them
+                suffix, tag_prefix, last_row = copy_sheet_rows(fh, dst)
+                first_row = last_row + 1 if start_row is None else start_row
+                if first_row <= last_row:
+                    raise ValueError(f"The rows cannot start at row {first_row}, since the sheet "
+                                     f"\"{sheet_name}\" has rows up to row {last_row}. "
+                                     f"Use replace=True to replace its rows.")
+        row_count.append(write_sheet_rows(dst, rows, start_row=first_row, tag_prefix=tag_prefix,
+                                          epoch=epoch, date_styles=date_styles))
+        dst.write(b"</" + tag_prefix + b"sheetData>")
+        dst.write(suffix)
+
+    # splice the new sheet into the workbook package, with the styles
+    # written after it, once the cell formats of its dates are known
+    replace_parts = {sheet_part: write_sheet}
+    if date_styles.part is not None:
+        replace_parts[date_styles.part] = date_styles.write_xml
+    rewrite_package(
+        file_path,
+        new_filename,
+        replace_parts=replace_parts,
+        drop_parts={"xl/calcChain.xml"},
+        write_last={date_styles.part},
+        )
+
+    return row_count[0]
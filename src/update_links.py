@@ -5,7 +5,6 @@ update_links.py
 import pyxlsb
 import openpyxl
 
-from .find_links import find_links
 from .is_xlsb import is_xlsb
 
 def update_links_pyxlsb(wb, links):
@@ -97,7 +96,7 @@ def update_links_openpyxl(wb, links):
     Parameters
     ----------
     wb : object
-        The workbook object. Must be able to be read by openpyxl.
+        The workbook object. Must be an openpyxl workbook object.
     links : dict
         The dictionary with the current links as keys
         and the desired links as values.
@@ -116,27 +115,32 @@ def update_links_openpyxl(wb, links):
     Raises
     ------
     ValueError
-        If the workbook object is not able to be read by openpyxl.
+        If the workbook object is not an openpyxl workbook object.
+
+    Notes
+    -----
+    The target of each link is the target of the relationship of its
+    external link part (link.file_link.Target), the same as `get_links_openpyxl`
+    gives, and it is written back to that relationship when the workbook is saved.
     """
-    # try to read the workbook with openpyxl
-    # if the workbook is not able to be read by openpyxl, raise a value error
-    try:
-        wb = openpyxl.load_workbook(wb)
-    except:
+    # check that the wb object is an openpyxl workbook object
+    if not isinstance(wb, openpyxl.Workbook):
         raise ValueError("The workbook object wb is " +
-        "not able to be read by openpyxl.")
+        "not an openpyxl workbook object.")
 
-    # get the list of links in the workbook
-    current_links = [link.target for link in wb._external_links]
+    # get the links in the workbook, by their current targets
+    current_links = {}
+    for link in wb._external_links:
+        current_links.setdefault(link.file_link.Target, []).append(link)
 
     # for each link in the dictionary of links
     for link in links:
         # if the link is in the list of links in the workbook
         if link in current_links:
-            # get the index of the link in the list of links in the workbook
-            index = current_links.index(link)
-            # update the link in the list of links in the workbook
-            current_links[index] = links[link]
+            # update the target of the link
+            # (a workbook can link to the same file more than once)
+            for external_link in current_links[link]:
+                external_link.file_link.Target = links[link]
         # if the link is not in the list of links in the workbook
         else:
             # pass a message to the user
@@ -144,9 +148,6 @@ def update_links_openpyxl(wb, links):
             # continue to the next link
             continue
 
-    # update the links in the workbook
-    wb._external_links = current_links
-
     # return the workbook object
     return wb
 
@@ -195,13 +196,8 @@ def update_links(wb, links):
     }
     >>> wb = update_links(wb, links)
     """
-    # check to make sure the workbook can be read by openpyxl or pyxlsb
-    # if the workbook is not able to be read by openpyxl or pyxlsb, raise a value error
-    try:
-        find_links(wb)
-    except:
-        raise ValueError("The workbook object wb is not able to be read by openpyxl or pyxlsb.")
-
+    # check to make sure the workbook is an openpyxl or pyxlsb workbook object
+    # if it is not, is_xlsb raises a value error
     # if the workbook is an xlsb file
     if is_xlsb(wb):
         # use the update_links_pyxlsb function to update the links
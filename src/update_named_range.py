@@ -2,7 +2,13 @@
 update_named_range.py
 """
 
+import openpyxl
+
 from .get_cells_a1 import get_cells_a1
+from .is_wb import is_wb
+from .is_xlsb import is_xlsb
+from .name_index import get_name_index
+from .values_equal import values_equal
 
 def update_named_range_pyxlsb(wb, named_range, value):
     """
@@ -104,7 +110,7 @@ def update_named_range_pyxlsb(wb, named_range, value):
         workbook[cell_a1] = value_i
 
 
-def update_named_range_openpyxl(wb, named_range, value):
+def update_named_range_openpyxl(wb, named_range, value, elide=False):
     """This function takes a wb object as input,
     named range as input and a value as input,
     and updates the named range with the value.
@@ -119,10 +125,14 @@ def update_named_range_openpyxl(wb, named_range, value):
         Named range.
     value : list
         Value.
+    elide : bool, optional
+        Whether to skip the cells whose values would not change
+        (see `values_equal`). Default is False.
 
     Returns
     -------
-    None
+    int
+        The number of cells written.
 
     Raises
     ------
@@ -152,31 +162,26 @@ def update_named_range_openpyxl(wb, named_range, value):
     >>> update_named_range_xlsx(wb, "named_range", 1)
     None
     """
-    # check that the wb object is a wb object
-    if not isinstance(wb, wb):
+    # check that the wb object is an openpyxl workbook object
+    if not isinstance(wb, openpyxl.Workbook):
         raise ValueError("The wb object is not a wb object.")
 
-    # get the workbook object
-    workbook = wb.active
-
-    # get the named ranges
-    named_ranges = workbook.defined_names.definedName
+    # get the destinations of the named range from the name index
+    # of the workbook, which raises a value error if the name is not found
+    # the index is built once per workbook and caches the parsed
+    # destinations, so the name list is not re-read on every update
+    destinations = get_name_index(wb).get(named_range)
 
-    # check that the named range is found
-    if named_range not in named_ranges:
-        raise ValueError("The named range is not found.")
-
-    # get the named range
-    named_range = named_ranges[named_range]
-
-    # get the cells in the named range
-    cells = named_range.destinations
-
-    # get the cells in A1 notation
-    cells_a1 = get_cells_a1(cells)
+    # get every cell in the named range, in row-major order
+    # and area by area for names with more than one area
+    cells = [
+        (sheet, row, column)
+        for sheet, cell_range in destinations
+        for row, column in cell_range.cells
+        ]
 
     # get the number of cells in the named range
-    number_of_cells = len(cells_a1)
+    number_of_cells = len(cells)
 
     # check that the value is a list of the same length as the named range
     # if the named range is a single cell, the value does not need to be a list
@@ -186,16 +191,19 @@ def update_named_range_openpyxl(wb, named_range, value):
         raise ValueError("The value is not a list of the same length as the named range.")
 
     # loop through the cells in the named range
-    for i in range(number_of_cells):
-        # get the cell in A1 notation
-        cell_a1 = cells_a1[i]
-        # get the value
-        value_i = value[i]
-        # update the cell with the value
-        workbook[cell_a1] = value_i
-
-
-def update_named_range(wb, named_range, value):
+    written = 0
+    for (sheet, row, column), value_i in zip(cells, value):
+        # update the cell with the value,
+        # unless it already has the value and writes are elided
+        cell = wb[sheet].cell(row=row, column=column)
+        if elide and values_equal(cell.value, value_i):
+            continue
+        cell.value = value_i
+        written += 1
+    return written
+
+
+def update_named_range(wb, named_range, value, elide=False):
     """This function combines the two functions above.
     Takes a wb object as input, named range as input and a value as input,
     and updates the named range with the value.
@@ -211,6 +219,9 @@ def update_named_range(wb, named_range, value):
         Named range.
     value : list
         Value.
+    elide : bool, optional
+        Whether to skip the cells whose values would not change,
+        for openpyxl workbooks. Default is False.
 
     Returns
     -------
@@ -242,22 +253,12 @@ def update_named_range(wb, named_range, value):
     None
     """
     # check that the wb object is a wb object
-    if not isinstance(wb, wb):
+    if not is_wb(wb):
         raise ValueError("The wb object is not a wb object.")
 
-    # get the file name
-    file_name = wb.file_name
-
-    # get the file extension
-    file_extension = file_name.split(".")[-1]
-
-    # if the file extension is .xlsb, use the pyxlsb function
-    if file_extension == "xlsb":
+    # if the workbook is an xlsb file, use the pyxlsb function
+    if is_xlsb(wb):
         update_named_range_pyxlsb(wb, named_range, value)
-    # if the file extension is .xlsx, .xlsm, .xltx, or .xlt use the openpyxl function
-    elif file_extension in ["xlsx", "xlsm", "xltx", "xltm"]:
-        update_named_range_openpyxl(wb, named_range, value)
-    # otherwise, raise a value error
+    # otherwise the workbook was opened with openpyxl, use the openpyxl function
     else:
-        raise ValueError("""The wb object does not refer to a file that
-        is one of .xlsx, .xlsm, .xltx, .xltm, or .xlsb.""")
+        update_named_range_openpyxl(wb, named_range, value, elide=elide)
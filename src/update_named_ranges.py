@@ -0,0 +1,212 @@
+"""
+update_named_ranges.py
+"""
+import openpyxl
+
+from .is_wb import is_wb
+from .is_xlsb import is_xlsb
+from .name_index import get_name_index
+from .update_named_range import update_named_range_pyxlsb
+from .values_equal import values_equal
+
+
+def update_named_ranges_openpyxl(wb, named_ranges, filename=None, elide=False, counts=None):
+    """
+    Description
+    -----------
+    This function updates many named ranges in an openpyxl
+    workbook object at once.
+
+    Every name is resolved through the name index of the workbook
+    first, and the values are checked against the sizes of the named
+    ranges before anything is written. The cells to write are then
+    grouped by sheet and sorted by row and column, so each sheet is
+    written in a single pass, and the workbook is saved at most once.
+
+    With elide, each value is compared with the value of its cell first
+    (see `values_equal`), and writes that would not change the cell are
+    skipped, so a sheet that only gets the values it already has is not
+    changed at all.
+
+    Parameters
+    ----------
+    wb : openpyxl.Workbook
+        Workbook object.
+    named_ranges : dict
+        Dictionary where the keys are the names of the named ranges
+        and the values are the new values. A value is a list with one
+        element for every cell in the named range (row by row, area by area),
+        or a single value if the named range is a single cell.
+    filename : str, optional
+        If given, the workbook is saved to this file
+        once all of the named ranges are updated.
+        Default is None, which does not save the workbook.
+    elide : bool, optional
+        Whether to skip the writes that would not change their cells.
+        Default is False.
+    counts : dict, optional
+        Dictionary to add the number of cells written and skipped on each
+        sheet to, as {sheet: {'written': int, 'elided': int}}.
+        Default is None.
+
+    Returns
+    -------
+    openpyxl.Workbook
+        Workbook object.
+
+    Raises
+    ------
+    ValueError
+        If the wb object is not an openpyxl workbook object.
+    ValueError
+        If a named range is not found.
+    ValueError
+        If a value is not a list of the same length as its named range.
+
+    Imports
+    -------
+    openpyxl
+    .name_index
+    .values_equal
+
+    Examples
+    --------
+    >>> wb = update_named_ranges_openpyxl(wb, {
+        "named_range_1": [1, 2],
+        "named_range_2": "test"
+        })
+    >>> wb = update_named_ranges_openpyxl(wb, {"named_range_1": [1, 2, 3]})
+    ValueError: The value for named_range_1 is not a list of the same length as the named range.
+    """
+    # check that the wb object is an openpyxl workbook object
+    if not isinstance(wb, openpyxl.Workbook):
+        raise ValueError("The wb object is not a wb object.")
+
+    # get the name index of the workbook
+    name_index = get_name_index(wb)
+
+    # dictionary of sheet name -> list of (row, column, value)
+    writes = {}
+
+    # resolve every named range and check every value
+    # before anything is written, so a bad name does not
+    # leave the workbook half updated
+    for named_range, value in named_ranges.items():
+        # get the destinations of the named range
+        destinations = name_index.get(named_range)
+
+        # get the number of cells in the named range
+        number_of_cells = sum(cell_range.size["rows"] * cell_range.size["columns"]
+                              for _, cell_range in destinations)
+
+        # check that the value is a list of the same length as the named range
+        # if the named range is a single cell, the value does not need to be a list
+        if not isinstance(value, list):
+            value = [value]
+        if len(value) != number_of_cells:
+            raise ValueError(f"The value for {named_range} is not a list " +
+                             "of the same length as the named range.")
+
+        # add the cells of the named range to the writes of their sheet
+        values = iter(value)
+        for sheet, cell_range in destinations:
+            sheet_writes = writes.setdefault(sheet, [])
+            for row, column in cell_range.cells:
+                sheet_writes.append((row, column, next(values)))
+
+    # write each sheet in a single pass, in row order
+    for sheet, sheet_writes in writes.items():
+        ws = wb[sheet]
+        sheet_writes.sort(key=lambda write: (write[0], write[1]))
+        written = 0
+        elided = 0
+        for row, column, value in sheet_writes:
+            cell = ws.cell(row=row, column=column)
+            if elide and values_equal(cell.value, value):
+                elided += 1
+            else:
+                cell.value = value
+                written += 1
+        if counts is not None:
+            sheet_counts = counts.setdefault(sheet, {'written': 0, 'elided': 0})
+            sheet_counts['written'] += written
+            sheet_counts['elided'] += elided
+
+    # save the workbook once, if a filename is given
+    if filename is not None:
+        wb.save(filename=filename)
+
+    # return the workbook object
+    return wb
+
+
+def update_named_ranges(wb, named_ranges, filename=None, elide=False, counts=None):
+    """
+    Description
+    -----------
+    Update many named ranges in the workbook at once,
+    where the keys of the dictionary are the names of the named ranges
+    and the values are the new values.
+    For openpyxl workbooks, the named ranges are written in one pass
+    per sheet with a single save (see `update_named_ranges_openpyxl`).
+    For xlsb workbooks, each named range is updated one at a time
+    with `update_named_range_pyxlsb`.
+
+    Parameters
+    ----------
+    wb : openpyxl.Workbook or pyxlsb.Workbook
+        Workbook object.
+    named_ranges : dict
+        Dictionary of the form:
+            {
+                named_range1: new_value1,
+                named_range2: new_value2,
+                ...
+            }
+    filename : str, optional
+        If given, the workbook is saved to this file
+        once all of the named ranges are updated.
+        Only used for openpyxl workbooks.
+        Default is None.
+    elide : bool, optional
+        Whether to skip the writes that would not change their cells.
+        Only used for openpyxl workbooks.
+        Default is False.
+    counts : dict, optional
+        Dictionary to add the number of cells written and skipped on each
+        sheet to (see `update_named_ranges_openpyxl`).
+        Only used for openpyxl workbooks.
+        Default is None.
+
+    Returns
+    -------
+    openpyxl.Workbook or pyxlsb.Workbook
+        Workbook object.
+
+    Raises
+    ------
+    ValueError
+        If the wb object is not a wb object.
+    ValueError
+        If the named_ranges input is not a dictionary.
+
+    Examples
+    --------
+    >>> wb = update_named_ranges(wb, {"named_range_1": [1, 2], "named_range_2": 3.0})
+    """
+    # check that the wb object is a wb object
+    if not is_wb(wb):
+        raise ValueError("The wb object is not a wb object.")
+
+    # check that the named ranges are a dictionary
+    if not isinstance(named_ranges, dict):
+        raise ValueError(f"The named ranges {named_ranges} are not a dictionary.")
+
+    # if the workbook is an xlsb file, update the named ranges one at a time
+    if is_xlsb(wb):
+        for named_range, value in named_ranges.items():
+            update_named_range_pyxlsb(wb, named_range, value)
+        return wb
+
+    # otherwise use the bulk openpyxl version
+    return update_named_ranges_openpyxl(wb, named_ranges, filename=filename, elide=elide, counts=counts)
@@ -1,31 +1,42 @@
 """
 update_range.py
 """
-
-import re
 # pylance: disable=import-error
 import openpyxl # pylance: disable=import-error
 # pylance: disable=import-error
 import pyxlsb
 
-from .get_cells_from_range import get_cells_from_range
 from .is_xlsb import is_xlsb
+from .write_request import build_write_requests, execute_write_requests
+
 
-def update_range_openpyxl(wb, excel_range, value):
+def update_range_openpyxl(wb, excel_range, value, filename=None):
     """
     Description
     -----------
     This function updates a range of cells in
     an openpyxl workbook object.
 
+    The sheets, ranges and values are checked once, when the writes
+    are made (see `build_write_request`), and nothing is written
+    unless all of them are valid. The writes are then run without
+    checking anything again.
+
     Parameters
     ----------
     wb : openpyxl.workbook.workbook.Workbook
         Workbook object.
     excel_range : dict
-        Dictionary of sheet names and cell references.
-    value : str, float, tuple, or list
-        Value.
+        Dictionary where the keys are sheet names (or numbers from 1)
+        and the values are cell ranges, either in A1 notation
+        ("B2" or "B2:C3") or (row, column) tuples.
+    value : object, list or tuple
+        The values to write to each range. Either a single value,
+        which is written to every cell of the range, a flat list with
+        one value for every cell (row by row), or a list of rows.
+    filename : str, optional
+        If given, the workbook is saved to this file.
+        Default is None, which does not save the workbook.
 
     Returns
     -------
@@ -35,340 +46,100 @@ def update_range_openpyxl(wb, excel_range, value):
     Raises
     ------
     ValueError
-        If the value cannot be a list, tuple, or dict.
+        If the wb object is not an openpyxl workbook object.
     ValueError
-        If the value is a list, tuple, or dict and the length
-        of the value is not the same as the number of cells
-        in the range.
+        If a sheet is not in the workbook.
     ValueError
-        If the wb object is not a wb object.
+        If a cell range is not in A1 notation or (row, column) notation.
     ValueError
-        If the wb object does not refer to a ".xlsx" file.
+        If the values do not fit a range.
+    ValueError
+        If a value is not a string, number, boolean, date, time or None.
 
     Imports
     -------
     openpyxl
-    re
+    .write_request
 
     Examples
     --------
     >>> wb = openpyxl.Workbook()
-    >>> wb = update_range_openpyxl(wb, {"Sheet1": "A1"}, "test")
-    >>> wb["Sheet1"]["A1"].value
+    >>> wb = update_range_openpyxl(wb, {"Sheet": "A1"}, "test")
+    >>> wb["Sheet"]["A1"].value
     'test'
-    >>> wb = update_range_openpyxl(wb, {"Sheet1": "A1"}, 1)
-    >>> wb["Sheet1"]["A1"].value
-    1
-    >>> wb = update_range_openpyxl(wb, {"Sheet1": "A1"}, (1, 2))
-    >>> wb["Sheet1"]["A1"].value
-    (1, 2)
-    >>> wb = update_range_openpyxl(wb, {"Sheet1": "A1"}, [1, 2])
-    >>> wb["Sheet1"]["A1"].value
-    [1, 2]
-    >>> wb = update_range_openpyxl(wb, {"Sheet1": "A1"}, {"test": "test"})
-    ValueError: The value cannot be a list, tuple, or dictionary.
-    >>> wb = update_range_openpyxl(wb, {"Sheet1": "A1"}, ["test", "test"])
-    ValueError: The value cannot be a list, tuple, or dictionary.
-    >>> wb = update_range_openpyxl(wb, {"Sheet1": "A1"},
-    [("test", "test"), ("test", "test")])
-    ValueError: The value cannot be a list, tuple, or dictionary.
-    >>> wb = update_range_openpyxl(wb, {"Sheet1": "A1"}, [
-        [("test", "test"), ("test", "test")], [("test", "test"), ("test", "test")]
-        ])
-    ValueError: The value cannot be a list, tuple, or dictionary.
-    >>> wb = update_range_openpyxl(wb, {"Sheet1": "A1"}, [[1, 2], [3, 4]])
-    ValueError: The value cannot be a list, tuple, or dictionary.
-    >>> wb = update_range_openpyxl(wb, {"Sheet1": "A1"}, [[1, 2], [3, 4]])
-    ValueError: The value cannot be a list, tuple, or dictionary.
-
+    >>> wb = update_range_openpyxl(wb, {"Sheet": "A1:B2"}, [[1, 2], [3, 4]])
+    >>> wb["Sheet"]["B2"].value
+    4
+    >>> wb = update_range_openpyxl(wb, {"Sheet": (1, 1)}, [1, 2])
+    ValueError: The value for Sheet!(1, 1) has 2 values, but the range has 1 cells.
+    >>> wb = update_range_openpyxl(wb, {"Sheet": "A1"}, {"test": "test"})
+    ValueError: The value {'test': 'test'} is not a string, number, boolean, date, time or None.
     """
     # if the wb object is not a wb object, raise a value error
     if not isinstance(wb, openpyxl.workbook.workbook.Workbook):
         raise ValueError("The wb object is not a wb object.")
 
-    # if the wb object does not have a file extension of .xlsx, .xlsm, or .xltx, raise a value error
-    if not wb.properties.file_extension in [".xlsx", ".xlsm", ".xltx"]:
-        raise ValueError("The wb object does not have a file extension of .xlsx, .xlsm, or .xltx.")
-
-    # loop through the excel_range dictionary
-    # for each sheet name, cell reference pair
-    for sheet_name, cell in excel_range.items():
-        # check that the sheet name is a string or integer
-        if not isinstance(sheet_name, (str, int)):
-            raise ValueError(f"The sheet name \"{sheet_name}\" is not a string or integer.")
-
-        # if the sheet name is a string, check that the sheet name is in the wb object
-        # if the sheet name is not in the wb object, raise a value error
-        if isinstance(sheet_name, str):
-            if not sheet_name in wb.sheetnames:
-                raise ValueError(f"The sheet name \"{sheet_name}\" is not in the wb object.")
-
-        # if the sheet name is an integer, check that the sheet name is in the wb object
-        # if the sheet name is not in the wb object, raise a value error
-        if isinstance(sheet_name, int):
-            if not sheet_name in range(1, len(wb.sheetnames) + 1):
-                raise ValueError(f"The sheet name {sheet_name} is not in the wb object.")
-
-        # check that the cell reference is a string, tuple, or list
-        if not isinstance(cell, (str, tuple, list)):
-            raise ValueError(f"The cell reference {cell} is not a string, tuple, or list.")
-
-        # if the cell reference is a string, check that the cell reference is in A1 notation
-        if isinstance(cell, str):
-            if not re.match(r"^[A-Z]+[0-9]+$", cell):
-                is_a1_notation = False
-
-        # if the cell reference is not in A1 notation,
-        # check that the cell reference is in (row, column) notation and
-        # that the cell reference is a tuple, with length 2
-        if not is_a1_notation:
-            if not isinstance(cell, tuple):
-                is_rc_notation = False
-            if not len(cell) == 2:
-                is_rc_notation = False
-
-        # if the cell reference is not in (row, column) notation, raise a value error
-        if not is_rc_notation and not is_a1_notation:
-            raise ValueError(f"The cell reference {cell}" +
-            " is not in A1 notation or (row, column) notation.")
-
-        # if the cell reference is a list,
-        # check that the cell reference is
-        # a list of strings or tuples
-        if isinstance(cell, list):
-            if not all(isinstance(x, (str, tuple)) for x in cell):
-                raise ValueError(f"The cell reference {cell} is not a list of strings or tuples.")
-
-        # if the cell reference is a list of strings or tuples,
-        # check that the cell references are in A1 notation or in
-        # (row, column) notation. if neither of these conditions are met,
-        # raise a value error
-        if isinstance(cell, list):
-            if not all(re.match(r"^[A-Z]+[0-9]+$", x) or isinstance(x, tuple) for x in cell):
-                raise ValueError(f"The cell reference {cell} is not a list of strings or tuples.")
-
-        # if the cell reference is a string or tuple,
-        # convert the cell reference to
-        # a list of individual cell references
-        if isinstance(cell, (str, tuple)):
-            cell = [cell]
-
-        # if the cell reference is a list, convert the cell reference to
-        # a list of individual cell references
-        if isinstance(cell, list):
-            cell = [x for x in cell]
-
-        # check that the value is a string, float, tuple, or list
-        if not isinstance(value, (str, float, tuple, list)):
-            raise ValueError(f"The value {value} is not a string, float, tuple, or list.")
-
-        # if the value is a string or float, check that there is only one cell reference
-        if isinstance(value, (str, float)):
-            if not len(cell) == 1:
-                raise ValueError(f"The value {value} is not a string or a float.")
-
-        # if the value is a tuple, check that there is only one cell reference
-        # if there is not only one cell reference, raise a value error
-        if isinstance(value, tuple):
-            if not len(cell) == 1:
-                raise ValueError(f"The value {value} is not a string or a float.")
-
-        # if the value is a list, check that there is only one cell reference
-        # if there is not only one cell reference, raise a value error
-        if isinstance(value, list):
-            if not len(cell) == 1:
-                raise ValueError(f"The value {value} is not a string or a float.")
-
-        # if the value is a list, check that the value is a list of strings or floats
-        # if the value is not a list of strings and/or floats, raise a value error
-        if isinstance(value, list):
-            if not all(isinstance(x, (str, float)) for x in value):
-                raise ValueError(f"The value {value} is not a list of strings or floats.")
-
-    # loop through the excel_range dictionary
-    # for each sheet name, cell reference pair
-    for sheet_name, cell in excel_range.items():
-        # if the cell reference is a string, convert the cell reference to a list of tuples
-        if isinstance(cell, str):
-            cell = [openpyxl.utils.cell.coordinate_from_string(cell)]
-
-        # if the cell reference is a list of strings, convert the cell reference to a list of tuples
-        if isinstance(cell, list):
-            cell = [openpyxl.utils.cell.coordinate_from_string(x) for x in cell]
-
-        # if the value is a string, convert the value to a tuple
-        if isinstance(value, str):
-            value = (value,)
-
-        # if the value is a list of strings, convert the value to a list of tuples
-        if isinstance(value, list):
-            value = [tuple(x) for x in value]
-
-        # if the value is a tuple, convert the value to a list of tuples
-        if isinstance(value, tuple):
-            value = [value]
-
-        # if the sheet name is a string, get the sheet object
-        if isinstance(sheet_name, str):
-            ws = wb[sheet_name]
-
-        # if the sheet name is an integer, get the sheet object
-        if isinstance(sheet_name, int):
-            ws = wb.worksheets[sheet_name - 1]
-
-        # if the cell reference is a tuple, update the cell
-        if isinstance(cell, tuple):
-            ws.cell(row=cell[0], column=cell[1]).value = value[0]
+    # check every write, then write them
+    requests = build_write_requests(wb.sheetnames, excel_range, value)
+    execute_write_requests(wb, requests)
 
-        # if the cell reference is a list of tuples, update the cells
-        if isinstance(cell, list):
-            for i, temp_cell in enumerate(cell):
-                ws.cell(row=temp_cell[0], column=temp_cell[1]).value = value[i]
-
-    # save the workbook
-    wb.save(filename=wb.filename)
+    # save the workbook, if a filename is given
+    if filename is not None:
+        wb.save(filename=filename)
 
     # return the workbook object
     return wb
 
 
 def update_range_pyxlsb(wb, excel_range, value):
-    """Update a range of cells in a pyxlsb workbook object.
+    """Check an update to a range of cells in a pyxlsb workbook object.
+
+    pyxlsb only reads xlsb files, so the update is checked the same
+    way as for openpyxl workbooks (in one pass), and then a ValueError
+    is raised, since it cannot be written.
 
     Parameters
     ----------
     wb : pyxlsb.workbook.Workbook
         The pyxlsb workbook object to be updated.
     excel_range : dict
-        The dictionary of cell references to be updated.
-    value : str, float, tuple, list
-        The value to be updated in the cell references.
+        The dictionary of sheet names and cell ranges to be updated.
+    value : object, list or tuple
+        The values to be written to the cell ranges.
 
     Returns
     -------
-    pyxlsb.workbook.Workbook
-        The updated pyxlsb workbook object.
+    None
+        Never returns, see Raises.
 
     Raises
     ------
     ValueError
         If the wb object is not a pyxlsb workbook object.
     ValueError
-        If the wb object does not have a file extension of .xlsb.
-    ValueError
-        If the value is not a string, float, tuple, or list.
-    ValueError
-        If the value is a string or float and there is more than one cell reference.
-    ValueError
-        If the value is a tuple or list and there is more than one cell reference.
-    ValueError
-        If the value is a list and the value is not a list of strings or floats.
-    ValueError
-        If the value is a string or float and there is more than one cell reference.
-    ValueError
-        If the value is a tuple or list and there is more than one cell reference.
+        If the update is not valid (see `build_write_request`).
     ValueError
-        If the value is a list and the value is not a list of strings or floats.
-    ValueError
-        If the value is a list and the value is not a list of strings or floats.
-    ValueError
-        If the value is a list and the value is not a list of strings or floats.
+        If the update is valid, since xlsb workbooks cannot be written.
 
     Examples
     --------
     >>> import pyxlsb
     >>> wb = pyxlsb.open_workbook('test.xlsb')
-    >>> excel_range = {'Sheet1': 'A1'}
-    >>> value = 'test'
-    >>> wb = update_range_pyxlsb(wb, excel_range, value)
+    >>> update_range_pyxlsb(wb, {'Sheet1': 'A1'}, 'test')
+    ValueError: xlsb workbooks are read only. Save the workbook as .xlsx or .xlsm to update it.
     """
-
     # check that the wb object is a pyxlsb workbook object
     # if the wb object is not a pyxlsb workbook object, raise a value error
     if not isinstance(wb, pyxlsb.workbook.Workbook):
         raise ValueError(f"The wb object {wb} is not a pyxlsb workbook object.")
 
-    # check that the wb object has a file extension of .xlsb
-    # if the wb object does not have a file extension of .xlsb, raise a value error
-    if not wb.filename.endswith('.xlsb'):
-        raise ValueError(f"The wb object {wb} does not have a file extension of .xlsb.")
-
-    # check that the value is a string, float, tuple, or list
-    # if the value is not a string, float, tuple, or list, raise a value error
-    if (not isinstance(value, str) and
-        not isinstance(value, float) and
-        not isinstance(value, tuple) and
-        not isinstance(value, list)):
-        raise ValueError(f"The value {value} is not a string, float, tuple, or list.")
-
-    # check that the value is a string or float and there is more than one cell reference
-    # if the value is a string or float and there is more than one cell reference, raise a value error
-    if (isinstance(value, str) or isinstance(value, float)) and len(excel_range) > 1:
-        raise ValueError(f"The value {value} is a string or float and there is more than one cell reference.")
-
-    # check that the value is a tuple or list and there is more than one cell reference
-    # if the value is a tuple or list and there is more than one cell reference, raise a value error
-    if (isinstance(value, tuple) or isinstance(value, list)) and len(excel_range) > 1:
-        raise ValueError(f"The value {value} is a tuple or list and there is more than one cell reference.")
-
-    # check that the value is a list and the value is not a list of strings or floats
-    # if the value is a list and the value is not a list of strings or floats, raise a value error
-    if isinstance(value, list) and not all(isinstance(v, str) or isinstance(v, float) for v in value):
-        raise ValueError(f"The value {value} is a list and the value is not a list of strings or floats.")
+    # check every write, so a bad update gets the same error as for openpyxl
+    build_write_requests(list(wb.sheets), excel_range, value)
 
-    # check that the value is a string or float and there is more than one cell reference
-    # if the value is a string or float and there is more than one cell reference, raise a value error
-    if (isinstance(value, str) or isinstance(value, float)) and len(excel_range) > 1:
-        raise ValueError(f"The value {value} is a string or float and there is more than one cell reference.")
+    raise ValueError("xlsb workbooks are read only. Save the workbook as .xlsx or .xlsm to update it.")
 
-    # check that the value is a tuple or list and there is more than one cell reference
-    # if the value is a tuple or list and there is more than one cell reference, raise a value error
-    if (isinstance(value, tuple) or isinstance(value, list)) and len(excel_range) > 1:
-        raise ValueError(f"The value {value} is a tuple or list and there is more than one cell reference.")
 
-    # check that the value is a list and the value is not a list of strings or floats
-    # if the value is a list and the value is not a list of strings or floats, raise a value error
-    if isinstance(value, list) and not all(isinstance(v, str) or isinstance(v, float) for v in value):
-        raise ValueError(f"The value {value} is a list and the value is not a list of strings or floats.")
-
-    # check that the value is a list and the value is not a list of strings or floats
-    # if the value is a list and the value is not a list of strings or floats, raise a value error
-    if isinstance(value, list) and not all(isinstance(v, str) or isinstance(v, float) for v in value):
-        raise ValueError(f"The value {value} is a list and the value is not a list of strings or floats.")
-
-    # check that the value is a list and the value is not a list of strings or floats
-    # if the value is a list and the value is not a list of strings or floats, raise a value error
-    if isinstance(value, list) and not all(isinstance(v, str) or isinstance(v, float) for v in value):
-        raise ValueError(f"The value {value} is a list and the value is not a list of strings or floats.")
-
-    # loop through the excel range dictionary
-    for sheet_name, cell_range in excel_range.items():
-
-        # get the sheet object
-        sheet = wb.get_sheet_by_name(sheet_name)
-
-        # get the cell references
-        cell_refs = get_cells_from_range(cell_range)
-
-        # check that the value is a string or float
-        # if the value is a string or float, update the cell references
-        if isinstance(value, str) or isinstance(value, float):
-            for cell_ref in cell_refs:
-                sheet.update_cell(cell_ref, value)
-
-        # check that the value is a tuple or list
-        # if the value is a tuple or list, update the cell references
-        if isinstance(value, tuple) or isinstance(value, list):
-            for cell_ref, v in zip(cell_refs, value):
-                sheet.update_cell(cell_ref, v)
-
-    # save the workbook
-    wb.save()
-
-    # return the workbook
-    return wb
-
-def update_range(wb, excel_range, value):
+def update_range(wb, excel_range, value, filename=None):
     """
     Update the cells in the excel_range input with the value input.
 
@@ -377,9 +148,14 @@ def update_range(wb, excel_range, value):
     wb : object
         The wb object.
     excel_range : dict
-        The excel_range input that is a dictionary.
-    value : str, tuple, or list
+        The excel_range input that is a dictionary
+        of sheet names and cell ranges.
+    value : object, list or tuple
         The value input.
+    filename : str, optional
+        If given, the workbook is saved to this file.
+        Only used for openpyxl workbooks.
+        Default is None.
 
     Returns
     -------
@@ -393,22 +169,15 @@ def update_range(wb, excel_range, value):
     ValueError
         If the excel_range input is not a dictionary.
     ValueError
-        If the value is not a string, tuple, or list.
+        If the update is not valid (see `build_write_request`).
     ValueError
-        If the value is a string or float and there is more than one cell reference.
-    ValueError
-        If the value is a tuple or list and there is more than one cell reference.
-    ValueError
-        If the value is a list and the value is not a list of strings or floats.
+        If the wb object is a pyxlsb workbook, which cannot be written.
 
     Examples
     --------
-    >>> import pyxlsb
-    >>> wb = pyxlsb.open_workbook("test.xlsb")
-    >>> excel_range = {"Sheet1": "A1:A3"}
-    >>> value = "test"
-    >>> wb = update_range(wb, excel_range, value)
-    >>> wb.worksheets[0].cells[0][0].value
+    >>> wb = openpyxl.load_workbook("test.xlsx")
+    >>> wb = update_range(wb, {"Sheet1": "A1:A3"}, "test")
+    >>> wb["Sheet1"]["A3"].value
     'test'
     """
     # checks that the wb object input is a wb object either of these packages can use
@@ -421,4 +190,4 @@ def update_range(wb, excel_range, value):
     if is_xlsb(wb):
         return update_range_pyxlsb(wb, excel_range, value)
     else:
-        return update_range_openpyxl(wb, excel_range, value)
+        return update_range_openpyxl(wb, excel_range, value, filename=filename)
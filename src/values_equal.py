@@ -0,0 +1,104 @@
+"""
+values_equal.py
+"""
+import datetime
+import math
+import numbers
+
+
+# the relative tolerance numbers are compared with,
+# well inside the 15 significant digits Excel keeps
+DEFAULT_REL_TOL = 1e-12
+
+
+def normalize_cell_value(value):
+    """
+    Description
+    -----------
+    Put a cell value in the form it is compared in: empty strings are
+    empty cells, dates are datetimes at midnight (which is how openpyxl
+    reads them back), and numbers are floats. Booleans stay booleans,
+    since writing True over 1 changes the type of the cell.
+
+    Parameters
+    ----------
+    value : object
+        The cell value.
+
+    Returns
+    -------
+    object
+        The normalized value.
+
+    Imports
+    -------
+    datetime
+    numbers
+
+    Examples
+    --------
+    >>> normalize_cell_value("")
+    None
+    >>> normalize_cell_value(datetime.date(2024, 6, 30))
+    datetime.datetime(2024, 6, 30, 0, 0)
+    >>> normalize_cell_value(3)
+    3.0
+    """
+    if value == "":
+        return None
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, numbers.Real):
+        return float(value)
+    if isinstance(value, datetime.date) and not isinstance(value, datetime.datetime):
+        return datetime.datetime.combine(value, datetime.time())
+    return value
+
+
+def values_equal(old, new, rel_tol=DEFAULT_REL_TOL, abs_tol=0.0):
+    """
+    Description
+    -----------
+    Check whether writing a value to a cell would leave the cell as it is.
+    The values are normalized first (see `normalize_cell_value`), numbers
+    are equal if they are within the tolerance of each other, and every
+    other value (strings and formulas included) must match exactly.
+
+    Parameters
+    ----------
+    old : object
+        The value of the cell.
+    new : object
+        The value to write.
+    rel_tol : float, optional
+        The relative tolerance of numbers. Default is 1e-12.
+    abs_tol : float, optional
+        The absolute tolerance of numbers. Default is 0.0.
+
+    Returns
+    -------
+    bool
+        Whether the write would not change the cell.
+
+    Imports
+    -------
+    math
+
+    Examples
+    --------
+    >>> values_equal(0.30000000000000004, 0.3)
+    True
+    >>> values_equal(1, True)
+    False
+    >>> values_equal(None, "")
+    True
+    """
+    if old is new:
+        return True
+    old = normalize_cell_value(old)
+    new = normalize_cell_value(new)
+    if type(old) is not type(new):
+        return False
+    if isinstance(old, float):
+        return math.isclose(old, new, rel_tol=rel_tol, abs_tol=abs_tol) or (math.isnan(old) and math.isnan(new))
+    return old == new
@@ -0,0 +1,204 @@
+"""
+write_cached_values.py
+"""
+import math
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+from .get_sheet_parts import get_sheet_parts
+from .mapped_zip import get_mapped_zip
+from .read_sheet_rows import ErrorValue
+from .rewrite_package import rewrite_package
+
+
+# a cell with a formula, with its attributes, its formula element,
+# and its (possibly empty) value element
+FORMULA_CELL_PATTERN = re.compile(
+    rb'<((?:\w+:)?)c\b([^>]*?\sr="([A-Z]+\d+)"[^>]*?)>'
+    rb'(<(?:\w+:)?f\b[^>]*?(?:/>|>.*?</(?:\w+:)?f>))'
+    rb'(?:<(?:\w+:)?v\s*/>|<(?:\w+:)?v>.*?</(?:\w+:)?v>)?'
+    rb'(</(?:\w+:)?c>)', re.S)
+TYPE_ATTRIBUTE_PATTERN = re.compile(rb'\st="[^"]*"')
+CELL_END_PATTERN = re.compile(rb"</(?:\w+:)?c>")
+
+
+def format_cached_value(value):
+    """
+    Description
+    -----------
+    Get the type attribute and the text of the value element
+    of a formula cell with a value.
+
+    Parameters
+    ----------
+    value : object
+        The value of the cell.
+
+    Returns
+    -------
+    tuple
+        Tuple of the form (type, text), where type is the value of the t
+        attribute (None for numbers) and text is the escaped text of
+        the value, or None if the cell has no value.
+
+    Examples
+    --------
+    >>> format_cached_value(12.5)
+    (None, b'12.5')
+    >>> format_cached_value("North")
+    (b'str', b'North')
+    """
+    if value is None:
+        return None, None
+    if isinstance(value, ErrorValue):
+        return b"e", escape(str(value)).encode("utf-8")
+    if isinstance(value, bool):
+        return b"b", b"1" if value else b"0"
+    if isinstance(value, (int, float)):
+        if isinstance(value, float) and not math.isfinite(value):
+            return b"e", b"#NUM!"
+        return None, repr(value).encode("ascii")
+    return b"str", escape(str(value)).encode("utf-8")
+
+
+def patch_cached_values(src, dst, cached_values, chunk_size=1 << 20):
+    """
+    Description
+    -----------
+    Copy the xml of a worksheet part, writing the cached values of the
+    formula cells into their value elements as they go by. The part is
+    read and written a chunk at a time, so memory use stays flat.
+
+    Parameters
+    ----------
+    src : file object
+        The worksheet part, opened for reading in binary mode.
+    dst : file object
+        The file object to write to, opened for writing in binary mode.
+    cached_values : dict
+        Dictionary where the keys are cell references (e.g. "B10")
+        and the values are the cached values of the formula cells.
+        Formula cells that are not in the dictionary are copied as they are.
+    chunk_size : int, optional
+        The number of bytes to read at a time.
+        Default is 1 MB.
+
+    Returns
+    -------
+    int
+        The number of formula cells whose values were written.
+
+    Imports
+    -------
+    re
+
+    Examples
+    --------
+    >>> with zf.open("xl/worksheets/sheet1.xml") as src:
+    ...     patch_cached_values(src, dst, {"B10": 10700.0})
+    1
+    """
+    count = 0
+
+    def replace(match):
+        nonlocal count
+        ref = match.group(3).decode("ascii")
+        if ref not in cached_values:
+            return match.group(0)
+        count += 1
+        cell_type, text = format_cached_value(cached_values[ref])
+        attributes = TYPE_ATTRIBUTE_PATTERN.sub(b"", match.group(2))
+        if cell_type is not None:
+            attributes += b' t="' + cell_type + b'"'
+        prefix = match.group(1)
+        value = b"" if text is None else b"<" + prefix + b"v>" + text + b"</" + prefix + b"v>"
+        return b"<" + prefix + b"c" + attributes + b">" + match.group(4) + value + match.group(5)
+
+    buffer = b""
+    while True:
+        chunk = src.read(chunk_size)
+        buffer += chunk
+        if not chunk:
+            dst.write(FORMULA_CELL_PATTERN.sub(replace, buffer))
+            return count
+
+        # only patch up to the end of the last complete cell in the buffer
+        end = buffer.rfind(b"c>")
+        while end >= 0:
+            start = buffer.rfind(b"</", 0, end)
+            if start >= 0 and CELL_END_PATTERN.fullmatch(buffer, start, end + 2):
+                break
+            end = buffer.rfind(b"c>", 0, end)
+        if end < 0:
+            continue
+        end += len(b"c>")
+        dst.write(FORMULA_CELL_PATTERN.sub(replace, buffer[:end]))
+        buffer = buffer[end:]
+
+
+def write_cached_values(file_path, cached_values, new_file_path=None, compression=zipfile.ZIP_DEFLATED):
+    """
+    Description
+    -----------
+    Write the cached values of formula cells into a workbook file,
+    so programs that read the values without calculating the formulas
+    (like openpyxl with data_only=True) see them. openpyxl does not keep
+    the cached values of formulas when it saves a workbook, so this is
+    used after saving.
+
+    Only the sheets with cached values to write are rewritten, one row
+    at a time, and every other part of the workbook package is copied as it is.
+
+    Parameters
+    ----------
+    file_path : str
+        The file path of the workbook.
+    cached_values : dict
+        Dictionary where the keys are sheet names and the values are
+        dictionaries of cached values by cell reference, as given by
+        `FormulaGraph.get_cached_values`.
+    new_file_path : str, optional
+        The file path to write the new workbook to.
+        Default is None, which rewrites the workbook in place.
+    compression : int, optional
+        The compression used for the sheets that are rewritten.
+        Default is zipfile.ZIP_DEFLATED.
+
+    Returns
+    -------
+    int
+        The number of formula cells whose values were written.
+
+    Imports
+    -------
+    zipfile
+    .get_sheet_parts
+    .mapped_zip
+    .rewrite_package
+
+    Examples
+    --------
+    >>> write_cached_values("report.xlsx", {"Summary": {"B10": 10700.0}})
+    1
+    """
+    with get_mapped_zip(file_path) as zf:
+        sheet_parts = get_sheet_parts(zf)
+
+    count = []
+
+    def patch(part, values):
+        def write_part(dst):
+            with get_mapped_zip(file_path) as zf, zf.open(part) as src:
+                count.append(patch_cached_values(src, dst, values))
+        return write_part
+
+    replace_parts = {sheet_parts[sheet]: patch(sheet_parts[sheet], values)
+                     for sheet, values in cached_values.items()
+                     if values and sheet in sheet_parts}
+    if replace_parts:
+        rewrite_package(file_path, new_file_path, replace_parts=replace_parts, compression=compression)
+    elif new_file_path is not None:
+        rewrite_package(file_path, new_file_path)
+
+    return sum(count)
@@ -0,0 +1,435 @@
+"""
+write_request.py
+"""
+import datetime
+import numbers
+from collections import namedtuple
+
+from openpyxl.utils.cell import get_column_letter, range_boundaries
+
+from .excel_dates import to_cell_values
+from .macro_msgpack import MacroBlock
+from .values_equal import values_equal
+
+
+# the types a cell value can have
+VALUE_TYPES = (str, int, float, bool, datetime.datetime, datetime.date,
+               datetime.time, datetime.timedelta, type(None))
+
+# the exact types checked first, so most values only need a set lookup
+_EXACT_VALUE_TYPES = frozenset(VALUE_TYPES)
+
+
+class WriteRequest(namedtuple("WriteRequest", [
+        "sheet_index", "sheet", "min_row", "min_col", "max_row", "max_col", "values"])):
+    """
+    Description
+    -----------
+    A write of a block of values to a rectangular range of one sheet,
+    checked once when it is made (see `build_write_request`), so it can be
+    written any number of times without checking it again
+    (see `execute_write_requests`).
+
+    Attributes
+    ----------
+    sheet_index : int
+        The index of the sheet in the worksheets of the workbook, from 0.
+    sheet : str
+        The name of the sheet.
+    min_row, min_col, max_row, max_col : int
+        The bounds of the range, from 1.
+    values : tuple
+        The values, as a tuple of rows, where each row is a tuple
+        of the values of its cells.
+
+    Examples
+    --------
+    >>> request = build_write_request(wb.sheetnames, "Inputs", "B2:C3", [[1, 2], [3, 4]])
+    >>> request.range_string
+    'B2:C3'
+    >>> request.values
+    ((1, 2), (3, 4))
+    """
+    __slots__ = ()
+
+    @property
+    def range_string(self):
+        start = f"{get_column_letter(self.min_col)}{self.min_row}"
+        if (self.min_row, self.min_col) == (self.max_row, self.max_col):
+            return start
+        return f"{start}:{get_column_letter(self.max_col)}{self.max_row}"
+
+    def to_dict(self):
+        """
+        Get the write as a dictionary for the cosmo log,
+        which `trusted_write_request` turns back into a write.
+        """
+        return {'sheet': self.sheet, 'range': self.range_string,
+                'values': [list(row) for row in self.values]}
+
+
+def parse_range(cell_range):
+    """
+    Description
+    -----------
+    Get the bounds of a cell range.
+
+    Parameters
+    ----------
+    cell_range : str or tuple
+        The cell range, either in A1 notation ("B2" or "B2:C3", with or
+        without "$"), or a (row, column) tuple for a single cell.
+
+    Returns
+    -------
+    tuple
+        Tuple of the form (min_row, min_col, max_row, max_col).
+
+    Raises
+    ------
+    ValueError
+        If the cell range is not a single area in A1 notation
+        or a (row, column) tuple.
+
+    Imports
+    -------
+    openpyxl
+
+    Examples
+    --------
+    >>> parse_range("B2:C3")
+    (2, 2, 3, 3)
+    >>> parse_range((4, 1))
+    (4, 1, 4, 1)
+    """
+    if isinstance(cell_range, tuple):
+        if (len(cell_range) != 2 or not all(isinstance(x, int) and not isinstance(x, bool) for x in cell_range)
+                or min(cell_range) < 1):
+            raise ValueError(f"The cell reference {cell_range} is not a (row, column) tuple.")
+        row, column = cell_range
+        return row, column, row, column
+
+    if not isinstance(cell_range, str):
+        raise ValueError(f"The cell reference {cell_range} is not a string or a (row, column) tuple.")
+    try:
+        min_col, min_row, max_col, max_row = range_boundaries(cell_range.replace("$", ""))
+    except (TypeError, ValueError):
+        raise ValueError(f"The cell reference {cell_range} is not in A1 notation.") from None
+    if None in (min_col, min_row, max_col, max_row):
+        raise ValueError(f"The cell reference {cell_range} is not a range of cells.")
+    return min_row, min_col, max_row, max_col
+
+
+def get_sheet_index(sheet_names, sheet):
+    """
+    Description
+    -----------
+    Get the index and the name of a sheet.
+
+    Parameters
+    ----------
+    sheet_names : list
+        The names of the sheets of the workbook, in order.
+    sheet : str or int
+        The name of the sheet, or its number from 1.
+
+    Returns
+    -------
+    tuple
+        Tuple of the form (sheet_index, sheet_name), where sheet_index is from 0.
+
+    Raises
+    ------
+    ValueError
+        If the sheet is not in the workbook.
+
+    Examples
+    --------
+    >>> get_sheet_index(["Inputs", "Summary"], "Summary")
+    (1, 'Summary')
+    >>> get_sheet_index(["Inputs", "Summary"], 1)
+    (0, 'Inputs')
+    """
+    if isinstance(sheet, int) and not isinstance(sheet, bool):
+        if not 1 <= sheet <= len(sheet_names):
+            raise ValueError(f"The sheet number {sheet} is not in the workbook.")
+        return sheet - 1, sheet_names[sheet - 1]
+    if not isinstance(sheet, str):
+        raise ValueError(f"The sheet name \"{sheet}\" is not a string or integer.")
+    try:
+        return sheet_names.index(sheet), sheet
+    except ValueError:
+        raise ValueError(f"The sheet name \"{sheet}\" is not in the workbook.") from None
+
+
+def check_values(values):
+    """
+    Description
+    -----------
+    Check that every value can be the value of a cell, in one pass.
+
+    Parameters
+    ----------
+    values : iterable
+        The values.
+
+    Raises
+    ------
+    ValueError
+        If a value is not a string, number, boolean, date, time or None.
+
+    Examples
+    --------
+    >>> check_values([1, "a", None])
+    >>> check_values([1, [2]])
+    ValueError: The value [2] is not a string, number, boolean, date, time or None.
+    """
+    for value in values:
+        if type(value) not in _EXACT_VALUE_TYPES and not isinstance(value, (VALUE_TYPES, numbers.Number)):
+            raise ValueError(f"The value {value} is not a string, number, boolean, date, time or None.")
+
+
+def build_write_request(sheet_names, sheet, cell_range, value):
+    """
+    Description
+    -----------
+    Make a write of a value or a block of values to a range of cells,
+    checking the sheet, the range and every value once, so the write
+    can be run without checking anything again.
+
+    Parameters
+    ----------
+    sheet_names : list
+        The names of the sheets of the workbook, in order.
+    sheet : str or int
+        The name of the sheet, or its number from 1.
+    cell_range : str or tuple
+        The cell range, either in A1 notation ("B2" or "B2:C3"),
+        or a (row, column) tuple for a single cell.
+    value : object, list or tuple
+        The values to write. Either a single value, which is written
+        to every cell of the range, a flat list with one value for every
+        cell (row by row), or a list of rows with the shape of the range.
+        numpy arrays and pandas Series and DataFrames are written as
+        lists, with their date columns converted at once (see `to_cell_values`).
+
+    Returns
+    -------
+    WriteRequest
+        The write.
+
+    Raises
+    ------
+    ValueError
+        If the sheet is not in the workbook.
+    ValueError
+        If the cell range is not valid.
+    ValueError
+        If the values do not fit the range.
+    ValueError
+        If a value is not a string, number, boolean, date, time or None.
+
+    Imports
+    -------
+    openpyxl
+    .excel_dates
+
+    Examples
+    --------
+    >>> build_write_request(["Inputs"], "Inputs", "B2:B3", [0.05, 1000]).values
+    ((0.05,), (1000,))
+    >>> build_write_request(["Inputs"], "Inputs", "B2:C2", 0).values
+    ((0, 0),)
+    >>> build_write_request(["Inputs"], "Inputs", "B2:B3", [1, 2, 3])
+    ValueError: The value for Inputs!B2:B3 has 3 values, but the range has 2 cells.
+    """
+    sheet_index, sheet = get_sheet_index(sheet_names, sheet)
+    min_row, min_col, max_row, max_col = parse_range(cell_range)
+    height, width = max_row - min_row + 1, max_col - min_col + 1
+    label = f"{sheet}!{cell_range}"
+
+    # numpy and pandas blocks are converted a column at a time
+    if hasattr(value, "dtype") or hasattr(value, "columns"):
+        value = to_cell_values(value)
+
+    # a single value is written to every cell of the range
+    if not isinstance(value, (list, tuple)):
+        check_values([value])
+        row = (value,) * width
+        return WriteRequest(sheet_index, sheet, min_row, min_col, max_row, max_col, (row,) * height)
+
+    # a list of rows needs the shape of the range
+    if value and all(isinstance(row, (list, tuple)) for row in value):
+        if len(value) != height or any(len(row) != width for row in value):
+            raise ValueError(f"The value for {label} is not a list of {height} rows of {width} values.")
+        values = tuple(tuple(row) for row in value)
+        for row in values:
+            check_values(row)
+        return WriteRequest(sheet_index, sheet, min_row, min_col, max_row, max_col, values)
+
+    # a flat list is written row by row
+    if len(value) != height * width:
+        raise ValueError(f"The value for {label} has {len(value)} values, " +
+                         f"but the range has {height * width} cells.")
+    check_values(value)
+    values = tuple(tuple(value[start:start + width]) for start in range(0, len(value), width))
+    return WriteRequest(sheet_index, sheet, min_row, min_col, max_row, max_col, values)
+
+
+def build_write_requests(sheet_names, excel_range, value):
+    """
+    Description
+    -----------
+    Make the writes of a value to ranges on one or more sheets,
+    with `build_write_request`, checking all of them before any is written.
+
+    Parameters
+    ----------
+    sheet_names : list
+        The names of the sheets of the workbook, in order.
+    excel_range : dict
+        Dictionary where the keys are sheet names (or numbers from 1)
+        and the values are cell ranges.
+    value : object, list or tuple
+        The value or values to write to each of the ranges.
+
+    Returns
+    -------
+    list
+        The writes, in the order of excel_range.
+
+    Raises
+    ------
+    ValueError
+        If excel_range is not a dictionary, or any write is not valid.
+
+    Examples
+    --------
+    >>> build_write_requests(["Inputs", "Summary"], {"Inputs": "B1", "Summary": "B1"}, 0.05)
+    [WriteRequest(sheet_index=0, sheet='Inputs', ...), WriteRequest(sheet_index=1, sheet='Summary', ...)]
+    """
+    if not isinstance(excel_range, dict):
+        raise ValueError(f"The excel range {excel_range} is not a dictionary.")
+    return [build_write_request(sheet_names, sheet, cell_range, value)
+            for sheet, cell_range in excel_range.items()]
+
+
+def trusted_write_request(sheet_names, sheet, range, values):
+    """
+    Description
+    -----------
+    Make a write from a write that was checked before, as given by
+    `WriteRequest.to_dict` (e.g. from the cosmo log of a macro),
+    without checking its values again. Only the sheet and the range
+    are looked up. Blocks of values in sidecar arrays (see `MacroBlock`)
+    are kept as they are, so they are only read when the write is made.
+
+    Parameters
+    ----------
+    sheet_names : list
+        The names of the sheets of the workbook, in order.
+    sheet : str
+        The name of the sheet.
+    range : str
+        The cell range, in A1 notation.
+    values : list or MacroBlock
+        The values, as a list of rows with the shape of the range.
+
+    Returns
+    -------
+    WriteRequest
+        The write.
+
+    Raises
+    ------
+    ValueError
+        If the sheet is not in the workbook, or the range is not valid.
+    ValueError
+        If the values are a block of another shape than the range.
+
+    Examples
+    --------
+    >>> trusted_write_request(["Inputs"], **{'sheet': 'Inputs', 'range': 'B1:B2', 'values': [[0.05], [1000]]})
+    WriteRequest(sheet_index=0, sheet='Inputs', min_row=1, min_col=2, max_row=2, max_col=2, values=((0.05,), (1000,)))
+    """
+    sheet_index, sheet = get_sheet_index(sheet_names, sheet)
+    min_row, min_col, max_row, max_col = parse_range(range)
+    if isinstance(values, MacroBlock):
+        if values.shape != (max_row - min_row + 1, max_col - min_col + 1):
+            raise ValueError(f"The value block {values} does not have the shape of the range {range}.")
+        return WriteRequest(sheet_index, sheet, min_row, min_col, max_row, max_col, values)
+    return WriteRequest(sheet_index, sheet, min_row, min_col, max_row, max_col, tuple(map(tuple, values)))
+
+
+def execute_write_requests(wb, requests, elide=False, counts=None):
+    """
+    Description
+    -----------
+    Write checked writes to an openpyxl workbook, in order,
+    without checking them again.
+
+    With elide, each value is compared with the value of its cell first
+    (see `values_equal`), and writes that would not change the cell are
+    skipped, so a sheet that only gets the values it already has is not
+    changed at all.
+
+    Parameters
+    ----------
+    wb : openpyxl.Workbook
+        The workbook object.
+    requests : list
+        The writes, as given by `build_write_request`.
+    elide : bool, optional
+        Whether to skip the writes that would not change their cells.
+        Default is False.
+    counts : dict, optional
+        Dictionary to add the number of cells written and skipped on each
+        sheet to, as {sheet: {'written': int, 'elided': int}}.
+        Default is None.
+
+    Returns
+    -------
+    int
+        The number of cells written.
+
+    Imports
+    -------
+    .values_equal
+
+    Examples
+    --------
+    >>> execute_write_requests(wb, build_write_requests(wb.sheetnames, {"Inputs": "B1:B2"}, [0.05, 1000]))
+    2
+    >>> counts = {}
+    >>> execute_write_requests(wb, build_write_requests(wb.sheetnames, {"Inputs": "B1:B2"}, [0.05, 1200]),
+    ...                        elide=True, counts=counts)
+    1
+    >>> counts
+    {'Inputs': {'written': 1, 'elided': 1}}
+    """
+    worksheets = wb.worksheets
+    count = 0
+    for request in requests:
+        cell = worksheets[request.sheet_index].cell
+        min_col = request.min_col
+        written = 0
+        elided = 0
+        for row, row_values in enumerate(request.values, start=request.min_row):
+            if not elide:
+                for column, value in enumerate(row_values, start=min_col):
+                    cell(row=row, column=column).value = value
+                written += len(row_values)
+                continue
+            for column, value in enumerate(row_values, start=min_col):
+                target = cell(row=row, column=column)
+                if values_equal(target.value, value):
+                    elided += 1
+                else:
+                    target.value = value
+                    written += 1
+        count += written
+        if counts is not None:
+            sheet_counts = counts.setdefault(request.sheet, {'written': 0, 'elided': 0})
+            sheet_counts['written'] += written
+            sheet_counts['elided'] += elided
+    return count